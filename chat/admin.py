@@ -1,25 +1,21 @@
 from django.contrib import admin
-from .models import Room, Message, MessageReaction, UserChatPosition
+from .models import Room, Message, ArchivedMessage, MessageReaction, UserChatPosition
 
 @admin.register(Room)
 class RoomAdmin(admin.ModelAdmin):
-    list_display = ('name', 'description', 'is_active', 'created_at')
+    list_display = ('name', 'title', 'description', 'is_active', 'access_roles', 'max_message_length', 'archived_until', 'created_at')
     list_filter = ('is_active', 'created_at')
     search_fields = ('name', 'description')
-    readonly_fields = ('id', 'created_at')
+    readonly_fields = ('id', 'created_at', 'archived_until')
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     list_display = ('id', 'author', 'room', 'content_snippet', 'is_deleted', 'is_edited', 'is_forwarded', 'is_pinned', 'likes_count', 'dislikes_count', 'created_at')
     list_filter = ('room', 'is_deleted', 'is_edited', 'is_forwarded', 'is_pinned', 'created_at')
     search_fields = ('content', 'author__username', 'author__name')
-    readonly_fields = ('id', 'created_at', 'likes_count', 'dislikes_count')
+    readonly_fields = ('id', 'created_at', 'likes_count', 'dislikes_count', 'clean_content', 'content_snippet', 'mention_text')
     raw_id_fields = ('author', 'parent', 'edited_by', 'pinned_by')
 
-    def content_snippet(self, obj):
-        return obj.content[:100] + '...' if len(obj.content) > 100 else obj.content
-    content_snippet.short_description = 'Содержимое'
-
     def has_change_permission(self, request, obj=None):
         """Запрещаем изменение сообщений через админку для защиты истории"""
         return False
@@ -28,6 +24,26 @@ class MessageAdmin(admin.ModelAdmin):
         """Запрещаем удаление сообщений через админку - только мягкое удаление"""
         return False
 
+@admin.register(ArchivedMessage)
+class ArchivedMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'author', 'room', 'content_snippet', 'is_deleted', 'created_at', 'archived_at')
+    list_filter = ('room', 'is_deleted', 'archived_at')
+    search_fields = ('content', 'author__username', 'author__name')
+    readonly_fields = ('id', 'created_at', 'archived_at', 'entry')
+    raw_id_fields = ('author',)
+
+    def content_snippet(self, obj):
+        return obj.content[:100] + '...' if len(obj.content) > 100 else obj.content
+    content_snippet.short_description = 'Содержимое'
+
+    def has_add_permission(self, request):
+        """Архив наполняется только командой archive_chat_messages"""
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        """Архив только для чтения"""
+        return False
+
 @admin.register(MessageReaction)
 class MessageReactionAdmin(admin.ModelAdmin):
     list_display = ('user', 'message_snippet', 'reaction_type', 'created_at')
@@ -0,0 +1,214 @@
+"""
+Архивация старых сообщений чата.
+
+Сообщения старше CHAT_ARCHIVE_AFTER_DAYS переносятся из Message в таблицу
+ArchivedMessage пачками по CHAT_ARCHIVE_BATCH_SIZE (команда
+archive_chat_messages и периодическая задача chat.tasks.archive_old_messages).
+Таблица Message и ее индексы остаются размером "последние дни", так что
+горячие запросы и обслуживание БД не дорожают с ростом истории.
+
+В Message остаются:
+- закрепленные сообщения (закрепы всегда показываются и меняются в консьюмере);
+- сообщения, на которые отвечают оставшиеся в Message (иначе ответ потеряет
+  ссылку parent через SET_NULL) - вместе с цепочкой их собственных родителей.
+
+Архивная запись хранит снимок build_cache_entries: реакции, счетчики и блок
+ответа замораживаются на момент архивации. Архив только для чтения -
+правки, реакции и ответы к архивным сообщениям отклоняются как к удаленным.
+Архивные сообщения не участвуют в поиске и считаются прочитанными: счетчики
+позиций, читавших комнату раньше границы архива, пересчитываются сразу после
+переноса (reconcile_counters), так что сверка счетчиков не находит расхождений.
+
+Чтение истории (fetch_room_page) сначала идет в Message и обращается к архиву,
+только если страница выходит за Room.archived_until или Message исчерпан,
+поэтому загрузка свежих страниц не делает лишних запросов. Граница берется из
+комнаты подключения (ConnectionState, реестр chat.rooms - он сбрасывается после
+архивации): подключение, открытое до первой архивации комнаты, увидит архив
+после переподключения.
+"""
+import logging
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .history_cache import get_history_cache
+from .models import ArchivedMessage, Message, Room, UserChatPosition
+from .pagination import DIRECTION_AFTER, DIRECTION_AROUND, DIRECTION_BEFORE, decode_cursor, encode_cursor, fetch_page
+from .rooms import invalidate_rooms
+from .serializers import MESSAGE_RELATED_FIELDS, build_cache_entries
+
+logger = logging.getLogger(__name__)
+
+
+def archive_old_messages(older_than_days=None, rooms=None, batch_size=None):
+    """Архивирует сообщения старше older_than_days дней во всех (или указанных) комнатах; возвращает их число"""
+    if older_than_days is None:
+        older_than_days = settings.CHAT_ARCHIVE_AFTER_DAYS
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    rooms = Room.objects.all() if rooms is None else rooms
+    return sum(archive_room(room, cutoff, batch_size) for room in rooms)
+
+
+def archive_room(room, cutoff, batch_size=None):
+    """Переносит в архив сообщения комнаты, созданные до cutoff; возвращает их число"""
+    batch_size = batch_size or settings.CHAT_ARCHIVE_BATCH_SIZE
+    keep = messages_to_keep(room, cutoff)
+    candidates = Message.objects.filter(room=room, created_at__lt=cutoff).exclude(id__in=keep)
+
+    archived = 0
+    while True:
+        # От новых к старым: ответы уходят в архив раньше своих родителей,
+        # и удаление родителя не обнуляет parent у еще не перенесенного ответа
+        batch = list(candidates.select_related(*MESSAGE_RELATED_FIELDS).order_by('-created_at', '-id')[:batch_size])
+        if not batch:
+            break
+        archive_batch(room, batch)
+        archived += len(batch)
+
+    if archived:
+        room.refresh_from_db(fields=['archived_until'])
+        # archived_until обновлен через update - сигналы не сработали, сбрасываем реестр комнат сами
+        invalidate_rooms()
+        settle_positions(room)
+        try:
+            async_to_sync(get_history_cache().clear)(room.name)
+        except Exception as e:
+            logger.error(f"Error clearing history cache after archiving {room.name}: {e}")
+        logger.info(f"Archived {archived} messages in {room.name} (before {cutoff.isoformat()})")
+    return archived
+
+
+def messages_to_keep(room, cutoff):
+    """ID старых сообщений, которые остаются в Message: закрепленные и родители оставшихся"""
+    old = Message.objects.filter(room=room, created_at__lt=cutoff)
+    keep = set(old.filter(is_pinned=True).values_list('id', flat=True))
+    keep |= set(old.filter(replies__created_at__gte=cutoff).values_list('id', flat=True))
+
+    frontier = keep
+    while frontier:
+        parents = set(Message.objects.filter(
+            id__in=frontier, parent__isnull=False
+        ).values_list('parent_id', flat=True))
+        frontier = parents - keep
+        keep |= frontier
+    return keep
+
+
+def archive_batch(room, messages):
+    """Копирует пачку сообщений в архив и удаляет их из Message в одной транзакции"""
+    now = timezone.now()
+    newest = max(message.created_at for message in messages)
+    archived = [
+        ArchivedMessage(
+            id=message.id, room_id=message.room_id, author_id=message.author_id, content=message.content,
+            created_at=message.created_at, is_deleted=message.is_deleted, entry=entry, archived_at=now,
+        )
+        for message, entry in zip(messages, build_cache_entries(messages))
+    ]
+    with transaction.atomic():
+        ArchivedMessage.objects.bulk_create(archived, ignore_conflicts=True)
+        Room.objects.filter(pk=room.pk).filter(
+            Q(archived_until__isnull=True) | Q(archived_until__lt=newest)
+        ).update(archived_until=newest)
+        # Реакции и упоминания удаляются каскадно, строки поиска - сигналом post_delete
+        Message.objects.filter(id__in=[message.id for message in messages]).delete()
+
+
+def settle_positions(room):
+    """Пересчитывает счетчики позиций, в которые входили перенесенные в архив сообщения"""
+    boundary = room.archived_until
+    positions = UserChatPosition.objects.filter(room=room).filter(
+        Q(last_read_at__lt=boundary) | Q(last_visit_at__lt=boundary)
+    )
+    return UserChatPosition.reconcile_counters(positions)
+
+
+def find_message(room, message_id):
+    """Неудаленное сообщение комнаты (только id и created_at) из Message или архива; None, если его нет"""
+    message = Message.objects.filter(
+        id=message_id, room=room, is_deleted=False
+    ).only('id', 'created_at').first()
+    if message is None and room.archived_until is not None:
+        message = ArchivedMessage.objects.filter(
+            id=message_id, room=room, is_deleted=False
+        ).only('id', 'created_at').first()
+    return message
+
+
+def fetch_room_page(room, cursor=None, direction=DIRECTION_BEFORE, limit=50):
+    """
+    fetch_page по истории комнаты с учетом архива: в странице могут быть и
+    Message, и ArchivedMessage (сериализация - serialize_messages).
+    """
+    page = fetch_page(
+        Message.objects.filter(room=room, is_deleted=False).select_related(*MESSAGE_RELATED_FIELDS),
+        cursor, direction, limit
+    )
+    if not _reaches_archive(room, page, cursor, direction):
+        return page
+
+    archived = fetch_page(ArchivedMessage.objects.filter(room=room, is_deleted=False), cursor, direction, limit)
+    return merge_pages(page, archived, cursor, direction, limit)
+
+
+def _reaches_archive(room, page, cursor, direction):
+    """Могут ли в странице оказаться архивные сообщения (все они не новее Room.archived_until)"""
+    boundary = room.archived_until
+    if boundary is None:
+        return False
+    key = decode_cursor(cursor) if cursor else None
+    if direction in (DIRECTION_AFTER, DIRECTION_AROUND) and key and key[0] <= boundary:
+        return True
+    if direction in (DIRECTION_BEFORE, DIRECTION_AROUND):
+        if not page['has_more_before']:
+            # Message исчерпан - продолжение истории может быть только в архиве
+            return True
+        oldest = next(message for message in page['messages'] if key is None or _key(message) < key)
+        return oldest.created_at <= boundary
+    return False
+
+
+def merge_pages(first, second, cursor, direction, limit):
+    """Объединяет две страницы fetch_page с одинаковыми параметрами в одну"""
+    key = decode_cursor(cursor) if cursor else None
+    messages = sorted(first['messages'] + second['messages'], key=_key)
+    before = [message for message in messages if key is None or _key(message) < key]
+    after = [message for message in messages if key is not None and _key(message) >= key]
+
+    has_more_before = first['has_more_before'] or second['has_more_before'] or len(before) > limit
+    before = before[-limit:]
+    after_limit = limit + 1 if direction == DIRECTION_AROUND else limit
+    has_more_after = first['has_more_after'] or second['has_more_after'] or len(after) > after_limit
+    after = after[:after_limit]
+
+    messages = before + after
+    return {
+        'messages': messages,
+        'before_cursor': first['before_cursor'] if not messages else encode_cursor(messages[0]),
+        'after_cursor': first['after_cursor'] if not messages else encode_cursor(messages[-1]),
+        'has_more_before': has_more_before,
+        'has_more_after': has_more_after,
+    }
+
+
+def build_entries(messages):
+    """Записи горячего кеша для страницы fetch_room_page (архивные - из снимка)"""
+    hot = iter(build_cache_entries([message for message in messages if isinstance(message, Message)]))
+    return [next(hot) if isinstance(message, Message) else message.entry for message in messages]
+
+
+def serialize_messages(serializer, messages):
+    """Сериализует страницу fetch_room_page для получателя (архивные - из снимка, без запросов)"""
+    hot = iter(serializer.serialize([message for message in messages if isinstance(message, Message)]))
+    return [
+        next(hot) if isinstance(message, Message) else serializer.from_cache_entry(message.entry)
+        for message in messages
+    ]
+
+
+def _key(message):
+    return message.created_at, message.id
@@ -0,0 +1,128 @@
+"""
+Серверное прореживание частых событий чата.
+
+Индикатор печати: клиент может присылать кадр typing на каждое нажатие клавиши,
+но в группу уходит не больше одной рассылки за CHAT_TYPING_WINDOW_MS, а если
+кадры перестали приходить, через CHAT_TYPING_TIMEOUT_MS сервер сам рассылает
+"перестал печатать".
+
+Позиция прокрутки: кадры save_position приходят на каждый скролл, но в БД
+записывается только последняя позиция - не чаще раза в CHAT_POSITION_FLUSH_MS
+и обязательно при отключении.
+
+Счетчики metrics (на процесс) показывают, сколько кадров пришло, сколько из них
+разослано или записано и сколько отброшено.
+"""
+import asyncio
+import time
+from collections import Counter
+
+from django.conf import settings
+
+# Счетчики процесса: typing_frames/typing_broadcasts/typing_dropped/typing_auto_stops,
+# position_frames/position_writes/position_writes_saved
+metrics = Counter()
+
+
+class CoalescerStats:
+    """Счетчики одного подключения, дублируемые в общие счетчики процесса"""
+
+    def __init__(self):
+        self.stats = Counter()
+
+    def count(self, name):
+        self.stats[name] += 1
+        metrics[name] += 1
+
+
+class TypingCoalescer(CoalescerStats):
+    """Индикатор печати одного подключения"""
+
+    def __init__(self, broadcast):
+        super().__init__()
+        # broadcast(is_typing) - корутина, рассылающая состояние в группу
+        self.broadcast = broadcast
+        self.is_typing = False
+        self.last_broadcast_at = 0.0
+        self.stop_at = 0.0
+        self.stop_task = None
+
+    async def update(self, is_typing):
+        """Обрабатывает кадр typing от клиента"""
+        self.count('typing_frames')
+        if is_typing:
+            self.stop_at = time.monotonic() + settings.CHAT_TYPING_TIMEOUT_MS / 1000
+            if self.stop_task is None:
+                self.stop_task = asyncio.create_task(self.stop_on_timeout())
+
+            now = time.monotonic()
+            if self.is_typing and now - self.last_broadcast_at < settings.CHAT_TYPING_WINDOW_MS / 1000:
+                self.count('typing_dropped')
+                return
+            self.last_broadcast_at = now
+            await self.send(True)
+        elif self.is_typing:
+            await self.send(False)
+        else:
+            self.count('typing_dropped')
+
+    async def stop(self):
+        """Рассылает "перестал печатать" при отключении, если пользователь печатал"""
+        if self.stop_task is not None:
+            self.stop_task.cancel()
+            self.stop_task = None
+        if self.is_typing:
+            await self.send(False)
+
+    async def stop_on_timeout(self):
+        # Каждый новый кадр typing сдвигает stop_at - спим, пока срок не наступит
+        while (delay := self.stop_at - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+        self.stop_task = None
+        if self.is_typing:
+            self.count('typing_auto_stops')
+            await self.send(False)
+
+    async def send(self, is_typing):
+        self.is_typing = is_typing
+        self.count('typing_broadcasts')
+        await self.broadcast(is_typing)
+
+
+class PositionBuffer(CoalescerStats):
+    """Отложенная запись позиции прокрутки одного подключения"""
+
+    def __init__(self, write):
+        super().__init__()
+        # write(last_visible_message_id, scroll_position_percent) - корутина, записывающая позицию в БД
+        self.write = write
+        self.pending = None
+        self.flush_task = None
+
+    async def update(self, last_visible_message_id, scroll_position_percent):
+        """Запоминает позицию; запись в БД - не позже чем через CHAT_POSITION_FLUSH_MS"""
+        self.count('position_frames')
+        if self.pending is not None:
+            # Предыдущая позиция еще не записана - она заменяется новой
+            self.count('position_writes_saved')
+            last_visible_message_id = last_visible_message_id or self.pending[0]
+        self.pending = (last_visible_message_id, scroll_position_percent)
+
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(settings.CHAT_POSITION_FLUSH_MS / 1000)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        """Записывает отложенную позицию немедленно (по таймеру или при отключении)"""
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        if self.pending is None:
+            return
+        pending, self.pending = self.pending, None
+        self.count('position_writes')
+        await self.write(*pending)
@@ -0,0 +1,62 @@
+"""
+Состояние websocket-подключения к чату.
+
+Комната (из реестра chat.rooms) и позиция пользователя загружаются один раз
+при подключении и дальше берутся из памяти: обработчики кадров не ищут комнату
+и не делают UserChatPosition.get_or_create_for_user на каждое сообщение,
+реакцию или скролл.
+
+Позиция меняется и в обход подключения: счетчики непрочитанных увеличиваются
+F-выражениями при сообщениях других пользователей, отметку прочтения может
+сдвинуть другая вкладка. Поэтому изменяемые поля перечитываются явно -
+refresh_position() одним запросом перед отправкой unread_info, а после сбоя
+обработчика состояние сбрасывается invalidate() и загружается заново.
+"""
+from .models import Room, UserChatPosition
+from .rooms import get_room
+
+# Поля позиции, которые могут измениться в обход подключения
+POSITION_REFRESH_FIELDS = [
+    'unread_count', 'personal_notifications_count', 'last_read_at', 'last_visit_at',
+    'last_message_id', 'last_visible_message_id', 'scroll_position_percent',
+]
+
+
+class ConnectionState:
+    """Комната и позиция пользователя одного подключения (доступ - только из синхронного кода)"""
+
+    def __init__(self, user, room_name, room=None):
+        self.user = user
+        self.room_name = room_name
+        self._room = room
+        self._position = None
+
+    @property
+    def room(self):
+        if self._room is None:
+            self._room = get_room(self.room_name)
+            if self._room is None:
+                raise Room.DoesNotExist(f"Room {self.room_name} does not exist")
+        return self._room
+
+    @property
+    def position(self):
+        if self._position is None:
+            position = UserChatPosition.get_or_create_for_user(self.user, self.room)
+            # Связи уже в памяти - position.room и position.user не делают запросов
+            position.room = self.room
+            position.user = self.user
+            self._position = position
+        return self._position
+
+    def refresh_position(self):
+        """Перечитывает изменяемые в обход подключения поля позиции (один запрос)"""
+        if self._position is None:
+            return self.position
+        self._position.refresh_from_db(fields=POSITION_REFRESH_FIELDS)
+        return self._position
+
+    def invalidate(self):
+        """Сбрасывает комнату и позицию - при следующем обращении они загрузятся из БД"""
+        self._room = None
+        self._position = None
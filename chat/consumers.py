@@ -1,48 +1,121 @@
+import asyncio
 import json
 import logging
+import time
+from collections import Counter
 from datetime import datetime
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.utils import timezone
-from django.core.paginator import Paginator
-from asgiref.sync import async_to_sync
-from channels.generic.websocket import WebsocketConsumer, AsyncWebsocketConsumer
+from django.db import IntegrityError, transaction
+from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 
-from .models import Room, Message, UserChatPosition
+from .models import Message, MessageMention, MessageReaction, UserChatPosition
+from .archive import build_entries, fetch_room_page, find_message, serialize_messages
+from .connection import ConnectionState
+from .presence import get_presence_backend, get_room_access_count
+from .rooms import get_available_room
+from .protocol import DEFAULT_CODEC, negotiate
+from .coalescing import PositionBuffer, TypingCoalescer
+from .event_log import REPLAYABLE_EVENTS, get_event_log
+from .history_cache import get_history_cache, page_from_window
+from .rate_limit import get_budget, get_rate_limiter, metrics as rate_limit_metrics
+from .pagination import DIRECTION_AFTER, DIRECTION_AROUND, DIRECTION_BEFORE, encode_cursor
+from .search import MAX_SEARCH_RESULTS, index_messages, search_messages
+from .serializers import ChatMessageSerializer, MESSAGE_RELATED_FIELDS, broadcast_message, build_cache_entries
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Максимальный размер страницы истории, который может запросить клиент
+MAX_PAGE_SIZE = 100
 
-class BaseChatConsumer(WebsocketConsumer):
-    """Базовый консьюмер для кастомного чата "Беседка" с поддержкой системы ответов"""
+# Пакетные действия (forward_messages, delete_messages, pin_messages): сообщений в кадре
+# и комнат назначения для пересылки
+MAX_BATCH_MESSAGES = 50
+MAX_FORWARD_ROOMS = 10
 
-    def connect(self):
-        """Подключение к WebSocket"""
-        # room_name должен быть установлен дочерним классом перед вызовом super().connect()
-        if not hasattr(self, 'room_name'):
-            self.close()
-            return
+# Верхняя граница запросов к БД на подключение: connect - до 3 (комната при холодном
+# реестре chat.rooms, позиция, запись первого визита), первый fetch_messages - окно кеша из БД при холодном кеше (2),
+# load_bootstrap (до 8) и количество пользователей с доступом при промахе кеша (1)
+CONNECT_QUERY_BUDGET = 14
 
-        self.room_group_name = f"chat_{self.room_name}"
+
+class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    Асинхронный консьюмер для кастомного чата "Беседка" с поддержкой системы ответов.
+
+    Один маршрут ws/chat/<room>/ для всех комнат: комната, ее политика доступа и
+    ограничения берутся из реестра комнат (chat.rooms), подключение к
+    несуществующей, неактивной или недоступной пользователю комнате отклоняется.
+
+    Все обработчики - корутины: рассылка в группу и отправка клиенту не занимают
+    поток. Работа с БД собрана в синхронные методы, обернутые в database_sync_to_async,
+    по одному переходу в поток на обработчик.
+    """
+
+    # Загрузки окна истории из БД, идущие в этом процессе: {room_name: Future}
+    history_loads = {}
+
+    # Кодек кадров; другой согласуется при подключении (chat.protocol.negotiate)
+    codec = DEFAULT_CODEC
+
+    async def connect(self):
+        """Подключение к WebSocket"""
+        self.room_name = self.scope["url_route"]["kwargs"]["room_name"]
         self.user = self.scope["user"]
 
         if self.user.is_anonymous:
-            self.close()
+            await self.close()
+            return
+
+        # 🏠 Комната из реестра (без запроса к БД, если реестр процесса уже ее знает)
+        room = await database_sync_to_async(get_available_room)(self.room_name, self.user)
+        if room is None:
+            logger.warning(f"User {self.user.username} denied access to chat {self.room_name}")
+            await self.close()
             return
+        self.max_message_length = room.max_message_length
+
+        self.room_group_name = f"chat_{self.room_name}"
 
         # Добавляем пользователя в группу чата
-        async_to_sync(self.channel_layer.group_add)(
+        await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
 
-        self.accept()
+        # 📦 Протокол кадров: JSON по умолчанию или MessagePack (подпротокол websocket или ?protocol=)
+        self.codec, subprotocol = negotiate(self.scope)
+        await self.accept(subprotocol)
+
+        # Прореживание частых событий: typing рассылается не чаще окна, позиция пишется в БД отложенно
+        self.typing = TypingCoalescer(self.broadcast_typing)
+        self.position_buffer = PositionBuffer(self.write_position)
+
+        # 🚦 Отброшенные ограничителем частоты кадры и время последнего ответа rate_limited по типам
+        self.throttled = Counter()
+        self.throttle_notified = {}
+
+        # 🏠 Комната и позиция загружаются один раз на подключение (chat.connection)
+        # 📬 ИСПРАВЛЕНО: НЕ ОТПРАВЛЯЕМ unread_info здесь - отправим ПОСЛЕ истории сообщений
+        self.state = ConnectionState(self.user, self.room_name, room)
+        await self.init_user_position()
+
+        # 👥 Регистрируем подключение в реестре присутствия и уведомляем других, если пользователь появился в сети
+        presence = get_presence_backend()
+        if await presence.connect(self.room_name, self.user.id, self.channel_name, self.user_to_json(self.user)):
+            await self.send_presence_diff(joined=[self.user_to_json(self.user)])
 
+        logger.info(f"User {self.user.username} connected to chat {self.room_name}")
+
+    @database_sync_to_async
+    def init_user_position(self):
+        """Получает позицию пользователя и инициализирует ее при первом визите"""
         # 🔧 ИСПРАВЛЕНО: Правильная последовательность инициализации позиции
-        room, _ = Room.objects.get_or_create(name=self.room_name)
-        position = UserChatPosition.get_or_create_for_user(self.user, room)
+        position = self.state.position
 
         # 🎯 ИСПРАВЛЕННАЯ ЛОГИКА: Определяем первый визит по last_read_at (единая логика!)
         is_first_visit = position.last_read_at is None
@@ -55,98 +128,143 @@ class BaseChatConsumer(WebsocketConsumer):
             current_time = timezone.now()
             position.last_visit_at = current_time
             position.last_read_at = current_time
-            position.save()
+            position.save(update_fields=['last_visit_at', 'last_read_at', 'updated_at'])
             logger.info(f"First visit: initialized position for {self.user.username} in {self.room_name} at {current_time}")
         else:
             # НЕ обновляем время визита при входе - это уничтожает персональные уведомления!
             # last_visit_at должен обновляться только при ВЫХОДЕ из чата
             logger.info(f"Return visit for {self.user.username} in {self.room_name} - keeping last_visit_at as is")
 
-        # Обновляем position после изменений
-        position.refresh_from_db()
-
-        # 📬 ИСПРАВЛЕНО: НЕ ОТПРАВЛЯЕМ unread_info здесь - отправим ПОСЛЕ истории сообщений
-        # Сохраняем позицию для позднейшего использования
-        self.user_position = position
-
-        # Уведомляем других о подключении
-        async_to_sync(self.channel_layer.group_send)(
-            self.room_group_name, {
-                "type": "user_joined",
-                "user": self.user_to_json(self.user)
-            }
-        )
-
-        logger.info(f"User {self.user.username} connected to chat {self.room_name}")
-
-    def disconnect(self, close_code):
+    async def disconnect(self, close_code):
         """Отключение от WebSocket"""
         if hasattr(self, 'room_group_name'):
+            if hasattr(self, 'typing'):
+                # Записываем отложенную позицию и снимаем индикатор печати
+                await self.position_buffer.flush()
+                await self.typing.stop()
+                logger.info(
+                    f"Coalescing for {self.user.username} in {self.room_name}: "
+                    f"typing {self.typing.stats['typing_broadcasts']}/{self.typing.stats['typing_frames']} frames broadcast, "
+                    f"positions {self.position_buffer.stats['position_writes']}/{self.position_buffer.stats['position_frames']} frames written"
+                )
+                if self.throttled:
+                    logger.warning(f"Throttled frames for {self.user.username} in {self.room_name}: {dict(self.throttled)}")
+
             # Обновляем last_visit_at при ВЫХОДЕ из чата
             try:
-                room = Room.objects.get(name=self.room_name)
-                position = UserChatPosition.get_or_create_for_user(self.user, room)
-                position.mark_visit()  # Теперь обновляем при выходе, а не при входе
+                await self.mark_visit()
                 logger.info(f"Updated last_visit_at on disconnect for {self.user.username} in {self.room_name}")
             except Exception as e:
                 logger.error(f"Error updating last_visit_at on disconnect: {e}")
 
-            # Уведомляем группу об отключении пользователя
-            async_to_sync(self.channel_layer.group_send)(
-                self.room_group_name, {
-                    "type": "user_left",
-                    "user": self.user_to_json(self.user)
-                }
-            )
+            # Уведомляем группу, если у пользователя не осталось подключений
+            if not self.user.is_anonymous:
+                presence = get_presence_backend()
+                if await presence.disconnect(self.room_name, self.user.id, self.channel_name):
+                    await self.send_presence_diff(left=[self.user_to_json(self.user)])
 
-            async_to_sync(self.channel_layer.group_discard)(
+            await self.channel_layer.group_discard(
                 self.room_group_name, self.channel_name
             )
         logger.info(f"User {self.user.username} disconnected from room {self.room_name}")
 
-    def receive(self, text_data):
+    @database_sync_to_async
+    def mark_visit(self):
+        """Отмечает визит пользователя (вызывается при выходе из чата)"""
+        self.state.position.mark_visit()  # Теперь обновляем при выходе, а не при входе
+
+    async def receive(self, text_data=None, bytes_data=None):
         """Получение сообщений от клиента с поддержкой различных типов"""
         try:
-            data = json.loads(text_data)
+            data = self.codec.decode(text_data if text_data is not None else bytes_data)
+        except ValueError as e:
+            logger.error(f"Invalid frame received: {e}")
+            return
+
+        try:
             message_type = data.get('type', 'message')
 
+            # 🚦 Кадры сверх бюджета пользователя отбрасываются до любой работы с БД
+            if not await self.check_rate_limit(message_type):
+                return
+
             if message_type == 'message':
-                self.handle_chat_message(data)
+                await self.handle_chat_message(data)
             elif message_type == 'fetch_messages':
-                self.send_message_history(data.get('page', 1))
+                await self.send_message_history(data.get('resume_from'))
             elif message_type == 'fetch_online_users':
-                self.send_online_users()
+                await self.send_online_users()
+            elif message_type == 'heartbeat':
+                await self.handle_heartbeat()
             elif message_type == 'typing':
-                self.handle_typing(data)
+                await self.handle_typing(data)
             elif message_type == 'reaction':
-                self.handle_reaction(data)
+                await self.handle_reaction(data)
             elif message_type == 'edit_message':
-                self.handle_edit_message(data)
+                await self.handle_edit_message(data)
             elif message_type == 'delete_message':
-                self.handle_delete_message(data)
+                await self.handle_delete_message(data)
             elif message_type == 'forward_message':
-                self.handle_forward_message(data)
+                await self.handle_forward_message(data)
             elif message_type == 'pin_message':
-                self.handle_pin_message(data)
+                await self.handle_pin_message(data)
             elif message_type == 'unpin_message':
-                self.handle_unpin_message(data)
+                await self.handle_unpin_message(data)
+            elif message_type == 'forward_messages':
+                await self.handle_forward_messages(data)
+            elif message_type == 'delete_messages':
+                await self.handle_delete_messages(data)
+            elif message_type == 'pin_messages':
+                await self.handle_pin_messages(data)
             elif message_type == 'mark_as_read':
-                self.handle_mark_as_read(data)
+                await self.handle_mark_as_read(data)
             elif message_type == 'load_more_messages':
-                self.handle_load_more_messages(data)
+                await self.handle_load_more_messages(data)
             elif message_type == 'save_position':
-                self.handle_save_position(data)
+                await self.handle_save_position(data)
             elif message_type == 'load_message_context':
-                self.handle_load_message_context(data)
+                await self.handle_load_message_context(data)
+            elif message_type == 'search_messages':
+                await self.handle_search_messages(data)
             else:
                 logger.warning(f"Unknown message type: {message_type}")
 
-        except json.JSONDecodeError:
-            logger.error(f"Invalid JSON received: {text_data}")
         except Exception as e:
             logger.error(f"Error processing message: {e}")
+            # Комната или позиция могли измениться в обход подключения - перечитаем при следующем обращении
+            if hasattr(self, 'state'):
+                self.state.invalidate()
+
+    async def check_rate_limit(self, message_type):
+        """Забирает токен для кадра (chat.rate_limit); при исчерпанном бюджете отвечает ошибкой rate_limited"""
+        try:
+            allowed, retry_after = await get_rate_limiter().allow(self.user.id, message_type)
+        except Exception as e:
+            # Сбой ограничителя не должен останавливать чат
+            logger.error(f"Error checking rate limit: {e}")
+            return True
+        if allowed:
+            return True
 
-    def handle_chat_message(self, data):
+        action = get_budget(message_type)[0]
+        rate_limit_metrics['throttled'] += 1
+        rate_limit_metrics[f'throttled:{action}'] += 1
+        self.throttled[action] += 1
+
+        # Флуд не должен превращаться в поток ответов: ошибка - не чаще раза в секунду на тип кадра
+        now = time.monotonic()
+        if now - self.throttle_notified.get(action, 0.0) >= 1:
+            self.throttle_notified[action] = now
+            await self.send_frame({
+                "type": "error",
+                "code": "rate_limited",
+                "action": message_type,
+                "retry_after": round(retry_after, 1),
+                "message": "Слишком много запросов, попробуйте чуть позже"
+            })
+        return False
+
+    async def handle_chat_message(self, data):
         """Обработка текстового сообщения с поддержкой ответов"""
         content = data.get('message', '').strip()
         reply_to_id = data.get('reply_to_id')
@@ -154,8 +272,21 @@ class BaseChatConsumer(WebsocketConsumer):
         if not content:
             return
 
-        # Получаем или создаем комнату
-        room, created = Room.objects.get_or_create(name=self.room_name)
+        if not await self.check_message_length(content):
+            return
+
+        cache_entry, mentioned_user_ids = await self.create_chat_message(content, reply_to_id)
+        await self.update_history_cache(get_history_cache().append(self.room_name, cache_entry))
+
+        # Отправляем сообщение в группу
+        await self.broadcast("new_message", {
+            "message": broadcast_message(cache_entry, mentioned_user_ids)
+        })
+
+    @database_sync_to_async
+    def create_chat_message(self, content, reply_to_id):
+        """Сохраняет новое сообщение, возвращает запись для кеша истории и ID упомянутых пользователей"""
+        room = self.state.room
 
         # Обрабатываем ответ на сообщение
         parent_message = None
@@ -165,142 +296,215 @@ class BaseChatConsumer(WebsocketConsumer):
             except Message.DoesNotExist:
                 logger.warning(f"Reply target message {reply_to_id} not found")
 
-        # Создаем сообщение
-        message = Message.objects.create(
-            room=room,
-            author=self.user,
-            content=content,
-            parent=parent_message
-        )
-
         # 🎯 НОВАЯ ЛОГИКА: При первом сообщении устанавливаем last_read_at
-        position = UserChatPosition.get_or_create_for_user(self.user, room)
+        position = self.state.position
         if position.last_read_at is None:
             # Первое сообщение пользователя - теперь он "читает" чат
             position.last_read_at = timezone.now()
-            position.save()
+            position.save(update_fields=['last_read_at', 'updated_at'])
             logger.info(f"First message sent: set last_read_at for {self.user.username} in {self.room_name}")
 
+        # Создаем сообщение, индексируем упоминания и ответ, инкрементально обновляем счетчики позиций
+        with transaction.atomic():
+            message = Message.objects.create(
+                room=room,
+                author=self.user,
+                content=content,
+                parent=parent_message
+            )
+            mentioned_user_ids = MessageMention.index_message(message)
+            UserChatPosition.register_new_message(message)
+
         # 🚫 УДАЛЕНА НЕПРАВИЛЬНАЯ АВТООТМЕТКА ПРИ ОТПРАВКЕ СООБЩЕНИЯ
         # Отправка сообщения НЕ означает прочтение всей истории чата!
 
-        # Отправляем сообщение в группу
-        async_to_sync(self.channel_layer.group_send)(
-            self.room_group_name, {
-                "type": "new_message",
-                "message": self.message_to_json(message)
-            }
-        )
+        return build_cache_entries([message])[0], mentioned_user_ids
+
+    async def send_message_history(self, resume_from=None):
+        """
+        Начальная загрузка подключения (bootstrap): история, unread_info, закрепленные
+        сообщения и список онлайн за фиксированное число запросов (см. load_bootstrap).
+        При переподключении (resume_from - seq последнего полученного события)
+        вместо истории отправляются только пропущенные события, если журнал комнаты их покрывает.
+        """
+        try:
+            resume_from = int(resume_from) if resume_from is not None else None
+        except (TypeError, ValueError):
+            resume_from = None
 
-    def send_message_history(self, page=1):
-        """Отправка истории сообщений с поддержкой непрочитанных сообщений"""
         try:
-            room, created = Room.objects.get_or_create(name=self.room_name)
-
-            # Получаем позицию пользователя для определения непрочитанных
-            user_position = UserChatPosition.get_or_create_for_user(self.user, room)
-
-            # 🔧 УМНАЯ ЗАГРУЗКА: Загружаем относительно позиции пользователя
-            if user_position.last_visible_message_id:
-                # Пользователь был в конкретном месте - загружаем от этого места
-                try:
-                    anchor_message = Message.objects.get(id=user_position.last_visible_message_id, room=room, is_deleted=False)
-                    # Загружаем 50 сообщений до позиции и 50 после
-                    messages_before = Message.objects.filter(
-                        room=room, is_deleted=False, created_at__lt=anchor_message.created_at
-                    ).select_related('author', 'parent', 'parent__author').order_by('-created_at')[:50]
-
-                    messages_after = Message.objects.filter(
-                        room=room, is_deleted=False, created_at__gte=anchor_message.created_at
-                    ).select_related('author', 'parent', 'parent__author').order_by('created_at')[:50]
-
-                    # Объединяем сообщения в правильном порядке
-                    messages = list(reversed(messages_before)) + list(messages_after)
-                    logger.info(f"Smart loading: {len(messages_before)} before + {len(messages_after)} after anchor {user_position.last_visible_message_id}")
-                except Message.DoesNotExist:
-                    # Якорное сообщение удалено - загружаем стандартно
-                    messages = Message.objects.filter(room=room, is_deleted=False).select_related(
-                        'author', 'parent', 'parent__author'
-                    ).order_by('-created_at')[:100]
-                    messages = list(reversed(messages))
+            if resume_from is not None and await self.send_replay(resume_from):
+                await self.send_unread_info()
             else:
-                # Новый пользователь или нет сохраненной позиции - загружаем последние 100
-                messages = Message.objects.filter(room=room, is_deleted=False).select_related(
-                    'author', 'parent', 'parent__author'
-                ).order_by('-created_at')[:100]
-                messages = list(reversed(messages))
-
-            # Конвертируем в JSON
-            messages_data = []
-            for msg in messages:
-                message_json = self.message_to_json(msg, is_history=True)
-
-                # 🔧 ИСПРАВЛЕНО: Правильная логика определения прочитанности
-                if user_position.last_read_at:
-                    # Пользователь уже посещал чат - сравниваем с last_read_at
-                    message_json['is_read'] = msg.created_at <= user_position.last_read_at
-                else:
-                    # Новый пользователь - все исторические сообщения считаются прочитанными
-                    # (это исправляется в connect(), но на всякий случай)
-                    message_json['is_read'] = True
-
-                # 🎯 НОВОЕ: Отмечаем персональные уведомления
-                message_json['is_personal_notification'] = msg.is_personal_notification_for(self.user)
-
-                messages_data.append(message_json)
-
-            # Отправляем историю сообщений
-            self.send(text_data=json.dumps({
-                "type": "messages_history",
-                "messages": messages_data
-            }))
-
-            # 📬 КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Отправляем unread_info ПОСЛЕ истории сообщений
-            # Используем позицию из connect() если она есть, иначе текущую
-            position_to_use = getattr(self, 'user_position', user_position)
-            self.send_unread_info(position_to_use)
+                # Номер читается до загрузки истории: события после него клиент сможет догрузить
+                last_seq = await self.get_last_seq()
+                window = await self.get_history_window()
+                page, messages_data, unread_info = await self.load_bootstrap(window)
+
+                # Отправляем историю сообщений вместе с курсорами для догрузки в обе стороны
+                await self.send_frame({
+                    "type": "messages_history",
+                    "messages": messages_data,
+                    "last_seq": last_seq,
+                    "before_cursor": page['before_cursor'],
+                    "after_cursor": page['after_cursor'],
+                    "has_more_before": page['has_more_before'],
+                    "has_more_after": page['has_more_after']
+                })
+
+                # 📬 КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Отправляем unread_info ПОСЛЕ истории сообщений
+                await self.send_frame(unread_info)
 
         except Exception as e:
             logger.error(f"Error sending message history: {e}")
 
-    def send_online_users(self):
-        """Отправка списка онлайн пользователей и общего количества пользователей с доступом"""
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-
-        # 👥 ПОДСЧЕТ ОБЩЕГО КОЛИЧЕСТВА ПОЛЬЗОВАТЕЛЕЙ С ДОСТУПОМ К ЧАТУ
-        if self.room_name == 'vip':
-            # VIP чат - только владельцы и администрация магазина
-            total_users_count = User.objects.filter(
-                role__in=['owner', 'store_owner', 'store_admin']
-            ).count()
-        elif self.room_name == 'moderators':
-            # Чат модераторов - только модераторы и владельцы
-            total_users_count = User.objects.filter(
-                role__in=['owner', 'moderator']
-            ).count()
+        # 👥 Список онлайн - в том же шаге, отдельный fetch_online_users клиенту не нужен
+        await self.send_online_users()
+
+    async def send_replay(self, resume_from):
+        """Отправляет события комнаты после resume_from; False, если пропуск больше журнала"""
+        try:
+            events = await get_event_log().since(self.room_name, resume_from)
+        except Exception as e:
+            logger.error(f"Error reading event log for {self.room_name}: {e}")
+            return False
+        if events is None:
+            logger.info(f"Replay gap for {self.user.username} in {self.room_name} after seq {resume_from}, sending full history")
+            return False
+
+        # События уже закодированы - собираем кадр без повторной сериализации
+        await self.send_encoded('{"type": "replay", "resume_from": %d, "events": [%s]}' % (resume_from, ', '.join(events)))
+        logger.info(f"Replayed {len(events)} events for {self.user.username} in {self.room_name} after seq {resume_from}")
+        return True
+
+    async def get_last_seq(self):
+        try:
+            return await get_event_log().last_seq(self.room_name)
+        except Exception as e:
+            logger.error(f"Error reading event log for {self.room_name}: {e}")
+            return None
+
+    async def get_history_window(self):
+        """Окно последних сообщений комнаты из горячего кеша (при холодном кеше - из БД)"""
+        try:
+            window = await get_history_cache().get(self.room_name)
+            if window is None:
+                # Одновременные подключения к холодной комнате ждут одну загрузку из БД
+                load = self.history_loads.get(self.room_name)
+                if load is None:
+                    load = asyncio.ensure_future(self.fill_history_window())
+                    self.history_loads[self.room_name] = load
+                    load.add_done_callback(lambda _, room_name=self.room_name: self.history_loads.pop(room_name, None))
+                window = await asyncio.shield(load)
+            return window
+        except Exception as e:
+            logger.error(f"Error reading history cache for {self.room_name}: {e}")
+            return None
+
+    async def fill_history_window(self):
+        window = await self.load_history_window()
+        await get_history_cache().fill(self.room_name, window['entries'], window['has_more_before'])
+        return window
+
+    @database_sync_to_async
+    def load_history_window(self):
+        """Загружает из БД окно последних сообщений для горячего кеша"""
+        page = fetch_room_page(self.state.room, None, DIRECTION_BEFORE, settings.CHAT_HISTORY_CACHE_SIZE)
+        return {'entries': build_entries(page['messages']), 'has_more_before': page['has_more_before']}
+
+    async def update_history_cache(self, operation):
+        """Выполняет операцию над горячим кешем истории; сбой кеша не мешает работе чата"""
+        try:
+            await operation
+        except Exception as e:
+            logger.error(f"Error updating history cache: {e}")
+
+    @database_sync_to_async
+    def load_bootstrap(self, window=None):
+        """
+        Данные начальной загрузки за один переход в поток. Комната и позиция уже
+        в состоянии подключения, поэтому запросов не больше:
+        - 1: свежие поля позиции (refresh_position);
+        - 0 из теплого окна кеша, иначе до 5: якорь, выборки до и после него, реакции (2);
+        - 2: первое непрочитанное и первое персональное сообщение.
+        Закрепленные сообщения клиент отмечает по is_pinned в истории и событиям message_pinned.
+        """
+        position = self.state.refresh_position()
+        serializer = ChatMessageSerializer(self.user, position)
+        page, messages_data = self.get_message_history(serializer, window)
+        return page, messages_data, self.build_unread_info(position)
+
+    def get_message_history(self, serializer, window=None):
+        """Загружает историю сообщений относительно сохраненной позиции пользователя"""
+        room = self.state.room
+        user_position = serializer.position
+
+        # 🔥 Горячий кеш: окно последних сообщений покрывает и новых пользователей, и тех, кто недавно был в чате
+        page = page_from_window(window, user_position.last_visible_message_id) if window is not None else None
+        if page is not None:
+            return page, [serializer.from_cache_entry(entry) for entry in page['messages']]
+
+        # 🔧 УМНАЯ ЗАГРУЗКА: Загружаем относительно позиции пользователя
+        anchor_message = None
+        if user_position.last_visible_message_id:
+            # Якорное сообщение могло быть удалено - тогда загружаем стандартно (архивное - находится в архиве)
+            anchor_message = find_message(room, user_position.last_visible_message_id)
+
+        if anchor_message:
+            # Пользователь был в конкретном месте - 50 сообщений до позиции, сама позиция и 50 после
+            page = fetch_room_page(room, encode_cursor(anchor_message), DIRECTION_AROUND, limit=50)
+            logger.info(f"Smart loading: {len(page['messages'])} messages around anchor {user_position.last_visible_message_id}")
         else:
-            # Общий чат - все зарегистрированные пользователи
-            total_users_count = User.objects.filter(is_active=True).count()
+            # Новый пользователь или нет сохраненной позиции - загружаем последние 100
+            page = fetch_room_page(room, None, DIRECTION_BEFORE, limit=100)
 
-        # 🔍 ВРЕМЕННАЯ РЕАЛИЗАЦИЯ ОНЛАЙН ПОЛЬЗОВАТЕЛЕЙ
-        # TODO: В будущем можно заменить на Redis или более продвинутую систему
-        online_users = [
-            self.user_to_json(self.user)
-        ]
+        # Конвертируем в JSON одним пакетом (прочитанность и персональные уведомления - в сериализаторе)
+        return page, serialize_messages(serializer, page['messages'])
+
+    async def send_online_users(self):
+        """Отправка списка онлайн пользователей и общего количества пользователей с доступом"""
+        presence = get_presence_backend()
+        await self.expire_presence()
 
-        self.send(text_data=json.dumps({
+        online_users = await presence.online_users(self.room_name)
+        total_users_count = await database_sync_to_async(get_room_access_count)(self.room_name)
+
+        await self.send_frame({
             "type": "online_users",
             "users": online_users,
             "count": len(online_users),
             "total_count": total_users_count  # 📊 НОВОЕ ПОЛЕ - общее количество с доступом
-        }))
-
-    def handle_typing(self, data):
-        """Обработка индикатора печати"""
-        is_typing = data.get('is_typing', False)
-
-        async_to_sync(self.channel_layer.group_send)(
+        })
+
+    async def handle_heartbeat(self):
+        """Продление присутствия подключения и очистка "мертвых" сокетов комнаты"""
+        presence = get_presence_backend()
+        if await presence.heartbeat(self.room_name, self.user.id, self.channel_name, self.user_to_json(self.user)):
+            # Подключение уже успело истечь - пользователь снова в сети
+            await self.send_presence_diff(joined=[self.user_to_json(self.user)])
+        await self.expire_presence()
+
+    async def expire_presence(self):
+        """Удаляет подключения без heartbeat и рассылает ушедших пользователей"""
+        gone = await get_presence_backend().expire(self.room_name)
+        if gone:
+            await self.send_presence_diff(left=gone)
+
+    async def send_presence_diff(self, joined=None, left=None):
+        """Рассылает в группу изменение списка онлайн вместо полного списка"""
+        await self.broadcast("presence_diff", {
+            "joined": joined or [],
+            "left": left or [],
+            "count": await get_presence_backend().count(self.room_name)
+        })
+
+    async def handle_typing(self, data):
+        """Обработка индикатора печати (рассылка прореживается, см. chat.coalescing)"""
+        await self.typing.update(bool(data.get('is_typing', False)))
+
+    async def broadcast_typing(self, is_typing):
+        """Рассылает в группу состояние индикатора печати пользователя"""
+        await self.channel_layer.group_send(
             self.room_group_name, {
                 "type": "typing_indicator",
                 "user": self.user.username,
@@ -308,213 +512,210 @@ class BaseChatConsumer(WebsocketConsumer):
             }
         )
 
-    def handle_reaction(self, data):
+    async def handle_reaction(self, data):
         """Обработка реакций на сообщения с сохранением в БД"""
         message_id = data.get('message_id')
         reaction_type = data.get('reaction')  # 'like' или 'dislike'
 
         if not message_id or not reaction_type:
-            self.send_error("Недостаточно данных для реакции")
+            await self.send_error("Недостаточно данных для реакции")
             return
 
         if reaction_type not in ['like', 'dislike']:
-            self.send_error("Неверный тип реакции")
+            await self.send_error("Неверный тип реакции")
             return
 
         try:
-            # Получаем сообщение
-            room, _ = Room.objects.get_or_create(name=self.room_name)
-            message = Message.objects.get(id=message_id, room=room, is_deleted=False)
-
-            # Проверяем, не реагирует ли пользователь на собственное сообщение
-            if message.author == self.user:
-                self.send_error("Нельзя ставить реакцию на собственное сообщение")
-                return
-
-            # Импортируем модель реакций
-            from .models import MessageReaction
+            likes_count, dislikes_count, cache_entry = await self.create_reaction(message_id, reaction_type)
+            await self.update_history_cache(get_history_cache().replace(self.room_name, cache_entry))
 
-            # Проверяем, есть ли уже реакция от этого пользователя
-            existing_reaction = MessageReaction.objects.filter(
-                message=message,
-                user=self.user
-            ).first()
-
-            if existing_reaction:
-                # Пользователь уже реагировал - отправляем ошибку
-                self.send_error("Вы уже реагировали на это сообщение")
-                return
+            # Отправляем обновленную реакцию всем в группе
+            await self.broadcast("reaction_updated", {
+                "message_id": str(message_id),
+                "reaction_type": reaction_type,
+                "user": self.user_to_json(self.user),
+                "likes_count": likes_count,
+                "dislikes_count": dislikes_count
+            })
+
+        except ValidationError as e:
+            await self.send_error(e.message)
+        except Exception as e:
+            logger.error(f"Error handling reaction: {e}")
+            await self.send_error("Ошибка при обработке реакции")
 
-            # Создаем новую реакцию
-            new_reaction = MessageReaction.objects.create(
-                message=message,
-                user=self.user,
-                reaction_type=reaction_type
-            )
+    @database_sync_to_async
+    def create_reaction(self, message_id, reaction_type):
+        """Сохраняет реакцию пользователя и возвращает обновленные счетчики"""
+        # Получаем сообщение
+        message = Message.objects.select_related(*MESSAGE_RELATED_FIELDS).get(id=message_id, room=self.state.room, is_deleted=False)
 
-            # Получаем обновленные счетчики
-            likes_count = message.likes_count
-            dislikes_count = message.dislikes_count
+        # Проверяем, не реагирует ли пользователь на собственное сообщение
+        if message.author == self.user:
+            raise ValidationError("Нельзя ставить реакцию на собственное сообщение")
 
-            # Отправляем обновленную реакцию всем в группе
-            async_to_sync(self.channel_layer.group_send)(
-                self.room_group_name, {
-                    "type": "reaction_updated",
-                    "message_id": str(message_id),
-                    "reaction_type": reaction_type,
-                    "user": self.user_to_json(self.user),
-                    "likes_count": likes_count,
-                    "dislikes_count": dislikes_count
-                }
-            )
+        # Реакция и счетчик сообщения сохраняются в одной транзакции; повторную
+        # реакцию отсекает уникальный индекс (message, user) без отдельной проверки
+        try:
+            MessageReaction.add(message, self.user, reaction_type)
+        except IntegrityError:
+            raise ValidationError("Вы уже реагировали на это сообщение")
 
-        except Exception as e:
-            logger.error(f"Error handling reaction: {e}")
-            self.send_error("Ошибка при обработке реакции")
+        # Запись для кеша истории со свежими счетчиками
+        cache_entry = build_cache_entries([message])[0]
+        return message.likes_count, message.dislikes_count, cache_entry
 
-    def handle_edit_message(self, data):
+    async def handle_edit_message(self, data):
         """Обработка редактирования сообщения с проверкой прав доступа"""
         message_id = data.get('message_id')
         new_content = data.get('new_content', '').strip()
 
         if not message_id or not new_content:
-            self.send_error("Недостаточно данных для редактирования")
+            await self.send_error("Недостаточно данных для редактирования")
             return
 
-        try:
-            # Получаем сообщение
-            room, _ = Room.objects.get_or_create(name=self.room_name)
-            message = Message.objects.get(id=message_id, room=room, is_deleted=False)
-
-            # 🎯 ПРОВЕРКА ПРАВ ДОСТУПА (согласно требованиям)
-            can_edit = self.can_edit_message(message)
-            if not can_edit:
-                self.send_error("У вас нет прав на редактирование этого сообщения")
-                return
-
-            # Сохраняем оригинальный контент для логирования
-            original_content = message.content
+        if not await self.check_message_length(new_content):
+            return
 
-            # Обновляем сообщение
-            message.content = new_content
-            message.is_edited = True
-            message.edited_by = self.user
-            message.edited_at = timezone.now()
-            message.save()
+        try:
+            cache_entry, mentioned_user_ids, original_content = await self.edit_message(message_id, new_content)
+            await self.update_history_cache(get_history_cache().replace(self.room_name, cache_entry))
 
             # Отправляем обновленное сообщение всем в группе
-            async_to_sync(self.channel_layer.group_send)(
-                self.room_group_name, {
-                    "type": "message_edited",
-                    "message": self.message_to_json(message),
-                    "editor": self.user_to_json(self.user)
-                }
-            )
+            await self.broadcast("message_edited", {
+                "message": broadcast_message(cache_entry, mentioned_user_ids),
+                "editor": self.user_to_json(self.user)
+            })
 
             logger.info(f"Message {message_id} edited by {self.user.username}. " +
                        f"Original: '{original_content[:50]}...' -> New: '{new_content[:50]}...'")
 
         except Message.DoesNotExist:
-            self.send_error("Сообщение не найдено")
+            await self.send_error("Сообщение не найдено")
+        except PermissionDenied:
+            await self.send_error("У вас нет прав на редактирование этого сообщения")
         except Exception as e:
             logger.error(f"Error editing message: {e}")
-            self.send_error("Ошибка при редактировании сообщения")
+            await self.send_error("Ошибка при редактировании сообщения")
+
+    @database_sync_to_async
+    def edit_message(self, message_id, new_content):
+        """Сохраняет новый текст сообщения, возвращает запись для кеша истории, упомянутых и исходный текст"""
+        # Получаем сообщение
+        message = Message.objects.select_related(*MESSAGE_RELATED_FIELDS).get(id=message_id, room=self.state.room, is_deleted=False)
+
+        # 🎯 ПРОВЕРКА ПРАВ ДОСТУПА (согласно требованиям)
+        if not self.can_edit_message(message):
+            raise PermissionDenied
+
+        # Сохраняем оригинальный контент для логирования
+        original_content = message.content
+
+        # Обновляем сообщение
+        message.content = new_content
+        message.is_edited = True
+        message.edited_by = self.user
+        message.edited_at = timezone.now()
+        with transaction.atomic():
+            message.save()
+            previous_user_ids = list(message.mentions.values_list('mentioned_user_id', flat=True))
+            mentioned_user_ids = MessageMention.index_message(message)
+            UserChatPosition.register_edited_message(message, previous_user_ids)
 
-    def handle_delete_message(self, data):
+        return build_cache_entries([message])[0], mentioned_user_ids, original_content
+
+    async def handle_delete_message(self, data):
         """Обработка удаления сообщения с проверкой прав доступа"""
         message_id = data.get('message_id')
 
         if not message_id:
-            self.send_error("Недостаточно данных для удаления")
+            await self.send_error("Недостаточно данных для удаления")
             return
 
         try:
-            # Получаем сообщение
-            room, _ = Room.objects.get_or_create(name=self.room_name)
-            message = Message.objects.get(id=message_id, room=room, is_deleted=False)
-
-            # 🎯 ПРОВЕРКА ПРАВ ДОСТУПА (аналогично редактированию)
-            can_delete = self.can_edit_message(message)
-            if not can_delete:
-                self.send_error("У вас нет прав на удаление этого сообщения")
-                return
-
-            # Помечаем сообщение как удаленное (мягкое удаление)
-            message.is_deleted = True
-            message.save()
+            await self.delete_message(message_id)
+            await self.update_history_cache(get_history_cache().remove(self.room_name, message_id))
 
             # Отправляем уведомление об удалении всем в группе
-            async_to_sync(self.channel_layer.group_send)(
-                self.room_group_name, {
-                    "type": "message_deleted",
-                    "message_id": str(message_id),
-                    "deleter": self.user_to_json(self.user)
-                }
-            )
+            await self.broadcast("message_deleted", {
+                "message_id": str(message_id),
+                "deleter": self.user_to_json(self.user)
+            })
 
             logger.info(f"Message {message_id} deleted by {self.user.username}")
 
         except Message.DoesNotExist:
-            self.send_error("Сообщение не найдено")
+            await self.send_error("Сообщение не найдено")
+        except PermissionDenied:
+            await self.send_error("У вас нет прав на удаление этого сообщения")
         except Exception as e:
             logger.error(f"Error deleting message: {e}")
-            self.send_error("Ошибка при удалении сообщения")
+            await self.send_error("Ошибка при удалении сообщения")
+
+    @database_sync_to_async
+    def delete_message(self, message_id):
+        """Мягко удаляет сообщение после проверки прав"""
+        # Получаем сообщение
+        message = Message.objects.select_related(*MESSAGE_RELATED_FIELDS).get(id=message_id, room=self.state.room, is_deleted=False)
 
-    def handle_forward_message(self, data):
+        # 🎯 ПРОВЕРКА ПРАВ ДОСТУПА (аналогично редактированию)
+        if not self.can_edit_message(message):
+            raise PermissionDenied
+
+        # Помечаем сообщение как удаленное (мягкое удаление) и убираем его из счетчиков позиций
+        with transaction.atomic():
+            message.is_deleted = True
+            message.save()
+            UserChatPosition.register_deleted_message(message)
+
+    async def handle_forward_message(self, data):
         """Обработка пересылки сообщения в другой чат"""
         message_id = data.get('message_id')
         target_room = data.get('target_room')
         custom_message = data.get('custom_message', '').strip()
 
         if not message_id or not target_room:
-            self.send_error("Недостаточно данных для пересылки")
+            await self.send_error("Недостаточно данных для пересылки")
             return
 
         try:
-            # Получаем оригинальное сообщение
-            source_room, _ = Room.objects.get_or_create(name=self.room_name)
-            original_message = Message.objects.get(id=message_id, room=source_room, is_deleted=False)
-
-            # Получаем комнату назначения
-            target_room_obj, _ = Room.objects.get_or_create(name=target_room)
-
-            # 🎯 КАСКАДНАЯ ЛОГИКА ПЕРЕСЫЛКИ: Каждый уровень ссылается на предыдущий
-            if original_message.is_forwarded:
-                # Пересылаем уже пересланное сообщение - берем основной контент (комментарий пользователя)
-                clean_content = self.extract_clean_content(original_message.content)
-                # Автор ЭТОГО пересланного сообщения (кто переслал), а не оригинального
-                original_author_with_icon = f"{original_message.author.get_role_icon} {original_message.author.display_name}"
-            else:
-                # Пересылаем обычное сообщение - берем его содержимое как есть
-                clean_content = original_message.content
-                original_author_with_icon = f"{original_message.author.get_role_icon} {original_message.author.display_name}"
-
-            # Определяем отображаемое название источника
-            if self.room_name == "general":
-                source_room_display = "Беседка"
-            elif self.room_name == "vip":
-                source_room_display = "Беседка - VIP"
-            elif self.room_name == "moderators":
-                source_room_display = "Модераторы"
-            else:
-                # Для любых других комнат используем более читаемое название
-                source_room_display = f"Чат «{self.room_name.title()}»"
+            cache_entry, mentioned_user_ids = await self.forward_message(message_id, target_room, custom_message)
+            await self.update_history_cache(get_history_cache().append(target_room, cache_entry))
 
-            # 💬 СОЗДАЕМ ФИНАЛЬНЫЙ КОНТЕНТ В ЗАВИСИМОСТИ ОТ НАЛИЧИЯ ПОЛЬЗОВАТЕЛЬСКОГО СООБЩЕНИЯ
-            if custom_message:
-                # 🎯 НОВАЯ ЛОГИКА: Пользовательское сообщение + структурированная цитата пересланного
-                forwarded_content = f"""{custom_message}
+            # Отправляем пересланное сообщение в группу ЦЕЛЕВОГО ЧАТА
+            await self.broadcast("message_forwarded", {
+                "message": broadcast_message(cache_entry, mentioned_user_ids),
+                "forwarder": self.user_to_json(self.user)
+            }, room_name=target_room)
 
-📤 Переслано из «{source_room_display}» • {original_author_with_icon}
-{original_author_with_icon}
-{clean_content}"""
+            if custom_message:
+                logger.info(f"Message {message_id} forwarded by {self.user.username} to {target_room} with custom message")
             else:
-                # Если нет пользовательского сообщения, используем стандартный формат
-                forwarded_content = f"""📤 Переслано из «{source_room_display}» • {original_author_with_icon}
-{original_author_with_icon}
-{clean_content}"""
+                logger.info(f"Message {message_id} forwarded by {self.user.username} to {target_room}")
 
-            # Создаем новое сообщение
+        except Message.DoesNotExist:
+            await self.send_error("Сообщение не найдено")
+        except ValidationError as e:
+            await self.send_error(e.message)
+        except Exception as e:
+            logger.error(f"Error forwarding message: {e}")
+            await self.send_error("Ошибка при пересылке сообщения")
+
+    @database_sync_to_async
+    def forward_message(self, message_id, target_room, custom_message):
+        """Создает пересланное сообщение в целевой комнате, возвращает запись для кеша истории и упомянутых"""
+        # Получаем оригинальное сообщение
+        original_message = Message.objects.select_related('author').get(id=message_id, room=self.state.room, is_deleted=False)
+
+        # Получаем комнату назначения из реестра: пересылка только в доступные пользователю комнаты
+        target_room_obj = get_available_room(target_room, self.user)
+        if target_room_obj is None:
+            raise ValidationError("Комната назначения недоступна")
+
+        forwarded_content = self.build_forwarded_content(original_message, custom_message)
+
+        # Создаем новое сообщение
+        with transaction.atomic():
             forwarded_message = Message.objects.create(
                 room=target_room_obj,
                 author=self.user,
@@ -522,355 +723,585 @@ class BaseChatConsumer(WebsocketConsumer):
                 is_forwarded=True,
                 original_message_id=str(message_id)
             )
+            mentioned_user_ids = MessageMention.index_message(forwarded_message)
+            UserChatPosition.register_new_message(forwarded_message)
+
+        return build_cache_entries([forwarded_message])[0], mentioned_user_ids
+
+    def build_forwarded_content(self, original_message, custom_message):
+        """Текст пересланного сообщения: комментарий пользователя и цитата с источником"""
+        # 🎯 КАСКАДНАЯ ЛОГИКА ПЕРЕСЫЛКИ: Каждый уровень ссылается на предыдущий
+        if original_message.is_forwarded:
+            # Пересылаем уже пересланное сообщение - берем основной контент (комментарий пользователя),
+            # выделенный при записи сообщения (chat.content.extract_clean_content)
+            clean_content = original_message.clean_content or original_message.content
+            # Автор ЭТОГО пересланного сообщения (кто переслал), а не оригинального
+            original_author_with_icon = f"{original_message.author.get_role_icon} {original_message.author.display_name}"
+        else:
+            # Пересылаем обычное сообщение - берем его содержимое как есть
+            clean_content = original_message.content
+            original_author_with_icon = f"{original_message.author.get_role_icon} {original_message.author.display_name}"
 
-            # Отправляем пересланное сообщение в группу ЦЕЛЕВОГО ЧАТА
-            target_group_name = f"chat_{target_room}"
-            async_to_sync(self.channel_layer.group_send)(
-                target_group_name, {
-                    "type": "message_forwarded",
-                    "message": self.message_to_json(forwarded_message),
-                    "forwarder": self.user_to_json(self.user)
-                }
-            )
+        # Отображаемое название источника - из настроек комнаты
+        source_room_display = self.state.room.display_title
 
-            if custom_message:
-                logger.info(f"Message {message_id} forwarded by {self.user.username} to {target_room} with custom message")
-            else:
-                logger.info(f"Message {message_id} forwarded by {self.user.username} to {target_room}")
+        # 💬 СОЗДАЕМ ФИНАЛЬНЫЙ КОНТЕНТ В ЗАВИСИМОСТИ ОТ НАЛИЧИЯ ПОЛЬЗОВАТЕЛЬСКОГО СООБЩЕНИЯ
+        if custom_message:
+            # 🎯 НОВАЯ ЛОГИКА: Пользовательское сообщение + структурированная цитата пересланного
+            forwarded_content = f"""{custom_message}
 
-        except Message.DoesNotExist:
-            self.send_error("Сообщение не найдено")
-        except Exception as e:
-            logger.error(f"Error forwarding message: {e}")
-            self.send_error("Ошибка при пересылке сообщения")
+📤 Переслано из «{source_room_display}» • {original_author_with_icon}
+{original_author_with_icon}
+{clean_content}"""
+        else:
+            # Если нет пользовательского сообщения, используем стандартный формат
+            forwarded_content = f"""📤 Переслано из «{source_room_display}» • {original_author_with_icon}
+{original_author_with_icon}
+{clean_content}"""
 
-    def handle_pin_message(self, data):
+        return forwarded_content
+
+    async def handle_pin_message(self, data):
         """Обработка закрепления сообщения"""
         message_id = data.get('message_id')
 
         if not message_id:
-            self.send_error("Недостаточно данных для закрепления")
+            await self.send_error("Недостаточно данных для закрепления")
             return
 
         try:
-            # Получаем сообщение
-            room, _ = Room.objects.get_or_create(name=self.room_name)
-            message = Message.objects.get(id=message_id, room=room, is_deleted=False)
-
-            # 🎯 ПРОВЕРКА ПРАВ ДОСТУПА (только модераторы и владельцы могут закреплять)
-            if self.user.role not in ['owner', 'moderator', 'admin']:
-                self.send_error("У вас нет прав на закрепление сообщений")
-                return
-
-            # Закрепляем сообщение
-            message.is_pinned = True
-            message.pinned_by = self.user
-            message.pinned_at = timezone.now()
-            message.save()
+            cache_entry = await self.set_message_pinned(message_id, True)
+            await self.update_history_cache(get_history_cache().replace(self.room_name, cache_entry))
 
             # Отправляем уведомление о закреплении всем в группе
-            async_to_sync(self.channel_layer.group_send)(
-                self.room_group_name, {
-                    "type": "message_pinned",
-                    "message": self.message_to_json(message),
-                    "pinner": self.user_to_json(self.user)
-                }
-            )
+            await self.broadcast("message_pinned", {
+                "message_id": str(message_id),
+                "message": broadcast_message(cache_entry),
+                "pinner": self.user_to_json(self.user)
+            })
 
             logger.info(f"Message {message_id} pinned by {self.user.username}")
 
         except Message.DoesNotExist:
-            self.send_error("Сообщение не найдено")
+            await self.send_error("Сообщение не найдено")
+        except PermissionDenied:
+            await self.send_error("У вас нет прав на закрепление сообщений")
         except Exception as e:
             logger.error(f"Error pinning message: {e}")
-            self.send_error("Ошибка при закреплении сообщения")
+            await self.send_error("Ошибка при закреплении сообщения")
 
-    def handle_unpin_message(self, data):
+    async def handle_unpin_message(self, data):
         """Обработка открепления сообщения"""
         message_id = data.get('message_id')
 
         if not message_id:
-            self.send_error("Недостаточно данных для открепления")
+            await self.send_error("Недостаточно данных для открепления")
             return
 
         try:
-            # Получаем сообщение
-            room, _ = Room.objects.get_or_create(name=self.room_name)
-            message = Message.objects.get(id=message_id, room=room, is_deleted=False)
+            cache_entry = await self.set_message_pinned(message_id, False)
+            await self.update_history_cache(get_history_cache().replace(self.room_name, cache_entry))
 
-            # 🎯 ПРОВЕРКА ПРАВ ДОСТУПА (только модераторы и владельцы могут откреплять)
-            if self.user.role not in ['owner', 'moderator', 'admin']:
-                self.send_error("У вас нет прав на открепление сообщений")
-                return
+            # Отправляем уведомление об открепленшании всем в группе
+            await self.broadcast("message_unpinned", {
+                "message_id": str(message_id),
+                "message": broadcast_message(cache_entry),
+                "unpinner": self.user_to_json(self.user)
+            })
+
+            logger.info(f"Message {message_id} unpinned by {self.user.username}")
 
-            # Открепляем сообщение
+        except Message.DoesNotExist:
+            await self.send_error("Сообщение не найдено")
+        except PermissionDenied:
+            await self.send_error("У вас нет прав на открепление сообщений")
+        except Exception as e:
+            logger.error(f"Error unpinning message: {e}")
+            await self.send_error("Ошибка при открепленшании сообщения")
+
+    @database_sync_to_async
+    def set_message_pinned(self, message_id, is_pinned):
+        """Закрепляет или открепляет сообщение и возвращает запись для кеша истории"""
+        # Получаем сообщение
+        message = Message.objects.select_related(*MESSAGE_RELATED_FIELDS).get(id=message_id, room=self.state.room, is_deleted=False)
+
+        # 🎯 ПРОВЕРКА ПРАВ ДОСТУПА (только модераторы и владельцы могут закреплять)
+        if self.user.role not in ['owner', 'moderator', 'admin']:
+            raise PermissionDenied
+
+        if is_pinned:
+            message.is_pinned = True
+            message.pinned_by = self.user
+            message.pinned_at = timezone.now()
+        else:
             message.is_pinned = False
             message.pinned_by = None
             message.pinned_at = None
-            message.save()
+        message.save()
 
-            # Отправляем уведомление об открепленшании всем в группе
-            async_to_sync(self.channel_layer.group_send)(
-                self.room_group_name, {
-                    "type": "message_unpinned",
-                    "message": self.message_to_json(message),
-                    "unpinner": self.user_to_json(self.user)
-                }
-            )
+        return build_cache_entries([message])[0]
 
-            logger.info(f"Message {message_id} unpinned by {self.user.username}")
+    def parse_batch_ids(self, values, limit):
+        """Уникальные строковые ID из списка кадра (в исходном порядке) или None, если список некорректен"""
+        if not isinstance(values, list) or not values:
+            return None
+        ids = list(dict.fromkeys(str(value) for value in values))
+        if len(ids) > limit:
+            return None
+        return ids
+
+    def load_batch(self, message_ids):
+        """Неудаленные сообщения комнаты подключения из пачки в хронологическом порядке (отсутствующие пропускаются)"""
+        messages = list(Message.objects.select_related('author').filter(
+            id__in=message_ids, room=self.state.room, is_deleted=False
+        ).order_by('created_at', 'id'))
+        if not messages:
+            raise Message.DoesNotExist
+        return messages
+
+    async def handle_forward_messages(self, data):
+        """Пакетная пересылка: несколько сообщений в несколько комнат одной транзакцией"""
+        message_ids = self.parse_batch_ids(data.get('message_ids'), MAX_BATCH_MESSAGES)
+        target_rooms = self.parse_batch_ids(data.get('target_rooms'), MAX_FORWARD_ROOMS)
+        custom_message = data.get('custom_message', '').strip()
+
+        if not message_ids or not target_rooms:
+            await self.send_error("Недостаточно данных для пересылки")
+            return
+
+        try:
+            forwarded = await self.forward_messages(message_ids, target_rooms, custom_message)
+            cache = get_history_cache()
+            for target_room, entries in forwarded.items():
+                await self.update_history_cache(asyncio.gather(*[
+                    cache.append(target_room, entry) for entry, _ in entries
+                ]))
+
+                # Одна рассылка на комнату назначения со всеми пересланными в нее сообщениями
+                await self.broadcast("messages_forwarded", {
+                    "messages": [broadcast_message(entry, mentioned_user_ids) for entry, mentioned_user_ids in entries],
+                    "forwarder": self.user_to_json(self.user)
+                }, room_name=target_room)
+
+            logger.info(f"{len(message_ids)} messages forwarded by {self.user.username} to {', '.join(target_rooms)}")
 
         except Message.DoesNotExist:
-            self.send_error("Сообщение не найдено")
+            await self.send_error("Сообщения не найдены")
+        except ValidationError as e:
+            await self.send_error(e.message)
         except Exception as e:
-            logger.error(f"Error unpinning message: {e}")
-            self.send_error("Ошибка при открепленшании сообщения")
+            logger.error(f"Error forwarding messages: {e}")
+            await self.send_error("Ошибка при пересылке сообщений")
+
+    @database_sync_to_async
+    def forward_messages(self, message_ids, target_rooms, custom_message):
+        """
+        Создает пересланные сообщения во всех комнатах назначения (bulk_create в одной
+        транзакции), возвращает {комната: [(запись для кеша истории, упомянутые), ...]}.
+        """
+        originals = self.load_batch(message_ids)
+
+        # Комнаты назначения из реестра: пересылка только в доступные пользователю комнаты
+        rooms = {name: get_available_room(name, self.user) for name in target_rooms}
+        if None in rooms.values():
+            raise ValidationError("Комната назначения недоступна")
+
+        contents = {original.id: self.build_forwarded_content(original, custom_message) for original in originals}
+        forwarded = []
+        for target_room in target_rooms:
+            for original in originals:
+                message = Message(
+                    room=rooms[target_room],
+                    author=self.user,
+                    content=contents[original.id],
+                    is_forwarded=True,
+                    original_message_id=str(original.id)
+                )
+                # bulk_create не вызывает save - производные поля заполняем сами
+                message.fill_derived_content()
+                forwarded.append(message)
+
+        with transaction.atomic():
+            Message.objects.bulk_create(forwarded)
+            mentioned_user_ids = MessageMention.index_new_messages(forwarded)
+            UserChatPosition.register_new_messages(forwarded)
+            index_messages(forwarded)
+
+        result = {target_room: [] for target_room in target_rooms}
+        for message, entry in zip(forwarded, build_cache_entries(forwarded)):
+            result[message.room.name].append((entry, mentioned_user_ids[message.id]))
+        return result
+
+    async def handle_delete_messages(self, data):
+        """Пакетное удаление сообщений с проверкой прав на каждое"""
+        message_ids = self.parse_batch_ids(data.get('message_ids'), MAX_BATCH_MESSAGES)
+
+        if not message_ids:
+            await self.send_error("Недостаточно данных для удаления")
+            return
+
+        try:
+            deleted_ids = await self.delete_messages(message_ids)
+            cache = get_history_cache()
+            await self.update_history_cache(asyncio.gather(*[
+                cache.remove(self.room_name, message_id) for message_id in deleted_ids
+            ]))
+
+            await self.broadcast("messages_deleted", {
+                "message_ids": deleted_ids,
+                "deleter": self.user_to_json(self.user)
+            })
+
+            logger.info(f"{len(deleted_ids)} messages deleted by {self.user.username}")
+
+        except Message.DoesNotExist:
+            await self.send_error("Сообщения не найдены")
+        except PermissionDenied:
+            await self.send_error("У вас нет прав на удаление некоторых из этих сообщений")
+        except Exception as e:
+            logger.error(f"Error deleting messages: {e}")
+            await self.send_error("Ошибка при удалении сообщений")
+
+    @database_sync_to_async
+    def delete_messages(self, message_ids):
+        """Мягко удаляет пачку сообщений (все или ничего по правам), возвращает ID удаленных"""
+        messages = self.load_batch(message_ids)
+
+        if not all(self.can_edit_message(message) for message in messages):
+            raise PermissionDenied
+
+        for message in messages:
+            message.is_deleted = True
+        with transaction.atomic():
+            Message.objects.bulk_update(messages, ['is_deleted'])
+            UserChatPosition.register_deleted_messages(messages)
+
+        return [str(message.id) for message in messages]
+
+    async def handle_pin_messages(self, data):
+        """Пакетное закрепление (или открепление при is_pinned: false) сообщений"""
+        message_ids = self.parse_batch_ids(data.get('message_ids'), MAX_BATCH_MESSAGES)
+        is_pinned = data.get('is_pinned', True) is not False
+
+        if not message_ids:
+            await self.send_error("Недостаточно данных для закрепления")
+            return
+
+        try:
+            entries = await self.set_messages_pinned(message_ids, is_pinned)
+            cache = get_history_cache()
+            await self.update_history_cache(asyncio.gather(*[
+                cache.replace(self.room_name, entry) for entry in entries
+            ]))
 
-    def handle_save_position(self, data):
+            await self.broadcast("messages_pinned", {
+                "is_pinned": is_pinned,
+                "messages": [broadcast_message(entry) for entry in entries],
+                "pinner": self.user_to_json(self.user)
+            })
+
+            logger.info(f"{len(entries)} messages {'pinned' if is_pinned else 'unpinned'} by {self.user.username}")
+
+        except Message.DoesNotExist:
+            await self.send_error("Сообщения не найдены")
+        except PermissionDenied:
+            await self.send_error("У вас нет прав на закрепление сообщений")
+        except Exception as e:
+            logger.error(f"Error pinning messages: {e}")
+            await self.send_error("Ошибка при закреплении сообщений")
+
+    @database_sync_to_async
+    def set_messages_pinned(self, message_ids, is_pinned):
+        """Закрепляет или открепляет пачку сообщений одним bulk_update, возвращает записи для кеша истории"""
+        # 🎯 ПРОВЕРКА ПРАВ ДОСТУПА (только модераторы и владельцы могут закреплять)
+        if self.user.role not in ['owner', 'moderator', 'admin']:
+            raise PermissionDenied
+
+        messages = list(Message.objects.select_related(*MESSAGE_RELATED_FIELDS).filter(
+            id__in=message_ids, room=self.state.room, is_deleted=False
+        ).order_by('created_at', 'id'))
+        if not messages:
+            raise Message.DoesNotExist
+
+        pinned_at = timezone.now()
+        for message in messages:
+            message.is_pinned = is_pinned
+            message.pinned_by = self.user if is_pinned else None
+            message.pinned_at = pinned_at if is_pinned else None
+        Message.objects.bulk_update(messages, ['is_pinned', 'pinned_by', 'pinned_at'])
+
+        return build_cache_entries(messages)
+
+    async def handle_save_position(self, data):
         """Сохранение позиции пользователя в чате для восстановления между сессиями"""
         last_visible_message_id = data.get('last_visible_message_id')
         scroll_position_percent = data.get('scroll_position_percent', 0.0)
 
-        try:
-            # Получаем комнату и позицию пользователя
-            room, _ = Room.objects.get_or_create(name=self.room_name)
-            position = UserChatPosition.get_or_create_for_user(self.user, room)
+        # Позиция записывается в БД отложенно: из серии скроллов сохраняется только последняя
+        await self.position_buffer.update(last_visible_message_id, scroll_position_percent)
 
-            # Сохраняем позицию
-            if last_visible_message_id:
-                position.last_visible_message_id = last_visible_message_id
-            position.scroll_position_percent = scroll_position_percent
-            position.save()
+    async def write_position(self, last_visible_message_id, scroll_position_percent):
+        """Записывает отложенную позицию (вызывается из PositionBuffer)"""
+        try:
+            await self.save_position(last_visible_message_id, scroll_position_percent)
 
             logger.info(f"Position saved for {self.user.username} in {self.room_name}: "
                        f"message_id={last_visible_message_id}, scroll={scroll_position_percent:.2f}")
 
         except Exception as e:
             logger.error(f"Error saving position: {e}")
-            self.send_error("Ошибка при сохранении позиции")
 
-    def handle_mark_as_read(self, data):
+    @database_sync_to_async
+    def save_position(self, last_visible_message_id, scroll_position_percent):
+        """Записывает позицию прокрутки пользователя в БД"""
+        position = self.state.position
+
+        # Сохраняем позицию
+        if last_visible_message_id:
+            position.last_visible_message_id = last_visible_message_id
+        position.scroll_position_percent = scroll_position_percent
+        position.save(update_fields=['last_visible_message_id', 'scroll_position_percent', 'updated_at'])
+
+    async def handle_mark_as_read(self, data):
         """Обработка отметки сообщений как прочитанных"""
         message_id = data.get('message_id')
         up_to_time = data.get('up_to_time')
 
         try:
-            # Получаем комнату и позицию пользователя
-            room, _ = Room.objects.get_or_create(name=self.room_name)
-            position = UserChatPosition.get_or_create_for_user(self.user, room)
-
-            if message_id:
-                # Отмечаем до конкретного сообщения
-                try:
-                    message = Message.objects.get(id=message_id, room=room, is_deleted=False)
-                    position.mark_as_read(up_to_message=message)
-                    logger.info(f"User {self.user.username} marked messages as read up to {message_id}")
-                except Message.DoesNotExist:
-                    self.send_error("Сообщение не найдено")
-                    return
-            elif up_to_time:
-                # Отмечаем до конкретного времени
-                position.mark_as_read(up_to_time=timezone.datetime.fromisoformat(up_to_time))
-                logger.info(f"User {self.user.username} marked messages as read up to {up_to_time}")
-            else:
-                # Отмечаем все сообщения как прочитанные
-                position.mark_as_read()
-                logger.info(f"User {self.user.username} marked all messages as read in {self.room_name}")
-
-            # 🔧 КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Обновляем кешированные счетчики перед отправкой
-            position.unread_count = position.get_unread_messages_count()
-            position.personal_notifications_count = position.get_personal_notifications_count()
-            position.save()
+            await self.mark_as_read(message_id, up_to_time)
 
             # Отправляем обновленную информацию о непрочитанных
-            self.send_unread_info(position)
+            await self.send_unread_info()
 
+        except Message.DoesNotExist:
+            await self.send_error("Сообщение не найдено")
         except Exception as e:
             logger.error(f"Error marking messages as read: {e}")
-            self.send_error("Ошибка при отметке сообщений как прочитанных")
+            await self.send_error("Ошибка при отметке сообщений как прочитанных")
+
+    @database_sync_to_async
+    def mark_as_read(self, message_id, up_to_time):
+        """Сдвигает отметку прочтения и возвращает обновленную позицию"""
+        position = self.state.position
+
+        if message_id:
+            # Отмечаем до конкретного сообщения
+            message = Message.objects.get(id=message_id, room=self.state.room, is_deleted=False)
+            position.mark_as_read(up_to_message=message)
+            logger.info(f"User {self.user.username} marked messages as read up to {message_id}")
+        elif up_to_time:
+            # Отмечаем до конкретного времени
+            position.mark_as_read(up_to_time=timezone.datetime.fromisoformat(up_to_time))
+            logger.info(f"User {self.user.username} marked messages as read up to {up_to_time}")
+        else:
+            # Отмечаем все сообщения как прочитанные
+            position.mark_as_read()
+            logger.info(f"User {self.user.username} marked all messages as read in {self.room_name}")
 
-    def get_user_position(self):
-        """Получает или создает позицию пользователя в текущей комнате"""
-        try:
-            room, _ = Room.objects.get_or_create(name=self.room_name)
-            return UserChatPosition.get_or_create_for_user(self.user, room)
-        except Exception as e:
-            logger.error(f"Error getting user position: {e}")
-            return None
+        return position
 
-    def send_unread_info(self, position):
+    async def send_unread_info(self):
         """Отправляет информацию о непрочитанных сообщениях пользователю"""
         try:
-            # 🔧 КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Всегда отправляем АКТУАЛЬНЫЕ счетчики, не кешированные!
-            actual_unread_count = position.get_unread_messages_count()
-            actual_personal_count = position.get_personal_notifications_count()
-
-            first_unread = position.get_first_unread_message()
-            first_personal = position.get_first_personal_notification()
-
-            # 🎯 ИСПРАВЛЕННАЯ ЛОГИКА: Всегда используем стандартную логику возврата
-            return_position = position.get_return_position()
-
-            # 🔧 УБРАНА СПЕЦИАЛЬНАЯ ОБРАБОТКА: Теперь last_read_at всегда установлен в connect()
-            # Поэтому используем только стандартную логику return_position из модели
-
-            self.send(text_data=json.dumps({
-                "type": "unread_info",
-                "unread_count": actual_unread_count,  # ⚡ ОБЩИЙ СЧЕТЧИК НЕПРОЧИТАННЫХ
-                "personal_notifications_count": actual_personal_count,  # ⚡ ПЕРСОНАЛЬНЫЕ УВЕДОМЛЕНИЯ
-                "first_unread_message_id": str(first_unread.id) if first_unread else None,
-                "first_personal_notification_id": str(first_personal.id) if first_personal else None,
-                "return_position": return_position,  # 🎯 ПОЗИЦИЯ ДЛЯ ВОЗВРАЩЕНИЯ
-                "last_read_at": position.last_read_at.isoformat() if position.last_read_at else None,
-                "last_visit_at": position.last_visit_at.isoformat() if position.last_visit_at else None,
-                "is_first_visit": False,  # 🔧 ИСПРАВЛЕНО: Теперь last_read_at всегда установлен
-                # 🎯 НОВЫЕ ПОЛЯ ДЛЯ ВОССТАНОВЛЕНИЯ ПОЗИЦИИ МЕЖДУ СЕССИЯМИ
-                "saved_position": {
-                    "last_visible_message_id": str(position.last_visible_message_id) if position.last_visible_message_id else None,
-                    "scroll_position_percent": position.scroll_position_percent
-                },
-                # 🐛 DEBUG: Добавляем отладочную информацию
-                "debug_cached_unread": position.unread_count,
-                "debug_actual_unread": actual_unread_count,
-                "debug_cached_personal": position.personal_notifications_count,
-                "debug_actual_personal": actual_personal_count
-            }))
-
-            # 🔧 ОБНОВЛЯЕМ КЕШИРОВАННЫЕ СЧЕТЧИКИ ДЛЯ СИНХРОНИЗАЦИИ
-            if position.unread_count != actual_unread_count or position.personal_notifications_count != actual_personal_count:
-                position.unread_count = actual_unread_count
-                position.personal_notifications_count = actual_personal_count
-                position.save()
-                logger.info(f"Updated cached counters for {self.user.username} in {self.room_name}: "
-                           f"unread: {actual_unread_count}, personal: {actual_personal_count}")
-
+            unread_info = await self.get_unread_info()
+            await self.send_frame(unread_info)
         except Exception as e:
             logger.error(f"Error sending unread info: {e}")
 
-    def handle_load_more_messages(self, data):
-        """Обработка загрузки дополнительных сообщений"""
-        before_message_id = data.get('before_message_id')
-        limit = data.get('limit', 50)  # По умолчанию 50 сообщений
-
-        try:
-            # Получаем комнату
-            room, _ = Room.objects.get_or_create(name=self.room_name)
-
-            # Строим базовый запрос
-            query = Message.objects.filter(room=room, is_deleted=False)
-
-            # Если указан ID сообщения, загружаем сообщения ДО него
-            if before_message_id:
-                try:
-                    before_message = Message.objects.get(id=before_message_id, room=room, is_deleted=False)
-                    query = query.filter(created_at__lt=before_message.created_at)
-                except Message.DoesNotExist:
-                    self.send_error("Опорное сообщение не найдено")
-                    return
+    @database_sync_to_async
+    def get_unread_info(self):
+        """unread_info по свежим полям позиции: счетчики обновляются F-выражениями из других подключений"""
+        return self.build_unread_info(self.state.refresh_position())
 
-            # Получаем сообщения в обратном порядке и ограничиваем количество
-            messages = query.select_related(
-                'author', 'parent', 'parent__author'
-            ).order_by('-created_at')[:limit]
+    def build_unread_info(self, position):
+        """Собирает данные для unread_info из инкрементальных счетчиков позиции (без пересчета по истории)"""
+        first_unread = position.get_first_unread_message()
+        first_personal = position.get_first_personal_notification()
 
-            # Получаем позицию пользователя для определения прочитанности
-            user_position = UserChatPosition.get_or_create_for_user(self.user, room)
+        # 🎯 ИСПРАВЛЕННАЯ ЛОГИКА: Всегда используем стандартную логику возврата
+        return_position = position.build_return_position(first_personal, first_unread)
 
-            # Конвертируем в JSON (в обратном порядке для правильного отображения)
-            messages_data = []
-            for msg in reversed(messages):
-                message_json = self.message_to_json(msg, is_history=True)
+        return {
+            "type": "unread_info",
+            "unread_count": position.unread_count,  # ⚡ ОБЩИЙ СЧЕТЧИК НЕПРОЧИТАННЫХ
+            "personal_notifications_count": position.personal_notifications_count,  # ⚡ ПЕРСОНАЛЬНЫЕ УВЕДОМЛЕНИЯ
+            "first_unread_message_id": str(first_unread.id) if first_unread else None,
+            "first_personal_notification_id": str(first_personal.id) if first_personal else None,
+            "return_position": return_position,  # 🎯 ПОЗИЦИЯ ДЛЯ ВОЗВРАЩЕНИЯ
+            "last_read_at": position.last_read_at.isoformat() if position.last_read_at else None,
+            "last_visit_at": position.last_visit_at.isoformat() if position.last_visit_at else None,
+            "is_first_visit": False,  # 🔧 ИСПРАВЛЕНО: Теперь last_read_at всегда установлен
+            # 🎯 НОВЫЕ ПОЛЯ ДЛЯ ВОССТАНОВЛЕНИЯ ПОЗИЦИИ МЕЖДУ СЕССИЯМИ
+            "saved_position": {
+                "last_visible_message_id": str(position.last_visible_message_id) if position.last_visible_message_id else None,
+                "scroll_position_percent": position.scroll_position_percent
+            }
+        }
 
-                # Определяем прочитанность
-                if user_position.last_read_at:
-                    message_json['is_read'] = msg.created_at <= user_position.last_read_at
-                else:
-                    message_json['is_read'] = True
+    async def handle_load_more_messages(self, data):
+        """Обработка загрузки дополнительных сообщений по курсору (before/after/around)"""
+        cursor = data.get('cursor')
+        direction = data.get('direction', DIRECTION_BEFORE)
+        before_message_id = data.get('before_message_id')  # Старые клиенты передают ID опорного сообщения
 
-                # 🎯 НОВОЕ: Отмечаем персональные уведомления
-                message_json['is_personal_notification'] = msg.is_personal_notification_for(self.user)
+        try:
+            limit = self.parse_page_size(data.get('limit', 50))  # По умолчанию 50 сообщений
+            if limit is None:
+                await self.send_error("Некорректный размер страницы")
+                return
 
-                messages_data.append(message_json)
+            page, messages_data = await self.get_more_messages(cursor, direction, before_message_id, limit)
 
             # Отправляем дополнительные сообщения
-            self.send(text_data=json.dumps({
+            await self.send_frame({
                 "type": "more_messages",
                 "messages": messages_data,
-                "has_more": len(messages) == limit,  # Есть ли еще сообщения для загрузки
+                "direction": direction,
+                # Есть ли еще сообщения для загрузки в запрошенном направлении
+                "has_more": page['has_more_after'] if direction == DIRECTION_AFTER else page['has_more_before'],
+                "has_more_before": page['has_more_before'],
+                "has_more_after": page['has_more_after'],
+                "next_cursor": page['after_cursor'] if direction == DIRECTION_AFTER else page['before_cursor'],
+                "before_cursor": page['before_cursor'],
+                "after_cursor": page['after_cursor'],
                 "before_message_id": before_message_id
-            }))
+            })
 
             logger.info(f"Loaded {len(messages_data)} more messages for {self.user.username} in {self.room_name}")
 
+        except Message.DoesNotExist:
+            await self.send_error("Опорное сообщение не найдено")
+        except ValueError:
+            await self.send_error("Некорректный курсор или направление загрузки")
         except Exception as e:
             logger.error(f"Error loading more messages: {e}")
-            self.send_error("Ошибка загрузки сообщений")
-
-    def handle_load_message_context(self, data):
-        """Обработка загрузки контекста вокруг сообщения"""
-        message_id = data.get('message_id')
-        context_size = data.get('context_size', 10)  # По умолчанию 10 сообщений до и после
-
-        if not message_id:
-            self.send_error("Недостаточно данных для загрузки контекста")
-            return
+            await self.send_error("Ошибка загрузки сообщений")
 
+    def parse_page_size(self, value, maximum=MAX_PAGE_SIZE):
+        """Размер страницы из кадра в пределах 1..maximum или None, если это не число"""
         try:
-            room, _ = Room.objects.get_or_create(name=self.room_name)
-            target_message = Message.objects.get(id=message_id, room=room, is_deleted=False)
+            return max(1, min(int(value), maximum))
+        except (TypeError, ValueError, OverflowError):
+            return None
+
+    @database_sync_to_async
+    def get_more_messages(self, cursor, direction, before_message_id, limit):
+        """Загружает страницу сообщений относительно курсора"""
+        room = self.state.room
 
-            # Получаем сообщения ДО целевого
-            messages_before = Message.objects.filter(
-                room=room, is_deleted=False, created_at__lt=target_message.created_at
-            ).select_related('author', 'parent', 'parent__author').order_by('-created_at')[:context_size]
+        # Старый протокол: курсор строится по опорному сообщению
+        if not cursor and before_message_id:
+            anchor_message = find_message(room, before_message_id)
+            if anchor_message is None:
+                raise Message.DoesNotExist
+            cursor = encode_cursor(anchor_message)
 
-            # Получаем сообщения ПОСЛЕ целевого (включая само целевое)
-            messages_after = Message.objects.filter(
-                room=room, is_deleted=False, created_at__gte=target_message.created_at
-            ).select_related('author', 'parent', 'parent__author').order_by('created_at')[:context_size + 1]
+        # За границей горячей таблицы страница продолжается архивом
+        page = fetch_room_page(room, cursor, direction, limit)
 
-            # Объединяем в правильном порядке
-            all_messages = list(reversed(messages_before)) + list(messages_after)
+        # Позиция пользователя нужна для определения прочитанности
+        return page, serialize_messages(ChatMessageSerializer(self.user, self.state.position), page['messages'])
 
-            # Получаем позицию пользователя для определения прочитанности
-            user_position = UserChatPosition.get_or_create_for_user(self.user, room)
+    async def handle_load_message_context(self, data):
+        """Обработка загрузки контекста вокруг сообщения"""
+        message_id = data.get('message_id')
 
-            # Конвертируем в JSON
-            messages_data = []
-            for msg in all_messages:
-                message_json = self.message_to_json(msg, is_history=True)
+        if not message_id:
+            await self.send_error("Недостаточно данных для загрузки контекста")
+            return
 
-                # Определяем прочитанность
-                if user_position.last_read_at:
-                    message_json['is_read'] = msg.created_at <= user_position.last_read_at
-                else:
-                    message_json['is_read'] = True
+        try:
+            context_size = self.parse_page_size(data.get('context_size', 10))  # По умолчанию 10 сообщений до и после
+            if context_size is None:
+                await self.send_error("Некорректный размер контекста")
+                return
 
-                # Отмечаем персональные уведомления
-                message_json['is_personal_notification'] = msg.is_personal_notification_for(self.user)
-                messages_data.append(message_json)
+            page, messages_data = await self.get_message_context(message_id, context_size)
 
-            self.send(text_data=json.dumps({
+            await self.send_frame({
                 "type": "message_context",
                 "messages": messages_data,
                 "target_message_id": str(message_id),
-                "found": True
-            }))
+                "found": True,
+                "before_cursor": page['before_cursor'],
+                "after_cursor": page['after_cursor'],
+                "has_more_before": page['has_more_before'],
+                "has_more_after": page['has_more_after']
+            })
 
             logger.info(f"Loaded {len(messages_data)} messages context for {self.user.username} around message {message_id}")
 
         except Message.DoesNotExist:
             # Сообщение удалено или не существует
-            self.send(text_data=json.dumps({
+            await self.send_frame({
                 "type": "message_context",
                 "messages": [],
                 "target_message_id": str(message_id),
                 "found": False
-            }))
+            })
             logger.info(f"Message {message_id} not found for context loading")
         except Exception as e:
             logger.error(f"Error loading message context: {e}")
-            self.send_error("Ошибка при загрузке контекста сообщения")
+            await self.send_error("Ошибка при загрузке контекста сообщения")
+
+    @database_sync_to_async
+    def get_message_context(self, message_id, context_size):
+        """Загружает context_size сообщений до целевого, само целевое и context_size после"""
+        room = self.state.room
+        target_message = find_message(room, message_id)
+        if target_message is None:
+            raise Message.DoesNotExist
+
+        page = fetch_room_page(room, encode_cursor(target_message), DIRECTION_AROUND, context_size)
+
+        # Конвертируем в JSON (позиция пользователя нужна для определения прочитанности)
+        return page, serialize_messages(ChatMessageSerializer(self.user, self.state.position), page['messages'])
+
+    async def handle_search_messages(self, data):
+        """Полнотекстовый поиск по сообщениям комнаты (переход к результату - load_message_context)"""
+        query = (data.get('query') or '').strip()
+        cursor = data.get('cursor')
+
+        if not query:
+            await self.send_error("Введите текст для поиска")
+            return
+
+        limit = self.parse_page_size(data.get('limit', 20), MAX_SEARCH_RESULTS)
+        if limit is None:
+            await self.send_error("Некорректное число результатов поиска")
+            return
+
+        try:
+            page, results = await self.find_messages(query, cursor, limit)
+
+            await self.send_frame({
+                "type": "search_results",
+                "query": query,
+                "cursor": cursor,  # Курсор запроса: без него клиент начинает список результатов заново
+                "results": results,
+                "next_cursor": page['next_cursor'],
+                "has_more": page['has_more']
+            })
+
+            logger.info(f"Search by {self.user.username} in {self.room_name}: {len(results)} results")
+
+        except ValueError:
+            await self.send_error("Некорректный курсор поиска")
+        except Exception as e:
+            logger.error(f"Error searching messages: {e}")
+            await self.send_error("Ошибка поиска сообщений")
+
+    @database_sync_to_async
+    def find_messages(self, query, cursor, limit):
+        """Страница результатов поиска: сообщения с рангом и подсвеченным фрагментом"""
+        page = search_messages(self.state.room, query, cursor, limit)
+        results = ChatMessageSerializer(self.user, self.state.position).serialize(
+            [message for message, _, _ in page['hits']]
+        )
+        for data, (_, rank, highlight) in zip(results, page['hits']):
+            data['rank'] = rank
+            data['highlight'] = highlight
+        return page, results
 
     def can_edit_message(self, message):
         """Проверка прав на редактирование сообщения"""
@@ -887,86 +1318,33 @@ class BaseChatConsumer(WebsocketConsumer):
         else:
             return message.author == self.user
 
-    def send_error(self, message):
+    async def check_message_length(self, content):
+        """Проверяет ограничение длины сообщения комнаты (Room.max_message_length)"""
+        if self.max_message_length and len(content) > self.max_message_length:
+            await self.send_error(f"Сообщение длиннее {self.max_message_length} символов")
+            return False
+        return True
+
+    async def send_frame(self, frame):
+        """Отправляет кадр в протоколе, согласованном при подключении (chat.protocol)"""
+        if self.codec.binary:
+            await self.send(bytes_data=self.codec.encode(frame))
+        else:
+            await self.send(text_data=self.codec.encode(frame))
+
+    async def send_encoded(self, text):
+        """Отправляет кадр, уже закодированный в JSON (события группы, replay)"""
+        if self.codec.binary:
+            await self.send(bytes_data=self.codec.encode_text(text))
+        else:
+            await self.send(text_data=text)
+
+    async def send_error(self, message):
         """Отправка сообщения об ошибке клиенту"""
-        self.send(text_data=json.dumps({
+        await self.send_frame({
             "type": "error",
             "message": message
-        }))
-
-    def extract_clean_content(self, content):
-        """Извлекает основной контент из пересланного сообщения для каскадной пересылки"""
-        lines = content.strip().split('\n')
-
-        if len(lines) < 3:
-            return content
-
-        # 🎯 КАСКАДНАЯ ЛОГИКА: Ищем пользовательский комментарий ДО секции "Переслано"
-        forwarded_section_start = -1
-
-        # Находим где начинается секция "📤 Переслано"
-        for i, line in enumerate(lines):
-            if line.strip().startswith('📤 Переслано') or line.strip().startswith('Переслано'):
-                forwarded_section_start = i
-                break
-
-        if forwarded_section_start > 0:
-            # Есть пользовательский комментарий ДО секции "Переслано"
-            user_comment_lines = lines[:forwarded_section_start]
-            user_comment = '\n'.join(user_comment_lines).strip()
-            if user_comment:
-                return user_comment
-
-        # Если нет пользовательского комментария, возвращаем только основной текст
-        # после автора (первую содержательную строку, не цитату)
-        if forwarded_section_start >= 0 and forwarded_section_start + 2 < len(lines):
-            # Пропускаем строку "📤 Переслано..." и строку с автором
-            main_content_start = forwarded_section_start + 2
-            if main_content_start < len(lines):
-                main_content = lines[main_content_start].strip()
-                # Возвращаем только первую строку основного контента
-                if main_content and not main_content.startswith('📤'):
-                    return main_content
-
-        # Fallback: возвращаем весь контент как есть
-        return content
-
-    def message_to_json(self, message, is_history=False):
-        """Конвертация сообщения в JSON с поддержкой ответов"""
-        reply_data = None
-        if message.parent:
-            reply_data = {
-                'id': str(message.parent.id),
-                'author_name': message.parent.author.display_name,
-                'author_role_icon': message.parent.author.get_role_icon,
-                'content_snippet': message.parent.content[:100] + ('...' if len(message.parent.content) > 100 else '')
-            }
-
-        return {
-            'id': str(message.id),
-            'content': message.content,
-            'author_name': message.author.display_name,
-            'author_role': message.author.role,
-            'author_role_icon': message.author.get_role_icon,
-            'created': message.created_at.isoformat(),
-            'is_own': message.author == self.user,
-            'reply_to': reply_data,
-            'is_reply_to_me': bool(message.parent and message.parent.author == self.user),
-            'mentions_me': message.mentions_user(self.user),  # 🎯 НОВОЕ: Упоминания пользователя
-            'is_personal_notification': message.is_personal_notification_for(self.user),  # 🎯 НОВОЕ: Персональные уведомления
-            'likes_count': message.likes_count,
-            'dislikes_count': message.dislikes_count,
-            'user_reaction': message.get_user_reaction(self.user),  # 'like', 'dislike' или None
-            'is_edited': message.is_edited,
-            'edited_by': message.edited_by.display_name if message.edited_by else None,
-            'edited_by_role': message.edited_by.role if message.edited_by else None,
-            'edited_at': message.edited_at.isoformat() if message.edited_at else None,
-            'is_pinned': message.is_pinned,
-            'pinned_by': message.pinned_by.display_name if message.pinned_by else None,
-            'pinned_at': message.pinned_at.isoformat() if message.pinned_at else None,
-            'is_forwarded': getattr(message, 'is_forwarded', False),
-            'original_message_id': getattr(message, 'original_message_id', None),
-        }
+        })
 
     def user_to_json(self, user):
         """Конвертация пользователя в JSON"""
@@ -977,105 +1355,39 @@ class BaseChatConsumer(WebsocketConsumer):
             'role_icon': user.get_role_icon,
         }
 
+    async def broadcast(self, event_type, payload, room_name=None):
+        """
+        Рассылает событие в группу комнаты. JSON кодируется один раз на рассылку,
+        а не в каждом консьюмере; поля конкретного получателя (is_own, mentions_me
+        и т.д.) клиент вычисляет сам по author_id, reply_to.author_id и mentioned_user_ids.
+        События сообщений получают seq и сохраняются в журнал комнаты (chat.event_log).
+        """
+        room_name = room_name or self.room_name
+        event = {"type": event_type, **payload}
+        text = None
+        if event_type in REPLAYABLE_EVENTS:
+            try:
+                text = await get_event_log().append(room_name, event)
+            except Exception as e:
+                # Без журнала событие все равно доставляется - клиент при переподключении получит полную историю
+                logger.error(f"Error writing event log for {room_name}: {e}")
+
+        await self.channel_layer.group_send(f"chat_{room_name}", {
+            "type": "broadcast_event",
+            "text": text or json.dumps(event)
+        })
+
     # Обработчики событий группы
-    def new_message(self, event):
-        """Отправка нового сообщения клиенту"""
-        self.send(text_data=json.dumps({
-            "type": "new_message",
-            "message": event["message"]
-        }))
-
-    def user_joined(self, event):
-        """Уведомление о присоединении пользователя"""
-        self.send(text_data=json.dumps({
-            "type": "user_joined",
-            "user": event["user"]
-        }))
-
-    def user_left(self, event):
-        """Уведомление об отключении пользователя"""
-        self.send(text_data=json.dumps({
-            "type": "user_left",
-            "user": event["user"]
-        }))
-
-    def typing_indicator(self, event):
+    async def broadcast_event(self, event):
+        """Отправка клиенту заранее закодированного события группы"""
+        await self.send_encoded(event["text"])
+
+    async def typing_indicator(self, event):
         """Отправка индикатора печати"""
         # Не отправляем самому себе
         if event["user"] != self.user.username:
-            self.send(text_data=json.dumps({
+            await self.send_frame({
                 "type": "typing",
                 "user": event["user"],
                 "is_typing": event["is_typing"]
-            }))
-
-    def message_edited(self, event):
-        """Уведомление о редактировании сообщения"""
-        self.send(text_data=json.dumps({
-            "type": "message_edited",
-            "message": event["message"],
-            "editor": event["editor"]
-        }))
-
-    def message_deleted(self, event):
-        """Уведомление об удалении сообщения"""
-        self.send(text_data=json.dumps({
-            "type": "message_deleted",
-            "message_id": event["message_id"],
-            "deleter": event["deleter"]
-        }))
-
-    def message_forwarded(self, event):
-        """Уведомление о пересылке сообщения"""
-        self.send(text_data=json.dumps({
-            "type": "message_forwarded",
-            "message": event["message"],
-            "forwarder": event["forwarder"]
-        }))
-
-    def message_pinned(self, event):
-        """Уведомление о закреплении сообщения"""
-        self.send(text_data=json.dumps({
-            "type": "message_pinned",
-            "message": event["message"],
-            "pinner": event["pinner"]
-        }))
-
-    def message_unpinned(self, event):
-        """Уведомление об откреплении сообщения"""
-        self.send(text_data=json.dumps({
-            "type": "message_unpinned",
-            "message": event["message"],
-            "unpinner": event["unpinner"]
-        }))
-
-    def reaction_updated(self, event):
-        """Уведомление об обновлении реакции"""
-        self.send(text_data=json.dumps({
-            "type": "reaction_updated",
-            "message_id": event["message_id"],
-            "reaction_type": event["reaction_type"],
-            "user": event["user"],
-            "likes_count": event["likes_count"],
-            "dislikes_count": event["dislikes_count"]
-        }))
-
-
-class GeneralChatConsumer(BaseChatConsumer):
-    """Консьюмер для общего чата"""
-
-    def connect(self):
-        """Подключение к общему чату"""
-        self.room_name = "general"
-        # Теперь вызываем родительский connect, но сначала пропускаем строку с room_name
-        super().connect()
-
-
-class VIPChatConsumer(BaseChatConsumer):
-    """Консьюмер для VIP чата"""
-
-    def connect(self):
-        """Подключение к VIP чату"""
-        self.room_name = "vip"
-        # Теперь вызываем родительский connect, но сначала пропускаем строку с room_name
-        super().connect()
+            })
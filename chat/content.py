@@ -0,0 +1,62 @@
+"""
+Производные от текста сообщения поля.
+
+Вычисляются один раз при записи сообщения (Message.save) и хранятся рядом с
+content, так что чтение истории и рассылки только копируют готовые строки:
+- clean_content - основной текст пересланного сообщения для каскадной пересылки
+  (у обычных сообщений пусто - основной текст совпадает с content);
+- content_snippet - фрагмент для блока ответа (reply_to);
+- mention_text - текст в нижнем регистре для поиска упоминаний (пусто, если
+  в сообщении нет "@" - упоминаний в нем быть не может).
+"""
+
+# Длина фрагмента сообщения в блоке ответа
+SNIPPET_LENGTH = 100
+
+
+def make_snippet(content):
+    """Фрагмент сообщения для блока ответа"""
+    return content[:SNIPPET_LENGTH] + ('...' if len(content) > SNIPPET_LENGTH else '')
+
+
+def make_mention_text(content):
+    """Текст для поиска упоминаний: все паттерны упоминаний начинаются с @"""
+    return content.lower() if '@' in content else ''
+
+
+def extract_clean_content(content):
+    """Извлекает основной контент из пересланного сообщения для каскадной пересылки"""
+    lines = content.strip().split('\n')
+
+    if len(lines) < 3:
+        return content
+
+    # 🎯 КАСКАДНАЯ ЛОГИКА: Ищем пользовательский комментарий ДО секции "Переслано"
+    forwarded_section_start = -1
+
+    # Находим где начинается секция "📤 Переслано"
+    for i, line in enumerate(lines):
+        if line.strip().startswith('📤 Переслано') or line.strip().startswith('Переслано'):
+            forwarded_section_start = i
+            break
+
+    if forwarded_section_start > 0:
+        # Есть пользовательский комментарий ДО секции "Переслано"
+        user_comment_lines = lines[:forwarded_section_start]
+        user_comment = '\n'.join(user_comment_lines).strip()
+        if user_comment:
+            return user_comment
+
+    # Если нет пользовательского комментария, возвращаем только основной текст
+    # после автора (первую содержательную строку, не цитату)
+    if forwarded_section_start >= 0 and forwarded_section_start + 2 < len(lines):
+        # Пропускаем строку "📤 Переслано..." и строку с автором
+        main_content_start = forwarded_section_start + 2
+        if main_content_start < len(lines):
+            main_content = lines[main_content_start].strip()
+            # Возвращаем только первую строку основного контента
+            if main_content and not main_content.startswith('📤'):
+                return main_content
+
+    # Fallback: возвращаем весь контент как есть
+    return content
@@ -0,0 +1,136 @@
+"""
+Журнал событий комнат чата для догрузки пропущенного при переподключении.
+
+Каждое событие комнаты (новое, отредактированное, удаленное, пересланное,
+закрепленное сообщение, реакция) получает возрастающий номер seq и попадает
+в ограниченный журнал из CHAT_EVENT_LOG_SIZE последних событий. Клиент
+запоминает seq последнего полученного события и после обрыва соединения
+присылает fetch_messages с resume_from=<seq>: если журнал покрывает пропуск,
+клиент получает только пропущенные события, иначе - полную историю.
+
+События хранятся в виде готового JSON (как они ушли в группу), поэтому ответ
+на переподключение собирается без повторной сериализации.
+
+Бэкенд выбирается настройкой CHAT_EVENT_LOG_BACKEND: RedisEventLog для
+нескольких воркеров, InMemoryEventLog - для тестов и одного процесса.
+"""
+import json
+from collections import deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# События, которые получают номер и попадают в журнал (присутствие и typing - нет)
+REPLAYABLE_EVENTS = {
+    'new_message', 'message_edited', 'message_deleted', 'message_forwarded',
+    'message_pinned', 'message_unpinned', 'reaction_updated',
+    'messages_forwarded', 'messages_deleted', 'messages_pinned',
+}
+
+_log = None
+
+
+def get_event_log():
+    """Возвращает экземпляр журнала событий (один на процесс)"""
+    global _log
+    if _log is None:
+        _log = import_string(settings.CHAT_EVENT_LOG_BACKEND)()
+    return _log
+
+
+def encode_event(seq, text):
+    """Добавляет номер к уже закодированному событию (JSON-объекту с полем type)"""
+    return f'{{"seq": {seq}, {text[1:]}'
+
+
+class InMemoryEventLog:
+    """Журнал событий в памяти процесса (тесты, локальная разработка с одним воркером)"""
+
+    def __init__(self):
+        self.rooms = {}
+
+    def _room(self, room_name):
+        return self.rooms.setdefault(room_name, {'seq': 0, 'events': deque(maxlen=settings.CHAT_EVENT_LOG_SIZE)})
+
+    async def append(self, room_name, event):
+        """Присваивает событию номер, сохраняет его и возвращает JSON для рассылки"""
+        room = self._room(room_name)
+        room['seq'] += 1
+        text = encode_event(room['seq'], json.dumps(event))
+        room['events'].append((room['seq'], text))
+        return text
+
+    async def last_seq(self, room_name):
+        return self._room(room_name)['seq']
+
+    async def since(self, room_name, seq):
+        """JSON событий после seq или None, если журнал не покрывает пропуск"""
+        room = self._room(room_name)
+        if seq > room['seq']:
+            return None
+        if seq == room['seq']:
+            return []
+        if not room['events'] or room['events'][0][0] > seq + 1:
+            return None
+        return [text for event_seq, text in room['events'] if event_seq > seq]
+
+    async def clear(self, room_name):
+        self.rooms.pop(room_name, None)
+
+
+class RedisEventLog:
+    """Журнал событий в Redis, общий для всех воркеров"""
+
+    # KEYS: счетчик seq (без TTL - номера не должны начинаться заново), журнал (zset seq -> JSON)
+    APPEND_SCRIPT = """
+        local seq = redis.call('INCR', KEYS[1])
+        local text = '{"seq": ' .. seq .. ', ' .. string.sub(ARGV[1], 2)
+        redis.call('ZADD', KEYS[2], seq, text)
+        redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -(tonumber(ARGV[2]) + 1))
+        redis.call('EXPIRE', KEYS[2], ARGV[3])
+        return text
+    """
+
+    SINCE_SCRIPT = """
+        local last = tonumber(redis.call('GET', KEYS[1]) or '0')
+        local seq = tonumber(ARGV[1])
+        if seq > last then
+            return false
+        end
+        if seq == last then
+            return {}
+        end
+        local oldest = redis.call('ZRANGE', KEYS[2], 0, 0, 'WITHSCORES')
+        if #oldest == 0 or tonumber(oldest[2]) > seq + 1 then
+            return false
+        end
+        return redis.call('ZRANGEBYSCORE', KEYS[2], '(' .. seq, '+inf')
+    """
+
+    def __init__(self, url=None):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url or settings.REDIS_URL, decode_responses=True)
+        self.append_script = self.client.register_script(self.APPEND_SCRIPT)
+        self.since_script = self.client.register_script(self.SINCE_SCRIPT)
+
+    def _keys(self, room_name):
+        prefix = f"chat:events:{room_name}"
+        return [f"{prefix}:seq", f"{prefix}:log"]
+
+    async def append(self, room_name, event):
+        """Присваивает событию номер, сохраняет его и возвращает JSON для рассылки"""
+        return await self.append_script(
+            keys=self._keys(room_name),
+            args=[json.dumps(event), settings.CHAT_EVENT_LOG_SIZE, settings.CHAT_EVENT_LOG_TTL],
+        )
+
+    async def last_seq(self, room_name):
+        return int(await self.client.get(self._keys(room_name)[0]) or 0)
+
+    async def since(self, room_name, seq):
+        """JSON событий после seq или None, если журнал не покрывает пропуск"""
+        return await self.since_script(keys=self._keys(room_name), args=[seq])
+
+    async def clear(self, room_name):
+        await self.client.delete(*self._keys(room_name))
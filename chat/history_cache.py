@@ -0,0 +1,252 @@
+"""
+Горячий кеш последних сообщений комнат чата.
+
+Для каждой комнаты хранится окно из CHAT_HISTORY_CACHE_SIZE последних
+сообщений в виде записей build_cache_entries: общие для всех поля плюс
+служебные данные для полей получателя (is_own, user_reaction, mentions_me),
+которые накладываются при отправке. Подключение к комнате с теплым кешем
+не загружает историю из БД - волна переподключений после деплоя почти не
+нагружает базу.
+
+Окно наполняется из БД при первом обращении и дальше поддерживается
+консьюмером: новые и пересланные сообщения добавляются, правки, закрепления
+и реакции заменяют запись, удаленные сообщения убираются. Кеш живет
+CHAT_HISTORY_CACHE_TTL секунд с последнего наполнения или добавления, так что
+изменения в обход консьюмера (например, через админку) со временем подхватываются.
+
+Бэкенд выбирается настройкой CHAT_HISTORY_CACHE_BACKEND: RedisHistoryCache для
+нескольких воркеров, InMemoryHistoryCache - для тестов и одного процесса.
+"""
+import json
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+_cache = None
+
+
+def get_history_cache():
+    """Возвращает экземпляр кеша истории (один на процесс)"""
+    global _cache
+    if _cache is None:
+        _cache = import_string(settings.CHAT_HISTORY_CACHE_BACKEND)()
+    return _cache
+
+
+def _score(entry):
+    """Порядок записи в окне: время создания (одинаковое время упорядочивается по id)"""
+    return datetime.fromisoformat(entry['created']).timestamp()
+
+
+def page_from_window(window, anchor_id=None, around=50, latest=100):
+    """
+    Страница истории из окна кеша в формате chat.pagination.fetch_page.
+
+    Без якоря - последние latest сообщений; с якорем - around сообщений до него,
+    сам якорь и around после. None, если окна недостаточно (якоря нет в окне или
+    перед ним в окне меньше around сообщений, а в БД есть более старые).
+    """
+    entries = window['entries']
+    if anchor_id is None:
+        start, end = max(0, len(entries) - latest), len(entries)
+    else:
+        index = next((i for i, entry in enumerate(entries) if entry['id'] == str(anchor_id)), None)
+        if index is None:
+            return None
+        start, end = index - around, index + around + 1
+        if start < 0:
+            if window['has_more_before']:
+                return None
+            start = 0
+
+    page = entries[start:end]
+    return {
+        'messages': page,
+        'before_cursor': page[0]['cursor'] if page else None,
+        'after_cursor': page[-1]['cursor'] if page else None,
+        'has_more_before': start > 0 or window['has_more_before'],
+        'has_more_after': end < len(entries),
+    }
+
+
+class InMemoryHistoryCache:
+    """Кеш истории в памяти процесса (тесты, локальная разработка с одним воркером)"""
+
+    def __init__(self):
+        self.rooms = {}
+
+    async def get(self, room_name):
+        """Окно {'entries': [...], 'has_more_before': bool} или None, если кеш холодный"""
+        room = self._room(room_name)
+        if room is None:
+            return None
+        entries = sorted((json.loads(entry) for entry in room['entries'].values()), key=lambda e: (_score(e), e['id']))
+        return {'entries': entries, 'has_more_before': room['has_more_before']}
+
+    async def fill(self, room_name, entries, has_more_before):
+        """Наполняет окно из БД, не перезаписывая уже добавленные записи"""
+        room = self._room(room_name) or {'entries': {}, 'has_more_before': has_more_before}
+        room['has_more_before'] = has_more_before
+        for entry in entries:
+            room['entries'].setdefault(entry['id'], json.dumps(entry))
+        self._store(room_name, room)
+
+    async def append(self, room_name, entry):
+        """Добавляет новое сообщение в теплое окно"""
+        room = self._room(room_name)
+        if room is None:
+            return
+        room['entries'][entry['id']] = json.dumps(entry)
+        self._store(room_name, room)
+
+    async def replace(self, room_name, entry):
+        """Обновляет запись, если сообщение есть в окне"""
+        room = self._room(room_name)
+        if room is not None and entry['id'] in room['entries']:
+            room['entries'][entry['id']] = json.dumps(entry)
+
+    async def remove(self, room_name, message_id):
+        room = self._room(room_name)
+        if room is not None:
+            room['entries'].pop(str(message_id), None)
+
+    async def clear(self, room_name):
+        self.rooms.pop(room_name, None)
+
+    def _room(self, room_name):
+        room = self.rooms.get(room_name)
+        if room is None or room['expires_at'] <= time.time():
+            return None
+        return room
+
+    def _store(self, room_name, room):
+        """Обрезает окно до CHAT_HISTORY_CACHE_SIZE последних сообщений и продлевает TTL"""
+        extra = len(room['entries']) - settings.CHAT_HISTORY_CACHE_SIZE
+        if extra > 0:
+            oldest = sorted(room['entries'].items(), key=lambda item: (_score(json.loads(item[1])), item[0]))
+            for message_id, _ in oldest[:extra]:
+                del room['entries'][message_id]
+            room['has_more_before'] = True
+        room['expires_at'] = time.time() + settings.CHAT_HISTORY_CACHE_TTL
+        self.rooms[room_name] = room
+
+
+class RedisHistoryCache:
+    """Кеш истории в Redis, общий для всех воркеров"""
+
+    # KEYS: записи (hash id -> JSON), порядок (zset id по времени), мета (has_more_before)
+    # Общий хвост скриптов: обрезка окна и продление TTL; ARGV[1] - размер окна, ARGV[2] - TTL
+    TRIM = """
+        local extra = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[1])
+        if extra > 0 then
+            local oldest = redis.call('ZRANGE', KEYS[2], 0, extra - 1)
+            redis.call('ZREMRANGEBYRANK', KEYS[2], 0, extra - 1)
+            redis.call('HDEL', KEYS[1], unpack(oldest))
+            redis.call('SET', KEYS[3], '1')
+        end
+        for i = 1, 3 do
+            redis.call('EXPIRE', KEYS[i], ARGV[2])
+        end
+    """
+
+    GET_SCRIPT = """
+        local meta = redis.call('GET', KEYS[3])
+        if not meta then
+            return false
+        end
+        local result = {meta}
+        local ids = redis.call('ZRANGE', KEYS[2], 0, -1)
+        if #ids > 0 then
+            for _, entry in ipairs(redis.call('HMGET', KEYS[1], unpack(ids))) do
+                if entry then
+                    table.insert(result, entry)
+                end
+            end
+        end
+        return result
+    """
+
+    # ARGV[3] - has_more_before, далее тройки (id, score, JSON)
+    FILL_SCRIPT = """
+        redis.call('SET', KEYS[3], ARGV[3])
+        for i = 4, #ARGV, 3 do
+            if redis.call('HSETNX', KEYS[1], ARGV[i], ARGV[i + 2]) == 1 then
+                redis.call('ZADD', KEYS[2], ARGV[i + 1], ARGV[i])
+            end
+        end
+    """ + TRIM
+
+    # ARGV[3..5] - id, score, JSON
+    APPEND_SCRIPT = """
+        if redis.call('EXISTS', KEYS[3]) == 0 then
+            return 0
+        end
+        redis.call('HSET', KEYS[1], ARGV[3], ARGV[5])
+        redis.call('ZADD', KEYS[2], ARGV[4], ARGV[3])
+    """ + TRIM + """
+        return 1
+    """
+
+    REPLACE_SCRIPT = """
+        if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+            return 0
+        end
+        redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+        return 1
+    """
+
+    def __init__(self, url=None):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url or settings.REDIS_URL, decode_responses=True)
+        self.get_script = self.client.register_script(self.GET_SCRIPT)
+        self.fill_script = self.client.register_script(self.FILL_SCRIPT)
+        self.append_script = self.client.register_script(self.APPEND_SCRIPT)
+        self.replace_script = self.client.register_script(self.REPLACE_SCRIPT)
+
+    def _keys(self, room_name):
+        prefix = f"chat:history:{room_name}"
+        return [f"{prefix}:entries", f"{prefix}:order", f"{prefix}:meta"]
+
+    def _window_args(self):
+        return [settings.CHAT_HISTORY_CACHE_SIZE, settings.CHAT_HISTORY_CACHE_TTL]
+
+    async def get(self, room_name):
+        """Окно {'entries': [...], 'has_more_before': bool} или None, если кеш холодный"""
+        result = await self.get_script(keys=self._keys(room_name))
+        if not result:
+            return None
+        return {
+            'entries': [json.loads(entry) for entry in result[1:]],
+            'has_more_before': result[0] == '1',
+        }
+
+    async def fill(self, room_name, entries, has_more_before):
+        """Наполняет окно из БД, не перезаписывая уже добавленные записи"""
+        args = [*self._window_args(), '1' if has_more_before else '0']
+        for entry in entries:
+            args.extend([entry['id'], _score(entry), json.dumps(entry)])
+        await self.fill_script(keys=self._keys(room_name), args=args)
+
+    async def append(self, room_name, entry):
+        """Добавляет новое сообщение в теплое окно"""
+        await self.append_script(
+            keys=self._keys(room_name),
+            args=[*self._window_args(), entry['id'], _score(entry), json.dumps(entry)],
+        )
+
+    async def replace(self, room_name, entry):
+        """Обновляет запись, если сообщение есть в окне"""
+        await self.replace_script(keys=self._keys(room_name), args=[entry['id'], json.dumps(entry)])
+
+    async def remove(self, room_name, message_id):
+        keys = self._keys(room_name)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hdel(keys[0], str(message_id))
+            pipe.zrem(keys[1], str(message_id))
+            await pipe.execute()
+
+    async def clear(self, room_name):
+        await self.client.delete(*self._keys(room_name))
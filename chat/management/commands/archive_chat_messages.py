@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat.archive import archive_old_messages
+from chat.models import Room
+
+
+class Command(BaseCommand):
+    help = 'Переносит старые сообщения чата в архив (ArchivedMessage), оставляя закрепленные и их ветки ответов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CHAT_ARCHIVE_AFTER_DAYS,
+                            help='Архивировать сообщения старше стольких дней')
+        parser.add_argument('--room', type=str, help='Архивировать только одну комнату (name)')
+        parser.add_argument('--batch-size', type=int, default=settings.CHAT_ARCHIVE_BATCH_SIZE,
+                            help='Сколько сообщений переносить за одну транзакцию')
+
+    def handle(self, *args, **options):
+        rooms = Room.objects.all()
+        if options['room']:
+            rooms = rooms.filter(name=options['room'])
+
+        archived = archive_old_messages(options['days'], rooms, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Перенесено в архив сообщений: {archived}'))
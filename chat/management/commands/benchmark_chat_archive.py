@@ -0,0 +1,115 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat.archive import archive_room, fetch_room_page
+from chat.models import Room, Message, ArchivedMessage
+from chat.pagination import DIRECTION_AROUND, DIRECTION_BEFORE, encode_cursor
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Бенчмарк архивации истории чата: для комнат с разным объемом истории измеряет '
+        'горячие запросы (последняя страница, подгрузка у края свежих сообщений) до и после '
+        'переноса старых сообщений в архив, а также переход к сообщению из архива.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000',
+                            help='Объемы истории комнат (всего сообщений) через запятую')
+        parser.add_argument('--hot', type=int, default=5000,
+                            help='Сколько сообщений в каждой комнате моложе CHAT_ARCHIVE_AFTER_DAYS')
+        parser.add_argument('--page-size', type=int, default=50, help='Размер страницы')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов каждого замера')
+        parser.add_argument('--batch-size', type=int, default=10_000, help='Размер пакета при наполнении')
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        cutoff = timezone.now() - timedelta(days=settings.CHAT_ARCHIVE_AFTER_DAYS)
+
+        self.stdout.write(f'\n📊 Архив истории: {options["hot"]} свежих сообщений, страница {page_size}')
+        self.stdout.write(
+            '├─ история | в Message | последняя страница, мс (до → после) '
+            '| край свежих, мс (до → после) | контекст в архиве, мс'
+        )
+        for size in [int(size) for size in options['sizes'].split(',') if size.strip()]:
+            room = self.seed(f'benchmark_archive_{size}', size, options['hot'], options['batch_size'])
+
+            before = None
+            if not ArchivedMessage.objects.filter(room=room).exists():
+                before = self.measure_hot(room, page_size, options['repeat'])
+                archive_room(room, cutoff)
+            room.refresh_from_db()
+            after = self.measure_hot(room, page_size, options['repeat'])
+
+            archived = ArchivedMessage.objects.filter(room=room, is_deleted=False).order_by('created_at', 'id')
+            anchor = archived[archived.count() // 2]
+            context = self.measure(
+                lambda room=room, anchor=anchor: fetch_room_page(room, encode_cursor(anchor), DIRECTION_AROUND, page_size),
+                options['repeat'],
+            )
+
+            hot_rows = Message.objects.filter(room=room).count()
+            latest_before, edge_before = ('—', '—') if before is None else (f'{before[0]:.2f}', f'{before[1]:.2f}')
+            latest = f'{latest_before:>8} → {after[0]:.2f}'
+            edge = f'{edge_before:>8} → {after[1]:.2f}'
+            self.stdout.write(f'├─ {size:>7} | {hot_rows:>9} | {latest:<36} | {edge:<28} | {context:.2f}')
+
+        self.stdout.write(self.style.SUCCESS('└─ Готово'))
+
+    def measure_hot(self, room, page_size, repeat):
+        """Медианы: последняя страница и страница у края свежих сообщений (там, где начинается архив)"""
+        latest = self.measure(lambda: fetch_room_page(room, None, DIRECTION_BEFORE, page_size), repeat)
+
+        edge_message = Message.objects.filter(
+            room=room, is_deleted=False, created_at__gte=timezone.now() - timedelta(days=settings.CHAT_ARCHIVE_AFTER_DAYS)
+        ).order_by('created_at', 'id')[page_size]
+        edge = self.measure(
+            lambda: fetch_room_page(room, encode_cursor(edge_message), DIRECTION_BEFORE, page_size // 2), repeat
+        )
+        return latest, edge
+
+    def seed(self, room_name, messages_count, hot_count, batch_size):
+        """Создает комнату: старые сообщения (старше срока архивации) и hot_count свежих, по секунде между ними"""
+        room, created = Room.objects.get_or_create(name=room_name)
+        if not created:
+            return room
+
+        author, _ = User.objects.get_or_create(
+            username='bench_archive_author', defaults={'email': 'bench_archive_author@example.com'}
+        )
+        self.stdout.write(f'⏳ Создаем {messages_count} сообщений в {room_name}...')
+        now = timezone.now()
+        old_start = now - timedelta(days=settings.CHAT_ARCHIVE_AFTER_DAYS + 1, seconds=messages_count)
+        hot_start = now - timedelta(seconds=hot_count)
+        old_count = messages_count - hot_count
+        for batch_start in range(0, messages_count, batch_size):
+            batch_end = min(batch_start + batch_size, messages_count)
+            messages = [
+                Message(
+                    room=room, author=author, content=f'История #{i}',
+                    created_at=old_start + timedelta(seconds=i) if i < old_count else hot_start + timedelta(seconds=i - old_count)
+                )
+                for i in range(batch_start, batch_end)
+            ]
+            # bulk_create не вызывает save - производные поля заполняем сами
+            for message in messages:
+                message.fill_derived_content()
+            Message.objects.bulk_create(messages, batch_size=batch_size)
+        return room
+
+    def measure(self, fn, repeat):
+        """Медиана времени выполнения, мс"""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
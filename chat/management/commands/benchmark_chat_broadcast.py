@@ -0,0 +1,122 @@
+import asyncio
+import json
+import statistics
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from chat.consumers import ChatConsumer
+from chat.models import Room, Message
+from chat.serializers import ChatMessageSerializer, broadcast_message, build_cache_entries
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Бенчмарк рассылки события в группу чата: CPU на одну рассылку нового сообщения '
+        'N подписчикам. Сравнивает прежний протокол (словарь события, json.dumps в каждом '
+        'консьюмере) с рассылкой заранее закодированного JSON. Подписчики - консьюмеры на '
+        'in-memory channel layer без websocket-подключений, отправка клиенту только учитывается.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumers', type=int, default=1000, help='Количество подписчиков группы')
+        parser.add_argument('--broadcasts', type=int, default=20, help='Количество рассылок на режим')
+
+    def handle(self, *args, **options):
+        message = self.prepare_message()
+        results = [
+            asyncio.run(self.run_mode(mode, message, options['consumers'], options['broadcasts']))
+            for mode in ('per_consumer', 'encode_once')
+        ]
+
+        self.stdout.write(f"\n📊 Рассылка нового сообщения {options['consumers']} подписчикам:")
+        self.stdout.write(
+            '├─ режим         | group_send, мс | консьюмеры, мс | CPU на рассылку, мс | мкс на получателя | байт в кадре'
+        )
+        for result in results:
+            self.stdout.write(
+                f"├─ {result['mode']:<13} | {result['send_ms']:>14.1f} | {result['handle_ms']:>14.1f} | "
+                f"{result['cpu_ms']:>19.1f} | {result['cpu_us_per_recipient']:>17.1f} | {result['frame_bytes']:>12}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"└─ Ускорение: {results[0]['cpu_ms'] / results[1]['cpu_ms']:.1f}x" if results[1]['cpu_ms'] else '└─ Готово'
+        ))
+
+    def prepare_data(self):
+        room, _ = Room.objects.get_or_create(name='benchmark_broadcast')
+        author, _ = User.objects.get_or_create(
+            username='bench_broadcast_author', defaults={'email': 'bench_broadcast_author@example.com'}
+        )
+        parent = Message.objects.create(room=room, author=author, content='Исходное сообщение')
+        return Message.objects.create(
+            room=room, author=author, parent=parent,
+            content='Сообщение для бенчмарка рассылки с упоминанием @bench_broadcast_author ' + 'текст ' * 40
+        )
+
+    def prepare_message(self):
+        """Готовит обе формы сообщения: прежний JSON отправителя и общую запись для рассылки"""
+        message = self.prepare_data()
+        return {
+            'legacy': ChatMessageSerializer(message.author).serialize([message])[0],
+            'shared': broadcast_message(build_cache_entries([message])[0], [message.author_id]),
+        }
+
+    async def run_mode(self, mode, message, consumers_count, broadcasts):
+        layer = InMemoryChannelLayer(capacity=broadcasts + 10)
+        group = 'chat_benchmark_broadcast'
+        frames = []
+
+        async def send(text_data=None, bytes_data=None):
+            frames.append(len(text_data))
+
+        consumers = []
+        for _ in range(consumers_count):
+            consumer = ChatConsumer()
+            consumer.channel_name = await layer.new_channel()
+            consumer.send = send
+            await layer.group_add(group, consumer.channel_name)
+            consumers.append(consumer)
+
+        async def legacy_handler(consumer, event):
+            # Прежний обработчик new_message: каждый консьюмер заново кодирует событие
+            await consumer.send(text_data=json.dumps({"type": "new_message", "message": event["message"]}))
+
+        send_timings, handle_timings = [], []
+        for _ in range(broadcasts):
+            frames.clear()
+            started = time.process_time()
+            if mode == 'per_consumer':
+                await layer.group_send(group, {"type": "new_message", "message": message['legacy']})
+            else:
+                await layer.group_send(group, {
+                    "type": "broadcast_event",
+                    "text": json.dumps({"type": "new_message", "message": message['shared']})
+                })
+            send_timings.append((time.process_time() - started) * 1000)
+
+            # layer.receive() чистит просроченные сообщения во всех каналах (O(N) на вызов) -
+            # это особенность in-memory слоя, поэтому события забираются из очередей вне замера
+            events = [layer.channels[consumer.channel_name].get_nowait()[1] for consumer in consumers]
+
+            started = time.process_time()
+            for consumer, event in zip(consumers, events):
+                if mode == 'per_consumer':
+                    await legacy_handler(consumer, event)
+                else:
+                    await consumer.broadcast_event(event)
+            handle_timings.append((time.process_time() - started) * 1000)
+
+        send_ms, handle_ms = statistics.median(send_timings), statistics.median(handle_timings)
+        cpu_ms = send_ms + handle_ms
+        return {
+            'mode': mode,
+            'send_ms': send_ms,
+            'handle_ms': handle_ms,
+            'cpu_ms': cpu_ms,
+            'cpu_us_per_recipient': cpu_ms * 1000 / consumers_count,
+            'frame_bytes': frames[0] if frames else 0,
+        }
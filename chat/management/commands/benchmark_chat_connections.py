@@ -0,0 +1,171 @@
+import asyncio
+import statistics
+import time
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from chat.models import Room, Message
+from chat.routing import websocket_urlpatterns
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Бенчмарк чата: сколько одновременных подключений выдерживает один воркер. '
+        'Каждый клиент подключается, запрашивает историю и ждет unread_info. '
+        'Параллельно пара клиентов-зондов обменивается typing-событиями: их задержка показывает, '
+        'блокируют ли обращения к БД доставку легких событий. '
+        'Используется in-memory channel layer, сообщения и пользователи создаются в текущей БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room', default='general', help='Комната чата (по умолчанию general)')
+        parser.add_argument('--levels', default='10,50,100,200',
+                            help='Уровни одновременных подключений через запятую')
+        parser.add_argument('--seed-messages', type=int, default=100,
+                            help='Сколько сообщений гарантированно должно быть в комнате')
+        parser.add_argument('--latency-budget-ms', type=float, default=1000.0,
+                            help='Допустимая p95-задержка подключения, мс')
+        parser.add_argument('--timeout', type=float, default=60.0,
+                            help='Таймаут ожидания ответа одного клиента, с')
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['levels'].split(',') if level.strip()]
+        room_name = options['room']
+
+        users = self.prepare_data(room_name, max(levels) + 2, options['seed_messages'])
+        probe_users, users = users[:2], users[2:]
+
+        # Ограничитель частоты кадров (chat.rate_limit) не должен искажать замер
+        with override_settings(
+            CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+            CHAT_RATE_LIMITS={'default': (10 ** 6, 10 ** 6)},
+        ):
+            results = [
+                asyncio.run(self.run_level(users[:level], probe_users, room_name, options['timeout']))
+                for level in levels
+            ]
+
+        self.stdout.write(f'\n📊 Бенчмарк подключений к чату «{room_name}»:')
+        self.stdout.write('├─ клиентов | всего, с | подключений/с | p50, мс | p95, мс | typing p95, мс | ошибок')
+        best_level = 0
+        for result in results:
+            self.stdout.write(
+                f"├─ {result['clients']:>8} | {result['wall_time']:>8.2f} | {result['throughput']:>13.1f} | "
+                f"{result['p50_ms']:>7.0f} | {result['p95_ms']:>7.0f} | {result['typing_p95_ms']:>14.0f} | {result['errors']}"
+            )
+            if result['errors'] == 0 and result['p95_ms'] <= options['latency_budget_ms']:
+                best_level = max(best_level, result['clients'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"└─ Одновременных подключений на воркер в пределах p95 ≤ {options['latency_budget_ms']:.0f} мс: {best_level}"
+        ))
+
+    def prepare_data(self, room_name, users_count, seed_messages):
+        """Создает пользователей и сообщения для бенчмарка"""
+        room, _ = Room.objects.get_or_create(name=room_name)
+
+        users = []
+        for i in range(users_count):
+            user, created = User.objects.get_or_create(
+                username=f'bench_user_{i}',
+                defaults={'email': f'bench_user_{i}@example.com'}
+            )
+            users.append(user)
+
+        missing = seed_messages - room.messages.filter(is_deleted=False).count()
+        if missing > 0:
+            messages = [
+                Message(room=room, author=users[i % len(users)], content=f'Сообщение для бенчмарка #{i}')
+                for i in range(missing)
+            ]
+            # bulk_create не вызывает save - производные поля заполняем сами
+            for message in messages:
+                message.fill_derived_content()
+            Message.objects.bulk_create(messages)
+
+        return users
+
+    async def run_level(self, users, probe_users, room_name, timeout):
+        """Подключает всех клиентов одновременно и замеряет задержку каждого"""
+        application = URLRouter(websocket_urlpatterns)
+        latencies = []
+        typing_latencies = []
+        errors = 0
+
+        def make_communicator(user):
+            communicator = WebsocketCommunicator(application, f'/ws/chat/{room_name}/')
+            communicator.scope['user'] = user
+            return communicator
+
+        async def client(user):
+            communicator = make_communicator(user)
+            started = time.perf_counter()
+            try:
+                connected, _ = await communicator.connect(timeout=timeout)
+                if not connected:
+                    return None
+                await communicator.send_json_to({'type': 'fetch_messages'})
+                while True:
+                    response = await communicator.receive_json_from(timeout=timeout)
+                    if response.get('type') == 'unread_info':
+                        break
+                return time.perf_counter() - started
+            finally:
+                await communicator.disconnect()
+
+        async def typing_probe(sender, listener, stop):
+            """Замеряет время доставки typing-события, пока идут подключения"""
+            is_typing = False
+            while not stop.is_set():
+                # Смена состояния рассылается всегда, повторные кадры сервер прореживает
+                is_typing = not is_typing
+                started = time.perf_counter()
+                await sender.send_json_to({'type': 'typing', 'is_typing': is_typing})
+                while True:
+                    response = await listener.receive_json_from(timeout=timeout)
+                    if response.get('type') == 'typing':
+                        break
+                typing_latencies.append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(0.05)
+
+        sender, listener = make_communicator(probe_users[0]), make_communicator(probe_users[1])
+        await sender.connect(timeout=timeout)
+        await listener.connect(timeout=timeout)
+        stop = asyncio.Event()
+        probe = asyncio.create_task(typing_probe(sender, listener, stop))
+
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(client(user) for user in users), return_exceptions=True)
+        wall_time = time.perf_counter() - started
+
+        stop.set()
+        await probe
+        await sender.disconnect()
+        await listener.disconnect()
+
+        for outcome in outcomes:
+            if isinstance(outcome, float):
+                latencies.append(outcome * 1000)
+            else:
+                errors += 1
+
+        latencies.sort()
+        typing_latencies.sort()
+        return {
+            'clients': len(users),
+            'wall_time': wall_time,
+            'throughput': len(latencies) / wall_time if wall_time else 0.0,
+            'p50_ms': statistics.median(latencies) if latencies else 0.0,
+            'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0,
+            'typing_p95_ms': (
+                typing_latencies[min(len(typing_latencies) - 1, int(len(typing_latencies) * 0.95))]
+                if typing_latencies else 0.0
+            ),
+            'errors': errors,
+        }
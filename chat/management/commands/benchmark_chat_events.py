@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from chat.coalescing import metrics
+from chat.models import Room, Message
+from chat.routing import websocket_urlpatterns
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Бенчмарк прореживания событий чата: один клиент печатает и прокручивает историю '
+        'с заданной частотой, второй слушает. Выводит, сколько кадров typing дошло до группы '
+        'и сколько кадров save_position превратилось в записи в БД (счетчики chat.coalescing).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room', default='general', help='Комната чата (по умолчанию general)')
+        parser.add_argument('--duration', type=float, default=10.0, help='Длительность сессии, с')
+        parser.add_argument('--keystroke-ms', type=float, default=120.0, help='Интервал между нажатиями клавиш, мс')
+        parser.add_argument('--scroll-ms', type=float, default=50.0, help='Интервал между событиями скролла, мс')
+
+    def handle(self, *args, **options):
+        room, _ = Room.objects.get_or_create(name=options['room'])
+        typist, _ = User.objects.get_or_create(username='bench_typist', defaults={'email': 'bench_typist@example.com'})
+        listener, _ = User.objects.get_or_create(username='bench_listener', defaults={'email': 'bench_listener@example.com'})
+        message = room.messages.filter(is_deleted=False).last() or Message.objects.create(
+            room=room, author=listener, content='Сообщение для бенчмарка событий'
+        )
+
+        before = metrics.copy()
+        # Ограничитель частоты кадров (chat.rate_limit) не должен искажать замер
+        with override_settings(
+            CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+            CHAT_RATE_LIMITS={'default': (10 ** 6, 10 ** 6)},
+        ):
+            typing_received = asyncio.run(self.run_session(room.name, typist, listener, str(message.id), options))
+        delta = {name: metrics[name] - before[name] for name in metrics}
+
+        self.stdout.write(f"\n📊 Прореживание событий за {options['duration']:.0f} с:")
+        self.stdout.write(
+            f"├─ typing: кадров от клиента {delta.get('typing_frames', 0)}, разослано {delta.get('typing_broadcasts', 0)} "
+            f"(получено слушателем {typing_received}), отброшено {delta.get('typing_dropped', 0)}, "
+            f"автоостановок {delta.get('typing_auto_stops', 0)}"
+        )
+        frames, writes = delta.get('position_frames', 0), delta.get('position_writes', 0)
+        self.stdout.write(
+            f"├─ save_position: кадров {frames}, записей в БД {writes}, сэкономлено {delta.get('position_writes_saved', 0)}"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"└─ Усиление записи: {frames / writes if writes else 0:.1f} кадров на одну запись (было 1.0)"
+        ))
+
+    async def run_session(self, room_name, typist, listener, message_id, options):
+        application = URLRouter(websocket_urlpatterns)
+
+        async def connect(user):
+            communicator = WebsocketCommunicator(application, f'/ws/chat/{room_name}/')
+            communicator.scope['user'] = user
+            await communicator.connect()
+            return communicator
+
+        sender, receiver = await connect(typist), await connect(listener)
+        deadline = time.monotonic() + options['duration']
+
+        async def type_keys():
+            while time.monotonic() < deadline:
+                await sender.send_json_to({'type': 'typing', 'is_typing': True})
+                await asyncio.sleep(options['keystroke_ms'] / 1000)
+
+        async def scroll():
+            percent = 0.0
+            while time.monotonic() < deadline:
+                percent = (percent + 1.5) % 100
+                await sender.send_json_to({
+                    'type': 'save_position', 'last_visible_message_id': message_id, 'scroll_position_percent': percent
+                })
+                await asyncio.sleep(options['scroll_ms'] / 1000)
+
+        await asyncio.gather(type_keys(), scroll())
+        await sender.disconnect()
+
+        typing_received = 0
+        while not await receiver.receive_nothing(timeout=0.2):
+            if (await receiver.receive_json_from())['type'] == 'typing':
+                typing_received += 1
+        await receiver.disconnect()
+        return typing_received
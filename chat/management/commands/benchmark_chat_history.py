@@ -0,0 +1,100 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat.models import Room, Message
+from chat.pagination import DIRECTION_BEFORE, encode_cursor, fetch_page
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Бенчмарк пагинации истории чата: сравнивает загрузку страницы на разной глубине '
+        'через OFFSET, через опорное сообщение + created_at__lt (старый load_more_messages) '
+        'и через keyset-курсор (created_at, id). Комната наполняется сообщениями в текущей БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room', default='benchmark_history', help='Комната для бенчмарка')
+        parser.add_argument('--messages', type=int, default=1_000_000,
+                            help='Сколько сообщений должно быть в комнате')
+        parser.add_argument('--page-size', type=int, default=50, help='Размер страницы')
+        parser.add_argument('--depths', default='0,0.25,0.5,0.9,0.99',
+                            help='Глубины истории (доля от общего числа сообщений) через запятую')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов на каждую глубину')
+        parser.add_argument('--batch-size', type=int, default=10_000, help='Размер пакета при наполнении')
+
+    def handle(self, *args, **options):
+        room = self.seed(options['room'], options['messages'], options['batch_size'])
+        queryset = Message.objects.filter(room=room, is_deleted=False)
+        total = queryset.count()
+        page_size = options['page_size']
+
+        self.stdout.write(f'\n📊 Пагинация истории: {total} сообщений, страница {page_size}')
+        self.stdout.write('├─ глубина | OFFSET, мс | anchor + created_at__lt, мс | keyset, мс')
+        for depth in [float(depth) for depth in options['depths'].split(',') if depth.strip()]:
+            offset = min(total - 1, int(total * depth))
+            # Опорное сообщение на нужной глубине (считая от последнего)
+            anchor = queryset.order_by('-created_at', '-id')[offset]
+            cursor = encode_cursor(anchor)
+
+            # Значения итерации связываются аргументами по умолчанию
+            def offset_page(offset=offset):
+                return list(queryset.order_by('-created_at', '-id')[offset + 1:offset + 1 + page_size])
+
+            def anchor_page(anchor=anchor):
+                anchor_message = Message.objects.get(id=anchor.id)
+                return list(queryset.filter(
+                    created_at__lt=anchor_message.created_at
+                ).order_by('-created_at')[:page_size])
+
+            def keyset_page(cursor=cursor):
+                return fetch_page(queryset, cursor, DIRECTION_BEFORE, page_size)['messages']
+
+            timings = [self.measure(fn, options['repeat']) for fn in (offset_page, anchor_page, keyset_page)]
+            self.stdout.write(
+                f'├─ {depth:>7.0%} | {timings[0]:>10.2f} | {timings[1]:>27.2f} | {timings[2]:>10.2f}'
+            )
+
+        self.stdout.write(self.style.SUCCESS('└─ Готово'))
+
+    def seed(self, room_name, messages_count, batch_size):
+        """Дозаполняет комнату до нужного числа сообщений (по секунде между сообщениями)"""
+        room, _ = Room.objects.get_or_create(name=room_name)
+        author, _ = User.objects.get_or_create(
+            username='bench_history_author', defaults={'email': 'bench_history_author@example.com'}
+        )
+
+        existing = room.messages.count()
+        if existing >= messages_count:
+            return room
+
+        self.stdout.write(f'⏳ Создаем {messages_count - existing} сообщений...')
+        started = timezone.now() - timedelta(seconds=messages_count)
+        for batch_start in range(existing, messages_count, batch_size):
+            batch_end = min(batch_start + batch_size, messages_count)
+            messages = [
+                # Каждые 10 сообщений имеют одинаковое время - как при пиковой нагрузке
+                Message(room=room, author=author, content=f'История #{i}',
+                        created_at=started + timedelta(seconds=i // 10))
+                for i in range(batch_start, batch_end)
+            ]
+            # bulk_create не вызывает save - производные поля заполняем сами
+            for message in messages:
+                message.fill_derived_content()
+            Message.objects.bulk_create(messages, batch_size=batch_size)
+        return room
+
+    def measure(self, fn, repeat):
+        """Медиана времени выполнения, мс"""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
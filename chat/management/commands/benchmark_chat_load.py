@@ -0,0 +1,378 @@
+import asyncio
+import contextvars
+import json
+import random
+import time
+from collections import Counter, defaultdict
+
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.urls import re_path
+from django.utils import timezone
+
+from chat.consumers import ChatConsumer
+from chat.models import Room, Message
+
+User = get_user_model()
+
+# Смесь действий клиента по умолчанию (веса)
+DEFAULT_MIX = 'message:25,reaction:15,typing:30,save_position:25,reconnect:5'
+
+PHRASES = [
+    'Всем привет!',
+    'Поливаю рассаду через день, листья уже расправились.',
+    'Глянь фото, это дефицит азота или просто перелив?',
+    'Согласен, лучше не торопиться с пересадкой.',
+    'Купил новую лампу, в спектре заметно больше красного - посмотрим на результат через неделю.',
+    'Спасибо за совет 👍',
+]
+
+# Счетчик запросов обрабатываемого события: контекст копируется в поток database_sync_to_async
+current_event = contextvars.ContextVar('chat_load_event', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    counter = current_event.get()
+    if counter is not None:
+        counter['queries'] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter():
+    """Подключает счетчик запросов к соединению потока, в котором работает database_sync_to_async"""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def percentile(values, q):
+    """Перцентиль по отсортированному списку (как в остальных бенчмарках чата)"""
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+class Recorder:
+    """Время и число запросов к БД каждого обработанного сервером события по типам"""
+
+    def __init__(self):
+        self.timings = defaultdict(list)
+        self.queries = defaultdict(list)
+
+    def record(self, event_type, elapsed, queries):
+        self.timings[event_type].append(elapsed * 1000)
+        self.queries[event_type].append(queries)
+
+    def summary(self):
+        events = {}
+        for event_type, timings in sorted(self.timings.items()):
+            timings = sorted(timings)
+            queries = self.queries[event_type]
+            events[event_type] = {
+                'count': len(timings),
+                'p50_ms': round(percentile(timings, 0.50), 3),
+                'p95_ms': round(percentile(timings, 0.95), 3),
+                'p99_ms': round(percentile(timings, 0.99), 3),
+                'max_ms': round(timings[-1], 3),
+                'queries_per_event': round(sum(queries) / len(queries), 2),
+                'max_queries': max(queries),
+            }
+        return events
+
+
+class MeasuredChatConsumer(ChatConsumer):
+    """ChatConsumer, который замеряет время и запросы к БД каждого подключения, кадра и отключения"""
+
+    recorder = None
+
+    async def measure(self, event_type, coroutine):
+        counter = {'queries': 0}
+        token = current_event.set(counter)
+        started = time.perf_counter()
+        try:
+            return await coroutine
+        finally:
+            current_event.reset(token)
+            self.recorder.record(event_type, time.perf_counter() - started, counter['queries'])
+
+    async def connect(self):
+        await self.measure('connect', super().connect())
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            event_type = json.loads(text_data).get('type', 'message')
+        except (TypeError, ValueError):
+            event_type = 'invalid'
+        await self.measure(event_type, super().receive(text_data, bytes_data))
+
+    async def disconnect(self, close_code):
+        await self.measure('disconnect', super().disconnect(close_code))
+
+
+class LoadClient:
+    """Симулированный клиент: отправляет действия из смеси и параллельно разбирает входящие кадры"""
+
+    def __init__(self, harness, user, rng):
+        self.harness = harness
+        self.user = user
+        self.rng = rng
+        self.communicator = None
+        self.reader = None
+        self.last_seq = None
+        self.reacted = set()
+        self.frames = Counter()
+
+    async def connect(self, resume_from=None):
+        self.communicator = WebsocketCommunicator(self.harness.application, f'/ws/chat/{self.harness.room_name}/')
+        self.communicator.scope['user'] = self.user
+        connected, _ = await self.communicator.connect(timeout=self.harness.timeout)
+        if not connected:
+            raise ConnectionError(f'{self.user.username} was not connected')
+        self.reader = asyncio.create_task(self.read())
+        await self.communicator.send_json_to({'type': 'fetch_messages', 'resume_from': resume_from})
+
+    async def disconnect(self):
+        # Ждем завершения обработчика отключения (запись позиции), а не секунду по умолчанию
+        await self.communicator.disconnect(timeout=self.harness.timeout)
+        self.reader.cancel()
+        try:
+            await self.reader
+        except asyncio.CancelledError:
+            pass
+
+    async def read(self):
+        """Разбирает кадры сервера: запоминает новые сообщения и номер последнего события"""
+        while True:
+            try:
+                frame = await self.communicator.receive_json_from(timeout=self.harness.timeout)
+            except asyncio.TimeoutError:
+                continue
+            self.frames[frame['type']] += 1
+            if frame.get('seq') is not None:
+                self.last_seq = max(self.last_seq or 0, frame['seq'])
+            if frame['type'] == 'new_message':
+                self.harness.known_messages.append((frame['message']['id'], frame['message']['author_id']))
+            elif frame['type'] == 'error':
+                self.harness.errors[frame.get('code') or frame['message']] += 1
+
+    async def run(self, events, think_ms):
+        await self.connect()
+        for _ in range(events):
+            # Пауза "на раздумье" - экспоненциальная, как у живых пользователей
+            await asyncio.sleep(self.rng.expovariate(1000 / think_ms) if think_ms else 0)
+            action = self.rng.choices(self.harness.actions, weights=self.harness.weights)[0]
+            await getattr(self, f'do_{action}')()
+        await self.disconnect()
+
+    async def do_message(self):
+        content = self.rng.choice(PHRASES)
+        if self.rng.random() < 0.15:
+            content = f'@{self.rng.choice(self.harness.users).username} {content}'
+        frame = {'type': 'message', 'message': content}
+        if self.harness.known_messages and self.rng.random() < 0.2:
+            frame['reply_to_id'] = self.rng.choice(self.harness.known_messages)[0]
+        await self.communicator.send_json_to(frame)
+
+    async def do_reaction(self):
+        candidates = [
+            message_id for message_id, author_id in self.harness.known_messages[-200:]
+            if author_id != self.user.id and message_id not in self.reacted
+        ]
+        if not candidates:
+            await self.do_typing()
+            return
+        message_id = self.rng.choice(candidates)
+        self.reacted.add(message_id)
+        await self.communicator.send_json_to({
+            'type': 'reaction', 'message_id': message_id, 'reaction': self.rng.choice(['like', 'like', 'dislike'])
+        })
+
+    async def do_typing(self):
+        await self.communicator.send_json_to({'type': 'typing', 'is_typing': self.rng.random() < 0.7})
+
+    async def do_save_position(self):
+        message_id = self.rng.choice(self.harness.known_messages)[0] if self.harness.known_messages else None
+        await self.communicator.send_json_to({
+            'type': 'save_position', 'last_visible_message_id': message_id,
+            'scroll_position_percent': round(self.rng.random(), 2),
+        })
+
+    async def do_reconnect(self):
+        await self.disconnect()
+        await self.connect(resume_from=self.last_seq)
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест чата: N симулированных клиентов (WebsocketCommunicator, in-memory channel layer) '
+        'одновременно отправляют смесь сообщений, реакций, typing, сохранений позиции и переподключений. '
+        'Сервер замеряет каждое событие: p50/p95/p99 времени обработки и запросов к БД на событие; '
+        'итог - события и сообщения в секунду. Результат сохраняется в JSON (--output) и сравнивается '
+        'с прошлым запуском (--compare). Пользователи и сообщения создаются в текущей БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room', default='benchmark_load', help='Комната чата (создается при необходимости)')
+        parser.add_argument('--clients', type=int, default=50, help='Одновременных клиентов')
+        parser.add_argument('--events', type=int, default=40, help='Действий на клиента')
+        parser.add_argument('--think-ms', type=float, default=100.0, help='Средняя пауза между действиями клиента, мс')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help='Веса действий: действие:вес через запятую')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора (повторяемая нагрузка)')
+        parser.add_argument('--seed-messages', type=int, default=200,
+                            help='Сколько сообщений гарантированно должно быть в комнате')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Таймаут ожидания кадра, с')
+        parser.add_argument('--label', default='', help='Метка запуска в JSON (ветка, изменение)')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument('--compare', help='JSON прошлого запуска для сравнения')
+
+    def handle(self, *args, **options):
+        self.room_name = options['room']
+        self.timeout = options['timeout']
+        self.actions, self.weights = self.parse_mix(options['mix'])
+        self.users = self.prepare_data(self.room_name, options['clients'], options['seed_messages'])
+        self.known_messages = [
+            (str(message_id), author_id) for message_id, author_id in Message.objects.filter(
+                room__name=self.room_name, is_deleted=False
+            ).order_by('-created_at').values_list('id', 'author_id')[:200]
+        ]
+        self.errors = Counter()
+
+        recorder = Recorder()
+        MeasuredChatConsumer.recorder = recorder
+        # Тот же маршрут, что в chat.routing, но с замерами
+        self.application = URLRouter([
+            re_path(r"ws/chat/(?P<room_name>[\w-]+)/$", MeasuredChatConsumer.as_asgi()),
+        ])
+
+        # Ограничитель частоты кадров (chat.rate_limit) не должен искажать замер
+        with override_settings(
+            CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+            CHAT_RATE_LIMITS={'default': (10 ** 6, 10 ** 6)},
+        ):
+            wall_time, frames = asyncio.run(self.run_clients(options))
+
+        events = recorder.summary()
+        handled = sum(stats['count'] for stats in events.values())
+        messages = events.get('message', {}).get('count', 0)
+        result = {
+            'label': options['label'],
+            'started_at': timezone.now().isoformat(),
+            'params': {
+                key: options[key] for key in ('room', 'clients', 'events', 'think_ms', 'mix', 'seed', 'seed_messages')
+            },
+            'wall_time_s': round(wall_time, 3),
+            'events_per_s': round(handled / wall_time, 1),
+            'messages_per_s': round(messages / wall_time, 1),
+            'deliveries_per_s': round(sum(frames.values()) / wall_time, 1),
+            'events': events,
+            'frames_received': dict(frames),
+            'errors': dict(self.errors),
+        }
+
+        self.report(result)
+        if options['compare']:
+            self.compare(result, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f'💾 Результаты сохранены в {options["output"]}')
+
+    def parse_mix(self, mix):
+        actions, weights = [], []
+        for item in mix.split(','):
+            action, _, weight = item.strip().partition(':')
+            if not hasattr(LoadClient, f'do_{action}'):
+                raise CommandError(f'Неизвестное действие в --mix: {action}')
+            actions.append(action)
+            weights.append(float(weight or 1))
+        return actions, weights
+
+    def prepare_data(self, room_name, users_count, seed_messages):
+        """Создает комнату, пользователей и сообщения для нагрузки"""
+        room, _ = Room.objects.get_or_create(name=room_name)
+
+        users = []
+        for i in range(users_count):
+            user, _ = User.objects.get_or_create(
+                username=f'bench_load_user_{i}',
+                defaults={'email': f'bench_load_user_{i}@example.com'}
+            )
+            users.append(user)
+
+        missing = seed_messages - room.messages.filter(is_deleted=False).count()
+        if missing > 0:
+            messages = [
+                Message(room=room, author=users[i % len(users)], content=PHRASES[i % len(PHRASES)])
+                for i in range(missing)
+            ]
+            # bulk_create не вызывает save - производные поля заполняем сами
+            for message in messages:
+                message.fill_derived_content()
+            Message.objects.bulk_create(messages)
+
+        return users
+
+    async def run_clients(self, options):
+        """Запускает всех клиентов одновременно; возвращает время прогона и число полученных кадров"""
+        await database_sync_to_async(install_query_counter)()
+
+        clients = [
+            LoadClient(self, user, random.Random(options['seed'] * 100_003 + index))
+            for index, user in enumerate(self.users)
+        ]
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(
+            *(client.run(options['events'], options['think_ms']) for client in clients), return_exceptions=True
+        )
+        wall_time = time.perf_counter() - started
+
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                self.errors[type(outcome).__name__] += 1
+
+        frames = Counter()
+        for client in clients:
+            frames.update(client.frames)
+        return wall_time, frames
+
+    def report(self, result):
+        params = result['params']
+        self.stdout.write(
+            f"\n📊 Нагрузка на чат «{params['room']}»: {params['clients']} клиентов × {params['events']} действий, "
+            f"пауза {params['think_ms']:.0f} мс"
+        )
+        self.stdout.write('├─ событие          | кол-во | p50, мс | p95, мс | p99, мс | запросов/событие')
+        for event_type, stats in result['events'].items():
+            self.stdout.write(
+                f"├─ {event_type:<16} | {stats['count']:>6} | {stats['p50_ms']:>7.1f} | {stats['p95_ms']:>7.1f} "
+                f"| {stats['p99_ms']:>7.1f} | {stats['queries_per_event']:>6.2f} (макс. {stats['max_queries']})"
+            )
+        self.stdout.write(
+            f"├─ {result['wall_time_s']:.1f} с: {result['events_per_s']} событий/с, {result['messages_per_s']} сообщений/с, "
+            f"{result['deliveries_per_s']} доставленных кадров/с"
+        )
+        if result['errors']:
+            self.stdout.write(self.style.WARNING(f"├─ Ошибки: {result['errors']}"))
+        self.stdout.write(self.style.SUCCESS('└─ Готово'))
+
+    def compare(self, result, path):
+        """Печатает изменение p95 и запросов на событие относительно прошлого запуска"""
+        with open(path, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+        self.stdout.write(f"\n📈 Сравнение с {path} ({baseline.get('label') or baseline.get('started_at')}):")
+        self.stdout.write('├─ событие          | p95, мс (было → стало) | запросов/событие (было → стало)')
+        for event_type, stats in result['events'].items():
+            before = baseline['events'].get(event_type)
+            if before is None:
+                continue
+            self.stdout.write(
+                f"├─ {event_type:<16} | {before['p95_ms']:>8.1f} → {stats['p95_ms']:<11.1f} "
+                f"| {before['queries_per_event']:>6.2f} → {stats['queries_per_event']:.2f}"
+            )
+        self.stdout.write(
+            f"└─ событий/с: {baseline['events_per_s']} → {result['events_per_s']}, "
+            f"сообщений/с: {baseline['messages_per_s']} → {result['messages_per_s']}"
+        )
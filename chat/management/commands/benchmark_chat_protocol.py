@@ -0,0 +1,111 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat.models import Room, Message
+from chat.protocol import CODECS
+from chat.serializers import ChatMessageSerializer, serialize_shared
+
+User = get_user_model()
+
+PHRASES = [
+    'Всем привет!',
+    'Поливаю рассаду через день, листья уже расправились.',
+    '@alice глянь фото, это дефицит азота или просто перелив?',
+    'Согласен, лучше не торопиться с пересадкой.',
+    'Купил новую лампу, в спектре заметно больше красного - посмотрим на результат через неделю.',
+    'Спасибо за совет 👍',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Бенчмарк протоколов websocket чата: размер кадров и время кодирования/разбора '
+        'для JSON, MessagePack и MessagePack со сжатием (chat.protocol). Кадры строятся '
+        'сериализатором из сообщений в памяти, БД не используется.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100, help='Сообщений в пакете истории')
+        parser.add_argument('--repeat', type=int, default=200, help='Повторов каждого замера')
+
+    def handle(self, *args, **options):
+        frames = self.build_frames(options['page_size'])
+
+        self.stdout.write(f'\n📊 Протоколы чата: история из {options["page_size"]} сообщений, {options["repeat"]} повторов')
+        self.stdout.write('├─ кадр             | протокол     |    байт | к JSON | кодирование, мкс | разбор, мкс')
+        for frame_name, frame in frames.items():
+            json_size = None
+            for codec in CODECS.values():
+                encoded = codec.encode(frame)
+                size = len(encoded.encode() if isinstance(encoded, str) else encoded)
+                json_size = json_size or size
+                encode_time = self.measure(lambda codec=codec, frame=frame: codec.encode(frame), options['repeat'])
+                decode_time = self.measure(lambda codec=codec, encoded=encoded: codec.decode(encoded), options['repeat'])
+                self.stdout.write(
+                    f'├─ {frame_name:<16} | {codec.name:<12} | {size:>7} | {size / json_size:>6.0%} '
+                    f'| {encode_time:>16.1f} | {decode_time:>11.1f}'
+                )
+
+        self.stdout.write(self.style.SUCCESS('└─ Готово'))
+
+    def build_frames(self, page_size):
+        """Типичные кадры: пакет истории, новое сообщение в рассылке, unread_info, индикатор печати"""
+        rng = random.Random(42)
+        room = Room(name='general')
+        authors = [User(id=i, username=f'user{i}', name=f'Гровер {i}', role='user') for i in range(1, 6)]
+        reader = authors[0]
+        serializer = ChatMessageSerializer(reader)
+
+        started = timezone.now() - timedelta(hours=1)
+        messages = []
+        for i in range(page_size):
+            message = Message(
+                room=room, author=rng.choice(authors), content=rng.choice(PHRASES),
+                created_at=started + timedelta(seconds=i * 7),
+                likes_count=rng.randint(0, 5), dislikes_count=rng.randint(0, 1),
+            )
+            message.fill_derived_content()
+            if messages and rng.random() < 0.2:
+                message.parent = rng.choice(messages)
+            messages.append(message)
+
+        history = [
+            serializer.overlay(
+                serialize_shared(message), author_id=message.author_id,
+                parent_author_id=message.parent.author_id if message.parent else None,
+                user_reaction=None, created_at=message.created_at, mention_text=message.mention_text,
+            )
+            for message in messages
+        ]
+        return {
+            'messages_history': {
+                'type': 'messages_history', 'messages': history, 'last_seq': 1000,
+                'before_cursor': history[0]['cursor'], 'after_cursor': history[-1]['cursor'],
+                'has_more_before': True, 'has_more_after': False,
+            },
+            'new_message': {'type': 'new_message', 'seq': 1001, 'message': history[-1]},
+            'unread_info': {
+                'type': 'unread_info', 'unread_count': 12, 'personal_notifications_count': 1,
+                'first_unread_message_id': history[-12]['id'], 'first_personal_notification_id': None,
+                'return_position': {'type': 'unread', 'message_id': history[-12]['id']},
+                'last_read_at': history[-13]['created'], 'last_visit_at': history[-13]['created'],
+                'is_first_visit': False,
+                'saved_position': {'last_visible_message_id': history[-13]['id'], 'scroll_position_percent': 0.87},
+            },
+            'typing': {'type': 'typing', 'user': reader.username, 'is_typing': True},
+        }
+
+    def measure(self, fn, repeat):
+        """Медиана времени выполнения, мкс"""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1_000_000)
+        return statistics.median(timings)
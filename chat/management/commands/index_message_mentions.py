@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chat.models import Message, MessageMention
+
+
+class Command(BaseCommand):
+    help = 'Заполняет индекс упоминаний и ответов (MessageMention) для уже существующих сообщений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Сколько сообщений обрабатывать за транзакцию')
+        parser.add_argument('--room', type=str, help='Проиндексировать только одну комнату (name)')
+
+    def handle(self, *args, **options):
+        messages = Message.objects.select_related('parent').order_by('created_at', 'id')
+        if options['room']:
+            messages = messages.filter(room__name=options['room'])
+
+        batch_size = options['batch_size']
+        total = messages.count()
+        processed = 0
+
+        while processed < total:
+            with transaction.atomic():
+                for message in messages[processed:processed + batch_size]:
+                    MessageMention.index_message(message)
+            processed += batch_size
+            self.stdout.write(f'├─ Проиндексировано {min(processed, total)} из {total}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Индекс упоминаний перестроен: {MessageMention.objects.count()} записей'
+        ))
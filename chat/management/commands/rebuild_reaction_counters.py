@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from chat.models import Message
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счетчики реакций сообщений по MessageReaction'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room', type=str, help='Пересчитать только одну комнату (name)')
+
+    def handle(self, *args, **options):
+        messages = Message.objects.all()
+        if options['room']:
+            messages = messages.filter(room__name=options['room'])
+
+        fixed = Message.rebuild_reaction_counters(messages)
+        self.stdout.write(self.style.SUCCESS(f'✅ Исправлено счетчиков реакций: {fixed}'))
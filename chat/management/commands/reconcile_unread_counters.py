@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from chat.models import UserChatPosition
+
+
+class Command(BaseCommand):
+    help = 'Сверяет инкрементальные счетчики непрочитанных и персональных уведомлений с полным пересчетом'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room', type=str, help='Сверить только одну комнату (name)')
+
+    def handle(self, *args, **options):
+        positions = UserChatPosition.objects.all()
+        if options['room']:
+            positions = positions.filter(room__name=options['room'])
+
+        fixed = UserChatPosition.reconcile_counters(positions)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Проверено позиций: {positions.count()}, исправлено счетчиков: {fixed}'
+        ))
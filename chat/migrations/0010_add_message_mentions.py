@@ -0,0 +1,78 @@
+# Generated by Django 4.2.21 on 2026-10-18 09:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("chat", "0009_fix_position_field_type"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MessageMention",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("mention", "Упоминание"), ("reply", "Ответ")],
+                        max_length=10,
+                        verbose_name="Тип",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(verbose_name="Дата сообщения")),
+                (
+                    "mentioned_user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chat_mentions",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+                (
+                    "message",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="mentions",
+                        to="chat.message",
+                        verbose_name="Сообщение",
+                    ),
+                ),
+                (
+                    "room",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="chat.room",
+                        verbose_name="Комната",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Упоминание в сообщении",
+                "verbose_name_plural": "Упоминания в сообщениях",
+                "indexes": [
+                    models.Index(
+                        fields=["mentioned_user", "room", "created_at"],
+                        name="chat_messag_mention_cea176_idx",
+                    )
+                ],
+                "unique_together": {("message", "mentioned_user", "kind")},
+            },
+        ),
+    ]
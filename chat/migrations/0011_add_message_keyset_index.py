@@ -0,0 +1,20 @@
+# Generated by Django 4.2.21 on 2026-10-18 09:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0010_add_message_mentions"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["room", "is_deleted", "created_at", "id"],
+                name="chat_message_keyset_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+from django.db import migrations
+
+# Индекс полнотекстового поиска (см. chat.search): на Postgres - генерируемая колонка
+# с GIN-индексом, на SQLite - таблица FTS5, которую дальше поддерживают сигналы Message
+POSTGRES_FORWARD = [
+    "ALTER TABLE chat_message ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('russian', coalesce(content, ''))) STORED",
+    "CREATE INDEX chat_message_search_idx ON chat_message USING GIN (search_vector)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS chat_message_search_idx",
+    "ALTER TABLE chat_message DROP COLUMN IF EXISTS search_vector",
+]
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE chat_message_fts USING fts5("
+    "content, message_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')",
+]
+SQLITE_BACKWARD = [
+    "DROP TABLE IF EXISTS chat_message_fts",
+]
+BATCH_SIZE = 2000
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for sql in POSTGRES_FORWARD:
+            schema_editor.execute(sql)
+    elif vendor == 'sqlite':
+        for sql in SQLITE_FORWARD:
+            schema_editor.execute(sql)
+        # Существующие сообщения индексируются пачками; rowid - младшие 63 бита UUID (как в chat.search)
+        Message = apps.get_model('chat', 'Message')
+        rows = []
+        with schema_editor.connection.cursor() as cursor:
+            for message_id, content in Message.objects.values_list('id', 'content').iterator(chunk_size=BATCH_SIZE):
+                rows.append((message_id.int & (2 ** 63 - 1), content, message_id.hex))
+                if len(rows) >= BATCH_SIZE:
+                    cursor.executemany('INSERT INTO chat_message_fts (rowid, content, message_id) VALUES (%s, %s, %s)', rows)
+                    rows = []
+            if rows:
+                cursor.executemany('INSERT INTO chat_message_fts (rowid, content, message_id) VALUES (%s, %s, %s)', rows)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for sql in POSTGRES_BACKWARD:
+            schema_editor.execute(sql)
+    elif vendor == 'sqlite':
+        for sql in SQLITE_BACKWARD:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0011_add_message_keyset_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
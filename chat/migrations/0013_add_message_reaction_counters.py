@@ -0,0 +1,48 @@
+# Generated by Django 4.2.21 on 2026-10-18 09:52
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+
+
+def backfill_reaction_counters(apps, schema_editor):
+    """Заполняет счетчики по существующим реакциям (у сообщений без реакций остается 0)"""
+    Message = apps.get_model('chat', 'Message')
+    MessageReaction = apps.get_model('chat', 'MessageReaction')
+
+    counters = defaultdict(dict)
+    for row in MessageReaction.objects.values('message_id', 'reaction_type').annotate(count=Count('id')).order_by():
+        counters[row['message_id']][row['reaction_type']] = row['count']
+
+    batch = []
+    for message_id, counts in counters.items():
+        batch.append(Message(pk=message_id, likes_count=counts.get('like', 0), dislikes_count=counts.get('dislike', 0)))
+        if len(batch) >= BATCH_SIZE:
+            Message.objects.bulk_update(batch, ['likes_count', 'dislikes_count'])
+            batch = []
+    if batch:
+        Message.objects.bulk_update(batch, ['likes_count', 'dislikes_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0012_add_message_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="dislikes_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="Дизлайки"),
+        ),
+        migrations.AddField(
+            model_name="message",
+            name="likes_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="Лайки"),
+        ),
+        migrations.RunPython(backfill_reaction_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.21 on 2026-10-18 09:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("chat", "0013_add_message_reaction_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="room",
+            name="archived_until",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Архив до"),
+        ),
+        migrations.CreateModel(
+            name="ArchivedMessage",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(editable=False, primary_key=True, serialize=False),
+                ),
+                ("content", models.TextField(verbose_name="Содержимое")),
+                ("created_at", models.DateTimeField(verbose_name="Дата создания")),
+                ("is_deleted", models.BooleanField(default=False)),
+                ("entry", models.JSONField(verbose_name="Снимок сообщения")),
+                (
+                    "archived_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Дата архивации"
+                    ),
+                ),
+                (
+                    "author",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_chat_messages",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Автор",
+                    ),
+                ),
+                (
+                    "room",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_messages",
+                        to="chat.room",
+                        verbose_name="Комната",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Архивное сообщение",
+                "verbose_name_plural": "Архивные сообщения",
+                "ordering": ["created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["room", "is_deleted", "created_at", "id"],
+                        name="chat_archived_keyset_idx",
+                    )
+                ],
+            },
+        ),
+    ]
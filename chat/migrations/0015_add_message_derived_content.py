@@ -0,0 +1,59 @@
+# Generated by Django 4.2.21 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+from chat.content import extract_clean_content, make_mention_text, make_snippet
+
+BATCH_SIZE = 2000
+
+
+def backfill_derived_content(apps, schema_editor):
+    """Вычисляет производные поля для существующих сообщений пачками по первичному ключу"""
+    Message = apps.get_model('chat', 'Message')
+
+    last_id = None
+    while True:
+        messages = Message.objects.order_by('id').only('id', 'content', 'is_forwarded')
+        if last_id is not None:
+            messages = messages.filter(id__gt=last_id)
+        batch = list(messages[:BATCH_SIZE])
+        if not batch:
+            break
+        for message in batch:
+            message.clean_content = extract_clean_content(message.content) if message.is_forwarded else ''
+            message.content_snippet = make_snippet(message.content)
+            message.mention_text = make_mention_text(message.content)
+        Message.objects.bulk_update(batch, ['clean_content', 'content_snippet', 'mention_text'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0014_add_message_archive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="clean_content",
+            field=models.TextField(
+                blank=True, default="", verbose_name="Основной текст пересланного"
+            ),
+        ),
+        migrations.AddField(
+            model_name="message",
+            name="content_snippet",
+            field=models.CharField(
+                blank=True, default="", max_length=103, verbose_name="Фрагмент"
+            ),
+        ),
+        migrations.AddField(
+            model_name="message",
+            name="mention_text",
+            field=models.TextField(
+                blank=True, default="", verbose_name="Текст для поиска упоминаний"
+            ),
+        ),
+        migrations.RunPython(backfill_derived_content, migrations.RunPython.noop),
+    ]
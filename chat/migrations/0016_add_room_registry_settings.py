@@ -0,0 +1,60 @@
+# Generated by Django 4.2.21 on 2026-10-18 10:19
+
+from django.db import migrations, models
+
+# Комнаты, которые раньше были зашиты в маршруты и chat.presence.ROOM_ACCESS_ROLES.
+# VIP - объединение прежних списков (presence, шаблоны, User.can_access_vip_chat):
+# теперь Room.access_roles - единственный источник, никто из имевших доступ его не теряет
+DEFAULT_ROOMS = [
+    ('general', 'Беседка', []),
+    ('vip', 'Беседка - VIP', ['owner', 'moderator', 'store_owner', 'store_admin']),
+    ('moderators', 'Модераторы', ['owner', 'moderator']),
+]
+
+
+def create_default_rooms(apps, schema_editor):
+    """Создает стандартные комнаты и переносит в них прежние названия и политику доступа"""
+    Room = apps.get_model('chat', 'Room')
+    for name, title, access_roles in DEFAULT_ROOMS:
+        room, _ = Room.objects.get_or_create(name=name)
+        room.title = title
+        room.access_roles = access_roles
+        room.save(update_fields=['title', 'access_roles'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0015_add_message_derived_content"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="room",
+            name="access_roles",
+            field=models.JSONField(
+                blank=True,
+                default=list,
+                help_text="Пусто - комната открыта всем пользователям",
+                verbose_name="Роли с доступом",
+            ),
+        ),
+        migrations.AddField(
+            model_name="room",
+            name="max_message_length",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Пусто - без ограничения",
+                null=True,
+                verbose_name="Максимальная длина сообщения",
+            ),
+        ),
+        migrations.AddField(
+            model_name="room",
+            name="title",
+            field=models.CharField(
+                blank=True, max_length=100, verbose_name="Отображаемое название"
+            ),
+        ),
+        migrations.RunPython(create_default_rooms, migrations.RunPython.noop),
+    ]
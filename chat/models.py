@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 import uuid
@@ -7,6 +9,8 @@ from django.contrib.auth import get_user_model
 from datetime import timedelta
 import re
 
+from .content import extract_clean_content, make_mention_text, make_snippet
+
 User = get_user_model()
 
 
@@ -19,6 +23,18 @@ class Room(models.Model):
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(_("Дата создания"), default=timezone.now)
     is_active = models.BooleanField(default=True)
+    # Время самого нового сообщения, перенесенного в архив (chat.archive); None - архива нет
+    archived_until = models.DateTimeField(_("Архив до"), null=True, blank=True)
+    # Настройки комнаты для реестра (chat.rooms): название, доступ и ограничения
+    title = models.CharField(_("Отображаемое название"), max_length=100, blank=True)
+    access_roles = models.JSONField(
+        _("Роли с доступом"), default=list, blank=True,
+        help_text=_("Пусто - комната открыта всем пользователям")
+    )
+    max_message_length = models.PositiveIntegerField(
+        _("Максимальная длина сообщения"), null=True, blank=True,
+        help_text=_("Пусто - без ограничения")
+    )
 
     class Meta:
         verbose_name = _("Комната чата")
@@ -28,6 +44,19 @@ class Room(models.Model):
     def __str__(self):
         return self.name
 
+    @property
+    def display_title(self):
+        """Название для пользователей (в пересланных сообщениях и т.п.)"""
+        return self.title or f"Чат «{self.name.title()}»"
+
+    def can_access(self, user):
+        """Есть ли у пользователя доступ к комнате по ее политике"""
+        return not self.access_roles or user.role in self.access_roles
+
+
+# Поля Message, которые пересчитываются вместе с content
+DERIVED_CONTENT_FIELDS = ('clean_content', 'content_snippet', 'mention_text')
+
 
 class Message(models.Model):
     """
@@ -73,28 +102,77 @@ class Message(models.Model):
                                  related_name='pinned_messages', help_text="Кто закрепил сообщение")
     pinned_at = models.DateTimeField(null=True, blank=True, help_text="Когда было закреплено")
 
+    # Денормализованные счетчики реакций: меняются в одной транзакции с записью
+    # MessageReaction (MessageReaction.add), пересчитываются rebuild_reaction_counters
+    likes_count = models.PositiveIntegerField(_("Лайки"), default=0)
+    dislikes_count = models.PositiveIntegerField(_("Дизлайки"), default=0)
+
+    # Производные от content поля (chat.content): вычисляются при записи, чтение только копирует строки
+    clean_content = models.TextField(_("Основной текст пересланного"), blank=True, default='')
+    content_snippet = models.CharField(_("Фрагмент"), max_length=103, blank=True, default='')
+    mention_text = models.TextField(_("Текст для поиска упоминаний"), blank=True, default='')
+
     class Meta:
         verbose_name = _("Сообщение")
         verbose_name_plural = _("Сообщения")
         ordering = ["created_at"]
+        indexes = [
+            # Keyset-пагинация истории по курсору (created_at, id), см. chat.pagination
+            models.Index(fields=['room', 'is_deleted', 'created_at', 'id'], name='chat_message_keyset_idx'),
+        ]
 
     def __str__(self):
         return f"Сообщение от {self.author} в {self.room}"
 
+    def save(self, *args, **kwargs):
+        """Пересчитывает производные от content поля, если content сохраняется"""
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            self.fill_derived_content()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, *DERIVED_CONTENT_FIELDS}
+        super().save(*args, **kwargs)
+
+    def fill_derived_content(self):
+        """Вычисляет очищенный текст, фрагмент для ответа и текст для поиска упоминаний"""
+        self.clean_content = extract_clean_content(self.content) if self.is_forwarded else ''
+        self.content_snippet = make_snippet(self.content)
+        self.mention_text = make_mention_text(self.content)
+
     @property
     def is_reply(self):
         """Является ли сообщение ответом на другое сообщение"""
         return self.parent is not None
 
-    @property
-    def likes_count(self):
-        """Количество лайков на сообщении"""
-        return self.reactions.filter(reaction_type='like').count()
+    @classmethod
+    def rebuild_reaction_counters(cls, queryset=None, batch_size=1000):
+        """
+        Пересчитывает счетчики реакций по MessageReaction и исправляет расхождения
+        (реакции, созданные или удаленные в обход MessageReaction.add, - админка, команды).
+        Возвращает количество исправленных сообщений.
+        """
+        if queryset is None:
+            queryset = cls.objects.all()
 
-    @property
-    def dislikes_count(self):
-        """Количество дизлайков на сообщении"""
-        return self.reactions.filter(reaction_type='dislike').count()
+        mismatched = queryset.annotate(
+            real_likes=Count('reactions', filter=Q(reactions__reaction_type='like')),
+            real_dislikes=Count('reactions', filter=Q(reactions__reaction_type='dislike')),
+        ).exclude(
+            likes_count=F('real_likes'), dislikes_count=F('real_dislikes')
+        ).values_list('pk', 'real_likes', 'real_dislikes')
+
+        fixed = 0
+        batch = []
+        for pk, likes, dislikes in mismatched.iterator(chunk_size=batch_size):
+            batch.append(cls(pk=pk, likes_count=likes, dislikes_count=dislikes))
+            if len(batch) >= batch_size:
+                fixed += len(batch)
+                cls.objects.bulk_update(batch, ['likes_count', 'dislikes_count'])
+                batch = []
+        if batch:
+            fixed += len(batch)
+            cls.objects.bulk_update(batch, ['likes_count', 'dislikes_count'])
+        return fixed
 
     def get_user_reaction(self, user):
         """Получить реакцию конкретного пользователя на сообщение"""
@@ -116,7 +194,7 @@ class Message(models.Model):
 
     def mentions_user(self, user):
         """Проверяет, упоминается ли пользователь в сообщении"""
-        if not self.content:
+        if not self.mention_text:
             return False
 
         # Паттерны для поиска упоминаний
@@ -130,7 +208,7 @@ class Message(models.Model):
         patterns = [p for p in patterns if p]
 
         for pattern in patterns:
-            if pattern.lower() in self.content.lower():
+            if pattern.lower() in self.mention_text:
                 return True
         return False
 
@@ -147,6 +225,45 @@ class Message(models.Model):
         return False
 
 
+class ArchivedMessage(models.Model):
+    """
+    Сообщение, перенесенное из Message в архив (см. chat.archive).
+    Хранит снимок записи горячего кеша истории (build_cache_entries) на момент
+    архивации, поэтому сериализуется без связей и запросов к реакциям.
+    Архив только для чтения: правки, реакции и закрепления к нему не применяются.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)  # ID исходного сообщения
+    room = models.ForeignKey(
+        Room,
+        on_delete=models.CASCADE,
+        related_name="archived_messages",
+        verbose_name=_("Комната")
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="archived_chat_messages",
+        verbose_name=_("Автор")
+    )
+    content = models.TextField(_("Содержимое"))
+    created_at = models.DateTimeField(_("Дата создания"))
+    is_deleted = models.BooleanField(default=False)
+    entry = models.JSONField(_("Снимок сообщения"))
+    archived_at = models.DateTimeField(_("Дата архивации"), default=timezone.now)
+
+    class Meta:
+        verbose_name = _("Архивное сообщение")
+        verbose_name_plural = _("Архивные сообщения")
+        ordering = ["created_at"]
+        indexes = [
+            # Та же keyset-пагинация, что и у Message
+            models.Index(fields=['room', 'is_deleted', 'created_at', 'id'], name='chat_archived_keyset_idx'),
+        ]
+
+    def __str__(self):
+        return f"Архивное сообщение от {self.author} в {self.room}"
+
+
 class MessageReaction(models.Model):
     """
     Модель для хранения реакций пользователей на сообщения в чате.
@@ -185,9 +302,29 @@ class MessageReaction(models.Model):
             models.Index(fields=['user', 'created_at']),
         ]
 
+    # Поле счетчика Message для каждого типа реакции
+    COUNTER_FIELDS = {
+        'like': 'likes_count',
+        'dislike': 'dislikes_count',
+    }
+
     def __str__(self):
         return f"{self.user.display_name} - {self.get_reaction_type_display()} на сообщение {self.message.id}"
 
+    @classmethod
+    def add(cls, message, user, reaction_type):
+        """
+        Сохраняет реакцию и увеличивает счетчик сообщения в одной транзакции.
+        Счетчики message обновляются из БД (с учетом реакций из других подключений).
+        Повторная реакция пользователя - IntegrityError (unique_together).
+        """
+        counter_field = cls.COUNTER_FIELDS[reaction_type]
+        with transaction.atomic():
+            reaction = cls.objects.create(message=message, user=user, reaction_type=reaction_type)
+            Message.objects.filter(pk=message.pk).update(**{counter_field: F(counter_field) + 1})
+        message.refresh_from_db(fields=list(cls.COUNTER_FIELDS.values()))
+        return reaction
+
     def save(self, *args, **kwargs):
         """Переопределяем save для логирования важных действий кармы"""
         is_new = self.pk is None
@@ -200,6 +337,114 @@ class MessageReaction(models.Model):
             logger.info(f"NEW REACTION: {self.user.username} {self.reaction_type}d message by {self.message.author.username}")
 
 
+class MessageMention(models.Model):
+    """
+    Индекс персональных уведомлений: кого упоминает сообщение и кому оно отвечает.
+    Заполняется при записи сообщения, чтобы счетчики персональных уведомлений
+    считались одним индексированным запросом, а не перебором сообщений в Python.
+    """
+    KIND_MENTION = 'mention'
+    KIND_REPLY = 'reply'
+    KIND_CHOICES = [
+        (KIND_MENTION, _('Упоминание')),
+        (KIND_REPLY, _('Ответ')),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    message = models.ForeignKey(
+        Message,
+        on_delete=models.CASCADE,
+        related_name='mentions',
+        verbose_name=_("Сообщение")
+    )
+    mentioned_user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='chat_mentions',
+        verbose_name=_("Пользователь")
+    )
+    kind = models.CharField(_("Тип"), max_length=10, choices=KIND_CHOICES)
+    # Денормализовано из сообщения для выборки по индексу (пользователь, комната, время)
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='+', verbose_name=_("Комната"))
+    created_at = models.DateTimeField(_("Дата сообщения"))
+
+    class Meta:
+        verbose_name = _("Упоминание в сообщении")
+        verbose_name_plural = _("Упоминания в сообщениях")
+        unique_together = ('message', 'mentioned_user', 'kind')
+        indexes = [
+            models.Index(fields=['mentioned_user', 'room', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.mentioned_user} в сообщении {self.message_id}"
+
+    @staticmethod
+    def find_mentioned_users(content):
+        """Находит пользователей, упомянутых через @ (та же логика, что в Message.mentions_user)"""
+        tokens = set(re.findall(r'@([\w.\-]+)', content or ''))
+        if not tokens:
+            return []
+
+        query = models.Q()
+        for token in tokens:
+            query |= models.Q(username__iexact=token) | models.Q(name__istartswith=token)
+            user_id = re.fullmatch(r'(?i)user(\d+)', token)
+            if user_id:
+                query |= models.Q(id=int(user_id.group(1)))
+
+        probe = Message(content=content, mention_text=make_mention_text(content or ''))
+        return [user for user in User.objects.filter(query) if probe.mentions_user(user)]
+
+    @classmethod
+    def index_message(cls, message):
+        """
+        Перестраивает индекс упоминаний и ответов для сообщения (при создании и редактировании).
+        Возвращает ID упомянутых пользователей - для рассылки сообщения в группу.
+        """
+        cls.objects.filter(message=message).delete()
+
+        mentioned_users = cls.find_mentioned_users(message.content)
+        entries = [
+            cls(message=message, mentioned_user=user, kind=cls.KIND_MENTION,
+                room_id=message.room_id, created_at=message.created_at)
+            for user in mentioned_users
+        ]
+        if message.parent_id:
+            entries.append(cls(message=message, mentioned_user_id=message.parent.author_id, kind=cls.KIND_REPLY,
+                               room_id=message.room_id, created_at=message.created_at))
+
+        cls.objects.bulk_create(entries)
+        return [user.id for user in mentioned_users]
+
+    @classmethod
+    def index_new_messages(cls, messages):
+        """
+        Индексирует пачку только что созданных сообщений (пакетная пересылка) одним
+        bulk_create; упомянутые ищутся один раз на уникальный текст.
+        Возвращает {ID сообщения: ID упомянутых пользователей}.
+        """
+        mentioned_by_content = {}
+        entries = []
+        mentioned_user_ids = {}
+        for message in messages:
+            if message.content not in mentioned_by_content:
+                mentioned_by_content[message.content] = cls.find_mentioned_users(message.content)
+            mentioned_users = mentioned_by_content[message.content]
+            entries.extend(
+                cls(message=message, mentioned_user=user, kind=cls.KIND_MENTION,
+                    room_id=message.room_id, created_at=message.created_at)
+                for user in mentioned_users
+            )
+            if message.parent_id:
+                entries.append(cls(message=message, mentioned_user_id=message.parent.author_id, kind=cls.KIND_REPLY,
+                                   room_id=message.room_id, created_at=message.created_at))
+            mentioned_user_ids[message.id] = [user.id for user in mentioned_users]
+
+        cls.objects.bulk_create(entries)
+        return mentioned_user_ids
+
+
 class UserChatPosition(models.Model):
     """
     Модель для отслеживания позиции пользователя в чате и непрочитанных сообщений.
@@ -294,19 +539,19 @@ class UserChatPosition(models.Model):
         # Персональные уведомления - это сообщения после последнего визита, которые:
         # 1. Являются ответами на сообщения этого пользователя
         # 2. Или упоминают этого пользователя
-        personal_messages = self.room.messages.filter(
-            created_at__gt=self.last_visit_at,
+        # Оба случая уже проиндексированы в MessageMention при записи сообщения
+        return self._personal_messages().count()
+
+    def _personal_messages(self):
+        """Сообщения с персональными уведомлениями после последнего визита (по индексу MessageMention)"""
+        return Message.objects.filter(
+            mentions__mentioned_user=self.user,
+            mentions__room=self.room,
+            mentions__created_at__gt=self.last_visit_at,
             is_deleted=False
         ).exclude(
             author=self.user  # Исключаем собственные сообщения
-        )
-
-        count = 0
-        for message in personal_messages:
-            if message.is_personal_notification_for(self.user):
-                count += 1
-
-        return count
+        ).distinct()
 
     def get_messages_below_current_position(self):
         """Возвращает количество сообщений ниже текущей позиции скролла"""
@@ -320,7 +565,9 @@ class UserChatPosition(models.Model):
 
     def mark_as_read(self, up_to_message=None, up_to_time=None):
         """
-        Отмечает сообщения как прочитанные до указанного сообщения или времени
+        Отмечает сообщения как прочитанные до указанного сообщения или времени.
+        Счетчик непрочитанных уменьшается на число сообщений в прочитанном отрезке,
+        а не пересчитывается по всей истории комнаты.
         """
         old_last_read_at = self.last_read_at
 
@@ -332,10 +579,28 @@ class UserChatPosition(models.Model):
         else:
             self.last_read_at = timezone.now()
 
-        # Обновляем кешированные счетчики
-        self.unread_count = self.get_unread_messages_count()
-        self.personal_notifications_count = self.get_personal_notifications_count()
-        self.save()
+        update_fields = ['last_read_at', 'last_message_id', 'updated_at']
+        if not up_to_message and not up_to_time:
+            # Прочитано все - счетчик просто обнуляется
+            self.unread_count = 0
+            self.save(update_fields=update_fields + ['unread_count'])
+        elif old_last_read_at is None:
+            self.unread_count = self.get_unread_messages_count()
+            self.save(update_fields=update_fields + ['unread_count'])
+        else:
+            self.save(update_fields=update_fields)
+            # Сдвиг может быть и назад (пользователь отметил более раннее сообщение)
+            lower, upper = sorted([old_last_read_at, self.last_read_at])
+            read_count = self.room.messages.filter(
+                created_at__gt=lower,
+                created_at__lte=upper,
+                is_deleted=False
+            ).count()
+            delta = read_count if self.last_read_at >= old_last_read_at else -read_count
+            UserChatPosition.objects.filter(pk=self.pk).update(
+                unread_count=Greatest(F('unread_count') - delta, 0)
+            )
+            self.refresh_from_db(fields=['unread_count'])
 
         # Логируем изменение для отладки
         import logging
@@ -345,9 +610,10 @@ class UserChatPosition(models.Model):
                    f"unread_count: {self.unread_count}, personal_notifications: {self.personal_notifications_count}")
 
     def mark_visit(self):
-        """Отмечает визит пользователя в чат"""
+        """Отмечает визит пользователя в чат (персональные уведомления считаются от этого момента)"""
         self.last_visit_at = timezone.now()
-        self.save()
+        self.personal_notifications_count = 0
+        self.save(update_fields=['last_visit_at', 'personal_notifications_count', 'updated_at'])
 
     def get_first_unread_message(self):
         """Возвращает первое непрочитанное сообщение или None"""
@@ -367,23 +633,19 @@ class UserChatPosition(models.Model):
             return None
 
         # Находим первое сообщение с персональным уведомлением
-        personal_messages = self.room.messages.filter(
-            created_at__gt=self.last_visit_at,
-            is_deleted=False
-        ).exclude(
-            author=self.user
-        ).order_by('created_at')
-
-        for message in personal_messages:
-            if message.is_personal_notification_for(self.user):
-                return message
-
-        return None
+        return self._personal_messages().order_by('created_at').first()
 
     def get_return_position(self):
         """Определяет позицию для возвращения в чат"""
+        return self.build_return_position(
+            self.get_first_personal_notification(),
+            self.get_first_unread_message()
+        )
+
+    @staticmethod
+    def build_return_position(first_personal, first_unread):
+        """Позиция возврата по уже найденным первому персональному и первому непрочитанному сообщениям"""
         # 🎯 ПРИОРИТЕТ 1: Если есть персональные уведомления, возвращаемся к первому
-        first_personal = self.get_first_personal_notification()
         if first_personal:
             return {
                 'type': 'personal',
@@ -391,7 +653,6 @@ class UserChatPosition(models.Model):
             }
 
         # 🎯 ПРИОРИТЕТ 2: Если есть непрочитанные сообщения, возвращаемся к первому непрочитанному
-        first_unread = self.get_first_unread_message()
         if first_unread:
             return {
                 'type': 'unread',
@@ -404,6 +665,135 @@ class UserChatPosition(models.Model):
             'message_id': None
         }
 
+    @classmethod
+    def register_new_message(cls, message):
+        """Инкрементально увеличивает счетчики позиций при появлении сообщения (после индексации упоминаний)"""
+        cls.objects.filter(
+            room_id=message.room_id,
+            last_read_at__lt=message.created_at
+        ).update(unread_count=F('unread_count') + 1)
+
+        cls.objects.filter(
+            room_id=message.room_id,
+            user__in=message.mentions.exclude(mentioned_user_id=message.author_id).values('mentioned_user'),
+            last_visit_at__lt=message.created_at
+        ).update(personal_notifications_count=F('personal_notifications_count') + 1)
+
+    @classmethod
+    def register_deleted_message(cls, message):
+        """Инкрементально уменьшает счетчики позиций, в которых учитывалось удаленное сообщение"""
+        cls.objects.filter(
+            room_id=message.room_id,
+            last_read_at__lt=message.created_at
+        ).update(unread_count=Greatest(F('unread_count') - 1, 0))
+
+        cls.objects.filter(
+            room_id=message.room_id,
+            user__in=message.mentions.exclude(mentioned_user_id=message.author_id).values('mentioned_user'),
+            last_visit_at__lt=message.created_at
+        ).update(personal_notifications_count=Greatest(F('personal_notifications_count') - 1, 0))
+
+    @classmethod
+    def register_edited_message(cls, message, previous_user_ids):
+        """
+        Сдвигает персональные счетчики после переиндексации упоминаний отредактированного
+        сообщения: +1 пользователям, которых правка добавила, -1 тем, кого убрала.
+        previous_user_ids - упомянутые (и адресаты ответа) до правки.
+        """
+        current_user_ids = set(message.mentions.values_list('mentioned_user_id', flat=True))
+        previous_user_ids = set(previous_user_ids)
+        positions = cls.objects.filter(room_id=message.room_id, last_visit_at__lt=message.created_at).exclude(
+            user_id=message.author_id
+        )
+
+        added = current_user_ids - previous_user_ids
+        if added:
+            positions.filter(user_id__in=added).update(
+                personal_notifications_count=F('personal_notifications_count') + 1
+            )
+        removed = previous_user_ids - current_user_ids
+        if removed:
+            positions.filter(user_id__in=removed).update(
+                personal_notifications_count=Greatest(F('personal_notifications_count') - 1, 0)
+            )
+
+    @classmethod
+    def register_new_messages(cls, messages):
+        """Пакетный register_new_message: по одному UPDATE на каждый счетчик для всей пачки"""
+        cls._shift_counters(messages, increment=True)
+
+    @classmethod
+    def register_deleted_messages(cls, messages):
+        """Пакетный register_deleted_message"""
+        cls._shift_counters(messages, increment=False)
+
+    @classmethod
+    def _shift_counters(cls, messages, increment):
+        """
+        Сдвигает счетчики позиций на число сообщений пачки, которые в них учитываются:
+        подзапрос считает для каждой позиции сообщения новее last_read_at
+        (упоминания - новее last_visit_at), как это делают одиночные методы.
+        """
+        if not messages:
+            return
+        message_ids = [message.id for message in messages]
+        room_ids = {message.room_id for message in messages}
+        latest = max(message.created_at for message in messages)
+
+        unread = Message.objects.filter(
+            id__in=message_ids, room_id=OuterRef('room_id'), created_at__gt=OuterRef('last_read_at')
+        ).order_by().values('room_id').annotate(count=Count('id')).values('count')
+        personal = MessageMention.objects.filter(
+            message_id__in=message_ids, room_id=OuterRef('room_id'), mentioned_user_id=OuterRef('user_id'),
+            created_at__gt=OuterRef('last_visit_at')
+        ).exclude(
+            mentioned_user_id=F('message__author_id')
+        ).order_by().values('mentioned_user_id').annotate(count=Count('message_id', distinct=True)).values('count')
+
+        def shifted(field, subquery):
+            delta = Coalesce(Subquery(subquery, output_field=IntegerField()), 0)
+            return F(field) + delta if increment else Greatest(F(field) - delta, 0)
+
+        cls.objects.filter(
+            room_id__in=room_ids, last_read_at__lt=latest
+        ).update(unread_count=shifted('unread_count', unread))
+
+        cls.objects.filter(
+            room_id__in=room_ids,
+            user__in=MessageMention.objects.filter(message_id__in=message_ids).values('mentioned_user'),
+            last_visit_at__lt=latest
+        ).update(personal_notifications_count=shifted('personal_notifications_count', personal))
+
+    @classmethod
+    def reconcile_counters(cls, queryset=None):
+        """
+        Сверяет инкрементальные счетчики с полным пересчетом и исправляет расхождения
+        (сообщения, созданные в обход консьюмера, bulk_create в командах и т.п.).
+        Пересчет и запись выполняются одним UPDATE с подзапросами: инкременты F() из
+        register_new_message и mark_as_read не затираются значениями, прочитанными
+        раньше. Возвращает количество исправленных позиций.
+        """
+        if queryset is None:
+            queryset = cls.objects.all()
+
+        # Те же условия, что в get_unread_messages_count и get_personal_notifications_count;
+        # при пустых last_read_at / last_visit_at сравнение с NULL ничего не находит - счетчик 0
+        unread = Message.objects.filter(
+            room_id=OuterRef('room_id'), created_at__gt=OuterRef('last_read_at'), is_deleted=False
+        ).order_by().values('room_id').annotate(count=Count('id')).values('count')
+        personal = MessageMention.objects.filter(
+            room_id=OuterRef('room_id'), mentioned_user_id=OuterRef('user_id'),
+            created_at__gt=OuterRef('last_visit_at'), message__is_deleted=False
+        ).exclude(
+            message__author_id=OuterRef('user_id')
+        ).order_by().values('mentioned_user_id').annotate(count=Count('message_id', distinct=True)).values('count')
+
+        unread_count = Coalesce(Subquery(unread, output_field=IntegerField()), 0)
+        personal_count = Coalesce(Subquery(personal, output_field=IntegerField()), 0)
+        return queryset.exclude(
+            unread_count=unread_count, personal_notifications_count=personal_count
+        ).update(unread_count=unread_count, personal_notifications_count=personal_count)
+
     @classmethod
     def get_or_create_for_user(cls, user, room):
         """Получает или создает позицию пользователя в комнате"""
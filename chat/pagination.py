@@ -0,0 +1,87 @@
+"""
+Keyset (курсорная) пагинация истории чата.
+
+Курсор - непрозрачная строка с парой (created_at, id) сообщения. Выборка идет
+по составному индексу Message(room, is_deleted, created_at, id), поэтому
+стоимость страницы не зависит от глубины истории, сообщения с одинаковым
+временем не теряются и не дублируются, а новые сообщения, пришедшие между
+запросами, не сдвигают уже загруженные страницы.
+"""
+import base64
+import uuid
+from datetime import datetime
+
+from django.db.models import Q
+
+DIRECTION_BEFORE = 'before'
+DIRECTION_AFTER = 'after'
+DIRECTION_AROUND = 'around'
+DIRECTIONS = (DIRECTION_BEFORE, DIRECTION_AFTER, DIRECTION_AROUND)
+
+
+def encode_cursor(message):
+    """Курсор, указывающий на сообщение"""
+    raw = f"{message.created_at.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Возвращает (created_at, id) из курсора; ValueError для поврежденного курсора"""
+    try:
+        created_at, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), uuid.UUID(message_id)
+    except (AttributeError, TypeError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def fetch_page(queryset, cursor=None, direction=DIRECTION_BEFORE, limit=50):
+    """
+    Загружает страницу сообщений относительно курсора.
+
+    before - limit сообщений строго до курсора (без курсора - последние limit сообщений);
+    after - limit сообщений строго после курсора;
+    around - limit до курсора, само сообщение курсора и limit после.
+
+    Возвращает словарь с сообщениями в хронологическом порядке, курсорами краев
+    страницы и признаками has_more_before/has_more_after.
+    """
+    if direction not in DIRECTIONS:
+        raise ValueError(f"Unknown direction: {direction!r}")
+
+    key = decode_cursor(cursor) if cursor else None
+    has_more_before = has_more_after = False
+    before, after = [], []
+
+    if direction in (DIRECTION_BEFORE, DIRECTION_AROUND):
+        page = queryset
+        if key:
+            # Отдельное условие по created_at дает планировщику диапазон по индексу,
+            # сравнение id нужно только для сообщений с тем же временем
+            page = page.filter(created_at__lte=key[0]).filter(
+                Q(created_at__lt=key[0]) | Q(created_at=key[0], id__lt=key[1])
+            )
+        before = list(page.order_by('-created_at', '-id')[:limit + 1])
+        has_more_before = len(before) > limit
+        before = before[:limit][::-1]
+
+    if direction in (DIRECTION_AFTER, DIRECTION_AROUND) and key:
+        page = queryset.filter(created_at__gte=key[0])
+        if direction == DIRECTION_AROUND:
+            # Само сообщение курсора входит в страницу
+            page = page.filter(Q(created_at__gt=key[0]) | Q(created_at=key[0], id__gte=key[1]))
+            after_limit = limit + 1
+        else:
+            page = page.filter(Q(created_at__gt=key[0]) | Q(created_at=key[0], id__gt=key[1]))
+            after_limit = limit
+        after = list(page.order_by('created_at', 'id')[:after_limit + 1])
+        has_more_after = len(after) > after_limit
+        after = after[:after_limit]
+
+    messages = before + after
+    return {
+        'messages': messages,
+        'before_cursor': encode_cursor(messages[0]) if messages else cursor,
+        'after_cursor': encode_cursor(messages[-1]) if messages else cursor,
+        'has_more_before': has_more_before,
+        'has_more_after': has_more_after,
+    }
@@ -0,0 +1,221 @@
+"""
+Реестр присутствия пользователей в комнатах чата.
+
+Каждое websocket-подключение - элемент отсортированного множества комнаты,
+где score - момент истечения heartbeat. Отдельно хранится число подключений
+каждого пользователя (онлайн-счетчик = размер этого хеша, O(1)) и его профиль
+для списка "онлайн" без обращений к БД. Подключения, не приславшие heartbeat
+за CHAT_PRESENCE_TTL секунд, удаляются при очередной проверке.
+
+Бэкенд выбирается настройкой CHAT_PRESENCE_BACKEND: RedisPresenceBackend для
+нескольких воркеров, InMemoryPresenceBackend - для тестов и одного процесса.
+"""
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from .models import Room
+from .rooms import get_room
+
+ROOM_ACCESS_COUNT_CACHE_KEY = 'chat:room_access_count:{room_name}'
+ROOM_ACCESS_COUNT_CACHE_TIMEOUT = 60 * 60 * 24
+
+_backend = None
+
+
+def get_presence_backend():
+    """Возвращает экземпляр бэкенда присутствия (один на процесс)"""
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.CHAT_PRESENCE_BACKEND)()
+    return _backend
+
+
+def get_room_access_count(room_name):
+    """Количество пользователей с доступом к комнате по ее Room.access_roles (кешируется до смены ролей)"""
+    cache_key = ROOM_ACCESS_COUNT_CACHE_KEY.format(room_name=room_name)
+    count = cache.get(cache_key)
+    if count is None:
+        room = get_room(room_name)
+        if room is None:
+            return 0
+        users = get_user_model().objects.all()
+        if room.access_roles:
+            users = users.filter(role__in=room.access_roles)
+        else:
+            users = users.filter(is_active=True)
+        count = users.count()
+        cache.set(cache_key, count, ROOM_ACCESS_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def invalidate_room_access_counts(room_names=None):
+    """Сбрасывает кеш количества пользователей с доступом для указанных (по умолчанию всех) комнат"""
+    if room_names is None:
+        room_names = Room.objects.values_list('name', flat=True)
+    cache.delete_many([
+        ROOM_ACCESS_COUNT_CACHE_KEY.format(room_name=room_name)
+        for room_name in room_names
+    ])
+
+
+def _connection_member(user_id, channel_name):
+    return f"{user_id}|{channel_name}"
+
+
+class InMemoryPresenceBackend:
+    """Реестр присутствия в памяти процесса (тесты, локальная разработка с одним воркером)"""
+
+    def __init__(self):
+        self.rooms = {}
+
+    def _room(self, room_name):
+        return self.rooms.setdefault(room_name, {'connections': {}, 'users': {}, 'profiles': {}})
+
+    async def connect(self, room_name, user_id, channel_name, profile):
+        """Регистрирует подключение. True, если пользователь только что появился в сети"""
+        room = self._room(room_name)
+        member = _connection_member(user_id, channel_name)
+        is_new_connection = member not in room['connections']
+        room['connections'][member] = time.time() + settings.CHAT_PRESENCE_TTL
+        if not is_new_connection:
+            return False
+
+        room['users'][str(user_id)] = room['users'].get(str(user_id), 0) + 1
+        room['profiles'][str(user_id)] = profile
+        return room['users'][str(user_id)] == 1
+
+    async def heartbeat(self, room_name, user_id, channel_name, profile):
+        """Продлевает жизнь подключения (восстанавливает его, если оно уже истекло)"""
+        return await self.connect(room_name, user_id, channel_name, profile)
+
+    async def disconnect(self, room_name, user_id, channel_name):
+        """Удаляет подключение. True, если у пользователя не осталось подключений"""
+        room = self._room(room_name)
+        if room['connections'].pop(_connection_member(user_id, channel_name), None) is None:
+            return False
+        return self._release_user(room, str(user_id)) is not None
+
+    async def expire(self, room_name):
+        """Удаляет подключения без heartbeat и возвращает профили ушедших пользователей"""
+        room = self._room(room_name)
+        now = time.time()
+        dead_members = [member for member, expires_at in room['connections'].items() if expires_at <= now]
+
+        gone = []
+        for member in dead_members:
+            del room['connections'][member]
+            profile = self._release_user(room, member.split('|', 1)[0])
+            if profile is not None:
+                gone.append(profile)
+        return gone
+
+    async def online_users(self, room_name):
+        return list(self._room(room_name)['profiles'].values())
+
+    async def count(self, room_name):
+        return len(self._room(room_name)['users'])
+
+    def _release_user(self, room, user_id):
+        """Уменьшает счетчик подключений; возвращает профиль, если пользователь ушел из сети"""
+        remaining = room['users'].get(user_id, 0) - 1
+        if remaining > 0:
+            room['users'][user_id] = remaining
+            return None
+        room['users'].pop(user_id, None)
+        return room['profiles'].pop(user_id, None)
+
+
+class RedisPresenceBackend:
+    """Реестр присутствия в Redis, общий для всех воркеров"""
+
+    CONNECT_SCRIPT = """
+        local is_new = redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+        if is_new == 0 then
+            return 0
+        end
+        redis.call('HSET', KEYS[3], ARGV[3], ARGV[4])
+        return redis.call('HINCRBY', KEYS[2], ARGV[3], 1) == 1 and 1 or 0
+    """
+
+    DISCONNECT_SCRIPT = """
+        if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+            return 0
+        end
+        if redis.call('HINCRBY', KEYS[2], ARGV[2], -1) > 0 then
+            return 0
+        end
+        redis.call('HDEL', KEYS[2], ARGV[2])
+        redis.call('HDEL', KEYS[3], ARGV[2])
+        return 1
+    """
+
+    EXPIRE_SCRIPT = """
+        local gone = {}
+        for _, member in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])) do
+            redis.call('ZREM', KEYS[1], member)
+            local user_id = string.match(member, '^([^|]+)|')
+            if redis.call('HINCRBY', KEYS[2], user_id, -1) <= 0 then
+                local profile = redis.call('HGET', KEYS[3], user_id)
+                if profile then
+                    table.insert(gone, profile)
+                end
+                redis.call('HDEL', KEYS[2], user_id)
+                redis.call('HDEL', KEYS[3], user_id)
+            end
+        end
+        return gone
+    """
+
+    def __init__(self, url=None):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url or settings.REDIS_URL, decode_responses=True)
+        self.connect_script = self.client.register_script(self.CONNECT_SCRIPT)
+        self.disconnect_script = self.client.register_script(self.DISCONNECT_SCRIPT)
+        self.expire_script = self.client.register_script(self.EXPIRE_SCRIPT)
+
+    def _keys(self, room_name):
+        prefix = f"chat:presence:{room_name}"
+        return [f"{prefix}:connections", f"{prefix}:users", f"{prefix}:profiles"]
+
+    async def connect(self, room_name, user_id, channel_name, profile):
+        """Регистрирует подключение. True, если пользователь только что появился в сети"""
+        joined = await self.connect_script(
+            keys=self._keys(room_name),
+            args=[
+                _connection_member(user_id, channel_name),
+                time.time() + settings.CHAT_PRESENCE_TTL,
+                str(user_id),
+                json.dumps(profile),
+            ],
+        )
+        return bool(joined)
+
+    async def heartbeat(self, room_name, user_id, channel_name, profile):
+        """Продлевает жизнь подключения (восстанавливает его, если оно уже истекло)"""
+        return await self.connect(room_name, user_id, channel_name, profile)
+
+    async def disconnect(self, room_name, user_id, channel_name):
+        """Удаляет подключение. True, если у пользователя не осталось подключений"""
+        left = await self.disconnect_script(
+            keys=self._keys(room_name),
+            args=[_connection_member(user_id, channel_name), str(user_id)],
+        )
+        return bool(left)
+
+    async def expire(self, room_name):
+        """Удаляет подключения без heartbeat и возвращает профили ушедших пользователей"""
+        gone = await self.expire_script(keys=self._keys(room_name), args=[time.time()])
+        return [json.loads(profile) for profile in gone]
+
+    async def online_users(self, room_name):
+        profiles = await self.client.hvals(self._keys(room_name)[2])
+        return [json.loads(profile) for profile in profiles]
+
+    async def count(self, room_name):
+        return await self.client.hlen(self._keys(room_name)[1])
@@ -0,0 +1,162 @@
+"""
+Кодирование кадров websocket-протокола чата.
+
+JSON в текстовых кадрах - протокол по умолчанию. Клиент может договориться о
+компактном двоичном протоколе при подключении - подпротоколом websocket
+(Sec-WebSocket-Protocol) или параметром ?protocol= в адресе:
+
+- besedka.json (protocol=json) - JSON, как и без согласования;
+- besedka.msgpack (protocol=msgpack) - MessagePack с короткими ID полей;
+- besedka.msgpack-zlib (protocol=msgpack-zlib) - то же, плюс сжатие zlib
+  пакетов истории (COMPRESSED_FRAME_TYPES) от COMPRESS_MIN_BYTES.
+
+Двоичный кадр: первый байт - флаг (FLAG_PLAIN или FLAG_ZLIB), дальше данные
+MessagePack. Ключи словарей на любой глубине заменяются номерами полей из
+FIELDS, неизвестные ключи передаются строками. Таблица только дополняется в
+конец: номер поля не меняется между версиями сервера. Клиент может
+отправлять кадры и JSON-текстом, и в двоичном формате своего протокола.
+
+Рассылки в группу кодируются в JSON один раз на событие (см. broadcast);
+двоичное представление того же события строится один раз на процесс
+(кеш encode_text), а не в каждом консьюмере.
+"""
+import json
+import zlib
+from functools import lru_cache
+from urllib.parse import parse_qs
+
+import msgpack
+
+PROTOCOL_PREFIX = 'besedka.'
+
+# Номера полей двоичного протокола (индекс в списке). Только дополнять в конец!
+FIELDS = [
+    # Общие поля кадров
+    'type', 'message', 'messages', 'message_id', 'code', 'action', 'retry_after',
+    # История и пагинация
+    'pinned_messages', 'last_seq', 'before_cursor', 'after_cursor', 'has_more_before', 'has_more_after',
+    'has_more', 'next_cursor', 'direction', 'before_message_id', 'target_message_id', 'found',
+    # Сообщение
+    'id', 'cursor', 'content', 'author_name', 'author_role', 'author_role_icon', 'author_id', 'created',
+    'reply_to', 'content_snippet', 'likes_count', 'dislikes_count', 'is_edited', 'edited_by', 'edited_by_role',
+    'edited_at', 'is_pinned', 'pinned_by', 'pinned_at', 'is_forwarded', 'original_message_id', 'is_own',
+    'is_reply_to_me', 'mentions_me', 'is_personal_notification', 'user_reaction', 'is_read', 'mentioned_user_ids',
+    # unread_info
+    'unread_count', 'personal_notifications_count', 'first_unread_message_id', 'first_personal_notification_id',
+    'return_position', 'last_read_at', 'last_visit_at', 'is_first_visit', 'saved_position',
+    'last_visible_message_id', 'scroll_position_percent',
+    # Пользователи, присутствие, реакции
+    'user', 'users', 'username', 'display_name', 'role', 'role_icon', 'is_typing', 'reaction_type',
+    'joined', 'left', 'count', 'total_count', 'editor', 'deleter', 'forwarder', 'pinner', 'unpinner',
+    # Журнал событий и поиск
+    'seq', 'events', 'resume_from', 'query', 'results', 'rank', 'highlight',
+    # Пакетные действия
+    'message_ids', 'target_rooms', 'custom_message',
+]
+FIELD_IDS = {name: index for index, name in enumerate(FIELDS)}
+
+# Флаг в первом байте двоичного кадра
+FLAG_PLAIN = b'\x00'
+FLAG_ZLIB = b'\x01'
+
+# Какие кадры сжимаются (пакеты истории) и с какого размера сжатие окупается
+COMPRESSED_FRAME_TYPES = frozenset({'messages_history', 'more_messages', 'message_context', 'replay', 'search_results'})
+COMPRESS_MIN_BYTES = 512
+COMPRESS_LEVEL = 6
+
+# Сколько последних закодированных событий группы помнит процесс
+ENCODED_EVENTS_CACHE_SIZE = 256
+
+
+def shorten(value):
+    """Заменяет ключи словарей (на любой глубине) номерами полей"""
+    if isinstance(value, dict):
+        return {FIELD_IDS.get(key, key): shorten(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [shorten(item) for item in value]
+    return value
+
+
+def expand(value):
+    """Обратная замена номеров полей на имена"""
+    if isinstance(value, dict):
+        return {(FIELDS[key] if isinstance(key, int) else key): expand(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [expand(item) for item in value]
+    return value
+
+
+class JsonCodec:
+    """JSON в текстовых кадрах (протокол по умолчанию)"""
+
+    name = 'json'
+    binary = False
+
+    def encode(self, frame):
+        return json.dumps(frame)
+
+    def encode_text(self, text):
+        """Кадр из уже закодированного в JSON события"""
+        return text
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class MsgpackCodec:
+    """MessagePack с короткими ID полей в двоичных кадрах; с compress - сжатие пакетов истории"""
+
+    binary = True
+
+    def __init__(self, compress=False):
+        self.compress = compress
+        self.name = 'msgpack-zlib' if compress else 'msgpack'
+
+    def encode(self, frame):
+        packed = msgpack.packb(shorten(frame), use_bin_type=True)
+        if self.compress and frame.get('type') in COMPRESSED_FRAME_TYPES and len(packed) >= COMPRESS_MIN_BYTES:
+            return FLAG_ZLIB + zlib.compress(packed, COMPRESS_LEVEL)
+        return FLAG_PLAIN + packed
+
+    def encode_text(self, text):
+        """Кадр из уже закодированного в JSON события (одно перекодирование на процесс)"""
+        return _encode_text(self.name, text)
+
+    def decode(self, data):
+        """Разбирает кадр клиента; ValueError для поврежденного кадра"""
+        if isinstance(data, str):
+            # Клиент двоичного протокола может прислать и обычный JSON
+            return json.loads(data)
+        flag, body = data[:1], data[1:]
+        try:
+            if flag == FLAG_ZLIB:
+                body = zlib.decompress(body)
+            elif flag != FLAG_PLAIN:
+                raise ValueError(f"Unknown frame flag: {flag!r}")
+            return expand(msgpack.unpackb(body, raw=False, strict_map_key=False))
+        except (zlib.error, msgpack.UnpackException, IndexError) as e:
+            raise ValueError(f"Invalid binary frame: {e}") from e
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec(), MsgpackCodec(), MsgpackCodec(compress=True))}
+DEFAULT_CODEC = CODECS['json']
+
+
+@lru_cache(maxsize=ENCODED_EVENTS_CACHE_SIZE)
+def _encode_text(codec_name, text):
+    return CODECS[codec_name].encode(json.loads(text))
+
+
+def negotiate(scope):
+    """
+    Выбирает кодек по подпротоколам websocket, иначе по параметру ?protocol=.
+    Возвращает (кодек, подпротокол для ответа при accept или None).
+    """
+    for subprotocol in scope.get('subprotocols') or []:
+        name = subprotocol[len(PROTOCOL_PREFIX):] if subprotocol.startswith(PROTOCOL_PREFIX) else None
+        if name in CODECS:
+            return CODECS[name], subprotocol
+
+    query = parse_qs((scope.get('query_string') or b'').decode('latin-1'))
+    name = (query.get('protocol') or [None])[0]
+    return CODECS.get(name, DEFAULT_CODEC), None
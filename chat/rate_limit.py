@@ -0,0 +1,130 @@
+"""
+Ограничение частоты кадров от пользователей чата.
+
+Каждому пользователю и типу кадра соответствует "корзина токенов" из
+CHAT_RATE_LIMITS: емкость задает допустимый всплеск, скорость пополнения -
+устойчивую частоту. Кадр, для которого токена нет, отбрасывается до обработчика
+и обращений к БД, клиент получает кадр error с кодом rate_limited
+(не чаще раза в секунду на тип кадра, чтобы флуд не превращался в поток ответов).
+
+Корзина общая для всех подключений пользователя: несколько вкладок не
+увеличивают его бюджет. Неизвестные типы кадров делят бюджет default.
+
+Счетчики metrics (на процесс) показывают, сколько кадров отброшено: всего
+(throttled) и по типам (throttled:<тип>).
+
+Бэкенд выбирается настройкой CHAT_RATE_LIMIT_BACKEND: RedisRateLimiter для
+нескольких воркеров, InMemoryRateLimiter - для тестов и одного процесса.
+"""
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Счетчики процесса: throttled и throttled:<тип кадра>
+metrics = Counter()
+
+# При скольких корзинах в памяти удалять полностью пополненные (они ничем не отличаются от новых)
+IN_MEMORY_PRUNE_SIZE = 10000
+
+_limiter = None
+
+
+def get_rate_limiter():
+    """Возвращает экземпляр ограничителя частоты (один на процесс)"""
+    global _limiter
+    if _limiter is None:
+        _limiter = import_string(settings.CHAT_RATE_LIMIT_BACKEND)()
+    return _limiter
+
+
+def get_budget(action):
+    """Тип кадра, по которому ведется корзина, и его бюджет (емкость, токенов в секунду)"""
+    limits = settings.CHAT_RATE_LIMITS
+    if action not in limits:
+        action = 'default'
+    capacity, rate = limits[action]
+    return action, capacity, rate
+
+
+class InMemoryRateLimiter:
+    """Корзины токенов в памяти процесса (тесты, локальная разработка с одним воркером)"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        # {(user_id, action): (токены, момент обновления)}
+        self.buckets = {}
+
+    async def allow(self, user_id, action):
+        """Забирает токен; возвращает (разрешено, через сколько секунд появится токен)"""
+        action, capacity, rate = get_budget(action)
+        now = self.clock()
+        key = (user_id, action)
+        tokens, updated_at = self.buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * rate)
+
+        if tokens >= 1:
+            self.buckets[key] = (tokens - 1, now)
+            if len(self.buckets) > IN_MEMORY_PRUNE_SIZE:
+                self.prune(now)
+            return True, 0.0
+
+        self.buckets[key] = (tokens, now)
+        return False, (1 - tokens) / rate
+
+    def prune(self, now):
+        for key, (tokens, updated_at) in list(self.buckets.items()):
+            _, capacity, rate = get_budget(key[1])
+            if tokens + (now - updated_at) * rate >= capacity:
+                del self.buckets[key]
+
+    async def clear(self):
+        self.buckets.clear()
+
+
+class RedisRateLimiter:
+    """Корзины токенов в Redis, общие для всех воркеров"""
+
+    # KEYS: корзина (hash tokens/ts); ARGV: емкость, токенов в секунду.
+    # Время берется у Redis, чтобы часы воркеров не влияли на пополнение
+    ALLOW_SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local time = redis.call('TIME')
+        local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = tonumber(state[1]) or capacity
+        local ts = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + (now - ts) * rate / 1000)
+        local allowed = 0
+        local retry_ms = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        else
+            retry_ms = math.ceil((1 - tokens) * 1000 / rate)
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+        redis.call('PEXPIRE', KEYS[1], math.ceil(capacity * 1000 / rate) + 1000)
+        return {allowed, retry_ms}
+    """
+
+    def __init__(self, url=None):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url or settings.REDIS_URL, decode_responses=True)
+        self.allow_script = self.client.register_script(self.ALLOW_SCRIPT)
+
+    async def allow(self, user_id, action):
+        """Забирает токен; возвращает (разрешено, через сколько секунд появится токен)"""
+        action, capacity, rate = get_budget(action)
+        allowed, retry_ms = await self.allow_script(
+            keys=[f"chat:ratelimit:{user_id}:{action}"], args=[capacity, rate]
+        )
+        return bool(allowed), retry_ms / 1000
+
+    async def clear(self):
+        async for key in self.client.scan_iter(match='chat:ratelimit:*'):
+            await self.client.delete(key)
+
@@ -0,0 +1,64 @@
+"""
+Реестр комнат чата.
+
+Комнаты (Room) - обычные записи БД: политика доступа (Room.access_roles) и
+ограничения (Room.max_message_length) задаются в админке, новые комнаты -
+модераторов, магазинов, гроурепортов - подключаются по адресу ws/chat/<room>/
+без изменений кода.
+
+Реестр держит загруженные комнаты в памяти процесса, поэтому подключение и
+обработчики кадров не обращаются за комнатой к БД. Отсутствующие комнаты
+тоже запоминаются, чтобы подключения к несуществующему адресу не делали
+запрос каждый раз. Любое изменение комнаты (сигналы Room, архивация,
+invalidate_rooms) меняет версию реестра в общем кеше Django: остальные
+процессы сбрасывают свои копии при следующем обращении, сверив версию.
+"""
+import threading
+import uuid
+
+from django.core.cache import cache
+
+from .models import Room
+
+ROOMS_VERSION_CACHE_KEY = 'chat:rooms:version'
+ROOMS_VERSION_CACHE_TIMEOUT = None  # Версия живет до следующего изменения
+
+_lock = threading.Lock()
+_rooms = {}
+_version = object()  # Не совпадает ни с одной версией из кеша - первое обращение загружает реестр
+
+
+def get_room(room_name):
+    """Комната по имени из реестра процесса (None, если такой комнаты нет)"""
+    global _version
+    version = cache.get(ROOMS_VERSION_CACHE_KEY)
+    with _lock:
+        if version != _version:
+            _rooms.clear()
+            _version = version
+        if room_name in _rooms:
+            return _rooms[room_name]
+
+    room = Room.objects.filter(name=room_name).first()
+    with _lock:
+        if _version == version:
+            _rooms[room_name] = room
+    return room
+
+
+def get_available_room(room_name, user):
+    """Активная комната, доступная пользователю, иначе None"""
+    room = get_room(room_name)
+    if room is None or not room.is_active or not room.can_access(user):
+        return None
+    return room
+
+
+def invalidate_rooms():
+    """Сбрасывает реестр во всех процессах (после изменения комнат в обход сигналов - update, bulk_create)"""
+    global _version
+    version = uuid.uuid4().hex
+    cache.set(ROOMS_VERSION_CACHE_KEY, version, ROOMS_VERSION_CACHE_TIMEOUT)
+    with _lock:
+        _rooms.clear()
+        _version = version
@@ -2,6 +2,6 @@ from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
-    re_path(r"ws/chat/general/$", consumers.GeneralChatConsumer.as_asgi()),
-    re_path(r"ws/chat/vip/$", consumers.VIPChatConsumer.as_asgi()),
+    # Любая комната из реестра (chat.rooms): general, vip, moderators и добавленные в админке
+    re_path(r"ws/chat/(?P<room_name>[\w-]+)/$", consumers.ChatConsumer.as_asgi()),
 ]
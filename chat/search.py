@@ -0,0 +1,205 @@
+"""
+Полнотекстовый поиск по сообщениям чата.
+
+Postgres: генерируемая колонка chat_message.search_vector (to_tsvector с
+конфигурацией SEARCH_CONFIG) с GIN-индексом. Колонку пересчитывает сама БД,
+поэтому индекс актуален при создании и правке сообщения любым путем -
+консьюмер, админка, bulk_create в командах. Запрос разбирается
+websearch_to_tsquery (слова, "фразы", -исключения), ранг - ts_rank,
+подсветка - ts_headline только для строк страницы.
+
+SQLite (тесты, локальная разработка): таблица FTS5 chat_message_fts, которую
+заполняют сигналы модели Message (rowid таблицы - 63 бита UUID сообщения,
+поэтому правка и удаление находят строку по ключу). Ранг - bm25, подсветка -
+snippet. Сообщения, созданные через bulk_create, на SQLite попадают в поиск,
+только если их явно передать в index_messages (так делает пакетная пересылка).
+
+Удаленные (is_deleted) сообщения отсекаются при поиске. Результаты упорядочены
+по рангу, затем по времени; курсор - (ранг, created_at, id) последнего
+результата, так что следующая страница продолжает выдачу без OFFSET.
+"""
+import base64
+import re
+import uuid
+from datetime import datetime
+
+from django.db import connection
+from django.utils.html import escape
+
+from .models import Message
+from .serializers import MESSAGE_RELATED_FIELDS
+
+# Конфигурация текстового поиска Postgres (она же зашита в генерируемую колонку миграции 0012)
+SEARCH_CONFIG = 'russian'
+
+# Максимальный размер страницы результатов, который может запросить клиент
+MAX_SEARCH_RESULTS = 50
+
+# Маркеры подсветки из БД (символы из области частного использования Unicode),
+# заменяются на <mark> после экранирования текста сообщения
+HIGHLIGHT_START, HIGHLIGHT_STOP = '\ue000', '\ue001'
+HEADLINE_OPTIONS = (
+    f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, '
+    'MaxWords=30, MinWords=10, MaxFragments=2, FragmentDelimiter=" … "'
+)
+
+# Условие продолжения выдачи после курсора, одинаковое для обоих бэкендов
+AFTER_CURSOR_SQL = 'WHERE hits.rank < %s OR (hits.rank = %s AND (hits.created_at, hits.id) < (%s, %s))'
+
+POSTGRES_SEARCH_SQL = """
+    SELECT page.id, page.rank, ts_headline(%s::regconfig, page.content, page.query, %s)
+    FROM (
+        SELECT hits.* FROM (
+            SELECT m.id, m.created_at, m.content, q.query, ts_rank(m.search_vector, q.query)::float8 AS rank
+            FROM chat_message m, websearch_to_tsquery(%s::regconfig, %s) AS q(query)
+            WHERE m.room_id = %s AND NOT m.is_deleted AND m.search_vector @@ q.query
+        ) hits
+        {after}
+        ORDER BY hits.rank DESC, hits.created_at DESC, hits.id DESC
+        LIMIT %s
+    ) page
+    ORDER BY page.rank DESC, page.created_at DESC, page.id DESC
+"""
+
+SQLITE_SEARCH_SQL = """
+    SELECT hits.id, hits.rank, hits.highlight FROM (
+        SELECT m.id, m.created_at, -bm25(chat_message_fts) AS rank,
+               snippet(chat_message_fts, 0, %s, %s, ' … ', 16) AS highlight
+        FROM chat_message_fts JOIN chat_message m ON m.id = chat_message_fts.message_id
+        WHERE chat_message_fts MATCH %s AND m.room_id = %s AND NOT m.is_deleted
+    ) hits
+    {after}
+    ORDER BY hits.rank DESC, hits.created_at DESC, hits.id DESC
+    LIMIT %s
+"""
+
+
+def encode_search_cursor(rank, message):
+    """Курсор, указывающий на результат поиска"""
+    raw = f"{rank!r}|{message.created_at.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_search_cursor(cursor):
+    """Возвращает (rank, created_at, id) из курсора; ValueError для поврежденного курсора"""
+    try:
+        rank, created_at, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return float(rank), datetime.fromisoformat(created_at), uuid.UUID(message_id)
+    except (AttributeError, TypeError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid search cursor: {cursor!r}") from e
+
+
+def render_highlight(snippet):
+    """Экранирует фрагмент сообщения и размечает найденные слова тегом <mark>"""
+    return escape(snippet).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_STOP, '</mark>')
+
+
+def search_messages(room, query, cursor=None, limit=20):
+    """
+    Ищет сообщения комнаты по тексту.
+
+    Возвращает словарь: hits - список (сообщение, ранг, подсветка) в порядке
+    релевантности (сообщения со связями MESSAGE_RELATED_FIELDS), next_cursor -
+    курсор для следующей страницы, has_more - есть ли еще результаты.
+    """
+    key = decode_search_cursor(cursor) if cursor else None
+    rows = []
+    if query.strip():
+        run = _search_postgres if connection.vendor == 'postgresql' else _search_sqlite
+        rows = run(room, query, key, limit + 1)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    pk = Message._meta.pk
+    messages = Message.objects.select_related(*MESSAGE_RELATED_FIELDS).in_bulk([pk.to_python(row[0]) for row in rows])
+    hits = [
+        (messages[pk.to_python(message_id)], rank, render_highlight(highlight))
+        for message_id, rank, highlight in rows
+        if pk.to_python(message_id) in messages
+    ]
+    return {
+        'hits': hits,
+        'next_cursor': encode_search_cursor(hits[-1][1], hits[-1][0]) if hits else cursor,
+        'has_more': has_more,
+    }
+
+
+def _key_params(key):
+    """Параметры AFTER_CURSOR_SQL в представлении БД (UUID и время хранятся по-разному)"""
+    if key is None:
+        return []
+    rank, created_at, message_id = key
+    return [
+        rank, rank,
+        Message._meta.get_field('created_at').get_db_prep_value(created_at, connection),
+        Message._meta.pk.get_db_prep_value(message_id, connection),
+    ]
+
+
+def _search_postgres(room, query, key, limit):
+    sql = POSTGRES_SEARCH_SQL.format(after=AFTER_CURSOR_SQL if key else '')
+    params = [
+        SEARCH_CONFIG, HEADLINE_OPTIONS, SEARCH_CONFIG, query, room.pk,
+        *_key_params(key), limit,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _search_sqlite(room, query, key, limit):
+    match = fts5_query(query)
+    if not match:
+        return []
+    sql = SQLITE_SEARCH_SQL.format(after=AFTER_CURSOR_SQL if key else '')
+    params = [
+        HIGHLIGHT_START, HIGHLIGHT_STOP, match,
+        Message._meta.get_field('room').get_db_prep_value(room.pk, connection),
+        *_key_params(key), limit,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def fts5_query(query):
+    """Запрос FTS5 из пользовательского текста: все слова обязательны, последнее - как префикс"""
+    words = re.findall(r'\w+', query)
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _fts_rowid(message_id):
+    """rowid строки FTS5 для сообщения: младшие 63 бита UUID"""
+    return uuid.UUID(str(message_id)).int & (2 ** 63 - 1)
+
+
+def index_message(message):
+    """Обновляет строку сообщения в индексе SQLite (Postgres пересчитывает колонку сам)"""
+    if connection.vendor != 'sqlite':
+        return
+    rowid = _fts_rowid(message.pk)
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM chat_message_fts WHERE rowid = %s', [rowid])
+        cursor.execute(
+            'INSERT INTO chat_message_fts (rowid, content, message_id) VALUES (%s, %s, %s)',
+            [rowid, message.content, Message._meta.pk.get_db_prep_value(message.pk, connection)]
+        )
+
+
+def index_messages(messages):
+    """Добавляет в индекс SQLite сообщения, созданные через bulk_create (сигналы для них не срабатывают)"""
+    for message in messages:
+        index_message(message)
+
+
+def unindex_message(message_id):
+    """Убирает сообщение из индекса SQLite"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM chat_message_fts WHERE rowid = %s', [_fts_rowid(message_id)])
@@ -0,0 +1,172 @@
+"""
+Пакетная сериализация сообщений чата.
+
+Страница истории сериализуется за фиксированное число запросов независимо от
+ее размера: сами сообщения (со связанными пользователями через select_related)
+и реакции текущего пользователя. Счетчики реакций хранятся в самом сообщении
+(Message.likes_count/dislikes_count), фрагмент для ответа и текст для поиска
+упоминаний вычисляются при записи (chat.content), так что упоминания и ответы
+определяются по уже загруженным данным, без обращений к БД.
+"""
+from collections import defaultdict
+from datetime import datetime
+
+from .content import make_mention_text
+from .models import MessageReaction
+from .pagination import encode_cursor
+
+# Связи, которые нужно подгрузить вместе с сообщениями перед сериализацией
+MESSAGE_RELATED_FIELDS = ('author', 'parent', 'parent__author', 'edited_by', 'pinned_by')
+
+
+def serialize_shared(message):
+    """Поля сообщения, одинаковые для всех получателей"""
+    reply_data = None
+    if message.parent:
+        reply_data = {
+            'id': str(message.parent.id),
+            'author_name': message.parent.author.display_name,
+            'author_role_icon': message.parent.author.get_role_icon,
+            'content_snippet': message.parent.content_snippet,
+        }
+
+    return {
+        'id': str(message.id),
+        'cursor': encode_cursor(message),  # Для запроса соседних страниц (load_more_messages)
+        'content': message.content,
+        'author_name': message.author.display_name,
+        'author_role': message.author.role,
+        'author_role_icon': message.author.get_role_icon,
+        'created': message.created_at.isoformat(),
+        'reply_to': reply_data,
+        'likes_count': message.likes_count,
+        'dislikes_count': message.dislikes_count,
+        'is_edited': message.is_edited,
+        'edited_by': message.edited_by.display_name if message.edited_by else None,
+        'edited_by_role': message.edited_by.role if message.edited_by else None,
+        'edited_at': message.edited_at.isoformat() if message.edited_at else None,
+        'is_pinned': message.is_pinned,
+        'pinned_by': message.pinned_by.display_name if message.pinned_by else None,
+        'pinned_at': message.pinned_at.isoformat() if message.pinned_at else None,
+        'is_forwarded': message.is_forwarded,
+        'original_message_id': message.original_message_id,
+    }
+
+
+def broadcast_message(entry, mentioned_user_ids=None):
+    """
+    Сообщение для рассылки в группу из записи build_cache_entries: только общие
+    поля и ID, по которым клиент сам определяет is_own, is_reply_to_me и mentions_me.
+    """
+    data = {key: value for key, value in entry.items() if not key.startswith('_')}
+    data['author_id'] = entry['_author_id']
+    if data['reply_to']:
+        data['reply_to'] = {**data['reply_to'], 'author_id': entry['_parent_author_id']}
+    if mentioned_user_ids is not None:
+        data['mentioned_user_ids'] = list(mentioned_user_ids)
+    return data
+
+
+def build_cache_entries(messages):
+    """
+    Записи для горячего кеша истории (chat.history_cache): общие поля сообщения
+    и служебные поля (с префиксом _), по которым поля получателя вычисляются
+    при отправке. Реакции (кто и как реагировал) загружаются одним запросом.
+    """
+    messages = list(messages)
+    reactions = defaultdict(dict)
+    if messages:
+        for message_id, user_id, reaction_type in MessageReaction.objects.filter(
+            message_id__in=[message.id for message in messages]
+        ).values_list('message_id', 'user_id', 'reaction_type'):
+            reactions[message_id][str(user_id)] = reaction_type
+
+    entries = []
+    for message in messages:
+        entry = serialize_shared(message)
+        entry.update({
+            '_author_id': message.author_id,
+            '_parent_author_id': message.parent.author_id if message.parent else None,
+            '_reactions': reactions[message.id],
+            '_mention_text': message.mention_text,
+        })
+        entries.append(entry)
+    return entries
+
+
+class ChatMessageSerializer:
+    """Сериализует сообщения для конкретного пользователя (is_own, user_reaction, mentions_me и т.д.)"""
+
+    def __init__(self, user, position=None):
+        self.user = user
+        # Позиция передается для истории: тогда в ответ добавляется is_read
+        self.position = position
+        # Те же паттерны, что в Message.mentions_user, но приведенные к нижнему регистру один раз
+        self.mention_patterns = [
+            pattern.lower() for pattern in (
+                f'@{user.username}',
+                f'@{user.display_name}',
+                f'@{user.name}' if user.name else None,
+            ) if pattern
+        ]
+
+    def serialize(self, messages):
+        """Возвращает список JSON-словарей в порядке переданных сообщений"""
+        messages = list(messages)
+        if not messages:
+            return []
+
+        user_reactions = dict(MessageReaction.objects.filter(
+            message_id__in=[message.id for message in messages], user=self.user
+        ).values_list('message_id', 'reaction_type'))
+
+        return [self.serialize_one(message, user_reactions.get(message.id)) for message in messages]
+
+    def serialize_one(self, message, user_reaction):
+        """Сериализует одно сообщение по заранее собранной реакции пользователя"""
+        return self.overlay(
+            serialize_shared(message),
+            author_id=message.author_id,
+            parent_author_id=message.parent.author_id if message.parent else None,
+            user_reaction=user_reaction,
+            created_at=message.created_at,
+            mention_text=message.mention_text,
+        )
+
+    def from_cache_entry(self, entry):
+        """Сериализует сообщение из горячего кеша истории без обращений к БД"""
+        data = {key: value for key, value in entry.items() if not key.startswith('_')}
+        return self.overlay(
+            data,
+            author_id=entry['_author_id'],
+            parent_author_id=entry['_parent_author_id'],
+            user_reaction=entry['_reactions'].get(str(self.user.id)),
+            created_at=datetime.fromisoformat(entry['created']),
+            # Записи, сохраненные до появления Message.mention_text, его не содержат
+            mention_text=entry['_mention_text'] if '_mention_text' in entry else make_mention_text(entry['content']),
+        )
+
+    def overlay(self, data, author_id, parent_author_id, user_reaction, created_at, mention_text):
+        """Добавляет к общим полям сообщения поля, зависящие от получателя"""
+        is_reply_to_me = parent_author_id is not None and parent_author_id == self.user.id
+        mentions_me = self.mentions_me(mention_text)
+
+        data.update({
+            'is_own': author_id == self.user.id,
+            'is_reply_to_me': is_reply_to_me,
+            'mentions_me': mentions_me,  # 🎯 Упоминания пользователя
+            'is_personal_notification': is_reply_to_me or mentions_me,  # 🎯 Персональные уведомления
+            'user_reaction': user_reaction,  # 'like', 'dislike' или None
+        })
+
+        if self.position is not None:
+            # Новый пользователь без last_read_at - все исторические сообщения считаются прочитанными
+            data['is_read'] = created_at <= self.position.last_read_at if self.position.last_read_at else True
+
+        return data
+
+    def mentions_me(self, mention_text):
+        """Ищет упоминания в Message.mention_text (уже в нижнем регистре)"""
+        if not mention_text:
+            return False
+        return any(pattern in mention_text for pattern in self.mention_patterns)
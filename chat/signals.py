@@ -1,8 +1,54 @@
-from django.db.models.signals import post_save, post_delete
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
-from .models import Message
 
-# Этот файл пока можно оставить пустым,
-# если у нас нет сигналов для новых моделей.
-# В будущем мы сможем добавить сюда логику,
-# например, для отправки уведомлений при новых сообщениях.
\ No newline at end of file
+from .models import Message, Room
+from .presence import invalidate_room_access_counts
+from .rooms import invalidate_rooms
+from .search import index_message, unindex_message
+
+User = get_user_model()
+
+
+def _chat_access_state(user):
+    # Читаем через __dict__, чтобы не подгружать отложенные (defer/only) поля отдельным запросом
+    return user.__dict__.get('role'), user.__dict__.get('is_active')
+
+
+@receiver(post_init, sender=User)
+def remember_chat_access_state(sender, instance, **kwargs):
+    """Запоминаем роль и активность, чтобы при сохранении понять, изменился ли доступ к чатам"""
+    instance._chat_access_state = _chat_access_state(instance)
+
+
+@receiver(post_save, sender=User)
+def invalidate_chat_access_counts_on_save(sender, instance, created, **kwargs):
+    """Сбрасываем кеш количества пользователей с доступом при смене роли или активности"""
+    if created or instance._chat_access_state != _chat_access_state(instance):
+        invalidate_room_access_counts()
+    instance._chat_access_state = _chat_access_state(instance)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_chat_access_counts_on_delete(sender, instance, **kwargs):
+    invalidate_room_access_counts()
+
+
+@receiver(post_save, sender=Message)
+def index_message_for_search(sender, instance, update_fields=None, **kwargs):
+    """Поддерживаем индекс поиска SQLite (на Postgres колонку search_vector пересчитывает БД)"""
+    if update_fields is None or 'content' in update_fields:
+        index_message(instance)
+
+
+@receiver(post_delete, sender=Message)
+def unindex_deleted_message(sender, instance, **kwargs):
+    unindex_message(instance.pk)
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidate_room_registry(sender, instance, **kwargs):
+    """Изменение комнаты (доступ, ограничения, архив) сбрасывает реестр комнат и счетчик доступа к ней"""
+    invalidate_rooms()
+    invalidate_room_access_counts([instance.name])
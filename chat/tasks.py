@@ -0,0 +1,24 @@
+import logging
+
+from celery import shared_task
+
+from . import archive
+from .models import UserChatPosition
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def reconcile_unread_counters():
+    """Периодическая сверка инкрементальных счетчиков позиций с полным пересчетом"""
+    fixed = UserChatPosition.reconcile_counters()
+    logger.info(f"Unread counters reconciled: {fixed} positions fixed")
+    return fixed
+
+
+@shared_task
+def archive_old_messages():
+    """Периодический перенос сообщений старше CHAT_ARCHIVE_AFTER_DAYS в архив"""
+    archived = archive.archive_old_messages()
+    logger.info(f"Chat messages archived: {archived}")
+    return archived
@@ -56,14 +56,9 @@ def can_access_vip_chat(user):
     Проверить, может ли пользователь получить доступ к VIP чату
     Использование: {% can_access_vip_chat request.user as vip_access %}
 
-    ВРЕМЕННО: VIP чат отключен до реализации кастомного чата
+    Политика доступа одна с подключением к комнате - Room.access_roles (см. chat.rooms)
     """
     if not user or not user.is_authenticated:
         return False
 
-    # Проверяем роль пользователя для доступа к VIP чату
-    # Пока что разрешаем доступ владельцам и администраторам
-    if hasattr(user, 'role'):
-        return user.role in ['owner', 'store_owner', 'moderator']
-
-    return False
+    return user.can_access_vip_chat()
@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+
+from chat.archive import archive_old_messages, fetch_room_page, find_message, serialize_messages
+from chat.models import Room, Message, ArchivedMessage, MessageMention, MessageReaction, UserChatPosition
+from chat.pagination import DIRECTION_AFTER, DIRECTION_AROUND, DIRECTION_BEFORE, encode_cursor
+from chat.serializers import ChatMessageSerializer
+
+User = get_user_model()
+
+
+class MessageArchiveTest(TestCase):
+    def setUp(self):
+        self.room = Room.objects.get_or_create(name='general')[0]
+        self.user = User.objects.create_user(username='alice', password='password123', email='alice@example.com')
+        self.other = User.objects.create_user(username='bob', password='password123', email='bob@example.com')
+        self.now = timezone.now()
+
+    def create_message(self, days_ago, content='Сообщение', author=None, **kwargs):
+        message = Message.objects.create(
+            room=self.room, author=author or self.other, content=content,
+            created_at=self.now - timedelta(days=days_ago), **kwargs
+        )
+        MessageMention.index_message(message)
+        return message
+
+    def archive(self):
+        archived = archive_old_messages(older_than_days=30, batch_size=3)
+        self.room.refresh_from_db()
+        return archived
+
+    def walk_back(self, limit):
+        """Листает историю комнаты от конца к началу, возвращает ID в хронологическом порядке"""
+        page = fetch_room_page(self.room, None, DIRECTION_BEFORE, limit)
+        ids = [message.id for message in page['messages']]
+        while page['has_more_before']:
+            page = fetch_room_page(self.room, page['before_cursor'], DIRECTION_BEFORE, limit)
+            ids = [message.id for message in page['messages']] + ids
+        return ids
+
+    def test_keeps_pins_and_parents_of_remaining_replies(self):
+        """Тест: закрепленные сообщения и цепочка родителей свежего ответа остаются в Message."""
+        root = self.create_message(60, 'Корень ветки')
+        middle = self.create_message(50, 'Ответ в ветке', parent=root)
+        self.create_message(1, 'Свежий ответ', parent=middle)
+        pinned = self.create_message(55, 'Закреп', is_pinned=True)
+        old = [self.create_message(40 + i, f'Старое {i}') for i in range(7)]
+
+        self.assertEqual(self.archive(), 7)
+        self.assertEqual(set(ArchivedMessage.objects.values_list('id', flat=True)), {m.id for m in old})
+        self.assertEqual(Message.objects.filter(id__in=[root.id, middle.id, pinned.id]).count(), 3)
+        self.assertEqual(self.room.archived_until, old[0].created_at)
+        self.assertEqual(self.archive(), 0)
+
+    def test_history_falls_through_to_archive(self):
+        """Тест: страницы истории и контекст сообщения продолжаются в архиве без потерь и повторов."""
+        messages = [self.create_message(days_ago) for days_ago in range(60, 0, -2)]
+        self.archive()
+        self.assertEqual(Message.objects.count(), 14)
+
+        self.assertEqual(self.walk_back(limit=4), [message.id for message in messages])
+
+        # Якорь в архиве: контекст захватывает и архив, и Message
+        anchor = find_message(self.room, messages[14].id)
+        self.assertIsInstance(anchor, ArchivedMessage)
+        page = fetch_room_page(self.room, encode_cursor(anchor), DIRECTION_AROUND, 2)
+        self.assertEqual([message.id for message in page['messages']], [message.id for message in messages[12:17]])
+
+        page = fetch_room_page(self.room, encode_cursor(anchor), DIRECTION_AFTER, 30)
+        self.assertEqual([message.id for message in page['messages']], [message.id for message in messages[15:]])
+        self.assertFalse(page['has_more_after'])
+
+    def test_archived_messages_keep_reactions_and_per_user_fields(self):
+        """Тест: архивное сообщение сериализуется из снимка с реакциями, без запросов."""
+        message = self.create_message(40, '@alice привет')
+        MessageReaction.add(message, self.user, 'like')
+        self.archive()
+
+        [archived] = fetch_room_page(self.room, None, DIRECTION_BEFORE, 10)['messages']
+        serializer = ChatMessageSerializer(self.user)
+        with self.assertNumQueries(0):
+            [data] = serialize_messages(serializer, [archived])
+        self.assertEqual(data['id'], str(message.id))
+        self.assertEqual((data['likes_count'], data['user_reaction'], data['mentions_me']), (1, 'like', True))
+        self.assertFalse(MessageReaction.objects.exists())
+
+    def test_counters_stay_consistent(self):
+        """Тест: после архивации сверка счетчиков не находит расхождений."""
+        position = UserChatPosition.get_or_create_for_user(self.user, self.room)
+        position.last_read_at = position.last_visit_at = self.now - timedelta(days=45)
+        position.save()
+        self.create_message(40, '@alice старое')
+        self.create_message(1, '@alice свежее')
+        UserChatPosition.reconcile_counters()
+
+        self.archive()
+
+        position.refresh_from_db()
+        self.assertEqual((position.unread_count, position.personal_notifications_count), (1, 1))
+        self.assertEqual(UserChatPosition.reconcile_counters(), 0)
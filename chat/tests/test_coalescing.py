@@ -0,0 +1,52 @@
+import asyncio
+
+from django.test import SimpleTestCase, override_settings
+
+from chat.coalescing import PositionBuffer, TypingCoalescer
+
+
+@override_settings(CHAT_TYPING_WINDOW_MS=1000, CHAT_TYPING_TIMEOUT_MS=50, CHAT_POSITION_FLUSH_MS=50)
+class CoalescingTest(SimpleTestCase):
+    async def test_typing_is_broadcast_once_per_window_and_stops_on_timeout(self):
+        """Тест: серия кадров typing дает одну рассылку, а по таймауту - "перестал печатать"."""
+        broadcasts = []
+
+        async def broadcast(is_typing):
+            broadcasts.append(is_typing)
+
+        typing = TypingCoalescer(broadcast)
+        for _ in range(10):
+            await typing.update(True)
+        self.assertEqual(broadcasts, [True])
+
+        await asyncio.sleep(0.1)
+        self.assertEqual(broadcasts, [True, False])
+        self.assertEqual(typing.stats['typing_dropped'], 9)
+        self.assertEqual(typing.stats['typing_auto_stops'], 1)
+
+        # Повторный "перестал печатать" от клиента никуда не рассылается
+        await typing.update(False)
+        self.assertEqual(broadcasts, [True, False])
+
+    async def test_position_writes_are_coalesced(self):
+        """Тест: из серии позиций в БД записывается только последняя."""
+        writes = []
+
+        async def write(last_visible_message_id, scroll_position_percent):
+            writes.append((last_visible_message_id, scroll_position_percent))
+
+        buffer = PositionBuffer(write)
+        await buffer.update('message-1', 10.0)
+        await buffer.update(None, 20.0)
+        await buffer.update(None, 30.0)
+        self.assertEqual(writes, [])
+
+        await asyncio.sleep(0.1)
+        self.assertEqual(writes, [('message-1', 30.0)])
+        self.assertEqual(buffer.stats['position_writes_saved'], 2)
+
+        # При отключении отложенная позиция записывается сразу
+        await buffer.update('message-2', 40.0)
+        await buffer.flush()
+        self.assertEqual(writes[-1], ('message-2', 40.0))
+        self.assertEqual(buffer.stats['position_writes'], 2)
@@ -0,0 +1,411 @@
+from importlib import import_module
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from chat.consumers import CONNECT_QUERY_BUDGET
+from chat.event_log import get_event_log
+from chat.history_cache import get_history_cache
+from chat.models import Room, Message, UserChatPosition
+from chat.protocol import CODECS
+from chat.rate_limit import get_rate_limiter
+from chat.rooms import invalidate_rooms
+from chat.routing import websocket_urlpatterns
+
+User = get_user_model()
+
+
+def seed_default_rooms():
+    """Комнаты с политикой доступа из миграции реестра комнат (TransactionTestCase очищает данные миграций)"""
+    import_module('chat.migrations.0016_add_room_registry_settings').create_default_rooms(apps, None)
+    invalidate_rooms()
+
+
+def render_navigation(user, room_name):
+    """Навигация страницы комнаты чата для пользователя"""
+    request = RequestFactory().get(reverse('chat:room', args=[room_name]))
+    request.user = user
+    request.resolver_match = resolve(request.path)
+    return render_to_string('includes/navigation.html', {'user': user}, request=request)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ChatConsumerTest(TransactionTestCase):
+    def setUp(self):
+        self.application = URLRouter(websocket_urlpatterns)
+        self.room = Room.objects.get_or_create(name='general')[0]
+        self.user = User.objects.create_user(username='alice', password='password123', email='alice@example.com')
+        self.other = User.objects.create_user(username='bob', password='password123', email='bob@example.com')
+        # Кеш истории живет в памяти процесса - не переносим окно комнаты между тестами
+        async_to_sync(get_history_cache().clear)('general')
+        async_to_sync(get_event_log().clear)('general')
+        async_to_sync(get_rate_limiter().clear)()
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(self.application, '/ws/chat/general/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive_type(self, communicator, message_type):
+        """Пропускает кадры, пока не придет кадр нужного типа"""
+        while True:
+            response = await communicator.receive_json_from(timeout=5)
+            if response['type'] == message_type:
+                return response
+
+    async def test_fetch_messages_sends_history_then_unread_info(self):
+        """Тест: fetch_messages возвращает историю, а затем unread_info."""
+        await Message.objects.acreate(room=self.room, author=self.other, content='Привет')
+        communicator = await self.connect(self.user)
+
+        await communicator.send_json_to({'type': 'fetch_messages'})
+        history = await self.receive_type(communicator, 'messages_history')
+        self.assertEqual([m['content'] for m in history['messages']], ['Привет'])
+        unread_info = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(unread_info['type'], 'unread_info')
+
+        await communicator.disconnect()
+
+    async def test_new_message_is_broadcast_to_group(self):
+        """Тест: новое сообщение сохраняется и рассылается всем в комнате."""
+        sender = await self.connect(self.user)
+        listener = await self.connect(self.other)
+
+        await sender.send_json_to({'type': 'message', 'message': 'Всем привет, @bob'})
+        event = await self.receive_type(listener, 'new_message')
+        self.assertEqual(event['message']['content'], 'Всем привет, @bob')
+        # Событие общее для всех получателей: поля получателя клиент вычисляет по ID
+        self.assertEqual(event['message']['author_id'], self.user.id)
+        self.assertEqual(event['message']['mentioned_user_ids'], [self.other.id])
+        self.assertNotIn('is_own', event['message'])
+        self.assertTrue(await Message.objects.filter(content='Всем привет, @bob', author=self.user).aexists())
+
+        await sender.disconnect()
+        await listener.disconnect()
+
+    async def test_batch_forward_delete_and_pin(self):
+        """Тест: пакетные действия выполняются одним кадром и дают одну рассылку на комнату."""
+        await database_sync_to_async(User.objects.filter(pk=self.user.pk).update)(role='moderator')
+        self.user.role = 'moderator'
+        await Room.objects.acreate(name='growers')
+        await Room.objects.acreate(name='owners', access_roles=['owner'])
+        messages = [
+            await Message.objects.acreate(room=self.room, author=self.other, content=f'Пачка {i}')
+            for i in range(3)
+        ]
+        message_ids = [str(message.id) for message in messages]
+        communicator = await self.connect(self.user)
+
+        # Комната, недоступная по роли, отклоняет всю пачку
+        await communicator.send_json_to({
+            'type': 'forward_messages', 'message_ids': message_ids, 'target_rooms': ['growers', 'owners'],
+        })
+        error = await self.receive_type(communicator, 'error')
+        self.assertEqual(error['message'], 'Комната назначения недоступна')
+
+        await communicator.send_json_to({
+            'type': 'forward_messages', 'message_ids': message_ids, 'target_rooms': ['general', 'growers'],
+        })
+        event = await self.receive_type(communicator, 'messages_forwarded')
+        self.assertEqual([m['original_message_id'] for m in event['messages']], message_ids)
+        self.assertEqual(await Message.objects.filter(is_forwarded=True).acount(), 6)
+
+        await communicator.send_json_to({'type': 'pin_messages', 'message_ids': message_ids[:2]})
+        event = await self.receive_type(communicator, 'messages_pinned')
+        self.assertTrue(event['is_pinned'])
+        self.assertEqual([m['id'] for m in event['messages']], message_ids[:2])
+
+        await communicator.send_json_to({'type': 'delete_messages', 'message_ids': message_ids})
+        event = await self.receive_type(communicator, 'messages_deleted')
+        self.assertEqual(event['message_ids'], message_ids)
+        self.assertEqual(await Message.objects.filter(id__in=message_ids, is_deleted=True).acount(), 3)
+
+        await communicator.disconnect()
+
+    async def test_room_route_follows_registry(self):
+        """Тест: маршрут ws/chat/<room>/ пускает только в существующие комнаты, доступные по роли."""
+        await Room.objects.acreate(name='owners', access_roles=['owner'])
+        for path in ('/ws/chat/owners/', '/ws/chat/missing/'):
+            communicator = WebsocketCommunicator(self.application, path)
+            communicator.scope['user'] = self.user
+            connected, _ = await communicator.connect()
+            self.assertFalse(connected)
+
+        await database_sync_to_async(User.objects.filter(pk=self.user.pk).update)(role='owner')
+        self.user.role = 'owner'
+        communicator = WebsocketCommunicator(self.application, '/ws/chat/owners/')
+        communicator.scope['user'] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.disconnect()
+
+    async def test_reaction_on_own_message_is_rejected(self):
+        """Тест: реакция на собственное сообщение возвращает ошибку."""
+        message = await Message.objects.acreate(room=self.room, author=self.user, content='Мое сообщение')
+        communicator = await self.connect(self.user)
+
+        await communicator.send_json_to({'type': 'reaction', 'message_id': str(message.id), 'reaction': 'like'})
+        error = await self.receive_type(communicator, 'error')
+        self.assertEqual(error['message'], 'Нельзя ставить реакцию на собственное сообщение')
+
+        await communicator.disconnect()
+
+    async def test_reaction_and_pin_load_message_relations_in_one_query(self):
+        """Тест: реакция и закрепление ответа не догружают parent, автора и pinned_by отдельными запросами."""
+        parent = await Message.objects.acreate(room=self.room, author=self.user, content='Вопрос')
+        reply = await Message.objects.acreate(
+            room=self.room, author=self.other, content='Ответ', parent=parent,
+            is_pinned=True, pinned_by=self.other, pinned_at=timezone.now(),
+        )
+        self.user.role = 'moderator'
+        await self.user.asave()
+        communicator = await self.connect(self.user)
+
+        queries = CaptureQueriesContext(connection)
+        await database_sync_to_async(queries.__enter__)()
+        await communicator.send_json_to({'type': 'reaction', 'message_id': str(reply.id), 'reaction': 'like'})
+        await self.receive_type(communicator, 'reaction_updated')
+        await communicator.send_json_to({'type': 'pin_message', 'message_id': str(reply.id)})
+        await self.receive_type(communicator, 'message_pinned')
+        await database_sync_to_async(queries.__exit__)(None, None, None)
+        executed = await database_sync_to_async(lambda: [query['sql'] for query in queries.captured_queries])()
+
+        lazy = [sql for sql in executed if sql.startswith('SELECT') and 'JOIN' not in sql and '"users_user"."id" =' in sql]
+        self.assertEqual(lazy, [], executed)
+
+        await communicator.disconnect()
+
+    async def test_page_size_is_validated_and_clamped(self):
+        """Тест: нечисловой размер страницы - кадр error, нулевой и отрицательный - не меньше одного сообщения."""
+        messages = [await Message.objects.acreate(room=self.room, author=self.other, content=f'Сообщение {i}') for i in range(3)]
+        communicator = await self.connect(self.user)
+
+        await communicator.send_json_to({'type': 'load_more_messages', 'before_message_id': str(messages[2].id), 'limit': 'много'})
+        error = await self.receive_type(communicator, 'error')
+        self.assertEqual(error['message'], 'Некорректный размер страницы')
+
+        for limit in (0, -5):
+            await communicator.send_json_to({'type': 'load_more_messages', 'before_message_id': str(messages[2].id), 'limit': limit})
+            page = await self.receive_type(communicator, 'more_messages')
+            self.assertEqual([m['content'] for m in page['messages']], ['Сообщение 1'])
+            self.assertTrue(page['has_more'])
+
+        await communicator.send_json_to({'type': 'load_message_context', 'message_id': str(messages[1].id), 'context_size': None})
+        error = await self.receive_type(communicator, 'error')
+        self.assertEqual(error['message'], 'Некорректный размер контекста')
+
+        await communicator.disconnect()
+
+    async def test_vip_link_and_connection_follow_room_roles(self):
+        """Тест: ссылка на VIP в навигации показывается ровно тем ролям, которых пускает консьюмер."""
+        await database_sync_to_async(seed_default_rooms)()
+        for role in ('owner', 'moderator', 'store_owner', 'store_admin', 'user'):
+            user = await database_sync_to_async(User.objects.create_user)(
+                username=f'vip_{role}', password='password123', email=f'vip_{role}@example.com', role=role,
+            )
+            shown = 'channel-option-vip' in await database_sync_to_async(render_navigation)(user, 'vip')
+
+            communicator = WebsocketCommunicator(self.application, '/ws/chat/vip/')
+            communicator.scope['user'] = user
+            connected, _ = await communicator.connect()
+            self.assertEqual(shown, connected, role)
+            self.assertEqual(connected, role != 'user', role)
+            await communicator.disconnect()
+
+    async def test_history_is_served_from_cache_and_kept_current(self):
+        """Тест: правки и реакции обновляют кеш истории, поля получателя у каждого свои."""
+        message = await Message.objects.acreate(room=self.room, author=self.other, content='Привет, @alice')
+        first = await self.connect(self.user)
+        await first.send_json_to({'type': 'fetch_messages'})
+        await self.receive_type(first, 'messages_history')
+
+        await first.send_json_to({'type': 'reaction', 'message_id': str(message.id), 'reaction': 'like'})
+        await self.receive_type(first, 'reaction_updated')
+
+        second = await self.connect(self.other)
+        await second.send_json_to({'type': 'edit_message', 'message_id': str(message.id), 'new_content': 'Правка @alice'})
+        await self.receive_type(second, 'message_edited')
+
+        await first.send_json_to({'type': 'fetch_messages'})
+        history = await self.receive_type(first, 'messages_history')
+        [data] = history['messages']
+        self.assertEqual(data['content'], 'Правка @alice')
+        self.assertEqual((data['likes_count'], data['user_reaction']), (1, 'like'))
+        self.assertEqual((data['is_own'], data['mentions_me']), (False, True))
+
+        # Поля получателя накладываются для каждого пользователя отдельно
+        await second.send_json_to({'type': 'fetch_messages'})
+        history = await self.receive_type(second, 'messages_history')
+        [data] = history['messages']
+        self.assertEqual((data['is_own'], data['mentions_me'], data['user_reaction']), (True, False, None))
+
+        await first.disconnect()
+        await second.disconnect()
+
+    async def test_scroll_positions_are_written_on_disconnect(self):
+        """Тест: серия save_position записывается в БД одной последней позицией при отключении."""
+        message = await Message.objects.acreate(room=self.room, author=self.other, content='Привет')
+        communicator = await self.connect(self.user)
+
+        for percent in (10.0, 20.0, 30.0):
+            await communicator.send_json_to({
+                'type': 'save_position', 'last_visible_message_id': str(message.id), 'scroll_position_percent': percent
+            })
+        await communicator.disconnect()
+
+        position = await UserChatPosition.objects.aget(user=self.user, room=self.room)
+        self.assertEqual((position.last_visible_message_id, position.scroll_position_percent), (message.id, 30.0))
+
+    async def test_reconnect_replays_only_missed_events(self):
+        """Тест: при переподключении с resume_from приходят только пропущенные события."""
+        sender = await self.connect(self.user)
+        listener = await self.connect(self.other)
+        await listener.send_json_to({'type': 'fetch_messages'})
+        history = await self.receive_type(listener, 'messages_history')
+        await listener.disconnect()
+
+        for text in ('Первое', 'Второе'):
+            await sender.send_json_to({'type': 'message', 'message': text})
+            await self.receive_type(sender, 'new_message')
+
+        listener = await self.connect(self.other)
+        await listener.send_json_to({'type': 'fetch_messages', 'resume_from': history['last_seq']})
+        replay = await self.receive_type(listener, 'replay')
+        self.assertEqual([event['message']['content'] for event in replay['events']], ['Первое', 'Второе'])
+        self.assertEqual([event['seq'] for event in replay['events']], [history['last_seq'] + 1, history['last_seq'] + 2])
+        await self.receive_type(listener, 'unread_info')
+
+        await sender.disconnect()
+        await listener.disconnect()
+
+    @override_settings(CHAT_HISTORY_CACHE_SIZE=2)
+    async def test_connect_and_bootstrap_fit_query_budget(self):
+        """Тест: подключение и начальная загрузка укладываются в CONNECT_QUERY_BUDGET запросов."""
+        messages = [
+            await Message.objects.acreate(room=self.room, author=self.other, content=f'Сообщение {i}')
+            for i in range(5)
+        ]
+        messages[0].is_pinned, messages[0].pinned_by, messages[0].pinned_at = True, self.other, timezone.now()
+        await messages[0].asave()
+        # Худший случай: сохраненная позиция вне окна кеша - история загружается из БД вокруг якоря
+        await UserChatPosition.objects.acreate(
+            user=self.user, room=self.room, last_read_at=timezone.now(), last_visit_at=timezone.now(),
+            last_visible_message_id=messages[1].id
+        )
+
+        # Запросы из database_sync_to_async выполняются в основном потоке - там и перехватываем
+        queries = CaptureQueriesContext(connection)
+        await database_sync_to_async(queries.__enter__)()
+        communicator = await self.connect(self.user)
+        await communicator.send_json_to({'type': 'fetch_messages'})
+        history = await self.receive_type(communicator, 'messages_history')
+        await self.receive_type(communicator, 'unread_info')
+        await self.receive_type(communicator, 'online_users')
+        await database_sync_to_async(queries.__exit__)(None, None, None)
+        executed = await database_sync_to_async(lambda: [query['sql'] for query in queries.captured_queries])()
+
+        self.assertLessEqual(len(executed), CONNECT_QUERY_BUDGET, executed)
+        self.assertEqual(len(history['messages']), 5)
+        self.assertNotIn('pinned_messages', history)
+
+        await communicator.disconnect()
+
+    async def test_search_messages_returns_highlighted_results(self):
+        """Тест: search_messages возвращает найденные сообщения с подсветкой и полями получателя."""
+        message = await Message.objects.acreate(room=self.room, author=self.other, content='Поливаем рассаду томатов')
+        await Message.objects.acreate(room=self.room, author=self.other, content='Совсем другое сообщение')
+        communicator = await self.connect(self.user)
+
+        await communicator.send_json_to({'type': 'search_messages', 'query': 'томатов'})
+        results = await self.receive_type(communicator, 'search_results')
+        [result] = results['results']
+        self.assertEqual(result['id'], str(message.id))
+        self.assertIn('<mark>томатов</mark>', result['highlight'])
+        self.assertFalse(result['is_own'])
+        self.assertFalse(results['has_more'])
+
+        await communicator.disconnect()
+
+    async def test_search_limit_is_validated_and_clamped(self):
+        """Тест: нулевой и отрицательный limit поиска дают один результат, нечисловой - отдельную ошибку."""
+        for i in range(3):
+            await Message.objects.acreate(room=self.room, author=self.other, content=f'Томаты, заметка {i}')
+        communicator = await self.connect(self.user)
+
+        for limit in (0, -5):
+            await communicator.send_json_to({'type': 'search_messages', 'query': 'томаты', 'limit': limit})
+            results = await self.receive_type(communicator, 'search_results')
+            self.assertEqual(len(results['results']), 1)
+            self.assertTrue(results['has_more'])
+            self.assertIsNotNone(results['next_cursor'])
+
+            await communicator.send_json_to({
+                'type': 'search_messages', 'query': 'томаты', 'limit': limit, 'cursor': results['next_cursor'],
+            })
+            following = await self.receive_type(communicator, 'search_results')
+            self.assertNotEqual(following['results'][0]['id'], results['results'][0]['id'])
+
+        await communicator.send_json_to({'type': 'search_messages', 'query': 'томаты', 'limit': 'все'})
+        error = await self.receive_type(communicator, 'error')
+        self.assertEqual(error['message'], 'Некорректное число результатов поиска')
+
+        await communicator.disconnect()
+
+    @override_settings(CHAT_RATE_LIMITS={'message': (2, 0.01), 'default': (30, 5.0)})
+    async def test_messages_over_budget_are_rejected(self):
+        """Тест: кадры сверх бюджета отбрасываются без записи в БД, клиент получает rate_limited."""
+        communicator = await self.connect(self.user)
+
+        for text in ('Первое', 'Второе', 'Третье', 'Четвертое'):
+            await communicator.send_json_to({'type': 'message', 'message': text})
+        # Рассылка новых сообщений и ответ об ограничении могут прийти в любом порядке
+        frames = []
+        while not await communicator.receive_nothing(timeout=0.3):
+            frames.append(await communicator.receive_json_from())
+
+        self.assertEqual([f['message']['content'] for f in frames if f['type'] == 'new_message'], ['Первое', 'Второе'])
+        # Ответ об ограничении приходит один раз, а не на каждый отброшенный кадр
+        [error] = [f for f in frames if f['type'] == 'error']
+        self.assertEqual((error['code'], error['action']), ('rate_limited', 'message'))
+        self.assertGreater(error['retry_after'], 0)
+
+        self.assertEqual(await Message.objects.filter(author=self.user).acount(), 2)
+        await communicator.disconnect()
+
+    async def test_msgpack_protocol_is_negotiated_by_subprotocol(self):
+        """Тест: клиент MessagePack получает историю и рассылки двоичными кадрами."""
+        await Message.objects.acreate(room=self.room, author=self.other, content='Привет')
+        codec = CODECS['msgpack-zlib']
+        communicator = WebsocketCommunicator(self.application, '/ws/chat/general/', subprotocols=['besedka.msgpack-zlib'])
+        communicator.scope['user'] = self.user
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, 'besedka.msgpack-zlib')
+
+        async def receive_type(message_type):
+            while True:
+                frame = codec.decode(await communicator.receive_from(timeout=5))
+                if frame['type'] == message_type:
+                    return frame
+
+        await communicator.send_to(bytes_data=codec.encode({'type': 'fetch_messages'}))
+        history = await receive_type('messages_history')
+        self.assertEqual([m['content'] for m in history['messages']], ['Привет'])
+
+        await communicator.send_to(bytes_data=codec.encode({'type': 'message', 'message': 'Ответ'}))
+        new_message = await receive_type('new_message')
+        self.assertEqual(new_message['message']['content'], 'Ответ')
+
+        await communicator.disconnect()
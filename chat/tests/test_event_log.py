@@ -0,0 +1,37 @@
+import json
+
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, override_settings
+
+from chat.event_log import InMemoryEventLog
+
+
+@override_settings(CHAT_EVENT_LOG_SIZE=3)
+class InMemoryEventLogTest(SimpleTestCase):
+    def setUp(self):
+        self.log = InMemoryEventLog()
+
+    def append(self, count):
+        return [
+            json.loads(async_to_sync(self.log.append)('general', {'type': 'new_message', 'n': i}))
+            for i in range(count)
+        ]
+
+    def test_events_are_numbered_per_room(self):
+        """Тест: события комнаты получают возрастающий seq, закодированный в JSON события."""
+        events = self.append(2)
+        self.assertEqual([(event['seq'], event['n']) for event in events], [(1, 0), (2, 1)])
+        self.assertEqual(async_to_sync(self.log.last_seq)('general'), 2)
+        self.assertEqual(async_to_sync(self.log.last_seq)('vip'), 0)
+
+    def test_since_returns_missed_events_or_none_for_gap(self):
+        """Тест: журнал отдает пропущенные события, а при пропуске больше журнала - None."""
+        self.append(5)
+        since = async_to_sync(self.log.since)
+
+        self.assertEqual([json.loads(text)['seq'] for text in since('general', 3)], [4, 5])
+        self.assertEqual(since('general', 5), [])
+        # События 2 уже нет в журнале из 3 последних событий
+        self.assertIsNone(since('general', 1))
+        # Номер из будущего (например, после сброса журнала) - только полная история
+        self.assertIsNone(since('general', 10))
@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+
+from chat.history_cache import InMemoryHistoryCache, page_from_window
+
+
+def make_entry(index, base=timezone.now()):
+    return {'id': f'00000000-0000-0000-0000-{index:012d}', 'cursor': str(index),
+            'created': (base + timedelta(seconds=index)).isoformat(), 'content': f'Сообщение {index}'}
+
+
+@override_settings(CHAT_HISTORY_CACHE_SIZE=5, CHAT_HISTORY_CACHE_TTL=60)
+class InMemoryHistoryCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.cache = InMemoryHistoryCache()
+
+    def contents(self):
+        window = async_to_sync(self.cache.get)('general')
+        return [entry['content'] for entry in window['entries']], window['has_more_before']
+
+    def test_cold_cache_ignores_updates(self):
+        """Тест: пока окно не наполнено, новые сообщения не создают неполный кеш."""
+        async_to_sync(self.cache.append)('general', make_entry(1))
+        self.assertIsNone(async_to_sync(self.cache.get)('general'))
+
+    def test_window_is_trimmed_and_kept_current(self):
+        """Тест: окно хранит последние N сообщений в порядке времени и обновляется по событиям."""
+        async_to_sync(self.cache.fill)('general', [make_entry(i) for i in range(3)], False)
+        for i in (4, 3, 5):
+            async_to_sync(self.cache.append)('general', make_entry(i))
+        self.assertEqual(self.contents(), ([f'Сообщение {i}' for i in range(1, 6)], True))
+
+        async_to_sync(self.cache.replace)('general', {**make_entry(2), 'content': 'Правка'})
+        async_to_sync(self.cache.replace)('general', {**make_entry(0), 'content': 'Вне окна'})
+        async_to_sync(self.cache.remove)('general', make_entry(4)['id'])
+        self.assertEqual(self.contents(), (['Сообщение 1', 'Правка', 'Сообщение 3', 'Сообщение 5'], True))
+
+    def test_fill_keeps_newer_entries(self):
+        """Тест: наполнение из БД не затирает записи, обновленные консьюмером."""
+        async_to_sync(self.cache.fill)('general', [make_entry(1)], False)
+        async_to_sync(self.cache.replace)('general', {**make_entry(1), 'content': 'Правка'})
+        async_to_sync(self.cache.fill)('general', [make_entry(1), make_entry(2)], False)
+        self.assertEqual(self.contents(), (['Правка', 'Сообщение 2'], False))
+
+
+class PageFromWindowTest(SimpleTestCase):
+    def setUp(self):
+        self.entries = [make_entry(i) for i in range(10)]
+
+    def test_latest_and_around_anchor(self):
+        """Тест: страница без якоря - последние сообщения, с якорем - сообщения вокруг него."""
+        page = page_from_window({'entries': self.entries, 'has_more_before': True}, latest=4)
+        self.assertEqual(page['messages'], self.entries[6:])
+        self.assertTrue(page['has_more_before'])
+        self.assertFalse(page['has_more_after'])
+
+        page = page_from_window({'entries': self.entries, 'has_more_before': True}, self.entries[5]['id'], around=2)
+        self.assertEqual(page['messages'], self.entries[3:8])
+        self.assertTrue(page['has_more_after'])
+
+    def test_falls_back_when_window_is_not_enough(self):
+        """Тест: якорь вне окна или у края неполного окна - история грузится из БД."""
+        window = {'entries': self.entries, 'has_more_before': True}
+        self.assertIsNone(page_from_window(window, '00000000-0000-0000-0000-999999999999'))
+        self.assertIsNone(page_from_window(window, self.entries[1]['id'], around=2))
+
+        window['has_more_before'] = False
+        page = page_from_window(window, self.entries[1]['id'], around=2)
+        self.assertEqual(page['messages'], self.entries[:4])
+        self.assertFalse(page['has_more_before'])
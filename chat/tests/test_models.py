@@ -0,0 +1,217 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError
+from django.test import TestCase
+from django.utils import timezone
+
+from chat.models import Room, Message, MessageMention, MessageReaction, UserChatPosition
+
+User = get_user_model()
+
+
+class PersonalNotificationsTest(TestCase):
+    def setUp(self):
+        self.room = Room.objects.get_or_create(name='general')[0]
+        self.user = User.objects.create_user(username='alice', password='password123', email='alice@example.com')
+        self.other = User.objects.create_user(username='bob', password='password123', email='bob@example.com')
+        self.position = UserChatPosition.get_or_create_for_user(self.user, self.room)
+        self.position.last_visit_at = timezone.now() - timedelta(hours=1)
+        self.position.save()
+
+    def create_message(self, author, content, parent=None):
+        message = Message.objects.create(room=self.room, author=author, content=content, parent=parent)
+        MessageMention.index_message(message)
+        return message
+
+    def test_mentions_and_replies_are_indexed(self):
+        """Тест: упоминание и ответ попадают в индекс MessageMention."""
+        own = self.create_message(self.user, 'Мое сообщение')
+        reply = self.create_message(self.other, 'Ответ тебе, @Alice', parent=own)
+
+        kinds = set(MessageMention.objects.filter(message=reply).values_list('kind', 'mentioned_user'))
+        self.assertEqual(kinds, {
+            (MessageMention.KIND_MENTION, self.user.id),
+            (MessageMention.KIND_REPLY, self.user.id),
+        })
+
+    def test_personal_notifications_use_single_query(self):
+        """Тест: подсчет и поиск первого персонального уведомления - по одному запросу."""
+        first = self.create_message(self.other, '@alice посмотри')
+        for i in range(20):
+            self.create_message(self.other, f'Просто сообщение {i}')
+        self.create_message(self.other, 'Еще раз @alice')
+        self.create_message(self.user, 'Сам себя упоминаю @alice')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.position.get_personal_notifications_count(), 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.position.get_first_personal_notification(), first)
+
+    def test_edit_reindexes_mentions(self):
+        """Тест: после редактирования упоминание исчезает из индекса."""
+        message = self.create_message(self.other, '@alice привет')
+        message.content = 'привет всем'
+        message.save()
+        MessageMention.index_message(message)
+
+        self.assertEqual(self.position.get_personal_notifications_count(), 0)
+
+
+class UnreadCountersTest(TestCase):
+    def setUp(self):
+        self.room = Room.objects.get_or_create(name='general')[0]
+        self.user = User.objects.create_user(username='alice', password='password123', email='alice@example.com')
+        self.other = User.objects.create_user(username='bob', password='password123', email='bob@example.com')
+        self.position = UserChatPosition.get_or_create_for_user(self.user, self.room)
+        self.position.last_read_at = self.position.last_visit_at = timezone.now() - timedelta(hours=1)
+        self.position.save()
+
+    def create_message(self, content):
+        message = Message.objects.create(room=self.room, author=self.other, content=content)
+        MessageMention.index_message(message)
+        UserChatPosition.register_new_message(message)
+        return message
+
+    def test_counters_follow_create_delete_and_read(self):
+        """Тест: счетчики меняются инкрементально при создании, удалении и прочтении."""
+        messages = [self.create_message(f'Сообщение {i}') for i in range(3)]
+        self.create_message('@alice, глянь')
+        self.position.refresh_from_db()
+        self.assertEqual((self.position.unread_count, self.position.personal_notifications_count), (4, 1))
+
+        messages[2].is_deleted = True
+        messages[2].save()
+        UserChatPosition.register_deleted_message(messages[2])
+        self.position.refresh_from_db()
+        self.assertEqual(self.position.unread_count, 3)
+
+        self.position.mark_as_read(up_to_message=messages[1])
+        self.assertEqual(self.position.unread_count, 1)
+        self.assertEqual(self.position.unread_count, self.position.get_unread_messages_count())
+
+    def test_batch_registration_matches_reconcile(self):
+        """Тест: пакетные register_new_messages/register_deleted_messages дают те же счетчики, что и пересчет."""
+        messages = [Message(room=self.room, author=self.other, content=content)
+                    for content in ('Раз', '@alice два', '@alice @alice три')]
+        for message in messages:
+            message.fill_derived_content()
+        Message.objects.bulk_create(messages)
+        MessageMention.index_new_messages(messages)
+        UserChatPosition.register_new_messages(messages)
+        self.position.refresh_from_db()
+        self.assertEqual((self.position.unread_count, self.position.personal_notifications_count), (3, 2))
+
+        Message.objects.filter(id__in=[m.id for m in messages[1:]]).update(is_deleted=True)
+        UserChatPosition.register_deleted_messages(messages[1:])
+        self.position.refresh_from_db()
+        self.assertEqual((self.position.unread_count, self.position.personal_notifications_count), (1, 0))
+        self.assertEqual(UserChatPosition.reconcile_counters(), 0)
+
+    def test_reconcile_fixes_drift(self):
+        """Тест: сверка исправляет счетчики сообщений, созданных в обход консьюмера."""
+        Message.objects.create(room=self.room, author=self.other, content='Без счетчиков')
+
+        self.assertEqual(UserChatPosition.reconcile_counters(), 1)
+        self.position.refresh_from_db()
+        self.assertEqual(self.position.unread_count, 1)
+
+    def test_edit_shifts_personal_counters(self):
+        """Тест: правка, добавившая или убравшая упоминание, сдвигает только персональный счетчик этого пользователя."""
+        third = User.objects.create_user(username='carol', password='password123', email='carol@example.com')
+        carol = UserChatPosition.get_or_create_for_user(third, self.room)
+        carol.last_read_at = carol.last_visit_at = timezone.now() - timedelta(hours=1)
+        carol.save()
+        message = self.create_message('Без упоминаний')
+
+        def edit(content):
+            previous_user_ids = list(message.mentions.values_list('mentioned_user_id', flat=True))
+            message.content = content
+            message.save()
+            MessageMention.index_message(message)
+            UserChatPosition.register_edited_message(message, previous_user_ids)
+            self.position.refresh_from_db()
+            carol.refresh_from_db()
+            return self.position.personal_notifications_count, carol.personal_notifications_count
+
+        self.assertEqual(edit('@alice, глянь'), (1, 0))
+        self.assertEqual(edit('@alice и @carol, глянь'), (1, 1))
+        self.assertEqual(edit('@carol, глянь'), (0, 1))
+        self.assertEqual(UserChatPosition.reconcile_counters(), 0)
+
+    def test_reconcile_is_a_single_update(self):
+        """Тест: сверка всех позиций - один UPDATE, без чтения позиций и затирания счетчиков."""
+        mention = Message.objects.create(room=self.room, author=self.other, content='@alice без счетчиков')
+        MessageMention.index_message(mention)
+        newcomer = UserChatPosition.get_or_create_for_user(self.other, self.room)
+        UserChatPosition.objects.filter(pk=newcomer.pk).update(unread_count=5)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(UserChatPosition.reconcile_counters(), 2)
+        self.position.refresh_from_db()
+        newcomer.refresh_from_db()
+        self.assertEqual((self.position.unread_count, self.position.personal_notifications_count), (1, 1))
+        self.assertEqual((newcomer.unread_count, newcomer.personal_notifications_count), (0, 0))
+        self.assertEqual(UserChatPosition.reconcile_counters(), 0)
+
+
+class ReactionCountersTest(TestCase):
+    def setUp(self):
+        self.room = Room.objects.get_or_create(name='general')[0]
+        self.author = User.objects.create_user(username='alice', password='password123', email='alice@example.com')
+        self.users = [
+            User.objects.create_user(username=f'user{i}', password='password123', email=f'user{i}@example.com')
+            for i in range(3)
+        ]
+        self.message = Message.objects.create(room=self.room, author=self.author, content='Урожай')
+
+    def test_add_updates_counters_atomically(self):
+        """Тест: реакция увеличивает счетчик сообщения, повторная - откатывается целиком."""
+        MessageReaction.add(self.message, self.users[0], 'like')
+        MessageReaction.add(self.message, self.users[1], 'like')
+        MessageReaction.add(self.message, self.users[2], 'dislike')
+        self.assertEqual((self.message.likes_count, self.message.dislikes_count), (2, 1))
+
+        with self.assertRaises(IntegrityError):
+            MessageReaction.add(self.message, self.users[0], 'dislike')
+        self.message.refresh_from_db()
+        self.assertEqual((self.message.likes_count, self.message.dislikes_count), (2, 1))
+
+    def test_rebuild_fixes_drift(self):
+        """Тест: пересчет исправляет счетчики реакций, созданных и удаленных в обход add."""
+        MessageReaction.objects.create(message=self.message, user=self.users[0], reaction_type='like')
+        MessageReaction.add(self.message, self.users[1], 'dislike')
+        MessageReaction.objects.filter(user=self.users[1]).delete()
+        untouched = Message.objects.create(room=self.room, author=self.author, content='Без реакций')
+
+        self.assertEqual(Message.rebuild_reaction_counters(), 1)
+        self.assertEqual(Message.rebuild_reaction_counters(), 0)
+        self.message.refresh_from_db()
+        untouched.refresh_from_db()
+        self.assertEqual((self.message.likes_count, self.message.dislikes_count), (1, 0))
+        self.assertEqual((untouched.likes_count, untouched.dislikes_count), (0, 0))
+
+
+class DerivedContentTest(TestCase):
+    def setUp(self):
+        self.room = Room.objects.get_or_create(name='general')[0]
+        self.user = User.objects.create_user(username='alice', password='password123', email='alice@example.com')
+        self.other = User.objects.create_user(username='bob', password='password123', email='bob@example.com')
+
+    def test_fields_follow_content(self):
+        """Тест: фрагмент, текст упоминаний и основной текст пересланного пересчитываются при сохранении."""
+        message = Message.objects.create(room=self.room, author=self.other, content='x' * 150)
+        self.assertEqual(message.content_snippet, 'x' * 100 + '...')
+        self.assertEqual((message.mention_text, message.clean_content), ('', ''))
+
+        message.content = 'Привет, @Alice'
+        message.save(update_fields=['content'])
+        message.refresh_from_db()
+        self.assertEqual((message.content_snippet, message.mention_text), ('Привет, @Alice', 'привет, @alice'))
+        self.assertTrue(message.mentions_user(self.user))
+
+        forwarded = Message.objects.create(
+            room=self.room, author=self.user, is_forwarded=True,
+            content='Мой комментарий\n📤 Переслано из general\n👤 bob\nИсходный текст',
+        )
+        self.assertEqual(forwarded.clean_content, 'Мой комментарий')
@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+
+from chat.models import Room, Message
+from chat.pagination import DIRECTION_AFTER, DIRECTION_AROUND, DIRECTION_BEFORE, decode_cursor, encode_cursor, fetch_page
+
+User = get_user_model()
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.room = Room.objects.get_or_create(name='general')[0]
+        self.user = User.objects.create_user(username='alice', password='password123', email='alice@example.com')
+
+    def create_messages(self, count, created_at=None):
+        """Создает сообщения позже уже существующих; при переданном created_at у всех одинаковое время"""
+        base = timezone.now() + timedelta(seconds=self.queryset().count())
+        return Message.objects.bulk_create([
+            Message(
+                room=self.room, author=self.user, content=f'Сообщение {i}',
+                created_at=created_at or base + timedelta(seconds=i)
+            )
+            for i in range(count)
+        ])
+
+    def queryset(self):
+        return Message.objects.filter(room=self.room, is_deleted=False)
+
+    def walk_back(self, limit):
+        """Листает историю от конца к началу и возвращает все ID в хронологическом порядке"""
+        page = fetch_page(self.queryset(), None, DIRECTION_BEFORE, limit)
+        ids = [message.id for message in page['messages']]
+        while page['has_more_before']:
+            page = fetch_page(self.queryset(), page['before_cursor'], DIRECTION_BEFORE, limit)
+            ids = [message.id for message in page['messages']] + ids
+        return ids
+
+    def test_identical_timestamps_are_not_lost_or_duplicated(self):
+        """Тест: сообщения с одинаковым created_at проходят страницы ровно по одному разу."""
+        self.create_messages(25, created_at=timezone.now())
+
+        ids = self.walk_back(limit=7)
+
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(set(ids), set(self.queryset().values_list('id', flat=True)))
+
+    def test_pages_are_stable_under_concurrent_inserts(self):
+        """Тест: новые сообщения не сдвигают страницы, загружаемые по курсору."""
+        self.create_messages(20)
+        first_page = fetch_page(self.queryset(), None, DIRECTION_BEFORE, 10)
+
+        # Пока пользователь читает, в комнату приходят новые сообщения
+        self.create_messages(5)
+
+        second_page = fetch_page(self.queryset(), first_page['before_cursor'], DIRECTION_BEFORE, 10)
+        older_ids = list(self.queryset().order_by('created_at', 'id').values_list('id', flat=True)[:10])
+        self.assertEqual([message.id for message in second_page['messages']], older_ids)
+        self.assertFalse(second_page['has_more_before'])
+
+        newer_page = fetch_page(self.queryset(), first_page['after_cursor'], DIRECTION_AFTER, 10)
+        self.assertEqual(len(newer_page['messages']), 5)
+        self.assertFalse(newer_page['has_more_after'])
+
+    def test_around_includes_anchor(self):
+        """Тест: around возвращает limit сообщений до якоря, сам якорь и limit после."""
+        messages = self.create_messages(30)
+        anchor = messages[15]
+
+        page = fetch_page(self.queryset(), encode_cursor(anchor), DIRECTION_AROUND, 5)
+
+        self.assertEqual([message.id for message in page['messages']], [message.id for message in messages[10:21]])
+        self.assertTrue(page['has_more_before'])
+        self.assertTrue(page['has_more_after'])
+
+    def test_invalid_cursor(self):
+        """Тест: поврежденный курсор и неизвестное направление дают ValueError."""
+        with self.assertRaises(ValueError):
+            decode_cursor('not-a-cursor')
+        with self.assertRaises(ValueError):
+            fetch_page(self.queryset(), None, 'sideways')
@@ -0,0 +1,49 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from chat.presence import InMemoryPresenceBackend, get_room_access_count
+
+User = get_user_model()
+
+
+class InMemoryPresenceBackendTest(SimpleTestCase):
+    def setUp(self):
+        self.presence = InMemoryPresenceBackend()
+        self.profile = {'username': 'alice', 'display_name': 'alice', 'role': 'user', 'role_icon': '👤'}
+
+    async def test_user_is_online_while_any_connection_is_alive(self):
+        """Тест: пользователь с двумя вкладками уходит из сети только после закрытия обеих."""
+        self.assertTrue(await self.presence.connect('general', 1, 'channel-a', self.profile))
+        self.assertFalse(await self.presence.connect('general', 1, 'channel-b', self.profile))
+        self.assertEqual(await self.presence.count('general'), 1)
+
+        self.assertFalse(await self.presence.disconnect('general', 1, 'channel-a'))
+        self.assertEqual(await self.presence.online_users('general'), [self.profile])
+        self.assertTrue(await self.presence.disconnect('general', 1, 'channel-b'))
+        self.assertEqual(await self.presence.count('general'), 0)
+
+    @override_settings(CHAT_PRESENCE_TTL=0)
+    async def test_expire_removes_connections_without_heartbeat(self):
+        """Тест: подключения без heartbeat удаляются, ушедшие пользователи возвращаются для рассылки."""
+        await self.presence.connect('general', 1, 'channel-a', self.profile)
+
+        self.assertEqual(await self.presence.expire('general'), [self.profile])
+        self.assertEqual(await self.presence.count('general'), 0)
+        self.assertTrue(await self.presence.heartbeat('general', 1, 'channel-a', self.profile))
+
+
+class RoomAccessCountTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='bob', password='password123', email='bob@example.com')
+
+    def test_count_is_cached_until_role_changes(self):
+        """Тест: количество с доступом кешируется и сбрасывается при смене роли."""
+        self.assertEqual(get_room_access_count('vip'), 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_room_access_count('vip'), 0)
+
+        self.user.role = User.Role.STORE_ADMIN
+        self.user.save()
+        self.assertEqual(get_room_access_count('vip'), 1)
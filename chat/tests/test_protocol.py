@@ -0,0 +1,52 @@
+from django.test import SimpleTestCase
+
+from chat.protocol import CODECS, DEFAULT_CODEC, FLAG_PLAIN, FLAG_ZLIB, negotiate
+
+
+def history_frame(size):
+    return {
+        'type': 'messages_history',
+        'messages': [
+            {'id': f'id-{i}', 'content': f'Сообщение {i}', 'likes_count': i, 'reply_to': None, 'custom_field': True}
+            for i in range(size)
+        ],
+        'has_more_before': True,
+    }
+
+
+class ProtocolTest(SimpleTestCase):
+    def test_msgpack_roundtrip_restores_field_names(self):
+        """Тест: кадр MessagePack раскодируется в тот же словарь, неизвестные ключи сохраняются."""
+        frame = history_frame(3)
+        for name in ('msgpack', 'msgpack-zlib'):
+            codec = CODECS[name]
+            encoded = codec.encode(frame)
+            self.assertIsInstance(encoded, bytes)
+            self.assertEqual(codec.decode(encoded), frame)
+
+        # Клиент двоичного протокола может прислать обычный JSON
+        self.assertEqual(CODECS['msgpack'].decode('{"type": "typing"}'), {'type': 'typing'})
+        with self.assertRaises(ValueError):
+            CODECS['msgpack'].decode(b'\x07garbage')
+
+    def test_only_large_history_frames_are_compressed(self):
+        """Тест: сжимаются только пакеты истории от порога, и они меньше JSON."""
+        codec = CODECS['msgpack-zlib']
+        self.assertEqual(codec.encode(history_frame(1))[:1], FLAG_PLAIN)
+        self.assertEqual(codec.encode({'type': 'typing', 'user': 'x' * 2000})[:1], FLAG_PLAIN)
+
+        large = history_frame(100)
+        encoded = codec.encode(large)
+        self.assertEqual(encoded[:1], FLAG_ZLIB)
+        self.assertLess(len(encoded), len(CODECS['msgpack'].encode(large)))
+        self.assertLess(len(CODECS['msgpack'].encode(large)), len(DEFAULT_CODEC.encode(large).encode()))
+
+    def test_negotiation(self):
+        """Тест: подпротокол websocket важнее параметра адреса, по умолчанию - JSON."""
+        self.assertEqual(negotiate({}), (DEFAULT_CODEC, None))
+        self.assertEqual(
+            negotiate({'subprotocols': ['unknown', 'besedka.msgpack'], 'query_string': b'protocol=json'}),
+            (CODECS['msgpack'], 'besedka.msgpack')
+        )
+        self.assertEqual(negotiate({'query_string': b'protocol=msgpack-zlib'}), (CODECS['msgpack-zlib'], None))
+        self.assertEqual(negotiate({'query_string': b'protocol=xml'}), (DEFAULT_CODEC, None))
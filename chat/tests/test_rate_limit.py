@@ -0,0 +1,59 @@
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, override_settings
+
+from chat.rate_limit import IN_MEMORY_PRUNE_SIZE, InMemoryRateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@override_settings(CHAT_RATE_LIMITS={'message': (3, 1.0), 'default': (2, 0.5)})
+class InMemoryRateLimiterTest(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = InMemoryRateLimiter(clock=self.clock)
+
+    def allow(self, user_id, action):
+        return async_to_sync(self.limiter.allow)(user_id, action)
+
+    def test_burst_up_to_capacity_then_throttled(self):
+        """Тест: корзина пропускает всплеск до емкости, затем отказывает с задержкой до токена."""
+        self.assertEqual([self.allow(1, 'message')[0] for _ in range(3)], [True, True, True])
+        allowed, retry_after = self.allow(1, 'message')
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 1.0)
+
+    def test_tokens_refill_over_time(self):
+        """Тест: токены пополняются со скоростью бюджета, но не выше емкости."""
+        for _ in range(3):
+            self.allow(1, 'message')
+        self.clock.now += 1.5
+        self.assertTrue(self.allow(1, 'message')[0])
+        self.assertFalse(self.allow(1, 'message')[0])
+
+        self.clock.now += 100
+        self.assertEqual([self.allow(1, 'message')[0] for _ in range(4)], [True, True, True, False])
+
+    def test_buckets_are_per_user_and_action(self):
+        """Тест: бюджеты разных пользователей и типов кадров независимы, неизвестные типы делят default."""
+        for _ in range(3):
+            self.allow(1, 'message')
+        self.assertFalse(self.allow(1, 'message')[0])
+        self.assertTrue(self.allow(2, 'message')[0])
+
+        self.assertTrue(self.allow(1, 'unknown_a')[0])
+        self.assertTrue(self.allow(1, 'unknown_b')[0])
+        self.assertFalse(self.allow(1, 'unknown_c')[0])
+
+    def test_full_buckets_are_pruned(self):
+        """Тест: полностью пополненные корзины не копятся в памяти."""
+        for user_id in range(IN_MEMORY_PRUNE_SIZE):
+            self.allow(user_id, 'message')
+        self.clock.now += 10
+        self.allow('last', 'message')
+        self.assertEqual(len(self.limiter.buckets), 1)
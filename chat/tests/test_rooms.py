@@ -0,0 +1,25 @@
+from django.test import TestCase
+
+from chat.models import Room
+from chat.rooms import get_room, invalidate_rooms
+
+
+class RoomRegistryTest(TestCase):
+    def setUp(self):
+        invalidate_rooms()
+
+    def test_rooms_are_cached_until_changed(self):
+        """Тест: реестр отдает комнату без запросов к БД и сбрасывается при ее изменении."""
+        room = Room.objects.create(name='growlog-42', max_message_length=500)
+        self.assertEqual(get_room('growlog-42'), room)
+        self.assertIsNone(get_room('growlog-43'))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_room('growlog-42').max_message_length, 500)
+            self.assertIsNone(get_room('growlog-43'))
+
+        room.access_roles = ['owner']
+        room.save()
+        self.assertEqual(get_room('growlog-42').access_roles, ['owner'])
+
+        Room.objects.create(name='growlog-43')
+        self.assertIsNotNone(get_room('growlog-43'))
@@ -0,0 +1,77 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from chat.models import Room, Message
+from chat.search import decode_search_cursor, encode_search_cursor, search_messages
+
+User = get_user_model()
+
+
+class MessageSearchTest(TestCase):
+    def setUp(self):
+        self.room = Room.objects.get_or_create(name='general')[0]
+        self.other_room = Room.objects.get_or_create(name='vip')[0]
+        self.user = User.objects.create_user(username='alice', password='password123', email='alice@example.com')
+
+    def create_message(self, content, room=None):
+        return Message.objects.create(room=room or self.room, author=self.user, content=content)
+
+    def found_ids(self, query, **kwargs):
+        return [message.id for message, _, _ in search_messages(self.room, query, **kwargs)['hits']]
+
+    def test_finds_messages_of_room_only(self):
+        """Тест: поиск находит сообщения по слову только в своей комнате."""
+        match = self.create_message('Поливаем рассаду томатов')
+        self.create_message('Совсем другое сообщение')
+        self.create_message('Рассаду поливаем и в VIP', room=self.other_room)
+
+        self.assertEqual(self.found_ids('томатов'), [match.id])
+        self.assertEqual(self.found_ids('огурцов'), [])
+        self.assertEqual(self.found_ids('   '), [])
+
+    def test_highlight_is_escaped_and_marked(self):
+        """Тест: фрагмент экранируется, найденное слово размечается <mark>."""
+        self.create_message('<script>alert(1)</script> томатов')
+
+        [(_, rank, highlight)] = search_messages(self.room, 'томатов')['hits']
+        self.assertIn('<mark>томатов</mark>', highlight)
+        self.assertNotIn('<script>', highlight)
+        self.assertIsInstance(rank, float)
+
+    def test_index_follows_edit_and_delete(self):
+        """Тест: правка обновляет индекс, удаленные сообщения не находятся."""
+        message = self.create_message('Поливаем рассаду томатов')
+        message.content = 'Собираем урожай перцев'
+        message.save()
+        self.assertEqual(self.found_ids('томатов'), [])
+        self.assertEqual(self.found_ids('перцев'), [message.id])
+
+        message.is_deleted = True
+        message.save()
+        self.assertEqual(self.found_ids('перцев'), [])
+
+        other = self.create_message('Еще перцев')
+        other.delete()
+        self.assertEqual(self.found_ids('перцев'), [])
+
+    def test_cursor_pagination_returns_each_result_once(self):
+        """Тест: страницы по курсору покрывают все результаты без повторов."""
+        messages = [self.create_message(f'Урожай томатов номер {i}') for i in range(7)]
+
+        page = search_messages(self.room, 'томатов', limit=3)
+        ids = [message.id for message, _, _ in page['hits']]
+        while page['has_more']:
+            page = search_messages(self.room, 'томатов', cursor=page['next_cursor'], limit=3)
+            ids += [message.id for message, _, _ in page['hits']]
+
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(set(ids), {message.id for message in messages})
+
+    def test_cursor_roundtrip(self):
+        """Тест: курсор поиска сохраняет ранг, время и ID без потерь."""
+        message = self.create_message('Томаты')
+        rank, created_at, message_id = decode_search_cursor(encode_search_cursor(0.1 + 0.2, message))
+        self.assertEqual((rank, created_at, message_id), (0.1 + 0.2, message.created_at, message.id))
+
+        with self.assertRaises(ValueError):
+            decode_search_cursor('broken')
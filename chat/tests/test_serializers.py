@@ -0,0 +1,53 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from chat.models import Room, Message, MessageReaction, UserChatPosition
+from chat.serializers import ChatMessageSerializer, MESSAGE_RELATED_FIELDS
+
+User = get_user_model()
+
+
+class ChatMessageSerializerTest(TestCase):
+    def setUp(self):
+        self.room = Room.objects.get_or_create(name='general')[0]
+        self.user = User.objects.create_user(username='alice', password='password123', email='alice@example.com')
+        self.other = User.objects.create_user(username='bob', password='password123', email='bob@example.com')
+        self.position = UserChatPosition.get_or_create_for_user(self.user, self.room)
+
+    def create_page(self, size):
+        """Создает страницу сообщений со всеми видами связей: ответы, правки, закрепы, реакции"""
+        parent = Message.objects.create(room=self.room, author=self.user, content='Исходное сообщение')
+        for i in range(size - 1):
+            message = Message.objects.create(
+                room=self.room, author=self.other, content=f'@alice ответ {i}', parent=parent,
+                edited_by=self.other, is_edited=True, pinned_by=self.user, is_pinned=True
+            )
+            MessageReaction.add(message, self.user, 'like')
+
+    def serialize_page(self):
+        messages = Message.objects.filter(room=self.room).select_related(*MESSAGE_RELATED_FIELDS)
+        return ChatMessageSerializer(self.user, self.position).serialize(messages)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        """Тест: страница истории сериализуется за 2 запроса при любом размере (счетчики реакций - в сообщении)."""
+        self.create_page(5)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.serialize_page()), 5)
+
+        self.create_page(50)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.serialize_page()), 55)
+
+    def test_per_user_fields(self):
+        """Тест: поля текущего пользователя совпадают с логикой модели."""
+        self.create_page(2)
+        parent_data, reply_data = self.serialize_page()
+
+        self.assertTrue(parent_data['is_own'])
+        self.assertFalse(reply_data['is_own'])
+        self.assertTrue(reply_data['is_reply_to_me'])
+        self.assertTrue(reply_data['mentions_me'])
+        self.assertEqual(reply_data['likes_count'], 1)
+        self.assertEqual(reply_data['user_reaction'], 'like')
+        self.assertEqual(reply_data['is_personal_notification'],
+                         Message.objects.get(id=reply_data['id']).is_personal_notification_for(self.user))
@@ -156,6 +156,82 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Chat
+# ------------------------------------------------------------------------------
+# Реестр присутствия пользователей в комнатах (chat.presence)
+CHAT_PRESENCE_BACKEND = "chat.presence.RedisPresenceBackend"
+# Через сколько секунд без heartbeat подключение считается "мертвым"
+CHAT_PRESENCE_TTL = 90
+# Горячий кеш последних сообщений комнат (chat.history_cache)
+CHAT_HISTORY_CACHE_BACKEND = "chat.history_cache.RedisHistoryCache"
+# Сколько последних сообщений комнаты держать в кеше
+CHAT_HISTORY_CACHE_SIZE = 200
+# Время жизни кеша комнаты с последнего наполнения или нового сообщения, секунд
+CHAT_HISTORY_CACHE_TTL = 60 * 10
+# Не больше одной рассылки индикатора печати от подключения за это окно, мс
+CHAT_TYPING_WINDOW_MS = 2000
+# Через сколько мс без кадров typing сервер сам рассылает "перестал печатать"
+CHAT_TYPING_TIMEOUT_MS = 5000
+# Как часто отложенная позиция прокрутки записывается в БД, мс
+CHAT_POSITION_FLUSH_MS = 5000
+# Журнал событий комнат для догрузки пропущенного при переподключении (chat.event_log)
+CHAT_EVENT_LOG_BACKEND = "chat.event_log.RedisEventLog"
+# Сколько последних событий комнаты хранить; при большем пропуске клиент получает полную историю
+CHAT_EVENT_LOG_SIZE = 500
+# Время жизни журнала комнаты с последнего события, секунд
+CHAT_EVENT_LOG_TTL = 60 * 60
+# Ограничение частоты кадров от пользователя (chat.rate_limit)
+CHAT_RATE_LIMIT_BACKEND = "chat.rate_limit.RedisRateLimiter"
+# Бюджеты по типу кадра: (емкость корзины, пополнение токенов в секунду); default - для остальных типов
+CHAT_RATE_LIMITS = {
+    "message": (10, 1.0),
+    "reaction": (20, 2.0),
+    "edit_message": (10, 0.5),
+    "delete_message": (10, 0.5),
+    "forward_message": (10, 0.5),
+    "pin_message": (10, 0.5),
+    "unpin_message": (10, 0.5),
+    "forward_messages": (3, 0.1),
+    "delete_messages": (3, 0.1),
+    "pin_messages": (3, 0.1),
+    "mark_as_read": (20, 2.0),
+    "save_position": (30, 5.0),
+    "typing": (30, 5.0),
+    "heartbeat": (10, 1.0),
+    "fetch_messages": (5, 0.2),
+    "fetch_online_users": (5, 0.2),
+    "load_more_messages": (20, 2.0),
+    "load_message_context": (20, 2.0),
+    "search_messages": (10, 0.5),
+    "default": (30, 5.0),
+}
+# Архивация старых сообщений (chat.archive): возраст в днях и размер пачки переноса
+CHAT_ARCHIVE_AFTER_DAYS = 90
+CHAT_ARCHIVE_BATCH_SIZE = 1000
+
+# News parsing (news.fetching)
+# ------------------------------------------------------------------------------
+# Сколько источников загружается одновременно и общий пул загрузки статей
+NEWS_FETCH_MAX_SOURCES = 4
+NEWS_FETCH_MAX_WORKERS = 16
+# Одновременных запросов к одному хосту
+NEWS_FETCH_PER_HOST = 2
+# Таймаут одного запроса и срок на весь источник (список + статьи), секунды
+NEWS_FETCH_TIMEOUT = 10
+NEWS_FETCH_SOURCE_DEADLINE = 45
+# Повторы временных сбоев (соединение, таймаут, 429, 5xx) и начальная задержка между ними
+NEWS_FETCH_RETRIES = 2
+NEWS_FETCH_BACKOFF = 0.5
+# Сколько дней хранится кеш страниц для условных запросов (news.models.CachedPage)
+NEWS_FETCH_CACHE_DAYS = 14
+# Провайдер перевода (news.translation) и размер LRU переводов в памяти процесса
+NEWS_TRANSLATION_BACKEND = "news.translation.GoogleTranslationBackend"
+NEWS_TRANSLATION_CACHE_SIZE = 5000
+# Почти одинаковые новости (news.similarity): наименьшее сходство отпечатков MinHash (оценка
+# сходства Жаккара шинглов) и минимум слов для отпечатка
+NEWS_DUPLICATE_MIN_SIMILARITY = 0.8
+NEWS_DUPLICATE_MIN_WORDS = 40
+
 # Other
 # ------------------------------------------------------------------------------
 SITE_ID = 1
@@ -164,3 +240,22 @@ LANGUAGE_CODE = "ru"
 TIME_ZONE = "UTC"
 USE_I18N = True
 USE_TZ = True
+
+# Celery
+# ------------------------------------------------------------------------------
+# https://docs.celeryq.dev/en/stable/userguide/configuration.html#std:setting-broker_url
+CELERY_BROKER_URL = REDIS_URL
+CELERY_TIMEZONE = TIME_ZONE
+# https://docs.celeryq.dev/en/stable/userguide/periodic-tasks.html
+CELERY_BEAT_SCHEDULE = {
+    # Сверка инкрементальных счетчиков непрочитанных в чате
+    "chat-reconcile-unread-counters": {
+        "task": "chat.tasks.reconcile_unread_counters",
+        "schedule": 60 * 60,
+    },
+    # Перенос старых сообщений чата в архив
+    "chat-archive-old-messages": {
+        "task": "chat.tasks.archive_old_messages",
+        "schedule": 24 * 60 * 60,
+    },
+}
@@ -34,5 +34,15 @@ TEMPLATES[0]["OPTIONS"]["debug"] = True  # type: ignore[index]
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#media-url
 MEDIA_URL = "http://media.testserver/"
+# CHAT
+# ------------------------------------------------------------------------------
+CHAT_PRESENCE_BACKEND = "chat.presence.InMemoryPresenceBackend"
+CHAT_HISTORY_CACHE_BACKEND = "chat.history_cache.InMemoryHistoryCache"
+CHAT_EVENT_LOG_BACKEND = "chat.event_log.InMemoryEventLog"
+CHAT_RATE_LIMIT_BACKEND = "chat.rate_limit.InMemoryRateLimiter"
+# NEWS
+# ------------------------------------------------------------------------------
+NEWS_TRANSLATION_BACKEND = "news.translation.FakeTranslationBackend"
+
 # Your stuff...
 # ------------------------------------------------------------------------------
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
 from django.urls import path, reverse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
@@ -7,6 +7,7 @@ from django.utils import timezone
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import Count
 from .models import Category, Tag, Post, Poll, PollChoice, PollVote, PostView, Comment, Reaction, NewsCategory, NewsSource, ParsedNews, News, ParsingLog
 import json
 
@@ -227,10 +228,36 @@ class NewsSourceAdmin(admin.ModelAdmin):
     disable_parsing.short_description = "Отключить парсинг для выбранных источников"
 
 
+class DuplicateClusterFilter(admin.SimpleListFilter):
+    """По умолчанию одна запись на историю - представитель кластера почти одинаковых статей"""
+    title = "Копии других источников"
+    parameter_name = 'copies'
+
+    def lookups(self, request, model_admin):
+        return [('one', "Одна на историю"), ('all', "Все статьи"), ('only', "Только копии")]
+
+    def choices(self, changelist):
+        # Без варианта "Все": без параметра действует 'one'
+        value = self.value() or 'one'
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': value == lookup,
+                'query_string': changelist.get_query_string({self.parameter_name: lookup}),
+                'display': title,
+            }
+
+    def queryset(self, request, queryset):
+        if self.value() == 'all':
+            return queryset
+        if self.value() == 'only':
+            return queryset.filter(duplicate_of__isnull=False)
+        return queryset.filter(duplicate_of__isnull=True)
+
+
 @admin.register(ParsedNews)
 class ParsedNewsAdmin(admin.ModelAdmin):
-    list_display = ['title_short', 'source', 'status', 'category', 'parsed_at', 'moderated_by', 'action_buttons']
-    list_filter = ['status', 'source', 'category', 'parsed_at']
+    list_display = ['title_short', 'source', 'status', 'category', 'cluster_size', 'parsed_at', 'moderated_by', 'action_buttons']
+    list_filter = [DuplicateClusterFilter, 'status', 'source', 'category', 'parsed_at']
     search_fields = ['title', 'original_title', 'content']
     list_per_page = 20
 
@@ -250,6 +277,10 @@ class ParsedNewsAdmin(admin.ModelAdmin):
             'fields': ('source', 'original_url', 'image_url'),
             'classes': ('collapse',)
         }),
+        ('Та же история в других источниках', {
+            'fields': ('duplicate_of', 'cluster_links'),
+            'classes': ('collapse',)
+        }),
         ('Модерация', {
             'fields': ('status', 'moderated_by', 'moderated_at', 'moderation_notes'),
             'classes': ('wide',)
@@ -260,7 +291,7 @@ class ParsedNewsAdmin(admin.ModelAdmin):
         }),
     )
 
-    readonly_fields = ['parsed_at', 'moderated_at', 'moderated_by']
+    readonly_fields = ['parsed_at', 'moderated_at', 'moderated_by', 'duplicate_of', 'cluster_links']
 
     actions = ['approve_news', 'reject_news', 'publish_news', 'reset_to_pending']
 
@@ -268,6 +299,27 @@ class ParsedNewsAdmin(admin.ModelAdmin):
         return obj.title[:80] + "..." if len(obj.title) > 80 else obj.title
     title_short.short_description = "Заголовок"
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(copies_count=Count('duplicates'))
+
+    def cluster_size(self, obj):
+        return obj.copies_count + 1 if obj.copies_count else "—"
+    cluster_size.short_description = "Источников"
+    cluster_size.admin_order_field = 'copies_count'
+
+    def cluster_links(self, obj):
+        representative = obj.duplicate_of or obj
+        cluster = [representative] + list(representative.duplicates.select_related('source').order_by('parsed_at'))
+        others = [item for item in cluster if item.pk != obj.pk]
+        if not others:
+            return "—"
+        return format_html_join(
+            format_html('<br>'), '<a href="{}">{}</a> (<a href="{}" target="_blank">{}</a>)',
+            ((reverse('admin:news_parsednews_change', args=[item.pk]), item.title[:80], item.original_url, item.source.name)
+             for item in others),
+        )
+    cluster_links.short_description = "Статьи кластера"
+
     def action_buttons(self, obj):
         if obj.status == 'pending':
             return format_html(
@@ -469,9 +521,18 @@ class NewsAdmin(admin.ModelAdmin):
 
 @admin.register(ParsingLog)
 class ParsingLogAdmin(admin.ModelAdmin):
-    list_display = ['started_at', 'status', 'total_sources', 'successful_sources', 'total_articles', 'new_articles', 'duration']
+    list_display = ['started_at', 'status', 'total_sources', 'successful_sources', 'total_articles', 'new_articles', 'sources_skipped', 'bytes_saved', 'translation_hits', 'duration']
     list_filter = ['status', 'started_at']
-    readonly_fields = ['started_at', 'finished_at', 'status', 'total_sources', 'successful_sources', 'total_articles', 'new_articles', 'errors', 'notes']
+    readonly_fields = [
+        'started_at', 'finished_at', 'status', 'total_sources', 'successful_sources', 'total_articles', 'new_articles',
+        'pages_fetched', 'pages_not_modified', 'sources_skipped', 'bytes_downloaded', 'bytes_saved',
+        'translation_segments', 'translation_cache_hits', 'translation_chars_translated', 'translation_chars_saved',
+        'duplicate_articles', 'errors', 'notes',
+    ]
+
+    def translation_hits(self, obj):
+        return f"{obj.translation_hit_rate:.0%}" if obj.translation_segments else "—"
+    translation_hits.short_description = "Переводы из кеша"
 
     def duration(self, obj):
         if obj.finished_at:
@@ -0,0 +1,289 @@
+"""
+Параллельная загрузка страниц для парсера новостей.
+
+Источники обрабатываются в пуле потоков (NEWS_FETCH_MAX_SOURCES), полные
+тексты статей источника - в общем пуле загрузчика (NEWS_FETCH_MAX_WORKERS).
+Все запросы идут через одну requests.Session с пулом соединений, а число
+одновременных запросов к одному хосту (host:port) ограничено
+NEWS_FETCH_PER_HOST, так что медленный сайт занимает не больше своих слотов
+и не задерживает остальные источники.
+
+Каждый источник получает срок (Deadline, NEWS_FETCH_SOURCE_DEADLINE секунд):
+таймауты запросов урезаются до оставшегося времени, а статьи, не успевшие
+загрузиться, остаются без полного текста. Временные сбои (соединение,
+таймаут, 429 и 5xx) повторяются до NEWS_FETCH_RETRIES раз с экспоненциальной
+задержкой от NEWS_FETCH_BACKOFF секунд, если повтор укладывается в срок.
+
+Кеш страниц (PageCache, модель CachedPage) хранит ETag, Last-Modified,
+SHA-256 и сжатое тело каждой загруженной страницы. Запросы отправляются
+условными (If-None-Match, If-Modified-Since): на 304 страница берется из
+кеша без загрузки тела, а совпавший хеш отмечает страницу неизменной, даже
+если сайт не поддерживает условные запросы. Кеш читается и сохраняется в БД
+в вызывающем потоке (run_parsing), потоки загрузки работают с копией в
+памяти.
+"""
+import hashlib
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from .models import CachedPage
+
+USER_AGENT = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/100.0.4896.75 Safari/537.36'
+)
+
+# Ответы, после которых имеет смысл повторить запрос
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Уровень сжатия тел страниц в кеше
+CACHE_COMPRESS_LEVEL = 6
+
+
+class FetchError(Exception):
+    """Страницу не удалось загрузить (после всех повторов или по истечении срока)"""
+
+
+class Deadline:
+    """Срок обработки источника по монотонным часам"""
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+
+@dataclass
+class Page:
+    """Загруженная страница; changed=False - не изменилась с прошлой загрузки (304 или тот же хеш)"""
+    url: str
+    text: str
+    changed: bool = True
+    entry: CachedPage = None  # Новая запись кеша (еще не примененная, см. PageCache.remember)
+
+
+class PageCache:
+    """
+    Кеш страниц на время прогона. load и save обращаются к БД и вызываются в
+    одном потоке; остальные методы потокобезопасны.
+    """
+
+    def __init__(self, entries=()):
+        self.entries = {entry.url: entry for entry in entries}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls):
+        """Записи, проверенные за последние NEWS_FETCH_CACHE_DAYS дней"""
+        since = timezone.now() - timedelta(days=settings.NEWS_FETCH_CACHE_DAYS)
+        return cls(CachedPage.objects.filter(checked_at__gte=since))
+
+    def conditional_headers(self, url):
+        with self._lock:
+            entry = self.entries.get(url)
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def not_modified(self, url):
+        """Ответ 304: страница из кеша; None, если записи нет (сервер ответил 304 без условий)"""
+        with self._lock:
+            entry = self.entries.get(url)
+            if entry is None:
+                return None
+            entry.checked_at = timezone.now()
+            self._dirty.add(url)
+        text = zlib.decompress(bytes(entry.body)).decode('utf-8')
+        return Page(url, text, changed=False)
+
+    def cached_size(self, url):
+        with self._lock:
+            entry = self.entries.get(url)
+        return entry.size if entry is not None else 0
+
+    def build_page(self, url, response):
+        """Страница из ответа 200 с новой записью кеша; changed - хеш отличается от сохраненного"""
+        content = response.content
+        content_hash = hashlib.sha256(content).hexdigest()
+        with self._lock:
+            previous = self.entries.get(url)
+        now = timezone.now()
+        entry = CachedPage(
+            pk=previous.pk if previous is not None else None, url=url,
+            etag=response.headers.get('ETag', '')[:255],
+            last_modified=response.headers.get('Last-Modified', '')[:64],
+            content_hash=content_hash, body=zlib.compress(content, CACHE_COMPRESS_LEVEL), size=len(content),
+            fetched_at=now, checked_at=now,
+        )
+        changed = previous is None or previous.content_hash != content_hash
+        return Page(url, response.text, changed=changed, entry=entry)
+
+    def remember(self, page):
+        """Сохраняет запись страницы в кеше (до save - только в памяти)"""
+        if page.entry is None:
+            return
+        with self._lock:
+            self.entries[page.url] = page.entry
+            self._dirty.add(page.url)
+
+    def save(self):
+        """Записывает измененные записи в БД и удаляет устаревшие"""
+        with self._lock:
+            entries = [self.entries[url] for url in self._dirty]
+            self._dirty.clear()
+
+        fields = ['etag', 'last_modified', 'content_hash', 'body', 'size', 'fetched_at', 'checked_at']
+        CachedPage.objects.bulk_update([entry for entry in entries if entry.pk], fields, batch_size=100)
+        CachedPage.objects.bulk_create(
+            [entry for entry in entries if not entry.pk], batch_size=100,
+            update_conflicts=True, unique_fields=['url'], update_fields=fields,
+        )
+        since = timezone.now() - timedelta(days=settings.NEWS_FETCH_CACHE_DAYS)
+        CachedPage.objects.filter(checked_at__lt=since).delete()
+
+
+class Fetcher:
+    """Загрузчик страниц: общая сессия, лимит запросов на хост, повторы, сроки и кеш страниц"""
+
+    def __init__(self, max_workers=None, per_host=None, timeout=None, retries=None, backoff=None, cache=None):
+        self.max_workers = max_workers or settings.NEWS_FETCH_MAX_WORKERS
+        self.per_host = per_host or settings.NEWS_FETCH_PER_HOST
+        self.timeout = timeout or settings.NEWS_FETCH_TIMEOUT
+        self.retries = settings.NEWS_FETCH_RETRIES if retries is None else retries
+        self.backoff = settings.NEWS_FETCH_BACKOFF if backoff is None else backoff
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='news-fetch')
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+
+        self.cache = cache
+        # Статистика прогона: pages_fetched, pages_not_modified, bytes_downloaded, bytes_saved, ...
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def host_slots(self, url):
+        """Семафор хоста: не больше per_host одновременных запросов к одному host:port"""
+        host = urlsplit(url).netloc.lower()
+        with self._hosts_lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return self._hosts[host]
+
+    def count(self, **values):
+        with self._stats_lock:
+            self.stats.update(values)
+
+    def fetch(self, url, deadline=None):
+        """Загружает страницу и возвращает ее текст; FetchError, если не удалось"""
+        return self.fetch_page(url, deadline).text
+
+    def fetch_page(self, url, deadline=None, remember=True):
+        """
+        Загружает страницу (условным запросом, если она есть в кеше). С
+        remember=False запись кеша не сохраняется - вызывающий сохраняет ее
+        сам через cache.remember, когда страница обработана.
+        """
+        slots = self.host_slots(url)
+        attempt = 0
+        while True:
+            timeout = self.timeout if deadline is None else min(self.timeout, deadline.remaining())
+            if timeout <= 0:
+                raise FetchError(f"{url}: истек срок источника")
+
+            # Ожидание слота хоста тоже ограничено сроком
+            if not slots.acquire(timeout=None if deadline is None else deadline.remaining()):
+                raise FetchError(f"{url}: истек срок источника в ожидании соединения")
+            try:
+                headers = self.cache.conditional_headers(url) if self.cache is not None else None
+                response = self.session.get(url, headers=headers, timeout=timeout)
+                if response.status_code == 304 and self.cache is not None:
+                    page = self.cache.not_modified(url)
+                    if page is not None:
+                        self.count(pages_not_modified=1, bytes_saved=self.cache.cached_size(url))
+                        return page
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return self.build_page(url, response, remember)
+                error = FetchError(f"{url}: HTTP {response.status_code}")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = FetchError(f"{url}: {e}")
+            except requests.RequestException as e:
+                raise FetchError(f"{url}: {e}") from e
+            finally:
+                slots.release()
+
+            # Экспоненциальная задержка с разбросом; повтор, только если он успевает до срока
+            delay = self.backoff * 2 ** attempt * (1 + random.random() / 2)
+            attempt += 1
+            if attempt > self.retries or (deadline is not None and deadline.remaining() <= delay):
+                raise error
+            time.sleep(delay)
+
+    def build_page(self, url, response, remember):
+        self.count(pages_fetched=1, bytes_downloaded=len(response.content))
+        if self.cache is None:
+            return Page(url, response.text)
+        page = self.cache.build_page(url, response)
+        if not page.changed:
+            self.count(pages_unchanged=1)
+        if remember:
+            self.cache.remember(page)
+        return page
+
+    def fetch_many(self, urls, deadline=None):
+        """
+        Загружает страницы параллельно в пуле загрузчика. Возвращает {url: текст}
+        для загруженных и {url: FetchError} для остальных; не дожидается страниц
+        дольше срока.
+        """
+        futures = {url: self.executor.submit(self.fetch, url, deadline) for url in dict.fromkeys(urls)}
+        results = {}
+        for url, future in futures.items():
+            try:
+                results[url] = future.result(timeout=None if deadline is None else deadline.remaining())
+            except FetchError as e:
+                results[url] = e
+            except Exception as e:
+                # TimeoutError ожидания: загрузка еще идет, но срок источника вышел
+                future.cancel()
+                results[url] = FetchError(f"{url}: истек срок источника ({type(e).__name__})")
+        return results
@@ -0,0 +1,142 @@
+"""
+Пакетная запись спарсенных статей.
+
+Статьи прогона проверяются на дубли по url_hash - SHA-256 нормализованного
+адреса (news.links). Уже известные адреса выбираются одним запросом на
+пакет, повторы внутри пакета отбрасываются в памяти, категории определяются
+по словарю в памяти (CategoryResolver), а новые записи вставляются
+bulk_create с ignore_conflicts: уникальный url_hash защищает от дублей и при
+параллельных прогонах.
+
+Почти одинаковые статьи разных источников (news.similarity) отделяются до
+перевода (split_duplicates): переводится только представитель кластера, копии
+получают его перевод и ссылку duplicate_of.
+"""
+from django.db.models import Q
+
+from .links import url_hash
+from .models import NewsCategory, ParsedNews, SimilarityBand
+from .similarity import DuplicateIndex, band_keys, fingerprint, unpack
+
+# Размер пачки bulk_create и выборки известных адресов
+BATCH_SIZE = 500
+
+# Ключевое слово в переведенном тексте -> (категория, слаг как в setup_news_data); первая найденная побеждает
+CATEGORY_KEYWORDS = [
+    ('выращивание', 'Выращивание', 'growing'),
+    ('медицин', 'Медицинский каннабис', 'medical'),
+    ('сорт', 'Сорта и штаммы', 'strains'),
+    ('оборудование', 'Оборудование', 'equipment'),
+    ('освещение', 'Освещение', 'lighting'),
+    ('удобрения', 'Удобрения', 'nutrients'),
+    ('гидропоник', 'Гидропоника', 'hydroponics'),
+    ('законодательство', 'Законодательство', 'legal'),
+    ('исследования', 'Исследования', 'research'),
+]
+GENERAL_CATEGORY = ('Общие новости', 'general', 'Общие новости о каннабисе')
+
+
+def select_new(items):
+    """
+    Оставляет статьи, которых еще нет в БД и которые не повторяются в пакете.
+    items - [(статья, источник)]; возвращает [(статья, источник, url_hash)].
+    Известные адреса выбираются одним запросом на BATCH_SIZE статей.
+    """
+    hashed = {}
+    for article, source in items:
+        hashed.setdefault(url_hash(article['url']), (article, source))
+
+    hashes = list(hashed)
+    known = set()
+    for start in range(0, len(hashes), BATCH_SIZE):
+        known.update(ParsedNews.objects.filter(
+            url_hash__in=hashes[start:start + BATCH_SIZE]
+        ).values_list('url_hash', flat=True))
+    return [(article, source, key) for key, (article, source) in hashed.items() if key not in known]
+
+
+def insert_new(news):
+    """
+    Вставляет записи, пропуская занятые url_hash, и полосы их отпечатков.
+    Возвращает {url_hash: id} действительно вставленных записей: адреса,
+    занятые до вставки (гонка с параллельным прогоном), не учитываются.
+    """
+    if not news:
+        return {}
+    hashes = [item.url_hash for item in news]
+    existing = set()
+    for start in range(0, len(hashes), BATCH_SIZE):
+        existing.update(ParsedNews.objects.filter(
+            url_hash__in=hashes[start:start + BATCH_SIZE]
+        ).values_list('url_hash', flat=True))
+
+    ParsedNews.objects.bulk_create(news, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    # bulk_create с ignore_conflicts не возвращает первичные ключи - они берутся выборкой
+    fresh = [key for key in hashes if key not in existing]
+    ids = {}
+    for start in range(0, len(fresh), BATCH_SIZE):
+        ids.update(ParsedNews.objects.filter(
+            url_hash__in=fresh[start:start + BATCH_SIZE]
+        ).values_list('url_hash', 'id'))
+
+    SimilarityBand.objects.bulk_create([
+        SimilarityBand(news_id=ids[item.url_hash], value=key)
+        for item in news if item.minhash is not None and item.url_hash in ids
+        for key in band_keys(unpack(item.minhash))
+    ], batch_size=BATCH_SIZE)
+    return ids
+
+
+def split_duplicates(fresh):
+    """
+    Делит новые статьи [(статья, источник, url_hash)] на представителей
+    кластеров [(статья, источник, url_hash, отпечаток)] и копии
+    [(статья, источник, url_hash, отпечаток, представитель)]. Представитель -
+    id записи в БД или url_hash статьи из этого же пакета.
+    """
+    signatures = {key: fingerprint(article['title'], article['full_text']) for article, _, key in fresh}
+    index = DuplicateIndex(signatures.values())
+
+    representatives, duplicates = [], []
+    for article, source, key in fresh:
+        signature = signatures[key]
+        representative = index.find(signature)
+        if representative is None:
+            representatives.append((article, source, key, signature))
+            if signature is not None:
+                index.add(signature, key)
+        else:
+            duplicates.append((article, source, key, signature, representative))
+    return representatives, duplicates
+
+
+def load_representatives(duplicates):
+    """Сохраненные представители копий одним запросом: {id или url_hash: ParsedNews}"""
+    ids = {representative for *_, representative in duplicates if isinstance(representative, int)}
+    keys = {representative for *_, representative in duplicates if isinstance(representative, str)}
+    rows = ParsedNews.objects.filter(Q(id__in=ids) | Q(url_hash__in=keys)).only('id', 'url_hash', 'title', 'content')
+    found = {}
+    for row in rows:
+        found[row.id] = found[row.url_hash] = row
+    return found
+
+
+class CategoryResolver:
+    """Категории по ключевым словам из словаря в памяти: одна выборка на прогон, недостающие создаются"""
+
+    def __init__(self):
+        self.by_name = {category.name: category for category in NewsCategory.objects.all()}
+
+    def resolve(self, text):
+        text_lower = text.lower()
+        for keyword, name, slug in CATEGORY_KEYWORDS:
+            if keyword in text_lower:
+                return self.get(name, slug, f'Новости о {keyword}')
+        return self.get(*GENERAL_CATEGORY)
+
+    def get(self, name, slug, description):
+        if name not in self.by_name:
+            self.by_name[name], _ = NewsCategory.objects.get_or_create(
+                name=name, defaults={'slug': slug, 'description': description},
+            )
+        return self.by_name[name]
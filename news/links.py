@@ -0,0 +1,37 @@
+"""
+Нормализация адресов статей для поиска дублей.
+
+normalize_url приводит адрес к каноническому виду: схема и хост в нижнем
+регистре, без www, порта по умолчанию, фрагмента, меток отслеживания и
+завершающего слеша; параметры запроса отсортированы. url_hash - SHA-256
+канонического адреса, хранится в ParsedNews.url_hash с уникальным индексом.
+"""
+import hashlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Параметры запроса, не влияющие на содержимое страницы
+TRACKING_PARAMS = {'fbclid', 'gclid', 'yclid', 'mc_cid', 'mc_eid', 'ref', '_ga'}
+TRACKING_PREFIXES = ('utm_',)
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+
+def normalize_url(url):
+    """Канонический вид адреса статьи для поиска дублей"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or 'https'
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    port = str(parts.port) if parts.port else ''
+    netloc = f'{host}:{port}' if port and DEFAULT_PORTS.get(scheme) != port else host
+
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+def url_hash(url):
+    return hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
@@ -0,0 +1,86 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from news.models import NewsSource, ParsedNews, SimilarityBand
+from news.similarity import SIGNATURE_SIZE, PRIME, DuplicateIndex, band_keys, fingerprint, pack
+
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = (
+        'Бенчмарк поиска почти одинаковых новостей (news.similarity): в БД добавляются статьи '
+        'со случайными отпечатками и полосами LSH, затем замеряется поиск кластера для копий '
+        'сохраненных историй и для новых историй. Изменения в БД откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=100000, help='Сохраненных статей')
+        parser.add_argument('--lookups', type=int, default=200, help='Поисков каждого вида')
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with transaction.atomic():
+            source = NewsSource.objects.create(name='benchmark', url='https://benchmark.invalid/news')
+            started = time.perf_counter()
+            self.seed(source, options['articles'], rng)
+            self.stdout.write(
+                f'\n📊 Поиск дублей: {options["articles"]} статей в БД '
+                f'(заполнение {time.perf_counter() - started:.1f} с)'
+            )
+
+            stories = [self.story(rng) for _ in range(options['lookups'])]
+            stored = [fingerprint('Stored story', text) for text in stories]
+            self.seed(source, 0, rng, signatures=stored)
+            # Копия: подпись другого сайта в заголовке и в конце текста
+            copies = [fingerprint('Stored story | Copy', f'{text} Источник: copy.') for text in stories]
+            fresh = [fingerprint('Fresh story', self.story(rng)) for _ in range(options['lookups'])]
+
+            self.stdout.write('├─ поиск           | мс на статью | найдено')
+            for mode, signatures in (('копии', copies), ('новые истории', fresh)):
+                started = time.perf_counter()
+                found = 0
+                for signature in signatures:
+                    found += DuplicateIndex([signature]).find(signature) is not None
+                elapsed = (time.perf_counter() - started) * 1000 / len(signatures)
+                self.stdout.write(f'├─ {mode:<15} | {elapsed:>12.3f} | {found:>7}')
+
+            started = time.perf_counter()
+            index = DuplicateIndex(copies)
+            found = sum(index.find(signature) is not None for signature in copies)
+            elapsed = (time.perf_counter() - started) * 1000 / len(copies)
+            self.stdout.write(f'├─ пакет копий     | {elapsed:>12.3f} | {found:>7}')
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('└─ Готово'))
+
+    def story(self, rng, words=200):
+        return ' '.join(f'слово{rng.randrange(5000)}' for _ in range(words))
+
+    def seed(self, source, count, rng, signatures=None):
+        """Статьи с отпечатками: переданными или случайными (генерировать тексты дольше)"""
+        if signatures is None:
+            signatures = (tuple(rng.randrange(PRIME) for _ in range(SIGNATURE_SIZE)) for _ in range(count))
+        signatures = list(signatures)
+        start = ParsedNews.objects.count()
+        for offset in range(0, len(signatures), BATCH_SIZE):
+            batch = signatures[offset:offset + BATCH_SIZE]
+            news = ParsedNews.objects.bulk_create([
+                ParsedNews(
+                    title='benchmark', original_title='benchmark', content='', original_content='', source=source,
+                    original_url=f'https://benchmark.invalid/news/{start + offset + number}',
+                    url_hash=f'benchmark-{start + offset + number}', minhash=pack(signature),
+                )
+                for number, signature in enumerate(batch)
+            ])
+            ids = dict(ParsedNews.objects.filter(
+                url_hash__in=[item.url_hash for item in news]
+            ).values_list('url_hash', 'id'))
+            SimilarityBand.objects.bulk_create([
+                SimilarityBand(news_id=ids[item.url_hash], value=key)
+                for item, signature in zip(news, batch)
+                for key in band_keys(signature)
+            ], batch_size=BATCH_SIZE)
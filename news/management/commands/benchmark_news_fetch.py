@@ -0,0 +1,84 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+
+from news.models import NewsSource
+from news.services import NewsParsingService
+from news.testing import StubPage, StubSite, article_html, listing_html
+
+
+class Command(BaseCommand):
+    help = (
+        'Бенчмарк загрузки новостей: полное время run_parsing по локальным сайтам-заглушкам '
+        '(news.testing), последовательно и с текущими настройками NEWS_FETCH_*. Каждый сайт - '
+        'отдельный хост со своей задержкой ответа, один сайт медленнее срока источника. '
+        'Изменения в БД откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sources', type=int, default=6, help='Сайтов-источников')
+        parser.add_argument('--articles', type=int, default=5, help='Статей на источник')
+        parser.add_argument('--delay-ms', type=int, default=150, help='Задержка ответа страницы, мс')
+        parser.add_argument('--slow-delay-ms', type=int, default=4000, help='Задержка медленного сайта, мс (0 - без него)')
+        parser.add_argument('--deadline', type=float, default=3, help='Срок источника, с')
+
+    def handle(self, *args, **options):
+        sites = [
+            self.build_site(f'source{number}', options['articles'], options['delay_ms'] / 1000)
+            for number in range(1, options['sources'] + 1)
+        ]
+        if options['slow_delay_ms']:
+            sites.append(self.build_site('slow', options['articles'], options['slow_delay_ms'] / 1000))
+        for _, site in sites:
+            site.start()
+
+        try:
+            self.stdout.write(
+                f'\n📊 Загрузка новостей: {len(sites)} источников × {options["articles"]} статей, '
+                f'задержка {options["delay_ms"]} мс, срок источника {options["deadline"]} с'
+            )
+            self.stdout.write('├─ режим           | время, с | статей | источников | ошибок | макс. запросов на хост')
+            modes = {
+                'последовательно': {'NEWS_FETCH_MAX_SOURCES': 1, 'NEWS_FETCH_MAX_WORKERS': 1, 'NEWS_FETCH_PER_HOST': 1},
+                'параллельно': {},
+            }
+            for mode, overrides in modes.items():
+                with override_settings(NEWS_FETCH_SOURCE_DEADLINE=options['deadline'], **overrides):
+                    elapsed, result = self.run(sites)
+                max_active = max(site.max_active for _, site in sites)
+                self.stdout.write(
+                    f'├─ {mode:<15} | {elapsed:>8.2f} | {result["new_articles"]:>6} '
+                    f'| {result["successful_sources"]:>10} | {len(result["errors"]):>6} | {max_active:>22}'
+                )
+        finally:
+            for _, site in sites:
+                site.stop()
+
+        self.stdout.write(self.style.SUCCESS('└─ Готово'))
+
+    def build_site(self, name, articles, delay):
+        links = [f'/{name}/article-{number}/' for number in range(1, articles + 1)]
+        pages = {f'/{name}/': StubPage(listing_html(f'Новости {name}', links), delay=delay)}
+        for link in links:
+            pages[link] = StubPage(article_html(f'Статья {link}'), delay=delay)
+        return name, StubSite(pages)
+
+    def run(self, sites):
+        """Один прогон run_parsing по сайтам-заглушкам; изменения в БД откатываются"""
+        for _, site in sites:
+            site.max_active = 0
+
+        with transaction.atomic():
+            # Реальные источники на время прогона выключены
+            NewsSource.objects.update(parsing_enabled=False)
+            for name, site in sites:
+                NewsSource.objects.create(name=name, url=site.url(f'/{name}/'))
+
+            started = time.perf_counter()
+            result = NewsParsingService().run_parsing()
+            elapsed = time.perf_counter() - started
+
+            transaction.set_rollback(True)
+        return elapsed, result
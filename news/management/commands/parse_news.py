@@ -2,6 +2,7 @@ import os
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from news.services import NewsParsingService
+from news.translation import hit_rate
 
 
 class Command(BaseCommand):
@@ -18,6 +19,11 @@ class Command(BaseCommand):
             type=str,
             help='Парсить только указанный источник (по имени)',
         )
+        parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='Загрузить все страницы заново, без условных запросов и пропуска неизменившихся источников',
+        )
 
     def handle(self, *args, **options):
         self.stdout.write(
@@ -25,7 +31,7 @@ class Command(BaseCommand):
         )
 
         try:
-            service = NewsParsingService()
+            service = NewsParsingService(use_cache=not options['no_cache'])
             result = service.run_parsing()
 
             if result['success']:
@@ -34,7 +40,13 @@ class Command(BaseCommand):
                         f'✅ Парсинг завершен успешно!\n'
                         f'📊 Всего обработано статей: {result["total_articles"]}\n'
                         f'🆕 Новых статей добавлено: {result["new_articles"]}\n'
-                        f'🌐 Успешных источников: {result["successful_sources"]}'
+                        f'🌐 Успешных источников: {result["successful_sources"]}\n'
+                        f'💾 Без изменений: источников {result["fetch_stats"].get("sources_skipped", 0)}, '
+                        f'страниц {result["fetch_stats"].get("pages_not_modified", 0)}, '
+                        f'сэкономлено {result["fetch_stats"].get("bytes_saved", 0) // 1024} КБ\n'
+                        f'🈯 Перевод: из кеша {hit_rate(result["translation_stats"]):.0%} текстов, '
+                        f'сэкономлено {result["translation_stats"].get("chars_saved", 0)} символов\n'
+                        f'🔁 Копий одной истории из других источников: {result["duplicate_articles"]}'
                     )
                 )
 
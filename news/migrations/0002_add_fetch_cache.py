@@ -0,0 +1,96 @@
+# Generated by Django 4.2.21 on 2026-10-18 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("news", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CachedPage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "url",
+                    models.URLField(max_length=1000, unique=True, verbose_name="URL"),
+                ),
+                (
+                    "etag",
+                    models.CharField(blank=True, max_length=255, verbose_name="ETag"),
+                ),
+                (
+                    "last_modified",
+                    models.CharField(
+                        blank=True, max_length=64, verbose_name="Last-Modified"
+                    ),
+                ),
+                (
+                    "content_hash",
+                    models.CharField(max_length=64, verbose_name="SHA-256 содержимого"),
+                ),
+                ("body", models.BinaryField(verbose_name="Тело (zlib)")),
+                (
+                    "size",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Размер без сжатия, байт"
+                    ),
+                ),
+                ("fetched_at", models.DateTimeField(verbose_name="Загружена")),
+                (
+                    "checked_at",
+                    models.DateTimeField(db_index=True, verbose_name="Проверена"),
+                ),
+            ],
+            options={
+                "verbose_name": "Кеш страницы",
+                "verbose_name_plural": "Кеш страниц",
+            },
+        ),
+        migrations.AddField(
+            model_name="parsinglog",
+            name="bytes_downloaded",
+            field=models.PositiveBigIntegerField(
+                default=0, verbose_name="Загружено байт"
+            ),
+        ),
+        migrations.AddField(
+            model_name="parsinglog",
+            name="bytes_saved",
+            field=models.PositiveBigIntegerField(
+                default=0, verbose_name="Сэкономлено байт"
+            ),
+        ),
+        migrations.AddField(
+            model_name="parsinglog",
+            name="pages_fetched",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Загружено страниц"
+            ),
+        ),
+        migrations.AddField(
+            model_name="parsinglog",
+            name="pages_not_modified",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Страниц без изменений (304)"
+            ),
+        ),
+        migrations.AddField(
+            model_name="parsinglog",
+            name="sources_skipped",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Источников без изменений"
+            ),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.21 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("news", "0002_add_fetch_cache"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="parsinglog",
+            name="translation_cache_hits",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Переводов из кеша"
+            ),
+        ),
+        migrations.AddField(
+            model_name="parsinglog",
+            name="translation_chars_saved",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Сэкономлено символов перевода"
+            ),
+        ),
+        migrations.AddField(
+            model_name="parsinglog",
+            name="translation_chars_translated",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Переведено символов"
+            ),
+        ),
+        migrations.AddField(
+            model_name="parsinglog",
+            name="translation_segments",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Текстов для перевода"
+            ),
+        ),
+        migrations.CreateModel(
+            name="CachedTranslation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("provider", models.CharField(max_length=32, verbose_name="Провайдер")),
+                (
+                    "target_language",
+                    models.CharField(max_length=10, verbose_name="Язык перевода"),
+                ),
+                (
+                    "source_hash",
+                    models.CharField(
+                        max_length=64, verbose_name="SHA-256 исходного текста"
+                    ),
+                ),
+                ("translated_text", models.TextField(verbose_name="Перевод")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "Кеш перевода",
+                "verbose_name_plural": "Кеш переводов",
+                "unique_together": {("source_hash", "target_language", "provider")},
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.21 on 2026-10-18 10:32
+
+from django.db import migrations, models
+
+from news.links import url_hash
+
+BATCH_SIZE = 2000
+
+
+def backfill_url_hash(apps, schema_editor):
+    """
+    Заполняет хеш ссылки существующих новостей пачками по первичному ключу.
+    Из дублей (одинаковая нормализованная ссылка) хеш получает самая ранняя
+    запись, у остальных он остается пустым - уникальный индекс допускает NULL.
+    """
+    ParsedNews = apps.get_model('news', 'ParsedNews')
+
+    seen = set()
+    last_id = None
+    while True:
+        news = ParsedNews.objects.order_by('id').only('id', 'original_url')
+        if last_id is not None:
+            news = news.filter(id__gt=last_id)
+        batch = list(news[:BATCH_SIZE])
+        if not batch:
+            break
+        for item in batch:
+            key = url_hash(item.original_url)
+            if key not in seen:
+                seen.add(key)
+                item.url_hash = key
+        ParsedNews.objects.bulk_update([item for item in batch if item.url_hash], ['url_hash'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("news", "0003_add_translation_cache"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="parsednews",
+            name="url_hash",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=64,
+                null=True,
+                unique=True,
+                verbose_name="Хеш нормализованной ссылки",
+            ),
+        ),
+        migrations.RunPython(backfill_url_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,166 @@
+# Generated by Django 4.2.21 on 2026-10-18 10:38
+
+import hashlib
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Копия алгоритма news.similarity на момент миграции: миграция не должна зависеть
+# от того, как модуль изменится позже
+BANDS = 16
+ROWS = 4
+SIGNATURE_SIZE = BANDS * ROWS
+SHINGLE_SIZE = 3
+MIN_SIMILARITY = 0.8
+MIN_WORDS = 40
+PRIME = (1 << 61) - 1
+COEFFICIENTS = [
+    (
+        int.from_bytes(hashlib.blake2b(f'minhash-a-{number}'.encode(), digest_size=8).digest(), 'big') % (PRIME - 1) + 1,
+        int.from_bytes(hashlib.blake2b(f'minhash-b-{number}'.encode(), digest_size=8).digest(), 'big') % PRIME,
+    )
+    for number in range(SIGNATURE_SIZE)
+]
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+BATCH_SIZE = 2000
+
+
+def fingerprint(title, text):
+    words = WORD_RE.findall(f'{title} {text}'.lower())
+    if len(words) < MIN_WORDS:
+        return None
+    hashes = {
+        int.from_bytes(hashlib.blake2b(' '.join(words[start:start + SHINGLE_SIZE]).encode('utf-8'), digest_size=8).digest(), 'big')
+        for start in range(len(words) - SHINGLE_SIZE + 1)
+    }
+    return tuple(min((a * value + b) % PRIME for value in hashes) for a, b in COEFFICIENTS)
+
+
+def similarity(a, b):
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SIZE
+
+
+def pack(signature):
+    return b''.join(value.to_bytes(8, 'big') for value in signature)
+
+
+def band_keys(signature):
+    keys = []
+    for band in range(BANDS):
+        data = bytes([band]) + pack(signature[band * ROWS:(band + 1) * ROWS])
+        keys.append(int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big', signed=True))
+    return keys
+
+
+def backfill_fingerprints(apps, schema_editor):
+    """
+    Вычисляет отпечатки существующих новостей пачками по первичному ключу и
+    объединяет почти одинаковые в кластеры: представитель - самая ранняя запись.
+    Дублями помечаются только записи, ожидающие модерации: одобренные,
+    опубликованные и отклоненные уже разобраны модератором и остаются
+    представителями своих кластеров.
+    """
+    ParsedNews = apps.get_model('news', 'ParsedNews')
+    SimilarityBand = apps.get_model('news', 'SimilarityBand')
+    buckets = {}  # {хеш полосы: [(отпечаток, представитель)]}
+
+    last_id = None
+    while True:
+        news = ParsedNews.objects.order_by('id').only('id', 'status', 'original_title', 'original_content')
+        if last_id is not None:
+            news = news.filter(id__gt=last_id)
+        batch = list(news[:BATCH_SIZE])
+        if not batch:
+            break
+        bands = []
+        for item in batch:
+            signature = fingerprint(item.original_title, item.original_content)
+            item.minhash = pack(signature) if signature is not None else None
+            if signature is None:
+                continue
+            keys = band_keys(signature)
+            item.duplicate_of_id = None
+            if item.status == 'pending':
+                matches = [
+                    (similarity(signature, other), representative)
+                    for key in keys
+                    for other, representative in buckets.get(key, ())
+                ]
+                matches = [match for match in matches if match[0] >= MIN_SIMILARITY]
+                if matches:
+                    item.duplicate_of_id = max(matches, key=lambda match: (match[0], -match[1]))[1]
+            for key in keys:
+                buckets.setdefault(key, []).append((signature, item.duplicate_of_id or item.id))
+                bands.append(SimilarityBand(news_id=item.id, value=key))
+        ParsedNews.objects.bulk_update(batch, ['minhash', 'duplicate_of'])
+        SimilarityBand.objects.bulk_create(bands, batch_size=BATCH_SIZE)
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("news", "0004_add_parsednews_url_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="parsednews",
+            name="duplicate_of",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="duplicates",
+                to="news.parsednews",
+                verbose_name="Дубликат новости",
+            ),
+        ),
+        migrations.AddField(
+            model_name="parsednews",
+            name="minhash",
+            field=models.BinaryField(
+                blank=True, null=True, verbose_name="Отпечаток MinHash"
+            ),
+        ),
+        migrations.AddField(
+            model_name="parsinglog",
+            name="duplicate_articles",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Дубликатов других источников"
+            ),
+        ),
+        migrations.CreateModel(
+            name="SimilarityBand",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "value",
+                    models.BigIntegerField(db_index=True, verbose_name="Хеш полосы"),
+                ),
+                (
+                    "news",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similarity_bands",
+                        to="news.parsednews",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Полоса отпечатка новости",
+                "verbose_name_plural": "Полосы отпечатков новостей",
+            },
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+    ]
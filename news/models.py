@@ -12,6 +12,8 @@ from django.utils.translation import gettext_lazy as _
 from django.utils.html import strip_tags
 from core.models import BaseComment
 
+from .links import url_hash
+
 User = get_user_model()
 
 
@@ -399,6 +401,16 @@ class ParsedNews(models.Model):
 
     source = models.ForeignKey(NewsSource, on_delete=models.CASCADE, verbose_name="Источник")
     original_url = models.URLField(verbose_name="Оригинальная ссылка")
+    url_hash = models.CharField(
+        max_length=64, unique=True, null=True, blank=True, editable=False,
+        verbose_name="Хеш нормализованной ссылки",
+    )
+    # Отпечаток текста для поиска почти одинаковых новостей (news.similarity)
+    minhash = models.BinaryField(null=True, blank=True, editable=False, verbose_name="Отпечаток MinHash")
+    duplicate_of = models.ForeignKey(
+        'self', null=True, blank=True, on_delete=models.SET_NULL, related_name='duplicates',
+        verbose_name="Дубликат новости",
+    )
     image_url = models.URLField(blank=True, null=True, verbose_name="URL изображения")
 
     parsed_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата парсинга")
@@ -424,6 +436,12 @@ class ParsedNews(models.Model):
     def __str__(self):
         return f"{self.title[:50]}... ({self.get_status_display()})"
 
+    def save(self, *args, **kwargs):
+        # Хеш ссылки для поиска дублей (парсер заполняет его сам перед bulk_create)
+        if not self.url_hash and self.original_url:
+            self.url_hash = url_hash(self.original_url)
+        super().save(*args, **kwargs)
+
     def get_display_title(self):
         """Возвращает отредактированный заголовок или оригинальный"""
         return self.edited_title or self.title
@@ -546,6 +564,20 @@ class ParsingLog(models.Model):
     total_articles = models.PositiveIntegerField(default=0, verbose_name="Всего статей")
     new_articles = models.PositiveIntegerField(default=0, verbose_name="Новых статей")
 
+    # Кеш загрузки (news.fetching.PageCache)
+    pages_fetched = models.PositiveIntegerField(default=0, verbose_name="Загружено страниц")
+    pages_not_modified = models.PositiveIntegerField(default=0, verbose_name="Страниц без изменений (304)")
+    sources_skipped = models.PositiveIntegerField(default=0, verbose_name="Источников без изменений")
+    bytes_downloaded = models.PositiveBigIntegerField(default=0, verbose_name="Загружено байт")
+    bytes_saved = models.PositiveBigIntegerField(default=0, verbose_name="Сэкономлено байт")
+
+    # Перевод (news.translation)
+    translation_segments = models.PositiveIntegerField(default=0, verbose_name="Текстов для перевода")
+    translation_cache_hits = models.PositiveIntegerField(default=0, verbose_name="Переводов из кеша")
+    translation_chars_translated = models.PositiveIntegerField(default=0, verbose_name="Переведено символов")
+    translation_chars_saved = models.PositiveIntegerField(default=0, verbose_name="Сэкономлено символов перевода")
+    duplicate_articles = models.PositiveIntegerField(default=0, verbose_name="Дубликатов других источников")
+
     errors = models.TextField(blank=True, verbose_name="Ошибки")
     notes = models.TextField(blank=True, verbose_name="Заметки")
 
@@ -554,9 +586,65 @@ class ParsingLog(models.Model):
         verbose_name_plural = "Логи парсинга"
         ordering = ['-started_at']
 
+    @property
+    def translation_hit_rate(self):
+        """Доля текстов, переведенных без обращения к провайдеру"""
+        if not self.translation_segments:
+            return 0.0
+        return self.translation_cache_hits / self.translation_segments
+
     def __str__(self):
         duration = ""
         if self.finished_at:
             delta = self.finished_at - self.started_at
             duration = f" ({delta.total_seconds():.1f}с)"
         return f"Парсинг {self.started_at.strftime('%d.%m.%Y %H:%M')}{duration} - {self.get_status_display()}"
+
+
+class CachedPage(models.Model):
+    """Кеш загруженной страницы источника для условных запросов (news.fetching.PageCache)"""
+    url = models.URLField(max_length=1000, unique=True, verbose_name="URL")
+    etag = models.CharField(max_length=255, blank=True, verbose_name="ETag")
+    last_modified = models.CharField(max_length=64, blank=True, verbose_name="Last-Modified")
+    content_hash = models.CharField(max_length=64, verbose_name="SHA-256 содержимого")
+    body = models.BinaryField(verbose_name="Тело (zlib)")
+    size = models.PositiveIntegerField(default=0, verbose_name="Размер без сжатия, байт")
+    fetched_at = models.DateTimeField(verbose_name="Загружена")
+    checked_at = models.DateTimeField(db_index=True, verbose_name="Проверена")
+
+    class Meta:
+        verbose_name = "Кеш страницы"
+        verbose_name_plural = "Кеш страниц"
+
+    def __str__(self):
+        return self.url
+
+
+class CachedTranslation(models.Model):
+    """Кеш переводов (news.translation): ключ - SHA-256 исходного текста, язык и провайдер"""
+    provider = models.CharField(max_length=32, verbose_name="Провайдер")
+    target_language = models.CharField(max_length=10, verbose_name="Язык перевода")
+    source_hash = models.CharField(max_length=64, verbose_name="SHA-256 исходного текста")
+    translated_text = models.TextField(verbose_name="Перевод")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Кеш перевода"
+        verbose_name_plural = "Кеш переводов"
+        unique_together = ['source_hash', 'target_language', 'provider']
+
+    def __str__(self):
+        return f"{self.provider}:{self.target_language}:{self.source_hash[:12]}"
+
+
+class SimilarityBand(models.Model):
+    """Полоса LSH отпечатка новости (news.similarity): статьи с общей полосой - кандидаты в дубли"""
+    news = models.ForeignKey(ParsedNews, on_delete=models.CASCADE, related_name='similarity_bands')
+    value = models.BigIntegerField(db_index=True, verbose_name="Хеш полосы")
+
+    class Meta:
+        verbose_name = "Полоса отпечатка новости"
+        verbose_name_plural = "Полосы отпечатков новостей"
+
+    def __str__(self):
+        return f"{self.news_id}:{self.value}"
@@ -1,59 +1,86 @@
 import os
 import sys
 import json
-import requests
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from urllib.parse import urljoin
 from django.utils import timezone
 from django.conf import settings
 from django.core.management.base import BaseCommand
 from bs4 import BeautifulSoup, Tag
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 # Добавляем путь к парсеру
 parser_path = os.path.join(settings.BASE_DIR, 'parser_translator')
 if parser_path not in sys.path:
     sys.path.append(parser_path)
 
-from .models import NewsSource, ParsedNews, ParsingLog, NewsCategory
+from .fetching import Deadline, FetchError, Fetcher, PageCache
+from .ingest import CategoryResolver, insert_new, load_representatives, select_new, split_duplicates
+from .models import NewsSource, ParsedNews, ParsingLog
+from .similarity import pack
+from .translation import get_translator, hit_rate
+
+# Максимальная длина полного текста статьи
+FULL_TEXT_LIMIT = 2000
+
 
 class NewsParsingService:
     """Сервис для парсинга новостей"""
 
-    def __init__(self):
-        self.translation_client = None
+    def __init__(self, fetcher: Optional[Fetcher] = None, use_cache: bool = True):
+        self.translator = None
         self.errors = []
+        # Загрузчик можно передать готовым (тесты, бенчмарк), иначе он создается на время run_parsing
+        self.fetcher = fetcher
+        # Кеш страниц для условных запросов (загружается в run_parsing) и статистика загрузки прогона
+        self.use_cache = use_cache
+        self.page_cache = None
+        self.fetch_stats = Counter()
+        self.unchanged_sources = set()
+        # Новые записи кеша страниц списков {source.pk: Page}: запоминаются после сохранения статей источника
+        self.listings = {}
+        # Источники, часть статей которых не удалось сохранить (их списки не запоминаются)
+        self.failed_sources = set()
+        # Статистика перевода прогона (см. news.translation)
+        self.translation_stats = Counter()
+        # Сколько статей прогона оказались копиями уже известных историй (news.similarity)
+        self.duplicate_articles = 0
 
     def init_translation_client(self):
-        """Инициализация клиента Google Cloud Translation API"""
+        """Инициализация переводчика: провайдер NEWS_TRANSLATION_BACKEND с кешем переводов"""
         try:
-            from google.cloud import translate_v2 as translate
-
-            # Устанавливаем переменную окружения для ключа API
-            api_key_path = os.path.join(settings.BASE_DIR, 'parser_translator', 'besedka-api-key.json')
-            if os.path.exists(api_key_path):
-                os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = api_key_path
-
-            self.translation_client = translate.Client()
+            translator = get_translator()
+            translator.backend.check()
+            self.translator = translator
             return True
         except Exception as e:
-            self.errors.append(f"Ошибка инициализации Google Cloud Translation API: {e}")
+            self.errors.append(f"Ошибка инициализации переводчика ({settings.NEWS_TRANSLATION_BACKEND}): {e}")
             return False
 
-    def translate_text(self, text: str, target_language: str = 'ru') -> str:
-        """Переводит текст с помощью Google Cloud Translation API"""
-        if not text or text.strip() == "N/A" or not self.translation_client:
-            return text
+    def translate_many(self, texts: List[str], target_language: str = 'ru') -> List[str]:
+        """Переводит тексты пакетом через кеш переводов; при ошибке возвращает их без перевода"""
+        if not self.translator:
+            return list(texts)
 
         try:
-            # Ограничиваем длину текста для API
-            if len(text) > 5000:
-                text = text[:5000] + "..."
-
-            result = self.translation_client.translate(text, target_language=target_language)
-            return result['translatedText']
+            return self.translator.translate_many(texts, target_language, stats=self.translation_stats)
         except Exception as e:
             self.errors.append(f"Ошибка при переводе текста: {e}")
-            return text
+            return list(texts)
+
+    def translate_text(self, text: str, target_language: str = 'ru') -> str:
+        """Переводит один текст (см. translate_many)"""
+        return self.translate_many([text], target_language)[0]
+
+    def translate_articles(self, articles: List[Dict[str, Any]]) -> Dict[str, str]:
+        """Переводит заголовки и тексты статей одним пакетом; возвращает {оригинал: перевод}"""
+        texts = []
+        for article in articles:
+            texts.extend([article['title'], article['full_text']])
+        return dict(zip(texts, self.translate_many(texts)))
 
     def safe_get_text(self, element) -> str:
         """Безопасно извлекает текст из BeautifulSoup элемента"""
@@ -67,49 +94,64 @@ class NewsParsingService:
             return element[attr]
         return "N/A"
 
+    def extract_article_text(self, html: str) -> str:
+        """Извлекает основной текст статьи из HTML страницы"""
+        soup = BeautifulSoup(html, 'html.parser')
+
+        # Попытка найти основной контент
+        content_selectors = [
+            'div[class*="content"]',
+            'div[class*="article-body"]',
+            'div[class*="post-content"]',
+            'div[class*="entry-content"]',
+            'article',
+            'main'
+        ]
+
+        full_text = []
+        for selector in content_selectors:
+            content_div = soup.select_one(selector)
+            if content_div and isinstance(content_div, Tag):
+                paragraphs = content_div.find_all('p')
+                for p in paragraphs:
+                    if isinstance(p, Tag):
+                        text = p.get_text(strip=True)
+                        if text and len(text) > 20:
+                            full_text.append(text)
+                if full_text:
+                    break
+
+        combined_text = '\n'.join(full_text)
+        return combined_text[:FULL_TEXT_LIMIT] + '...' if len(combined_text) > FULL_TEXT_LIMIT else combined_text
+
     def get_full_article_content(self, article_url: str) -> str:
         """Получает полный текст статьи по URL"""
         if not article_url or article_url == "N/A":
             return ""
 
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/100.0.4896.75 Safari/537.36'
-            }
-            response = requests.get(article_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # Попытка найти основной контент
-            content_selectors = [
-                'div[class*="content"]',
-                'div[class*="article-body"]',
-                'div[class*="post-content"]',
-                'div[class*="entry-content"]',
-                'article',
-                'main'
-            ]
-
-            full_text = []
-            for selector in content_selectors:
-                content_div = soup.select_one(selector)
-                if content_div and isinstance(content_div, Tag):
-                    paragraphs = content_div.find_all('p')
-                    for p in paragraphs:
-                        if isinstance(p, Tag):
-                            text = p.get_text(strip=True)
-                            if text and len(text) > 20:
-                                full_text.append(text)
-                    if full_text:
-                        break
-
-            combined_text = '\n'.join(full_text)
-            return combined_text[:2000] + '...' if len(combined_text) > 2000 else combined_text
-
+            with self.fetcher_scope() as fetcher:
+                return self.extract_article_text(fetcher.fetch(article_url))
         except Exception as e:
             self.errors.append(f"Ошибка при получении полного текста статьи {article_url}: {e}")
             return ""
 
+    def fill_full_texts(self, articles: List[Dict[str, Any]], deadline: Optional[Deadline] = None):
+        """Загружает полные тексты статей параллельно; не успевшие к сроку остаются без текста"""
+        urls = [article['url'] for article in articles]
+        pages = self.fetcher.fetch_many(urls, deadline)
+        for article in articles:
+            page = pages.get(article['url'])
+            if isinstance(page, FetchError):
+                self.errors.append(f"Ошибка при получении полного текста статьи {article['url']}: {page}")
+                article['full_text'] = ""
+            else:
+                try:
+                    article['full_text'] = self.extract_article_text(page)
+                except Exception as e:
+                    self.errors.append(f"Ошибка при разборе статьи {article['url']}: {e}")
+                    article['full_text'] = ""
+
     def parse_leafly_news(self, soup: BeautifulSoup, source_name: str) -> List[Dict[str, Any]]:
         """Парсит новости с Leafly News"""
         articles = []
@@ -137,12 +179,12 @@ class NewsParsingService:
                     'source': source_name,
                     'image_url': image_url,
                     'date_published': date_published,
-                    'full_text': self.get_full_article_content(link)
+                    'full_text': ""  # Заполняется в fill_full_texts
                 })
 
         return articles
 
-    def parse_generic_news(self, soup: BeautifulSoup, source_name: str) -> List[Dict[str, Any]]:
+    def parse_generic_news(self, soup: BeautifulSoup, source_name: str, base_url: Optional[str] = None) -> List[Dict[str, Any]]:
         """Универсальный парсер для новостных сайтов"""
         articles = []
 
@@ -187,8 +229,11 @@ class NewsParsingService:
 
                 # Проверяем и исправляем относительные ссылки
                 if link != "N/A" and not link.startswith('http'):
-                    base_url = f"https://{source_name.lower().replace(' ', '')}.com"
-                    link = f"{base_url}{link}" if link.startswith('/') else f"{base_url}/{link}"
+                    if base_url:
+                        link = urljoin(base_url, link)
+                    else:
+                        guessed_url = f"https://{source_name.lower().replace(' ', '')}.com"
+                        link = f"{guessed_url}{link}" if link.startswith('/') else f"{guessed_url}/{link}"
 
                 if title != "N/A" and link != "N/A" and len(title) > 10:
                     articles.append({
@@ -197,7 +242,7 @@ class NewsParsingService:
                         'source': source_name,
                         'image_url': image_url,
                         'date_published': "N/A",
-                        'full_text': self.get_full_article_content(link)
+                        'full_text': ""  # Заполняется в fill_full_texts
                     })
 
             if articles:
@@ -205,21 +250,33 @@ class NewsParsingService:
 
         return articles
 
-    def parse_source(self, source: NewsSource) -> List[Dict[str, Any]]:
-        """Парсит новости с одного источника"""
+    def parse_source(self, source: NewsSource, deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        """
+        Парсит новости с одного источника: страница списка, затем полные тексты
+        статей параллельно. Выполняется в пуле потоков run_parsing, поэтому к БД
+        не обращается.
+        """
+        deadline = deadline or Deadline(settings.NEWS_FETCH_SOURCE_DEADLINE)
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/100.0.4896.75 Safari/537.36'
-            }
-            response = requests.get(source.url, headers=headers, timeout=15)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # Специализированный парсинг для известных сайтов
-            if "leafly.com/news" in source.url:
-                return self.parse_leafly_news(soup, source.name)
-            else:
-                return self.parse_generic_news(soup, source.name)
+            with self.fetcher_scope() as fetcher:
+                listing = fetcher.fetch_page(source.url, deadline, remember=False)
+                if not listing.changed:
+                    # Список не изменился (304 или тот же хеш) - статьи уже обработаны в прошлый раз
+                    fetcher.count(sources_skipped=1)
+                    self.unchanged_sources.add(source.pk)
+                    return []
+                soup = BeautifulSoup(listing.text, 'html.parser')
+
+                # Специализированный парсинг для известных сайтов
+                if "leafly.com/news" in source.url:
+                    articles = self.parse_leafly_news(soup, source.name)
+                else:
+                    articles = self.parse_generic_news(soup, source.name, base_url=source.url)
+
+                self.fill_full_texts(articles, deadline)
+                # Запись кеша списка применяется в run_parsing только после сохранения статей источника
+                self.listings[source.pk] = listing
+                return articles
 
         except Exception as e:
             self.errors.append(f"Ошибка при парсинге {source.name} ({source.url}): {e}")
@@ -255,80 +312,93 @@ class NewsParsingService:
         ]
         return test_articles
 
-    def process_article(self, article_data: Dict[str, Any], source: NewsSource) -> Optional[ParsedNews]:
-        """Обрабатывает одну статью и сохраняет в базу данных"""
-        try:
-            # Проверяем, не существует ли уже такая статья
-            if ParsedNews.objects.filter(original_url=article_data['url']).exists():
-                return None
-
-            # Переводим текст
-            original_title = article_data['title']
-            original_content = article_data['full_text']
-
-            translated_title = self.translate_text(original_title)
-            translated_content = self.translate_text(original_content)
-
-            # Создаем краткое описание
-            summary = translated_content[:300] + "..." if len(translated_content) > 300 else translated_content
-
-            # Определяем категорию (простая логика на основе ключевых слов)
-            category = self.determine_category(translated_title + " " + translated_content)
-
-            # Парсим дату
-            parsed_date = self.parse_date(article_data.get('date_published', ''))
-
-            # Создаем запись
-            parsed_news = ParsedNews.objects.create(
-                title=translated_title,
-                original_title=original_title,
-                content=translated_content,
-                original_content=original_content,
-                summary=summary,
-                source=source,
-                original_url=article_data['url'],
-                image_url=article_data.get('image_url'),
-                original_date=parsed_date,
-                category=category
-            )
-
-            return parsed_news
-
-        except Exception as e:
-            self.errors.append(f"Ошибка при обработке статьи {article_data.get('title', 'Неизвестно')}: {e}")
-            return None
-
-    def determine_category(self, text: str) -> Optional[NewsCategory]:
-        """Определяет категорию новости на основе содержания"""
-        text_lower = text.lower()
-
-        # Создаем базовые категории если их нет
-        categories_map = {
-            'выращивание': 'Выращивание',
-            'медицин': 'Медицинский каннабис',
-            'сорт': 'Сорта и штаммы',
-            'оборудование': 'Оборудование',
-            'освещение': 'Освещение',
-            'удобрения': 'Удобрения',
-            'гидропоник': 'Гидропоника',
-            'законодательство': 'Законодательство',
-            'исследования': 'Исследования'
-        }
-
-        for keyword, category_name in categories_map.items():
-            if keyword in text_lower:
-                category, created = NewsCategory.objects.get_or_create(
-                    name=category_name,
-                    defaults={'description': f'Новости о {keyword}'}
-                )
-                return category
-
-        # Возвращаем общую категорию
-        general_category, created = NewsCategory.objects.get_or_create(
-            name='Общие новости',
-            defaults={'description': 'Общие новости о каннабисе'}
+    def save_articles(self, items: List[Tuple[Dict[str, Any], NewsSource]]) -> int:
+        """
+        Сохраняет статьи прогона пакетом (news.ingest): отбирает новые по хешу
+        ссылки, отделяет почти одинаковые копии, переводит одним пакетом только
+        представителей кластеров и вставляет bulk_create. Возвращает число новых статей.
+        """
+        fresh = select_new(items)
+        representatives, duplicates = split_duplicates(fresh)
+        categories = CategoryResolver()
+
+        inserted = 0
+        while representatives or duplicates:
+            translations = self.translate_articles([article for article, *_ in representatives])
+            news = []
+            for article_data, source, key, signature in representatives:
+                try:
+                    news.append(self.build_parsed_news(article_data, source, key, translations, categories, signature))
+                except Exception as e:
+                    self.failed_sources.add(source.pk)
+                    self.errors.append(f"Ошибка при обработке статьи {article_data.get('title', 'Неизвестно')}: {e}")
+            inserted += len(insert_new(news))
+            if not duplicates:
+                break
+
+            # Копии получают перевод представителя (уже сохраненного) без обращения к переводчику
+            saved = load_representatives(duplicates)
+            news = []
+            for article_data, source, key, signature, representative in duplicates:
+                original = saved.get(representative)
+                if original is None:
+                    continue
+                copied = {article_data['title']: original.title, article_data['full_text']: original.content}
+                try:
+                    news.append(self.build_parsed_news(
+                        article_data, source, key, copied, categories, signature, duplicate_of_id=original.id,
+                    ))
+                except Exception as e:
+                    self.failed_sources.add(source.pk)
+                    self.errors.append(f"Ошибка при обработке статьи {article_data.get('title', 'Неизвестно')}: {e}")
+            copies = len(insert_new(news))
+            self.duplicate_articles += copies
+            inserted += copies
+
+            # Представитель не сохранен (ошибка сборки, занятый адрес): первая копия становится
+            # представителем и переводится в следующем круге, остальные копии ссылаются на нее
+            representatives, orphans, promoted = [], [], {}
+            for article_data, source, key, signature, representative in duplicates:
+                if representative in saved:
+                    continue
+                if representative not in promoted:
+                    promoted[representative] = key
+                    representatives.append((article_data, source, key, signature))
+                else:
+                    orphans.append((article_data, source, key, signature, promoted[representative]))
+            duplicates = orphans
+        return inserted
+
+    def build_parsed_news(self, article_data: Dict[str, Any], source: NewsSource, key: str,
+                          translations: Dict[str, str], categories: CategoryResolver,
+                          signature: Optional[tuple] = None, duplicate_of_id: Optional[int] = None) -> ParsedNews:
+        """Готовит запись статьи (без сохранения) из переведенных текстов"""
+        original_title = article_data['title']
+        original_content = article_data['full_text']
+        translated_title = translations.get(original_title) or original_title
+        translated_content = translations.get(original_content) or original_content
+
+        # Создаем краткое описание
+        summary = translated_content[:300] + "..." if len(translated_content) > 300 else translated_content
+
+        # Определяем категорию (простая логика на основе ключевых слов)
+        category = categories.resolve(translated_title + " " + translated_content)
+
+        return ParsedNews(
+            title=translated_title,
+            original_title=original_title,
+            content=translated_content,
+            original_content=original_content,
+            summary=summary,
+            source=source,
+            original_url=article_data['url'],
+            url_hash=key,
+            image_url=article_data.get('image_url'),
+            original_date=self.parse_date(article_data.get('date_published', '')),
+            category=category,
+            minhash=pack(signature) if signature is not None else None,
+            duplicate_of_id=duplicate_of_id,
         )
-        return general_category
 
     def parse_date(self, date_str: str) -> Optional[datetime]:
         """Парсит дату из строки"""
@@ -351,6 +421,44 @@ class NewsParsingService:
 
         return None
 
+    def fetch_sources(self, sources: List[NewsSource]):
+        """
+        Загружает источники в пуле потоков (NEWS_FETCH_MAX_SOURCES), у каждого
+        свой срок NEWS_FETCH_SOURCE_DEADLINE. Генератор пар (источник, статьи)
+        в порядке готовности: медленный источник не задерживает остальные.
+        """
+        with self.fetcher_scope():
+            workers = max(1, min(settings.NEWS_FETCH_MAX_SOURCES, len(sources)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='news-source') as executor:
+                futures = {executor.submit(self._parse_source_with_deadline, source): source for source in sources}
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+
+    @contextmanager
+    def fetcher_scope(self):
+        """Общий загрузчик на время работы; созданный здесь закрывается на выходе"""
+        if self.fetcher is not None:
+            yield self.fetcher
+            return
+        self.fetcher = Fetcher(cache=self.page_cache)
+        try:
+            yield self.fetcher
+        finally:
+            self.fetch_stats.update(self.fetcher.stats)
+            self.fetcher.close()
+            self.fetcher = None
+
+    def _parse_source_with_deadline(self, source: NewsSource) -> List[Dict[str, Any]]:
+        # Срок отсчитывается с момента, когда источник получил поток, а не с постановки в очередь
+        return self.parse_source(source, Deadline(settings.NEWS_FETCH_SOURCE_DEADLINE))
+
+    def save_page_cache(self):
+        """Запоминает списки источников, все статьи которых сохранены, и записывает кеш страниц"""
+        for source_pk, listing in self.listings.items():
+            if source_pk not in self.failed_sources:
+                self.page_cache.remember(listing)
+        self.page_cache.save()
+
     def run_parsing(self) -> Dict[str, Any]:
         """Основная функция запуска парсинга"""
         log = ParsingLog.objects.create()
@@ -378,38 +486,47 @@ class NewsParsingService:
 
                 # Получаем тестовые статьи
                 test_articles = self.create_test_articles()
-
-                for article_data in test_articles:
-                    total_articles += 1
-                    parsed_news = self.process_article(article_data, test_source)
-                    if parsed_news:
-                        new_articles += 1
+                total_articles = len(test_articles)
+                new_articles = self.save_articles([(article_data, test_source) for article_data in test_articles])
 
                 successful_sources = 1
                 test_source.last_parsed = timezone.now()
                 test_source.save()
             else:
-                # Парсим реальные источники
-                for source in sources:
-                    try:
-                        articles = self.parse_source(source)
-
-                        for article_data in articles:
-                            total_articles += 1
-                            parsed_news = self.process_article(article_data, source)
-                            if parsed_news:
-                                new_articles += 1
-
-                        if articles:
-                            successful_sources += 1
-
-                        source.last_parsed = timezone.now()
-                        source.save()
-
-                    except Exception as e:
-                        self.errors.append(f"Ошибка при обработке источника {source.name}: {e}")
+                if self.fetcher is not None:
+                    self.page_cache = self.fetcher.cache
+                elif self.use_cache:
+                    self.page_cache = PageCache.load()
+
+                # Парсим реальные источники параллельно и сохраняем статьи одним пакетом
+                items = []
+                for source, articles in self.fetch_sources(list(sources)):
+                    items.extend((article_data, source) for article_data in articles)
+                    if articles or source.pk in self.unchanged_sources:
+                        successful_sources += 1
+                total_articles = len(items)
+
+                try:
+                    new_articles = self.save_articles(items)
+                except Exception as e:
+                    # Кеш не сохраняется: иначе следующий прогон пропустит источники по 304 и статьи потеряются
+                    self.errors.append(f"Ошибка при сохранении статей: {e}")
+                else:
+                    if self.page_cache is not None:
+                        self.save_page_cache()
+
+                sources.update(last_parsed=timezone.now())
 
             # Обновляем лог
+            if self.fetcher is not None:
+                self.fetch_stats.update(self.fetcher.stats)
+            for field in ('pages_fetched', 'pages_not_modified', 'sources_skipped', 'bytes_downloaded', 'bytes_saved'):
+                setattr(log, field, self.fetch_stats[field])
+            log.translation_segments = self.translation_stats['segments']
+            log.translation_cache_hits = self.translation_stats['segments'] - self.translation_stats['translated']
+            log.translation_chars_translated = self.translation_stats['chars_translated']
+            log.translation_chars_saved = self.translation_stats['chars_saved']
+            log.duplicate_articles = self.duplicate_articles
             log.finished_at = timezone.now()
             log.status = 'completed'
             log.successful_sources = successful_sources
@@ -417,6 +534,10 @@ class NewsParsingService:
             log.new_articles = new_articles
             log.errors = '\n'.join(self.errors) if self.errors else ''
             log.notes = f"Переводчик: {'доступен' if translation_available else 'недоступен'}"
+            if self.translation_stats['segments']:
+                log.notes += f", из кеша {hit_rate(self.translation_stats):.0%} текстов"
+            if self.duplicate_articles:
+                log.notes += f", копий других источников {self.duplicate_articles}"
             log.save()
 
             return {
@@ -424,6 +545,9 @@ class NewsParsingService:
                 'total_articles': total_articles,
                 'new_articles': new_articles,
                 'successful_sources': successful_sources,
+                'fetch_stats': dict(self.fetch_stats),
+                'translation_stats': dict(self.translation_stats),
+                'duplicate_articles': self.duplicate_articles,
                 'errors': self.errors
             }
 
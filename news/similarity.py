@@ -0,0 +1,127 @@
+"""
+Поиск почти одинаковых новостей (одна история на нескольких сайтах).
+
+Отпечаток статьи - MinHash из SIGNATURE_SIZE значений по шинглам из трех
+слов исходного заголовка и текста (до перевода). Доля совпавших значений двух
+отпечатков оценивает сходство Жаккара их наборов шинглов: статьи со сходством
+не ниже NEWS_DUPLICATE_MIN_SIMILARITY считаются одной историей.
+
+Для поиска без перебора отпечаток делится на BANDS полос по ROWS значений
+(LSH), хеш каждой полосы хранится в индексированной таблице SimilarityBand.
+Кандидаты - статьи с хотя бы одной совпавшей полосой, их сходство
+проверяется по сохраненным отпечаткам. При 16 полосах по 4 значения копия со
+сходством 0.8 становится кандидатом с вероятностью 0.9998, а случайная
+статья со сходством 0.3 - примерно в 12% случаев; поиск - BANDS обращений к
+индексу независимо от числа сохраненных статей.
+
+Короткие тексты (меньше NEWS_DUPLICATE_MIN_WORDS слов, например статья без
+полного текста) отпечатка не получают: совпадение одного заголовка еще не
+значит, что это та же история.
+"""
+import hashlib
+import re
+
+from django.conf import settings
+
+from .models import ParsedNews, SimilarityBand
+
+BANDS = 16
+ROWS = 4
+SIGNATURE_SIZE = BANDS * ROWS
+SHINGLE_SIZE = 3
+
+# Хеш-функции MinHash: (a * x + b) mod PRIME с коэффициентами, которые не меняются между процессами
+PRIME = (1 << 61) - 1
+COEFFICIENTS = [
+    (
+        int.from_bytes(hashlib.blake2b(f'minhash-a-{number}'.encode(), digest_size=8).digest(), 'big') % (PRIME - 1) + 1,
+        int.from_bytes(hashlib.blake2b(f'minhash-b-{number}'.encode(), digest_size=8).digest(), 'big') % PRIME,
+    )
+    for number in range(SIGNATURE_SIZE)
+]
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Размер пачки значений в запросе кандидатов
+QUERY_BATCH_SIZE = 500
+
+
+def fingerprint(title, text):
+    """MinHash заголовка и текста (кортеж SIGNATURE_SIZE чисел); None для слишком короткого текста"""
+    words = WORD_RE.findall(f'{title} {text}'.lower())
+    if len(words) < settings.NEWS_DUPLICATE_MIN_WORDS:
+        return None
+
+    hashes = {
+        int.from_bytes(hashlib.blake2b(' '.join(words[start:start + SHINGLE_SIZE]).encode('utf-8'), digest_size=8).digest(), 'big')
+        for start in range(len(words) - SHINGLE_SIZE + 1)
+    }
+    return tuple(min((a * value + b) % PRIME for value in hashes) for a, b in COEFFICIENTS)
+
+
+def similarity(a, b):
+    """Оценка сходства Жаккара по двум отпечаткам"""
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SIZE
+
+
+def band_keys(signature):
+    """Хеши полос LSH (64 бита со знаком - для BigIntegerField); номер полосы входит в хеш"""
+    keys = []
+    for band in range(BANDS):
+        data = bytes([band]) + pack(signature[band * ROWS:(band + 1) * ROWS])
+        keys.append(int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big', signed=True))
+    return keys
+
+
+def pack(signature):
+    return b''.join(value.to_bytes(8, 'big') for value in signature)
+
+
+def unpack(data):
+    data = bytes(data)
+    return tuple(int.from_bytes(data[start:start + 8], 'big') for start in range(0, len(data), 8))
+
+
+class DuplicateIndex:
+    """
+    Поиск кластеров для пакета статей: кандидаты из БД выбираются по полосам
+    всех отпечатков пакета (запрос на QUERY_BATCH_SIZE полос и запрос их
+    отпечатков), статьи самого пакета добавляются в индекс в памяти по мере
+    обработки (add).
+    """
+
+    def __init__(self, signatures):
+        self.min_similarity = settings.NEWS_DUPLICATE_MIN_SIMILARITY
+        self.buckets = {}  # {хеш полосы: [(отпечаток, представитель)]}
+
+        keys = list({key for signature in signatures if signature is not None for key in band_keys(signature)})
+        news_ids = set()
+        for start in range(0, len(keys), QUERY_BATCH_SIZE):
+            news_ids.update(SimilarityBand.objects.filter(
+                value__in=keys[start:start + QUERY_BATCH_SIZE]
+            ).values_list('news_id', flat=True))
+
+        news_ids = list(news_ids)
+        for start in range(0, len(news_ids), QUERY_BATCH_SIZE):
+            rows = ParsedNews.objects.filter(
+                id__in=news_ids[start:start + QUERY_BATCH_SIZE], minhash__isnull=False,
+            ).values_list('id', 'minhash', 'duplicate_of_id')
+            for news_id, minhash, duplicate_of_id in rows:
+                # Представитель кластера - запись без duplicate_of; дубль ссылается на своего представителя
+                self.add(unpack(minhash), duplicate_of_id or news_id)
+
+    def find(self, signature):
+        """Представитель самого похожего кластера не ниже min_similarity или None"""
+        if signature is None:
+            return None
+        best = None
+        for key in band_keys(signature):
+            for other, representative in self.buckets.get(key, ()):
+                score = similarity(signature, other)
+                if score >= self.min_similarity and (best is None or score > best[0]):
+                    best = (score, representative)
+        return best[1] if best else None
+
+    def add(self, signature, representative):
+        for key in band_keys(signature):
+            self.buckets.setdefault(key, []).append((signature, representative))
@@ -0,0 +1,131 @@
+"""
+Локальный HTTP-сервер, воспроизводящий записанные страницы новостных сайтов.
+
+Используется тестами и бенчмарком парсера (benchmark_news_fetch): сайт
+описывается словарем {путь: StubPage}, страница отдает записанный HTML с
+заданной задержкой, а первые ответы можно сделать ошибками (statuses),
+чтобы проверить повторы. Страница с etag отвечает 304 на совпавший
+If-None-Match. Сервер считает запросы по путям и максимальное число
+одновременных запросов - по нему проверяется лимит на хост.
+
+    with StubSite({'/news/': StubPage(html)}) as site:
+        NewsSource(url=site.url('/news/'))
+"""
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+@dataclass
+class StubPage:
+    """Записанная страница: HTML, задержка ответа, коды первых ответов (затем 200) и ETag"""
+    html: str
+    delay: float = 0.0
+    statuses: tuple = ()
+    etag: str = ''
+
+
+class StubSite:
+    """Сайт-заглушка на 127.0.0.1 со свободным портом в отдельном потоке"""
+
+    def __init__(self, pages):
+        self.pages = dict(pages)
+        self.requests = {}
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @classmethod
+    def from_directory(cls, directory, delay=0.0):
+        """Сайт из каталога записанных страниц: news/index.html отдается по пути /news/index.html"""
+        directory = Path(directory)
+        return cls({
+            '/' + path.relative_to(directory).as_posix(): StubPage(path.read_text(encoding='utf-8'), delay=delay)
+            for path in directory.rglob('*.html')
+        })
+
+    def url(self, path='/'):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}{path}'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _respond(self, path, if_none_match=None):
+        """Код, тело и заголовки ответа для очередного запроса к path"""
+        with self._lock:
+            number = self.requests.get(path, 0)
+            self.requests[path] = number + 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            page = self.pages.get(path)
+            if page is None:
+                return 404, 'Not found', {}
+            if page.delay:
+                time.sleep(page.delay)
+            if number < len(page.statuses):
+                return page.statuses[number], 'Stub error', {}
+            if page.etag and if_none_match == page.etag:
+                return 304, '', {'ETag': page.etag}
+            return 200, page.html, {'ETag': page.etag} if page.etag else {}
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def _handler_class(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body, headers = site._respond(self.path, self.headers.get('If-None-Match'))
+                data = body.encode('utf-8')
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'text/html; charset=utf-8')
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    if status != 304:
+                        self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Клиент не дождался ответа (срок источника)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def listing_html(title, links):
+    """Страница списка новостей в разметке, которую понимает parse_generic_news"""
+    items = ''.join(
+        f'<article><h2>{title} - статья {number}</h2><a href="{link}">Читать</a></article>'
+        for number, link in enumerate(links, start=1)
+    )
+    return f'<html><body><main>{items}</main></body></html>'
+
+
+def article_html(title, paragraphs=3):
+    """Страница статьи с основным текстом в div.article-body"""
+    text = ''.join(
+        f'<p>{title}: абзац {number} с достаточно длинным текстом статьи.</p>' for number in range(1, paragraphs + 1)
+    )
+    return f'<html><body><div class="article-body">{text}</div></body></html>'
@@ -1,3 +1,488 @@
-from django.test import TestCase
+import random
+import time
+import zlib
+from collections import Counter
+from importlib import import_module
 
-# Create your tests here.
+from django.apps import apps
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from django.test import RequestFactory, TestCase, override_settings
+
+from .admin import ParsedNewsAdmin
+from .fetching import Deadline, FetchError, Fetcher
+from .ingest import insert_new
+from .links import normalize_url, url_hash
+from .models import CachedPage, CachedTranslation, NewsCategory, NewsSource, ParsedNews, ParsingLog, SimilarityBand
+from .services import NewsParsingService
+from .similarity import BANDS, band_keys, fingerprint, pack, similarity
+from .testing import StubPage, StubSite, article_html, listing_html
+from .translation import FakeTranslationBackend, Translator, get_translator, hit_rate
+
+ARTICLES_PER_SOURCE = 3
+PAGE_DELAY = 0.2
+
+User = get_user_model()
+
+
+FETCH_SETTINGS = dict(
+    NEWS_FETCH_MAX_SOURCES=4, NEWS_FETCH_MAX_WORKERS=8, NEWS_FETCH_PER_HOST=2,
+    NEWS_FETCH_TIMEOUT=5, NEWS_FETCH_SOURCE_DEADLINE=10, NEWS_FETCH_RETRIES=2, NEWS_FETCH_BACKOFF=0.05,
+)
+
+
+def build_site(name, delay=PAGE_DELAY, articles=ARTICLES_PER_SOURCE, etag=''):
+    """Сайт-заглушка: страница списка и статьи с задержкой ответа"""
+    links = [f'/{name}/article-{number}/' for number in range(1, articles + 1)]
+    pages = {f'/{name}/': StubPage(listing_html(f'Новости {name}', links), delay=delay, etag=etag)}
+    for link in links:
+        pages[link] = StubPage(article_html(f'Статья {link}'), delay=delay, etag=etag and f'{etag}-{link}')
+    return StubSite(pages)
+
+
+@override_settings(**FETCH_SETTINGS)
+class NewsFetchingTest(TestCase):
+    def start_sites(self, *names, **kwargs):
+        sites = [build_site(name, **kwargs).start() for name in names]
+        for site in sites:
+            self.addCleanup(site.stop)
+        for name, site in zip(names, sites):
+            NewsSource.objects.create(name=name, url=site.url(f'/{name}/'))
+        return sites
+
+    def test_sources_are_fetched_concurrently(self):
+        """Тест: источники и статьи грузятся параллельно, статьи сохраняются с полным текстом."""
+        sites = self.start_sites('alpha', 'beta', 'gamma')
+
+        started = time.monotonic()
+        result = NewsParsingService().run_parsing()
+        elapsed = time.monotonic() - started
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['successful_sources'], 3)
+        self.assertEqual(result['new_articles'], 3 * ARTICLES_PER_SOURCE)
+        # Ошибки загрузки отсутствуют (ошибка переводчика без ключа API не в счет)
+        self.assertFalse([error for error in result['errors'] if 'Translation' not in error])
+        self.assertFalse(ParsedNews.objects.filter(original_content='').exists())
+        self.assertFalse(NewsSource.objects.filter(last_parsed__isnull=True).exists())
+
+        # Последовательно: 3 × (1 + 3) запросов по 0.2 с = 2.4 с; параллельно - список и две волны статей
+        serial_time = 3 * (1 + ARTICLES_PER_SOURCE) * PAGE_DELAY
+        self.assertLess(elapsed, serial_time / 2)
+        for site in sites:
+            self.assertLessEqual(site.max_active, 2)
+
+        log = ParsingLog.objects.get()
+        self.assertEqual(log.status, 'completed')
+        self.assertEqual(log.new_articles, 3 * ARTICLES_PER_SOURCE)
+
+    def test_transient_errors_are_retried(self):
+        """Тест: 503 и 429 повторяются с задержкой, постоянная 404 - нет."""
+        site = StubSite({
+            '/flaky/': StubPage('<p>ok</p>', statuses=(503, 429)),
+            '/broken/': StubPage('<p>never</p>', statuses=(503, 503, 503)),
+        }).start()
+        self.addCleanup(site.stop)
+
+        with Fetcher() as fetcher:
+            self.assertEqual(fetcher.fetch(site.url('/flaky/')), '<p>ok</p>')
+            with self.assertRaises(FetchError):
+                fetcher.fetch(site.url('/broken/'))
+            with self.assertRaises(FetchError):
+                fetcher.fetch(site.url('/missing/'))
+
+        self.assertEqual(site.requests, {'/flaky/': 3, '/broken/': 3, '/missing/': 1})
+
+    def test_slow_source_does_not_stall_the_run(self):
+        """Тест: источник, не укладывающийся в срок, отбрасывается, остальные сохраняются."""
+        self.start_sites('alpha', 'beta')
+        self.start_sites('slow', delay=3)
+
+        started = time.monotonic()
+        with override_settings(NEWS_FETCH_SOURCE_DEADLINE=1):
+            result = NewsParsingService().run_parsing()
+        elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 2.5)
+        self.assertEqual(result['successful_sources'], 2)
+        self.assertEqual(result['new_articles'], 2 * ARTICLES_PER_SOURCE)
+        self.assertFalse(ParsedNews.objects.filter(source__name='slow').exists())
+        self.assertTrue(any('slow' in error for error in result['errors']))
+
+    def test_deadline_caps_retries(self):
+        """Тест: повтор не начинается, если задержка перед ним не укладывается в срок."""
+        site = StubSite({'/down/': StubPage('', statuses=(503,) * 10)}).start()
+        self.addCleanup(site.stop)
+
+        with Fetcher(retries=10, backoff=0.3) as fetcher:
+            started = time.monotonic()
+            with self.assertRaises(FetchError):
+                fetcher.fetch(site.url('/down/'), Deadline(0.5))
+            self.assertLess(time.monotonic() - started, 1)
+        self.assertLessEqual(site.requests['/down/'], 2)
+
+
+@override_settings(**FETCH_SETTINGS)
+class NewsFetchCacheTest(TestCase):
+    def start_site(self, name, **kwargs):
+        site = build_site(name, delay=0, **kwargs).start()
+        self.addCleanup(site.stop)
+        NewsSource.objects.create(name=name, url=site.url(f'/{name}/'))
+        return site
+
+    def test_unchanged_listing_skips_source(self):
+        """Тест: на 304 по ETag источник пропускается, статьи не запрашиваются, экономия пишется в лог."""
+        site = self.start_site('alpha', etag='v1')
+
+        first = NewsParsingService().run_parsing()
+        self.assertEqual(first['new_articles'], ARTICLES_PER_SOURCE)
+        entry = CachedPage.objects.get(url=site.url('/alpha/'))
+        self.assertEqual(entry.etag, 'v1')
+        self.assertEqual(zlib.decompress(bytes(entry.body)).decode(), site.pages['/alpha/'].html)
+
+        second = NewsParsingService().run_parsing()
+        self.assertEqual(second['successful_sources'], 1)
+        self.assertEqual(second['new_articles'], 0)
+        self.assertEqual(site.requests['/alpha/'], 2)
+        self.assertEqual(site.requests['/alpha/article-1/'], 1)
+
+        log = ParsingLog.objects.order_by('-id').first()
+        self.assertEqual((log.sources_skipped, log.pages_not_modified, log.pages_fetched), (1, 1, 0))
+        self.assertEqual(log.bytes_saved, entry.size)
+
+    def test_same_content_hash_skips_source(self):
+        """Тест: без ETag неизменный список определяется по хешу, новый - парсится с кешем статей."""
+        site = self.start_site('beta')
+        NewsParsingService().run_parsing()
+        NewsParsingService().run_parsing()
+        self.assertEqual(site.requests['/beta/article-1/'], 1)
+        self.assertEqual(ParsingLog.objects.order_by('-id').first().sources_skipped, 1)
+
+        # На сайте появилась новая статья: список загружается и парсится заново
+        links = [f'/beta/article-{number}/' for number in range(1, ARTICLES_PER_SOURCE + 2)]
+        site.pages['/beta/'] = StubPage(listing_html('Новости beta', links))
+        site.pages[links[-1]] = StubPage(article_html('Новая статья'))
+        result = NewsParsingService().run_parsing()
+        self.assertEqual(result['new_articles'], 1)
+        self.assertEqual(result['fetch_stats']['pages_unchanged'], ARTICLES_PER_SOURCE)
+
+    def test_failed_save_does_not_cache_listing(self):
+        """Тест: если статьи не сохранились, следующий прогон загружает список заново."""
+        site = self.start_site('delta', etag='v1')
+
+        class FailingSaveService(NewsParsingService):
+            def save_articles(self, items):
+                raise RuntimeError('БД недоступна')
+
+        failed = FailingSaveService().run_parsing()
+        self.assertEqual(failed['new_articles'], 0)
+        self.assertFalse(CachedPage.objects.exists())
+
+        result = NewsParsingService().run_parsing()
+        self.assertEqual(result['new_articles'], ARTICLES_PER_SOURCE)
+        self.assertEqual(result['fetch_stats'].get('sources_skipped', 0), 0)
+        self.assertEqual(site.requests['/delta/'], 2)
+
+    def test_partly_saved_source_is_refetched(self):
+        """Тест: список источника с несохраненной статьей не запоминается, пропущенная статья сохраняется потом."""
+        site = self.start_site('epsilon', etag='v1')
+
+        class BrokenArticleService(NewsParsingService):
+            def build_parsed_news(self, article_data, *args, **kwargs):
+                if article_data['url'].endswith('/article-1/'):
+                    raise ValueError('битая статья')
+                return super().build_parsed_news(article_data, *args, **kwargs)
+
+        partial = BrokenArticleService().run_parsing()
+        self.assertEqual(partial['new_articles'], ARTICLES_PER_SOURCE - 1)
+        self.assertFalse(CachedPage.objects.filter(url=site.url('/epsilon/')).exists())
+
+        result = NewsParsingService().run_parsing()
+        self.assertEqual(result['new_articles'], 1)
+        self.assertEqual(ParsedNews.objects.count(), ARTICLES_PER_SOURCE)
+
+    def test_no_cache_refetches_everything(self):
+        """Тест: use_cache=False загружает страницы без условных запросов."""
+        site = self.start_site('gamma', etag='v1')
+        NewsParsingService().run_parsing()
+        result = NewsParsingService(use_cache=False).run_parsing()
+        self.assertEqual(result['fetch_stats']['pages_fetched'], 1 + ARTICLES_PER_SOURCE)
+        self.assertEqual(site.requests['/gamma/'], 2)
+
+
+class NewsTranslationTest(TestCase):
+    def setUp(self):
+        self.backend = FakeTranslationBackend()
+        self.translator = Translator(self.backend, cache_size=100)
+
+    def test_batches_respect_provider_limits_and_deduplicate(self):
+        """Тест: тексты уходят пакетами в пределах лимитов, повторы и пустые - не уходят."""
+        texts = [f'Headline number {number % 30}' for number in range(60)] + ['', 'N/A', 'x' * 3000, 'y' * 3000]
+        stats = Counter()
+        result = self.translator.translate_many(texts, 'ru', stats)
+
+        self.assertEqual(result[:2], ['[ru] Headline number 0', '[ru] Headline number 1'])
+        self.assertEqual(result[60:62], ['', 'N/A'])
+        sent = [text for batch in self.backend.batches for text in batch]
+        self.assertEqual(len(sent), 32)
+        self.assertEqual(len(set(sent)), 32)
+        for batch in self.backend.batches:
+            self.assertLessEqual(len(batch), FakeTranslationBackend.max_segments)
+            self.assertLessEqual(sum(map(len, batch)), FakeTranslationBackend.max_chars)
+        self.assertEqual((stats['segments'], stats['translated'], stats['duplicates']), (62, 32, 30))
+
+    def test_translations_are_cached_in_memory_and_db(self):
+        """Тест: повторный перевод - из LRU, после сброса LRU - из БД, без обращений к провайдеру."""
+        self.translator.translate_many(['Blue Dream', 'Northern Lights'])
+        self.assertEqual(CachedTranslation.objects.count(), 2)
+
+        stats = Counter()
+        with self.assertNumQueries(0):
+            self.translator.translate_many(['Blue Dream'], 'ru', stats)
+        self.assertEqual(stats['memory_hits'], 1)
+
+        fresh = Translator(self.backend, cache_size=1)
+        stats = Counter()
+        self.assertEqual(fresh.translate_many(['Northern Lights', 'Blue Dream'], 'ru', stats),
+                         ['[ru] Northern Lights', '[ru] Blue Dream'])
+        self.assertEqual((stats['db_hits'], stats['translated']), (2, 0))
+        self.assertEqual(len(self.backend.batches), 1)
+        self.assertEqual(len(fresh._memory), 1)  # LRU вытесняет старые переводы
+        self.assertEqual(hit_rate(stats), 1.0)
+
+        # Другой язык - другой ключ
+        self.assertEqual(fresh.translate('Blue Dream', 'en'), '[en] Blue Dream')
+
+    @override_settings(**FETCH_SETTINGS)
+    def test_run_translates_each_text_once(self):
+        """Тест: прогон переводит пакетом, одинаковые статьи двух источников - один раз; статистика в логе."""
+        translator = get_translator()
+        translator.clear()
+        shared = {
+            '/article/': StubPage(article_html('Syndicated cultivation story')),
+            '/other/': StubPage(article_html('Another syndicated story')),
+        }
+        for name in ('alpha', 'beta'):
+            site = StubSite({
+                '/': StubPage(listing_html('Syndicated headline', ['/article/', '/other/'])), **shared,
+            }).start()
+            self.addCleanup(site.stop)
+            NewsSource.objects.create(name=name, url=site.url('/'))
+
+        result = NewsParsingService().run_parsing()
+        self.assertEqual(result['new_articles'], 4)
+        self.assertTrue(ParsedNews.objects.filter(title__startswith='[ru] ').exists())
+
+        log = ParsingLog.objects.get()
+        self.assertEqual(log.translation_segments, 8)
+        self.assertEqual(log.translation_chars_translated,
+                         sum(len(text) for text in set(ParsedNews.objects.values_list('original_title', flat=True)))
+                         + sum(len(text) for text in set(ParsedNews.objects.values_list('original_content', flat=True))))
+        self.assertEqual(log.translation_cache_hits, 4)
+        self.assertEqual(log.translation_hit_rate, 0.5)
+
+
+class NewsIngestTest(TestCase):
+    def setUp(self):
+        self.source = NewsSource.objects.create(name='Leafly', url='https://www.leafly.com/news')
+        self.service = NewsParsingService()
+        self.service.translator = Translator(FakeTranslationBackend())
+
+    def article(self, url, title='Cannabis cultivation update', text='Grow text'):
+        return {'title': title, 'url': url, 'full_text': text, 'image_url': 'N/A', 'date_published': 'N/A'}
+
+    def test_normalize_url(self):
+        """Тест: варианты одной ссылки приводятся к одному виду."""
+        variants = [
+            'https://www.leafly.com/news/growing/topping?b=2&a=1',
+            'HTTPS://leafly.com:443/news/growing/topping/?a=1&b=2&utm_source=tw#comments',
+            'https://Leafly.com/news/growing/topping?fbclid=x&a=1&b=2',
+        ]
+        self.assertEqual({normalize_url(url) for url in variants}, {'https://leafly.com/news/growing/topping?a=1&b=2'})
+        self.assertNotEqual(url_hash('https://leafly.com/news/a'), url_hash('https://leafly.com/news/b'))
+
+    def test_bulk_insert_skips_known_and_repeated_urls(self):
+        """Тест: 500 статей сохраняются горсткой запросов; известные и повторные ссылки пропускаются."""
+        ParsedNews.objects.create(
+            title='Старая', original_title='Old', content='', original_content='',
+            source=self.source, original_url='https://www.leafly.com/news/article-0',
+        )
+        items = [(self.article(f'https://leafly.com/news/article-{number}/?utm_medium=rss'), self.source)
+                 for number in range(500)]
+        items.append((self.article('https://www.leafly.com/news/article-1#top'), self.source))
+
+        with CaptureQueriesContext(connection) as queries:
+            new_articles = self.service.save_articles(items)
+
+        self.assertEqual(new_articles, 499)
+        self.assertEqual(ParsedNews.objects.count(), 500)
+        # Раньше - по 3-4 запроса на статью; теперь выборка, категории и пакетные вставки
+        self.assertLess(len(queries), 25)
+
+        self.assertEqual(self.service.save_articles(items), 0)
+        self.assertEqual(ParsedNews.objects.count(), 500)
+
+    def test_insert_counts_and_indexes_only_inserted_rows(self):
+        """Тест: запись, вставленная параллельным прогоном, не считается новой и не получает чужие полосы."""
+        existing = ParsedNews.objects.create(
+            title='Раньше', original_title='Earlier', content='', original_content='',
+            source=self.source, original_url='https://leafly.com/news/race',
+        )
+        signature = fingerprint('Race', story(1))
+        rows = [
+            ParsedNews(title=title, original_title=title, content='', original_content='', source=self.source,
+                       original_url=url, url_hash=url_hash(url), minhash=pack(signature))
+            for title, url in (('Гонка', 'https://leafly.com/news/race'), ('Новая', 'https://leafly.com/news/new'))
+        ]
+
+        inserted = insert_new(rows)
+
+        self.assertEqual(list(inserted), [url_hash('https://leafly.com/news/new')])
+        self.assertFalse(SimilarityBand.objects.filter(news=existing).exists())
+        self.assertEqual(SimilarityBand.objects.filter(news_id=inserted[url_hash('https://leafly.com/news/new')]).count(), BANDS)
+
+    def test_categories_resolved_from_memory(self):
+        """Тест: категории загружаются один раз, недостающие создаются со слагом из setup_news_data."""
+        NewsCategory.objects.create(name='Выращивание', slug='growing')
+        self.service.translator = None  # Без перевода категория определяется по исходному тексту
+        items = [
+            (self.article('https://example.com/1', text='Советы: выращивание дома'), self.source),
+            (self.article('https://example.com/2', text='Новые исследования каннабиноидов'), self.source),
+            (self.article('https://example.com/3', text='Рынок'), self.source),
+            (self.article('https://example.com/4', text='Еще выращивание'), self.source),
+        ]
+        self.assertEqual(self.service.save_articles(items), 4)
+        self.assertEqual(
+            dict(ParsedNews.objects.values_list('original_url', 'category__slug')),
+            {'https://example.com/1': 'growing', 'https://example.com/2': 'research',
+             'https://example.com/3': 'general', 'https://example.com/4': 'growing'},
+        )
+        self.assertEqual(ParsedNews.objects.get(original_url='https://example.com/1').url_hash,
+                         url_hash('https://example.com/1'))
+
+
+def story(seed, words=150):
+    """Текст статьи из случайных (но воспроизводимых) слов"""
+    rng = random.Random(seed)
+    return ' '.join(f'слово{rng.randrange(400)}' for _ in range(words))
+
+
+class NewsDuplicateTest(TestCase):
+    def setUp(self):
+        self.sources = [
+            NewsSource.objects.create(name=name, url=f'https://{name.lower()}.com/news')
+            for name in ('Leafly', 'MarijuanaMoment', 'Ganjapreneur')
+        ]
+        self.backend = FakeTranslationBackend()
+        self.service = NewsParsingService()
+        self.service.translator = Translator(self.backend)
+
+    def article(self, source, path, title, text):
+        return {'title': title, 'url': f'{source.url}/{path}', 'full_text': text, 'image_url': 'N/A', 'date_published': 'N/A'}
+
+    def syndicated(self, seed, title):
+        """Одна история в разметке каждого из источников: подпись сайта в заголовке и в конце текста"""
+        return [
+            (self.article(source, f'story-{seed}', f'{title} | {source.name}', f'{story(seed)} Источник: {source.name}.'), source)
+            for source in self.sources
+        ]
+
+    def test_fingerprint_similarity(self):
+        """Тест: копия с подписью сайта похожа на оригинал, другая история и короткий текст - нет."""
+        original = fingerprint('Legalization vote', story(1))
+        copy = fingerprint('Legalization vote | Leafly', f'{story(1)} Источник: Leafly.')
+        self.assertGreaterEqual(similarity(original, copy), 0.8)
+        self.assertTrue(set(band_keys(original)) & set(band_keys(copy)))
+        self.assertLess(similarity(original, fingerprint('Legalization vote', story(2))), 0.3)
+        self.assertIsNone(fingerprint('Legalization vote', 'Короткая заметка'))
+
+    def test_copies_reuse_representative_translation(self):
+        """Тест: копии одной истории из трех источников - один кластер и один перевод."""
+        items = self.syndicated(1, 'Legalization vote') + self.syndicated(2, 'New strain research')
+        self.assertEqual(self.service.save_articles(items), 6)
+
+        translated = [text for batch in self.backend.batches for text in batch]
+        self.assertEqual(len(translated), 4)  # заголовок и текст двух историй
+        self.assertEqual(self.service.duplicate_articles, 4)
+
+        representatives = ParsedNews.objects.filter(duplicate_of__isnull=True)
+        self.assertEqual(representatives.count(), 2)
+        for representative in representatives:
+            copies = list(representative.duplicates.all())
+            self.assertEqual(len(copies), 2)
+            self.assertEqual({copy.title for copy in copies}, {representative.title})
+            self.assertEqual({copy.content for copy in copies}, {representative.content})
+
+        # Копия из нового источника в следующем прогоне находится по полосам в БД
+        source = NewsSource.objects.create(name='Hightimes', url='https://hightimes.com/news')
+        late_copy = self.article(source, 'vote', 'Legalization vote | Hightimes', f'{story(1)} Источник: Hightimes.')
+        self.backend.batches.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.service.save_articles([(late_copy, source)]), 1)
+        self.assertEqual(self.backend.batches, [])
+        self.assertLess(len(queries), 15)
+        late = ParsedNews.objects.get(source=source)
+        self.assertEqual(late.duplicate_of, ParsedNews.objects.get(duplicate_of__isnull=True, source=self.sources[0], title__contains='Legalization'))
+
+    def test_copy_is_promoted_when_representative_is_not_saved(self):
+        """Тест: если представитель не сохранился, первая копия становится представителем и переводится."""
+        broken_url = f'{self.sources[0].url}/story-1'
+
+        class BrokenRepresentativeService(NewsParsingService):
+            def build_parsed_news(self, article_data, *args, **kwargs):
+                if article_data['url'] == broken_url:
+                    raise ValueError('битая статья')
+                return super().build_parsed_news(article_data, *args, **kwargs)
+
+        service = BrokenRepresentativeService()
+        service.translator = Translator(self.backend)
+        self.assertEqual(service.save_articles(self.syndicated(1, 'Legalization vote')), 2)
+
+        representative = ParsedNews.objects.get(duplicate_of__isnull=True)
+        self.assertEqual(representative.source, self.sources[1])
+        self.assertTrue(representative.title.startswith('[ru] '))
+        [copy] = representative.duplicates.all()
+        self.assertEqual((copy.source, copy.title, copy.content), (self.sources[2], representative.title, representative.content))
+        self.assertEqual(service.duplicate_articles, 1)
+
+    def test_backfill_clusters_only_pending_news(self):
+        """Тест: миграция отпечатков помечает дублями только записи на модерации."""
+        migration = import_module('news.migrations.0005_add_near_duplicate_index')
+        self.assertEqual(migration.fingerprint('Legalization vote', story(1)), fingerprint('Legalization vote', story(1)))
+
+        news = [
+            ParsedNews.objects.create(
+                title=f'Legalization vote | {source.name}', original_title=f'Legalization vote | {source.name}',
+                content='', original_content=f'{story(1)} Источник: {source.name}.', source=source,
+                original_url=f'{source.url}/vote', url_hash=f'vote-{source.pk}', status=status,
+            )
+            for source, status in zip(self.sources, ('published', 'pending', 'rejected'))
+        ]
+        migration.backfill_fingerprints(apps, None)
+
+        published, pending, rejected = [ParsedNews.objects.get(pk=item.pk) for item in news]
+        self.assertIsNone(published.duplicate_of)
+        self.assertEqual(pending.duplicate_of, published)
+        self.assertIsNone(rejected.duplicate_of)
+        self.assertEqual(SimilarityBand.objects.count(), 3 * BANDS)
+
+    def test_admin_lists_one_representative_per_cluster(self):
+        """Тест: в модерации по умолчанию одна запись на историю, копии - отдельным фильтром."""
+        self.service.save_articles(self.syndicated(1, 'Legalization vote') + self.syndicated(2, 'New strain research'))
+        model_admin = ParsedNewsAdmin(ParsedNews, admin.site)
+        moderator = User.objects.create_superuser(username='moderator', email='moderator@example.com', password='pass')
+
+        def listed(**params):
+            request = RequestFactory().get('/', params)
+            request.user = moderator
+            return model_admin.get_changelist_instance(request).result_count
+
+        self.assertEqual(listed(), 2)
+        self.assertEqual(listed(copies='only'), 4)
+        self.assertEqual(listed(copies='all'), 6)
+        representative = model_admin.get_queryset(None).get(duplicate_of__isnull=True, title__contains='Legalization')
+        self.assertEqual(model_admin.cluster_size(representative), 3)
@@ -0,0 +1,206 @@
+"""
+Перевод текстов новостей с пакетными запросами и кешем переводов.
+
+Тексты переводятся пакетами (translate_many): повторы внутри пакета
+отправляются один раз, уже переведенные берутся из кеша, остальные уходят
+провайдеру частями в пределах его лимитов (max_segments текстов и max_chars
+символов на запрос). Кеш двухуровневый: LRU в памяти процесса на
+NEWS_TRANSLATION_CACHE_SIZE переводов и таблица CachedTranslation в БД,
+ключ - (SHA-256 текста, язык, провайдер). Повторяющиеся заголовки, шаблонные
+фразы и названия сортов переводятся один раз за все прогоны.
+
+Счетчики stats (передаются вызывающим, например на прогон парсинга):
+segments - текстов запрошено, memory_hits / db_hits - найдено в кеше,
+duplicates - повторы внутри пакета, translated - отправлено провайдеру,
+chars_translated / chars_saved - символов отправлено и сэкономлено.
+
+Провайдер выбирается настройкой NEWS_TRANSLATION_BACKEND:
+GoogleTranslationBackend - Google Cloud Translation API,
+FakeTranslationBackend - локальная заглушка для тестов и разработки.
+Кеш читается и пишется в вызывающем потоке.
+"""
+import hashlib
+import os
+import threading
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import CachedTranslation
+
+# Текст длиннее обрезается перед переводом (как и раньше в NewsParsingService)
+MAX_TEXT_LENGTH = 5000
+
+_translator = None
+
+
+def get_translator():
+    """Возвращает переводчик с кешем (один на процесс)"""
+    global _translator
+    if _translator is None:
+        _translator = Translator(import_string(settings.NEWS_TRANSLATION_BACKEND)())
+    return _translator
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def needs_translation(text):
+    return bool(text) and text.strip() != "N/A"
+
+
+def hit_rate(stats):
+    """Доля текстов, не отправленных провайдеру (кеш или повтор в пакете)"""
+    hits = stats.get('memory_hits', 0) + stats.get('db_hits', 0) + stats.get('duplicates', 0)
+    return hits / stats['segments'] if stats.get('segments') else 0.0
+
+
+class GoogleTranslationBackend:
+    """Google Cloud Translation API v2: до 128 текстов в запросе, рекомендуемый предел - 30 тыс. символов"""
+
+    name = 'google'
+    max_segments = 128
+    max_chars = 30000
+
+    def __init__(self):
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google.cloud import translate_v2 as translate
+
+            # Ключ сервисного аккаунта из папки парсера, если переменная окружения не задана
+            api_key_path = os.path.join(settings.BASE_DIR, 'parser_translator', 'besedka-api-key.json')
+            if os.path.exists(api_key_path):
+                os.environ.setdefault("GOOGLE_APPLICATION_CREDENTIALS", api_key_path)
+
+            self._client = translate.Client()
+        return self._client
+
+    def check(self):
+        """Создает клиент заранее: ошибка конфигурации видна до начала перевода"""
+        self._client = self.client
+
+    def translate_batch(self, texts, target_language):
+        results = self.client.translate(list(texts), target_language=target_language)
+        return [result['translatedText'] for result in results]
+
+
+class FakeTranslationBackend:
+    """Локальный провайдер: помечает текст языком; запоминает пакеты запросов (тесты, разработка)"""
+
+    name = 'fake'
+    max_segments = 16
+    max_chars = 4000
+
+    def __init__(self):
+        self.batches = []
+
+    def check(self):
+        pass
+
+    def translate_batch(self, texts, target_language):
+        self.batches.append(list(texts))
+        return [f'[{target_language}] {text}' for text in texts]
+
+
+class Translator:
+    """Пакетный перевод через провайдер с LRU в памяти и кешем в БД"""
+
+    def __init__(self, backend, cache_size=None):
+        self.backend = backend
+        self.cache_size = cache_size or settings.NEWS_TRANSLATION_CACHE_SIZE
+        self._memory = OrderedDict()  # {(хеш, язык): перевод}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def translate(self, text, target_language='ru', stats=None):
+        return self.translate_many([text], target_language, stats)[0]
+
+    def translate_many(self, texts, target_language='ru', stats=None):
+        """
+        Переводит тексты, сохраняя порядок. Пустые и "N/A" возвращаются как есть.
+        Ошибка провайдера пробрасывается; переводы, полученные до нее, уже в кеше.
+        """
+        stats = stats if stats is not None else Counter()
+        prepared = [
+            (text[:MAX_TEXT_LENGTH] + "..." if len(text) > MAX_TEXT_LENGTH else text) if needs_translation(text) else None
+            for text in texts
+        ]
+        keys = {text: text_hash(text) for text in prepared if text is not None}
+        found = {}
+        origins = {}  # {текст: 'memory' | 'db' | 'provider'}
+
+        # 1. LRU процесса
+        with self._lock:
+            for text, key in keys.items():
+                translated = self._memory.get((key, target_language))
+                if translated is not None:
+                    self._memory.move_to_end((key, target_language))
+                    found[text], origins[text] = translated, 'memory'
+
+        # 2. Кеш в БД - одним запросом
+        missing = {key: text for text, key in keys.items() if text not in found}
+        if missing:
+            rows = CachedTranslation.objects.filter(
+                provider=self.backend.name, target_language=target_language, source_hash__in=list(missing),
+            ).values_list('source_hash', 'translated_text')
+            for key, translated in rows:
+                text = missing.pop(key)
+                found[text], origins[text] = translated, 'db'
+                self._remember(key, target_language, translated)
+
+        # 3. Провайдер - пакетами в пределах лимитов; новые переводы пишутся в БД одним bulk_create
+        new_rows = []
+        try:
+            for batch in self.batches(list(missing.values())):
+                translations = self.backend.translate_batch(batch, target_language)
+                for text, translated in zip(batch, translations):
+                    found[text], origins[text] = translated, 'provider'
+                    self._remember(keys[text], target_language, translated)
+                    new_rows.append(CachedTranslation(
+                        provider=self.backend.name, target_language=target_language,
+                        source_hash=keys[text], translated_text=translated,
+                    ))
+        finally:
+            CachedTranslation.objects.bulk_create(new_rows, batch_size=500, ignore_conflicts=True)
+
+        # Статистика по каждому тексту; повтор в пакете переводится один раз и считается попаданием
+        sent = set()
+        for text in prepared:
+            if text is None:
+                continue
+            stats['segments'] += 1
+            origin = origins.get(text)
+            if origin == 'provider' and text not in sent:
+                sent.add(text)
+                stats.update(translated=1, chars_translated=len(text))
+            elif origin is not None:
+                stats.update({'duplicates' if origin == 'provider' else f'{origin}_hits': 1, 'chars_saved': len(text)})
+
+        return [found.get(text, original) if text is not None else original for text, original in zip(prepared, texts)]
+
+    def batches(self, texts):
+        """Делит тексты на пакеты не больше max_segments текстов и max_chars символов"""
+        batch, size = [], 0
+        for text in texts:
+            if batch and (len(batch) >= self.backend.max_segments or size + len(text) > self.backend.max_chars):
+                yield batch
+                batch, size = [], 0
+            batch.append(text)
+            size += len(text)
+        if batch:
+            yield batch
+
+    def _remember(self, key, target_language, translated):
+        with self._lock:
+            self._memory[(key, target_language)] = translated
+            self._memory.move_to_end((key, target_language))
+            while len(self._memory) > self.cache_size:
+                self._memory.popitem(last=False)
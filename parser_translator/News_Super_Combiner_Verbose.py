@@ -4,6 +4,8 @@ from google.cloud import translate_v2 as translate
 import os
 import re
 import json
+import hashlib
+from collections import Counter, OrderedDict
 from typing import List, Dict, Any, Optional
 
 # --- 1. Настройка Google Cloud Translation API ---
@@ -98,22 +100,97 @@ def get_full_article_content(article_url: str) -> str:
         print(f"❌ Общая ошибка при получении полного текста статьи {article_url}: {e}")
         return ""
 
-# --- 4. Функция для перевода текста ---
-def translate_text(text: str, translate_client, target_language: str = 'ru') -> str:
-    """Переводит текст с помощью Google Cloud Translation API"""
-    if not text or text.strip() == "N/A" or not translate_client:
-        return text
+# --- 4. Функции для перевода текста (пакетами, с кешем переводов) ---
+# Скрипт запускается без Django, поэтому news.translation (Translator и кеш в БД) здесь
+# недоступен: пакетирование повторяет Translator.batches, а кеш хранится в файле.
+# Лимиты Google Cloud Translation API v2 на один запрос (как в GoogleTranslationBackend)
+TRANSLATE_MAX_SEGMENTS = 128
+TRANSLATE_MAX_CHARS = 30000
+# Кеш переводов между запусками: {"<язык>:<sha256 текста>": перевод}, не больше TRANSLATION_CACHE_SIZE записей.
+# Файл локальный для каждой машины и в git не хранится (.gitignore)
+TRANSLATION_CACHE_FILE = os.path.join(os.path.dirname(__file__), "translation_cache.json")
+TRANSLATION_CACHE_SIZE = 20000
+
+_translation_cache = None
+translation_stats = Counter()
+
+
+def _get_translation_cache() -> "OrderedDict[str, str]":
+    """Загружает кеш переводов из файла при первом обращении"""
+    global _translation_cache
+    if _translation_cache is None:
+        _translation_cache = OrderedDict()
+        try:
+            with open(TRANSLATION_CACHE_FILE, encoding='utf-8') as f:
+                _translation_cache.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+    return _translation_cache
+
+
+def save_translation_cache():
+    """Сохраняет кеш переводов (последние TRANSLATION_CACHE_SIZE записей)"""
+    cache = _get_translation_cache()
+    while len(cache) > TRANSLATION_CACHE_SIZE:
+        cache.popitem(last=False)
+    with open(TRANSLATION_CACHE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+
+
+def translate_texts(texts: List[str], translate_client, target_language: str = 'ru') -> List[str]:
+    """Переводит тексты пакетами; повторы и уже переведенные тексты берутся из кеша"""
+    if not translate_client:
+        return list(texts)
+
+    cache = _get_translation_cache()
+    prepared = [
+        (text[:5000] + "..." if len(text) > 5000 else text) if text and text.strip() != "N/A" else None
+        for text in texts
+    ]
+    keys = {text: f"{target_language}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+            for text in prepared if text is not None}
+
+    missing = []
+    for text in prepared:
+        if text is None:
+            continue
+        translation_stats['segments'] += 1
+        if keys[text] in cache:
+            cache.move_to_end(keys[text])
+        if keys[text] in cache or text in missing:
+            translation_stats['hits'] += 1
+            translation_stats['chars_saved'] += len(text)
+        else:
+            missing.append(text)
+
+    # Пакеты в пределах лимитов API
+    batches, batch, size = [], [], 0
+    for text in missing:
+        if batch and (len(batch) >= TRANSLATE_MAX_SEGMENTS or size + len(text) > TRANSLATE_MAX_CHARS):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(text)
+        size += len(text)
+    if batch:
+        batches.append(batch)
+
+    for batch in batches:
+        try:
+            results = translate_client.translate(batch, target_language=target_language)
+        except Exception as e:
+            print(f"❌ Ошибка при переводе текста: {e}")
+            continue
+        for text, result in zip(batch, results):
+            cache[keys[text]] = result['translatedText']
+            translation_stats['chars_translated'] += len(text)
 
-    try:
-        # Ограничиваем длину текста для API
-        if len(text) > 5000:
-            text = text[:5000] + "..."
+    return [cache.get(keys[text], original) if text is not None else original
+            for text, original in zip(prepared, texts)]
 
-        result = translate_client.translate(text, target_language=target_language)
-        return result['translatedText']
-    except Exception as e:
-        print(f"❌ Ошибка при переводе текста: {e}")
-        return text
+
+def translate_text(text: str, translate_client, target_language: str = 'ru') -> str:
+    """Переводит текст с помощью Google Cloud Translation API (через кеш, см. translate_texts)"""
+    return translate_texts([text], translate_client, target_language)[0]
 
 # --- 5. Функция для безопасного извлечения текста из элемента ---
 def safe_get_text(element) -> str:
@@ -433,6 +510,7 @@ def run_parser_and_translator(output_filename: str = "translated_cannabis_news.j
     print("🚀 Начинаем процесс парсинга и перевода...")
     print(f"📊 Максимум статей с каждого сайта: {max_articles_per_site}")
 
+    all_articles = []
     for site_name, url in SITES.items():
         print(f"\n📰 Обрабатываем {site_name}...")
         articles = parse_site(site_name, url)
@@ -442,26 +520,38 @@ def run_parser_and_translator(output_filename: str = "translated_cannabis_news.j
 
         for i, article in enumerate(articles, 1):
             print(f"   📄 Обрабатываем статью {i}/{len(articles)}: {article['title'][:50]}...")
-
-            original_title = article.get('title', 'N/A')
-            original_text = article.get('full_text', 'N/A')
-
-            # Перевод заголовка и текста
-            translated_title = translate_text(original_title, translate_client) if translate_client else original_title
-            translated_text = translate_text(original_text, translate_client) if translate_client else original_text
-
-            all_translated_news.append({
-                'source': article.get('source', 'N/A'),
-                'original_title': original_title,
-                'translated_title': translated_title,
-                'original_text': original_text,
-                'translated_text': translated_text,
-                'url': article.get('url', 'N/A'),
-                'image_url': article.get('image_url', 'N/A'),
-                'date_published': article.get('date_published', 'N/A'),
-                'parsed_at': __import__('datetime').datetime.now().isoformat()
-            })
-            total_parsed += 1
+            all_articles.append(article)
+
+    # Перевод заголовков и текстов всех статей одним набором пакетов
+    originals = []
+    for article in all_articles:
+        originals.extend([article.get('title', 'N/A'), article.get('full_text', 'N/A')])
+    translations = translate_texts(originals, translate_client)
+    if translate_client:
+        segments = translation_stats['segments']
+        print(f"\n🈯 Перевод: из кеша {translation_stats['hits']}/{segments} текстов, "
+              f"сэкономлено {translation_stats['chars_saved']} символов")
+        try:
+            save_translation_cache()
+        except OSError as e:
+            print(f"❌ Ошибка при сохранении кеша переводов: {e}")
+
+    for index, article in enumerate(all_articles):
+        original_title, original_text = originals[2 * index], originals[2 * index + 1]
+        translated_title, translated_text = translations[2 * index], translations[2 * index + 1]
+
+        all_translated_news.append({
+            'source': article.get('source', 'N/A'),
+            'original_title': original_title,
+            'translated_title': translated_title,
+            'original_text': original_text,
+            'translated_text': translated_text,
+            'url': article.get('url', 'N/A'),
+            'image_url': article.get('image_url', 'N/A'),
+            'date_published': article.get('date_published', 'N/A'),
+            'parsed_at': __import__('datetime').datetime.now().isoformat()
+        })
+        total_parsed += 1
 
     # Сохранение результатов в JSON
     try:
@@ -275,9 +275,11 @@ class User(AbstractUser):
     def can_access_vip_chat(self) -> bool:
         """
         Проверяет, имеет ли пользователь доступ к VIP-чату.
-        Доступ разрешен для Владельца платформы и Администратора платформы.
+        Роли с доступом задаются в комнате (Room.access_roles), как и при подключении к ней.
         """
-        return self.role in [self.Role.OWNER, self.Role.MODERATOR]
+        from chat.rooms import get_available_room
+
+        return get_available_room('vip', self) is not None
 
     @property
     def has_admin_access(self) -> bool: